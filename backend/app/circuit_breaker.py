@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+from datetime import datetime
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_COOLDOWN_SECONDS = int(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "300"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """La fuente está en enfriamiento y la llamada se omitió"""
+
+class _MeteredStream:
+    """Iterador que informa al breaker cuando se agota, falla o se abandona"""
+
+    def __init__(self, breaker: "CircuitBreaker", items, started: float):
+        self._breaker = breaker
+        self._items = iter(items)
+        self._started = started
+        self._pending = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._pending:
+            raise StopIteration
+        try:
+            return next(self._items)
+        except StopIteration:
+            self._pending = False
+            self._breaker.record_success((time.monotonic() - self._started) * 1000)
+            raise
+        except Exception as e:
+            # Cuerpo cortado o mal formado: la fuente falló aunque respondió
+            self._pending = False
+            self._breaker.record_failure(e, (time.monotonic() - self._started) * 1000)
+            raise
+
+    def close(self):
+        """Consumo abandonado antes del final: sin veredicto, solo libera la sonda"""
+        if self._pending:
+            self._pending = False
+            self._breaker.release_probe()
+        close = getattr(self._items, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self):
+        self.close()
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown_seconds: int = CIRCUIT_COOLDOWN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self.last_success_at = None
+        self.last_failure_at = None
+        self.last_error = None
+        self.last_latency_ms = None
+        self.avg_latency_ms = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            return HALF_OPEN
+        return self._state
+
+    def is_open(self) -> bool:
+        """Abierto y todavía en enfriamiento (no admite ni siquiera una sonda)"""
+        return self.state == OPEN
+
+    def allow(self) -> bool:
+        """¿Se puede llamar a la fuente? En semiabierto solo pasa una sonda a la vez"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._state = HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def _record_latency(self, latency_ms: float):
+        self.last_latency_ms = round(latency_ms, 1)
+        # Media móvil exponencial para suavizar picos
+        self.avg_latency_ms = round(latency_ms if self.avg_latency_ms is None
+                                    else 0.8 * self.avg_latency_ms + 0.2 * latency_ms, 1)
+
+    def record_success(self, latency_ms: float):
+        with self._lock:
+            self._record_latency(latency_ms)
+            self._state = CLOSED
+            self._probe_in_flight = False
+            self.consecutive_failures = 0
+            self.last_success_at = datetime.utcnow()
+
+    def record_failure(self, error: Exception, latency_ms: float):
+        with self._lock:
+            self._record_latency(latency_ms)
+            self._probe_in_flight = False
+            self.consecutive_failures += 1
+            self.last_failure_at = datetime.utcnow()
+            self.last_error = str(error)[:200]
+            if self._state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """La llamada terminó sin resultado atribuible a la fuente"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def call(self, fn, *args, **kwargs):
+        """Ejecutar `fn` a través del breaker"""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuito de {self.name} abierto")
+
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e, (time.monotonic() - started) * 1000)
+            raise
+        self.record_success((time.monotonic() - started) * 1000)
+        return result
+
+    def stream(self, fn, *args, **kwargs):
+        """Como `call` para respuestas que se consumen de forma perezosa.
+
+        `fn` hace la petición y devuelve un iterable; el éxito se registra al
+        agotarlo y un error al leerlo o parsearlo cuenta como falla.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuito de {self.name} abierto")
+
+        started = time.monotonic()
+        try:
+            items = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e, (time.monotonic() - started) * 1000)
+            raise
+        return _MeteredStream(self, items, started)
+
+    def status(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == OPEN:
+                retry_in = round(self.cooldown_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self.consecutive_failures,
+                "last_success_at": self.last_success_at.isoformat() if self.last_success_at else None,
+                "last_failure_at": self.last_failure_at.isoformat() if self.last_failure_at else None,
+                "last_error": self.last_error,
+                "last_latency_ms": self.last_latency_ms,
+                "avg_latency_ms": self.avg_latency_ms,
+                "retry_in_seconds": retry_in
+            }
@@ -0,0 +1,55 @@
+import os
+import logging
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel, create_engine
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración de base de datos
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./alerts.db")
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
+
+def ensure_columns(db_engine=engine):
+    """Agregar columnas e índices nuevos a tablas existentes (create_all no altera tablas)"""
+    inspector = inspect(db_engine)
+    existing_tables = set(inspector.get_table_names())
+    models = {m.__tablename__: m for m in SQLModel.__subclasses__() if hasattr(m, "__table__")}
+    removed = 0
+
+    with db_engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                field = models[table.name].model_fields.get(column.name) if table.name in models else None
+                default = field.default if field is not None and isinstance(field.default, (str, int, float)) else None
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if default is not None:
+                    ddl += f" DEFAULT '{default}'" if isinstance(default, str) else f" DEFAULT {default}"
+                conn.execute(text(ddl))
+                logging.info(f"🔧 Columna agregada: {table.name}.{column.name}")
+            current = {i["name"]: i for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.unique and index.name in current and not current[index.name]["unique"]:
+                    # Índice previo sin unicidad: quitar duplicados (se conserva el primero) y recrearlo
+                    columns = [c.name for c in index.columns]
+                    present = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+                    result = conn.execute(text(
+                        f"DELETE FROM {table.name} WHERE {present} AND id NOT IN "
+                        f"(SELECT MIN(id) FROM {table.name} WHERE {present} GROUP BY {', '.join(columns)})"
+                    ))
+                    removed += result.rowcount
+                    index.drop(conn)
+                    logging.info(f"🔧 Índice único: {index.name} ({result.rowcount} duplicados eliminados)")
+                index.create(conn, checkfirst=True)
+
+    if removed:
+        # Los duplicados ya estaban sumados en los rollups
+        from .rollups import rebuild_rollups
+        rebuild_rollups(db_engine)
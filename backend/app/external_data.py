@@ -5,19 +5,91 @@ from datetime import datetime, timedelta
 from sqlmodel import Session
 from .models import Alert
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import numpy as np
+from array import array
+from .circuit_breaker import CircuitBreaker
+from .json_stream import iter_items, iter_leaves
+from .points import DEFAULT_POINT, load_point_registry, point_key
+from .timeseries_store import nasa_power_store, parse_day, window_mean, anomaly
 
 # Configuración
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
-OPENWEATHER_BASE_URL = "http://api.openweathermap.org/data/2.5"
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
-GDACS_URL = "https://www.gdacs.org/gdacsapi/api/events/get/eventlist/SEARCH"
+# Las URLs se pueden redirigir (p. ej. al servidor de replay de bench/replay.py)
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org/data/2.5")
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+GDACS_URL = os.getenv("GDACS_URL", "https://www.gdacs.org/gdacsapi/api/events/get/eventlist/SEARCH")
+# País para GDACS (vacío = feed regional/global completo)
+GDACS_COUNTRY = os.getenv("GDACS_COUNTRY", "GT")
+NASA_POWER_URL = os.getenv("NASA_POWER_URL", "https://power.larc.nasa.gov/api/temporal/daily/point")
+
+EXTERNAL_SOURCES = ('OPEN_METEO', 'OPENWEATHER', 'GDACS', 'NASA_POWER')
+EXTERNAL_TIMEOUT_SECONDS = float(os.getenv("EXTERNAL_TIMEOUT_SECONDS", "15"))
+
+# Lotes y concurrencia para la ingesta multi-punto
+OPEN_METEO_BATCH_SIZE = int(os.getenv("OPEN_METEO_BATCH_SIZE", "50"))
+EXTERNAL_MAX_CONCURRENCY = int(os.getenv("EXTERNAL_MAX_CONCURRENCY", "4"))
+OPENWEATHER_MAX_POINTS = int(os.getenv("OPENWEATHER_MAX_POINTS", "10"))
+
+# NASA POWER: serie local incremental
+NASA_POWER_PARAMETERS = ('T2M', 'PRECTOT', 'WS2M', 'RH2M')
+NASA_POWER_FILL = -999.0
+NASA_POWER_BACKFILL_DAYS = int(os.getenv("NASA_POWER_BACKFILL_DAYS", "365"))
+NASA_POWER_MAX_POINTS = int(os.getenv("NASA_POWER_MAX_POINTS", "100"))
+NASA_POWER_ANOMALY_C = float(os.getenv("NASA_POWER_ANOMALY_C", "2.0"))
+# Años anteriores que forman la climatología de la anomalía (misma ventana del calendario)
+NASA_POWER_CLIMATOLOGY_YEARS = int(os.getenv("NASA_POWER_CLIMATOLOGY_YEARS", "3"))
+NASA_POWER_ANOMALY_WINDOW_DAYS = 30
+# Historia necesaria para la climatología completa
+NASA_POWER_HISTORY_DAYS = max(NASA_POWER_BACKFILL_DAYS,
+                              round(365.25 * NASA_POWER_CLIMATOLOGY_YEARS) + NASA_POWER_ANOMALY_WINDOW_DAYS)
+
+# Tipos de evento GDACS -> alert_type del sistema
+GDACS_EVENT_TYPES = {'EQ': 'terremoto', 'FL': 'inundacion', 'WF': 'incendio'}
 
 class ExternalDataFetcher:
     def __init__(self):
         self.session = requests.Session()
         self.session.timeout = 30
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=EXTERNAL_MAX_CONCURRENCY * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breakers = {source: CircuitBreaker(source) for source in EXTERNAL_SOURCES}
+
+    def _request(self, url, params, stream=False):
+        response = self.session.get(url, params=params, timeout=EXTERNAL_TIMEOUT_SECONDS, stream=stream)
+        # Solo los errores del servidor y el rate limit cuentan como caída de la fuente
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+    def _get(self, source, url, params, stream=False):
+        """GET a través del circuit breaker de la fuente, con timeout real"""
+        response = self.breakers[source].call(self._request, url, params, stream)
+        response.raise_for_status()
+        return response
+
+    def _get_items(self, source, url, params, parse):
+        """GET en streaming: el breaker registra el resultado al terminar de leer el cuerpo"""
+        opened = {}
 
-    def fetch_weather_alerts(self, lat=14.625, lon=-90.525):
+        def open_items():
+            response = opened['response'] = self._request(url, params, stream=True)
+            # Un 4xx no es caída de la fuente: se levanta fuera del breaker, como en `_get`
+            return parse(response) if response.ok else iter(())
+
+        items = self.breakers[source].stream(open_items)
+        if not opened['response'].ok:
+            items.close()
+            opened['response'].raise_for_status()
+        return items
+
+    def sources_status(self):
+        """Estado de los breakers de todas las fuentes"""
+        return {source: breaker.status() for source, breaker in self.breakers.items()}
+
+    def fetch_weather_alerts(self, lat=DEFAULT_POINT[0], lon=DEFAULT_POINT[1]):
         """Obtener alertas meteorológicas de OpenWeatherMap"""
         try:
             if not OPENWEATHER_API_KEY:
@@ -34,8 +106,7 @@ class ExternalDataFetcher:
                 'lang': 'es'
             }
             
-            response = self.session.get(current_url, params=params)
-            response.raise_for_status()
+            response = self._get('OPENWEATHER', current_url, params)
             data = response.json()
             
             alerts = []
@@ -64,7 +135,8 @@ class ExternalDataFetcher:
                     'severity': 3,
                     'lat': lat,
                     'lon': lon,
-                    'source': 'OPENWEATHER'
+                    'source': 'OPENWEATHER',
+                    'alert_type': 'incendio'
                 })
             
             if wind_speed > 15:  # Vientos fuertes
@@ -83,160 +155,273 @@ class ExternalDataFetcher:
             logging.error(f"Error obteniendo datos de OpenWeather: {e}")
             return None
 
-    def fetch_open_meteo_data(self, lat=14.625, lon=-90.525):
+    def _request_open_meteo(self, coords):
+        """Una sola petición multi-coordenada a Open-Meteo; devuelve un resultado por punto"""
+        params = {
+            'latitude': ','.join(f'{lat:.4f}' for lat, _ in coords),
+            'longitude': ','.join(f'{lon:.4f}' for _, lon in coords),
+            'current': 'temperature_2m,relative_humidity_2m,precipitation,weather_code,wind_speed_10m',
+            'daily': 'weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max',
+            'timezone': 'auto',
+            'forecast_days': 3
+        }
+
+        response = self._get('OPEN_METEO', OPEN_METEO_URL, params)
+        data = response.json()
+
+        # Con varias coordenadas Open-Meteo responde una lista en el mismo orden
+        return data if isinstance(data, list) else [data]
+
+    def _evaluate_open_meteo(self, data, lat, lon):
+        """Aplicar las reglas de umbral de Open-Meteo a un punto"""
+        alerts = []
+        current = data.get('current', {})
+        daily = data.get('daily', {})
+
+        # Analizar datos actuales
+        precipitation = current.get('precipitation', 0) or 0
+        weather_code = current.get('weather_code', 0)
+
+        # Generar alertas basadas en códigos de clima
+        severe_weather_codes = [95, 96, 99]  # Tormentas severas
+        if weather_code in severe_weather_codes:
+            alerts.append({
+                'title': 'Alerta de Tormenta Severa',
+                'description': 'Tormenta eléctrica severa detectada en el área.',
+                'severity': 4,
+                'lat': lat,
+                'lon': lon,
+                'source': 'OPEN_METEO'
+            })
+
+        if precipitation > 20:  # Lluvia intensa
+            alerts.append({
+                'title': 'Alerta de Lluvia Intensa',
+                'description': f'Precipitación intensa detectada: {precipitation} mm. Riesgo de inundaciones.',
+                'severity': 3,
+                'lat': lat,
+                'lon': lon,
+                'source': 'OPEN_METEO',
+                'alert_type': 'inundacion'
+            })
+
+        # Verificar pronóstico para los próximos días
+        daily_precipitation = [p for p in daily.get('precipitation_sum', []) if p is not None]
+        if daily_precipitation and max(daily_precipitation) > 30:
+            alerts.append({
+                'title': 'Alerta de Lluvias Futuras',
+                'description': 'Se pronostican lluvias intensas en los próximos días.',
+                'severity': 2,
+                'lat': lat,
+                'lon': lon,
+                'source': 'OPEN_METEO',
+                'alert_type': 'inundacion'
+            })
+
+        return alerts
+
+    def fetch_open_meteo_data(self, lat=DEFAULT_POINT[0], lon=DEFAULT_POINT[1]):
         """Obtener datos meteorológicos de Open-Meteo (sin API key)"""
         try:
-            params = {
-                'latitude': lat,
-                'longitude': lon,
-                'current': 'temperature_2m,relative_humidity_2m,precipitation,weather_code,wind_speed_10m',
-                'daily': 'weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max',
-                'timezone': 'auto',
-                'forecast_days': 3
-            }
-            
-            response = self.session.get(OPEN_METEO_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            alerts = []
-            current = data.get('current', {})
-            daily = data.get('daily', {})
-            
-            # Analizar datos actuales
-            precipitation = current.get('precipitation', 0)
-            wind_speed = current.get('wind_speed_10m', 0)
-            weather_code = current.get('weather_code', 0)
-            
-            # Generar alertas basadas en códigos de clima
-            severe_weather_codes = [95, 96, 99]  # Tormentas severas
-            if weather_code in severe_weather_codes:
-                alerts.append({
-                    'title': 'Alerta de Tormenta Severa',
-                    'description': 'Tormenta eléctrica severa detectada en el área.',
-                    'severity': 4,
-                    'lat': lat,
-                    'lon': lon,
-                    'source': 'OPEN_METEO'
-                })
-            
-            if precipitation > 20:  # Lluvia intensa
-                alerts.append({
-                    'title': 'Alerta de Lluvia Intensa',
-                    'description': f'Precipitación intensa detectada: {precipitation} mm. Riesgo de inundaciones.',
-                    'severity': 3,
-                    'lat': lat,
-                    'lon': lon,
-                    'source': 'OPEN_METEO'
-                })
-            
-            # Verificar pronóstico para los próximos días
-            daily_precipitation = daily.get('precipitation_sum', [])
-            if daily_precipitation and max(daily_precipitation) > 30:
-                alerts.append({
-                    'title': 'Alerta de Lluvias Futuras',
-                    'description': 'Se pronostican lluvias intensas en los próximos días.',
-                    'severity': 2,
-                    'lat': lat,
-                    'lon': lon,
-                    'source': 'OPEN_METEO'
-                })
-            
-            return alerts
-            
+            data = self._request_open_meteo([(lat, lon)])[0]
+            return self._evaluate_open_meteo(data, lat, lon)
+
         except Exception as e:
             logging.error(f"Error obteniendo datos de Open-Meteo: {e}")
             return None
 
-    def fetch_gdacs_alerts(self):
-        """Obtener alertas globales de desastres de GDACS"""
+    def _fetch_open_meteo_chunk(self, points):
+        """Procesar un lote de puntos; un lote fallido no afecta a los demás"""
         try:
-            params = {
-                'fromdate': (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d'),
-                'todate': datetime.now().strftime('%Y-%m-%d'),
-                'alertlevel': 'Green,Orange,Red',
-                'country': 'GT'  # Guatemala
-            }
-            
-            response = self.session.get(GDACS_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
+            results = self._request_open_meteo([(p.lat, p.lon) for p in points])
             alerts = []
-            
-            for event in data.get('features', []):
-                properties = event.get('properties', {})
-                geometry = event.get('geometry', {})
-                
-                event_type = properties.get('eventtype', '')
-                alert_level = properties.get('alertlevel', '')
-                title = properties.get('title', '')
-                description = properties.get('description', '')
-                
-                # Convertir alert level a severidad numérica
-                severity_map = {'Green': 2, 'Orange': 3, 'Red': 4}
-                severity = severity_map.get(alert_level, 2)
-                
-                # Obtener coordenadas (usar el primer punto si es Polygon)
-                coords = geometry.get('coordinates', [])
-                if coords and isinstance(coords[0], list) and isinstance(coords[0][0], list):
-                    # Es un polígono, usar el primer punto
-                    lon, lat = coords[0][0]
-                else:
-                    # Usar coordenadas por defecto de Guatemala
-                    lat, lon = 14.625, -90.525
-                
-                alerts.append({
-                    'title': f'GDACS: {title}',
-                    'description': description,
-                    'severity': severity,
-                    'lat': lat,
-                    'lon': lon,
-                    'source': 'GDACS'
-                })
-            
+            for point, data in zip(points, results):
+                alerts.extend(self._evaluate_open_meteo(data, point.lat, point.lon))
             return alerts
+
+        except Exception as e:
+            logging.error(f"Error obteniendo lote de Open-Meteo ({len(points)} puntos): {e}")
+            return None
+
+    def fetch_open_meteo_grid(self, points):
+        """Open-Meteo para todo el registro de puntos en peticiones multi-coordenada"""
+        chunks = [points[i:i + OPEN_METEO_BATCH_SIZE] for i in range(0, len(points), OPEN_METEO_BATCH_SIZE)]
+        if not chunks:
+            return []
+
+        alerts = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=min(EXTERNAL_MAX_CONCURRENCY, len(chunks))) as pool:
+            for chunk_alerts in pool.map(self._fetch_open_meteo_chunk, chunks):
+                if chunk_alerts is None:
+                    failed += 1
+                else:
+                    alerts.extend(chunk_alerts)
+
+        logging.info(f"Open-Meteo: {len(points)} puntos en {len(chunks)} peticiones ({failed} fallidas)")
+        return alerts if failed < len(chunks) else None
+
+    def fetch_weather_alerts_for_points(self, points):
+        """OpenWeatherMap no admite lotes: concurrencia acotada sobre los primeros puntos"""
+        points = points[:OPENWEATHER_MAX_POINTS]
+        if not points:
+            return []
+
+        alerts = []
+        with ThreadPoolExecutor(max_workers=min(EXTERNAL_MAX_CONCURRENCY, len(points))) as pool:
+            for point_alerts in pool.map(lambda p: self.fetch_weather_alerts(p.lat, p.lon), points):
+                if point_alerts:
+                    alerts.extend(point_alerts)
+        return alerts
+
+    def _gdacs_event_to_alert(self, event):
+        """Normalizar un feature GDACS a una alerta"""
+        properties = event.get('properties', {})
+        geometry = event.get('geometry') or {}
+        
+        event_type = properties.get('eventtype', '')
+        alert_level = properties.get('alertlevel', '')
+        title = properties.get('title', '')
+        description = properties.get('description', '')
+        
+        # Convertir alert level a severidad numérica
+        severity_map = {'Green': 2, 'Orange': 3, 'Red': 4}
+        severity = severity_map.get(alert_level, 2)
+        
+        # Obtener coordenadas (usar el primer punto si es Polygon)
+        coords = geometry.get('coordinates', [])
+        if coords and isinstance(coords[0], list) and isinstance(coords[0][0], list):
+            # Es un polígono, usar el primer punto
+            lon, lat = coords[0][0][:2]
+        elif len(coords) >= 2 and not isinstance(coords[0], list):
+            # Es un punto
+            lon, lat = coords[:2]
+        else:
+            # Usar coordenadas por defecto de Guatemala
+            lat, lon = DEFAULT_POINT
+        
+        return {
+            'title': f'GDACS: {title}',
+            'description': description,
+            'severity': severity,
+            'lat': lat,
+            'lon': lon,
+            'source': 'GDACS',
+            'alert_type': GDACS_EVENT_TYPES.get(event_type, 'general'),
+            'external_id': f"GDACS:{event_type}:{properties.get('eventid', '')}:{properties.get('episodeid', '')}",
+            'event_date': properties.get('fromdate')
+        }
+
+    def iter_gdacs_alerts(self, since=None):
+        """Alertas GDACS una a una a medida que llegan del feed (memoria acotada)"""
+        # Ventana incremental: desde la última fecha ingerida, o 7 días la primera vez
+        fromdate = since or (datetime.now() - timedelta(days=7))
+        params = {
+            'fromdate': fromdate.strftime('%Y-%m-%d'),
+            'todate': datetime.now().strftime('%Y-%m-%d'),
+            'alertlevel': 'Green,Orange,Red'
+        }
+        if GDACS_COUNTRY:
+            params['country'] = GDACS_COUNTRY
+        
+        # La petición se hace aquí; el cuerpo se consume de forma perezosa y la
+        # fuente cuenta como sana recién cuando se leyó y normalizó completo
+        return self._get_items('GDACS', GDACS_URL, params, lambda response: (
+            self._gdacs_event_to_alert(event) for event in iter_items(response, 'features.item')))
+
+    def fetch_gdacs_alerts(self, since=None):
+        """Obtener alertas globales de desastres de GDACS"""
+        try:
+            return list(self.iter_gdacs_alerts(since=since))
             
         except Exception as e:
             logging.error(f"Error obteniendo datos de GDACS: {e}")
             return None
 
-    def fetch_nasa_power_data(self, lat=14.625, lon=-90.525):
-        """Obtener datos climáticos de NASA POWER"""
+    def _sync_nasa_power(self, lat, lon):
+        """Descargar solo los días que el almacén local aún no tiene"""
+        key = point_key(lat, lon)
+        today = datetime.utcnow().date()
+        last = nasa_power_store.last_day(key)
+        start = last + timedelta(days=1) if last else today - timedelta(days=NASA_POWER_HISTORY_DAYS)
+        if start > today:
+            return key
+
+        params = {
+            'parameters': ','.join(NASA_POWER_PARAMETERS),
+            'start': start.strftime('%Y%m%d'),
+            'end': today.strftime('%Y%m%d'),
+            'latitude': lat,
+            'longitude': lon,
+            'community': 'AG',
+            'format': 'JSON'
+        }
+
+        response = self._get('NASA_POWER', NASA_POWER_URL, params, stream=True)
+
+        # Parseo incremental directo a arreglos compactos (sin dicts por día)
+        raw_days = {name: array('q') for name in NASA_POWER_PARAMETERS}
+        raw_values = {name: array('d') for name in NASA_POWER_PARAMETERS}
+        for path, value in iter_leaves(response, 'properties.parameter'):
+            if len(path) == 2 and path[0] in raw_days and value is not None:
+                raw_days[path[0]].append(int(path[1]))
+                raw_values[path[0]].append(float(value))
+
+        all_days = np.unique(np.concatenate([np.frombuffer(d, dtype=np.int64) for d in raw_days.values()]))
+        days = [str(day) for day in all_days]
+        values = {}
+        for name in NASA_POWER_PARAMETERS:
+            column = np.full(len(all_days), np.nan)
+            name_days = np.frombuffer(raw_days[name], dtype=np.int64)
+            column[np.searchsorted(all_days, name_days)] = np.frombuffer(raw_values[name], dtype=np.float64)
+            column[column <= NASA_POWER_FILL] = np.nan
+            values[name] = column
+
+        # NASA POWER publica con días de retraso: no guardar la cola sin datos
+        # para volver a pedir esos días en el próximo ciclo
+        valid = np.zeros(len(days), dtype=bool)
+        for column in values.values():
+            valid |= ~np.isnan(column)
+        if not valid.any():
+            return key
+        keep = int(np.flatnonzero(valid)[-1]) + 1
+        nasa_power_store.append(
+            key, parse_day(days[0]), {name: column[:keep] for name, column in values.items()}
+        )
+        return key
+
+    def fetch_nasa_power_data(self, lat=DEFAULT_POINT[0], lon=DEFAULT_POINT[1]):
+        """Obtener datos climáticos de NASA POWER (incremental, con almacén local)"""
         try:
-            url = "https://power.larc.nasa.gov/api/temporal/daily/point"
-            params = {
-                'parameters': 'T2M,PRECTOT,WS2M,RH2M',
-                'start': (datetime.now() - timedelta(days=30)).strftime('%Y%m%d'),
-                'end': datetime.now().strftime('%Y%m%d'),
-                'latitude': lat,
-                'longitude': lon,
-                'community': 'AG',
-                'format': 'JSON'
-            }
-            
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Analizar datos para tendencias peligrosas
-            temperatures = data.get('properties', {}).get('parameter', {}).get('T2M', {})
-            precipitation = data.get('properties', {}).get('parameter', {}).get('PRECTOT', {})
+            key = self._sync_nasa_power(lat, lon)
+            temperatures = nasa_power_store.read(key, 'T2M', days=NASA_POWER_HISTORY_DAYS)
             
             alerts = []
             
             # Verificar temperaturas extremas recientes
-            if temperatures:
-                avg_temp = sum(temperatures.values()) / len(temperatures)
-                if avg_temp > 30:
-                    alerts.append({
-                        'title': 'Tendencia de Temperaturas Altas',
-                        'description': f'Temperatura promedio alta detectada: {avg_temp:.1f}°C',
-                        'severity': 2,
-                        'lat': lat,
-                        'lon': lon,
-                        'source': 'NASA_POWER'
-                    })
+            avg_temp = window_mean(temperatures, 30)
+            if avg_temp > 30:
+                alerts.append({
+                    'title': 'Tendencia de Temperaturas Altas',
+                    'description': f'Temperatura promedio alta detectada: {avg_temp:.1f}°C',
+                    'severity': 2,
+                    'lat': lat,
+                    'lon': lon,
+                    'source': 'NASA_POWER'
+                })
+
+            # Anomalía frente a la climatología de la misma época (sin historia suficiente es NaN y no alerta)
+            temp_anomaly = anomaly(temperatures, window=NASA_POWER_ANOMALY_WINDOW_DAYS, years=NASA_POWER_CLIMATOLOGY_YEARS)
+            if temp_anomaly > NASA_POWER_ANOMALY_C:
+                alerts.append({
+                    'title': 'Anomalía de Temperatura',
+                    'description': f'Últimos 30 días {temp_anomaly:.1f}°C sobre lo normal para la época. Riesgo de sequía e incendios.',
+                    'severity': 2,
+                    'lat': lat,
+                    'lon': lon,
+                    'source': 'NASA_POWER',
+                    'alert_type': 'incendio'
+                })
             
             return alerts
             
@@ -244,34 +429,56 @@ class ExternalDataFetcher:
             logging.error(f"Error obteniendo datos de NASA POWER: {e}")
             return None
 
-    def check_all_sources(self):
+    def fetch_nasa_power_for_points(self, points):
+        """NASA POWER por punto con concurrencia acotada; cada punto pide solo días nuevos"""
+        points = points[:NASA_POWER_MAX_POINTS]
+        if not points:
+            return []
+
+        alerts = []
+        with ThreadPoolExecutor(max_workers=min(EXTERNAL_MAX_CONCURRENCY, len(points))) as pool:
+            for point_alerts in pool.map(lambda p: self.fetch_nasa_power_data(p.lat, p.lon), points):
+                if point_alerts:
+                    alerts.extend(point_alerts)
+        return alerts
+
+    def fetch_source(self, source, points, since=None):
+        """Consultar una sola fuente para el registro de puntos"""
+        if self.breakers[source].is_open():
+            # Fuente en enfriamiento: no gastar tiempo del ciclo en ella
+            logging.warning(f"Circuito de {source} abierto, se omite el ciclo")
+            return None
+        if source == 'OPEN_METEO':
+            return self.fetch_open_meteo_grid(points)
+        if source == 'OPENWEATHER':
+            return self.fetch_weather_alerts_for_points(points) if OPENWEATHER_API_KEY else []
+        if source == 'GDACS':
+            # Iterador perezoso: la ingesta normaliza y deduplica feature a feature
+            try:
+                return self.iter_gdacs_alerts(since=since)
+            except Exception as e:
+                logging.error(f"Error obteniendo datos de GDACS: {e}")
+                return None
+        if source == 'NASA_POWER':
+            return self.fetch_nasa_power_for_points(points)
+        raise ValueError(f"Fuente desconocida: {source}")
+
+    def check_all_sources(self, points=None):
         """Verificar todas las fuentes de datos externas"""
         all_alerts = []
+        if points is None:
+            # Mismo registro que la ingesta: zonas, refugios y malla
+            from .database import engine
+            with Session(engine) as session:
+                points = load_point_registry(session)
         
-        try:
-            # Open-Meteo (siempre disponible)
-            meteo_alerts = self.fetch_open_meteo_data()
-            if meteo_alerts:
-                all_alerts.extend(meteo_alerts)
-            
-            # OpenWeatherMap (si tiene API key)
-            if OPENWEATHER_API_KEY:
-                weather_alerts = self.fetch_weather_alerts()
-                if weather_alerts:
-                    all_alerts.extend(weather_alerts)
-            
-            # GDACS Alertas globales
-            gdacs_alerts = self.fetch_gdacs_alerts()
-            if gdacs_alerts:
-                all_alerts.extend(gdacs_alerts)
-            
-            # NASA POWER datos históricos
-            nasa_alerts = self.fetch_nasa_power_data()
-            if nasa_alerts:
-                all_alerts.extend(nasa_alerts)
-                
-        except Exception as e:
-            logging.error(f"Error general en check_all_sources: {e}")
+        for source in EXTERNAL_SOURCES:
+            try:
+                alerts = self.fetch_source(source, points)
+                if alerts:
+                    all_alerts.extend(alerts)
+            except Exception as e:
+                logging.error(f"Error general en check_all_sources ({source}): {e}")
         
         return all_alerts
 
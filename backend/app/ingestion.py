@@ -0,0 +1,191 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from .database import engine
+from .models import Alert
+from .external_data import external_fetcher, EXTERNAL_SOURCES
+from .leadership import LeaseLostError, lease_manager
+from .points import load_point_registry, point_key
+
+# Configuración del programador de ingesta (intervalos en minutos)
+CHECK_EXTERNAL_INTERVAL = int(os.getenv("CHECK_EXTERNAL_INTERVAL", "30"))
+INGEST_JITTER_SECONDS = int(os.getenv("INGEST_JITTER_SECONDS", "60"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+SOURCES = EXTERNAL_SOURCES
+
+# NASA POWER publica datos diarios: no tiene sentido consultarlo cada media hora
+DEFAULT_INTERVALS = {"NASA_POWER": 720}
+
+def source_interval(source: str) -> int:
+    """Intervalo de una fuente: INGEST_INTERVAL_<FUENTE> o el intervalo general"""
+    default = DEFAULT_INTERVALS.get(source, CHECK_EXTERNAL_INTERVAL)
+    return int(os.getenv(f"INGEST_INTERVAL_{source}", default))
+
+def lease_name(source: str) -> str:
+    """Lease (y id del trabajo en el programador) de la ingesta de una fuente"""
+    return f"ingest_{source.lower()}"
+
+def parse_event_date(value):
+    """Fecha de evento de la fuente como datetime UTC naive"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - (parsed.utcoffset() or timedelta(0))
+    return parsed
+
+class IngestionPipeline:
+    def __init__(self, fetcher=external_fetcher, db_engine=engine):
+        self.fetcher = fetcher
+        self.engine = db_engine
+        self._locks = {source: threading.Lock() for source in SOURCES}
+        self.last_runs = {}
+        # Callbacks tras un ciclo con alertas nuevas (p. ej. refrescar instantáneas)
+        self.listeners = []
+
+    def schedule(self, scheduler):
+        """Registrar un trabajo por fuente con su intervalo y jitter"""
+        for i, source in enumerate(SOURCES):
+            job_id = lease_name(source)
+            scheduler.add_job(
+                # Con varios workers solo el dueño de la lease de la fuente consulta la API externa
+                lease_manager.leader_only(job_id, self.run_source),
+                "interval",
+                minutes=source_interval(source),
+                jitter=INGEST_JITTER_SECONDS,
+                args=[source],
+                id=job_id,
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True,
+                # Escalonar el primer ciclo para no golpear todas las fuentes a la vez
+                next_run_time=datetime.utcnow() + timedelta(seconds=10 + i * 5)
+            )
+        logging.info(f"🕒 Ingesta programada para {len(SOURCES)} fuentes")
+
+    def run_source(self, source: str) -> int:
+        """Un ciclo de ingesta de una fuente; nunca se solapa consigo mismo"""
+        lock = self._locks[source]
+        if not lock.acquire(blocking=False):
+            logging.info(f"⏭️ Ingesta de {source} en curso, se omite este ciclo")
+            return 0
+
+        started = time.monotonic()
+        try:
+            with Session(self.engine) as session:
+                points = load_point_registry(session)
+                since = self.last_ingested(session, source) if source == "GDACS" else None
+
+            raw_alerts = self.fetcher.fetch_source(source, points, since=since)
+            if raw_alerts is None:
+                logging.warning(f"⚠️ {source} no devolvió datos en este ciclo")
+                return 0
+
+            # Cada lote verifica que este proceso sigue siendo el líder de la fuente
+            inserted = self.persist((self.normalize(raw) for raw in raw_alerts), lease=lease_name(source))
+            self.last_runs[source] = {
+                "finished_at": datetime.utcnow().isoformat(),
+                "inserted": inserted,
+                "duration_ms": round((time.monotonic() - started) * 1000)
+            }
+            logging.info(f"📥 {source}: {inserted} alertas nuevas")
+            if inserted:
+                for listener in self.listeners:
+                    listener()
+            return inserted
+
+        except LeaseLostError as e:
+            logging.warning(f"🔻 Ingesta de {source} descartada: {e}")
+            return 0
+        except Exception as e:
+            logging.error(f"❌ Error en ingesta de {source}: {e}")
+            return 0
+        finally:
+            lock.release()
+
+    def last_ingested(self, session: Session, source: str):
+        """Fecha del último evento ingerido (con un día de solape) para ventanas incrementales"""
+        last = session.exec(select(func.max(Alert.created_at)).where(Alert.source == source)).first()
+        return last - timedelta(days=1) if last else None
+
+    def normalize(self, raw: dict) -> Alert:
+        """Convertir un resultado de fuente externa en una fila Alert"""
+        created_at = parse_event_date(raw.get('event_date')) or datetime.utcnow()
+        lat, lon = float(raw.get('lat', 0)), float(raw.get('lon', 0))
+        source = raw.get('source', 'EXTERNAL')
+
+        external_id = raw.get('external_id')
+        if not external_id:
+            # Las fuentes meteorológicas no tienen id: una alerta por regla, punto y día
+            digest = hashlib.sha1(
+                f"{raw.get('title', '')}|{point_key(lat, lon)}|{created_at:%Y-%m-%d}".encode()
+            ).hexdigest()[:16]
+            external_id = f"{source}:{digest}"
+
+        return Alert(
+            title=raw.get('title', 'Alerta externa'),
+            description=raw.get('description') or "",
+            lat=lat,
+            lon=lon,
+            severity=int(raw.get('severity', 2)),
+            alert_type=raw.get('alert_type', 'general'),
+            source=source,
+            external_id=external_id,
+            created_at=created_at
+        )
+
+    def persist(self, alerts, lease: Optional[str] = None) -> int:
+        """Deduplicar contra la base de datos e insertar en bloque.
+
+        Con `lease`, cada lote se confirma solo si la lease sigue siendo propia
+        (fencing): un líder reemplazado no escribe después de perderla.
+        """
+        inserted = 0
+        batch = {}
+
+        with Session(self.engine) as session:
+            for alert in alerts:
+                batch.setdefault(alert.external_id, alert)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    inserted += self._insert_batch(session, batch, lease)
+                    batch = {}
+            if batch:
+                inserted += self._insert_batch(session, batch, lease)
+
+        return inserted
+
+    def _insert_batch(self, session: Session, batch: dict, lease: Optional[str] = None) -> int:
+        for attempt in range(2):
+            existing = set(session.exec(
+                select(Alert.external_id).where(Alert.external_id.in_(list(batch)))
+            ).all())
+            new_alerts = [alert for key, alert in batch.items() if key not in existing]
+            if not new_alerts:
+                return 0
+            try:
+                if lease is not None:
+                    lease_manager.fence(lease, session)
+                session.add_all(new_alerts)
+                session.commit()
+                return len(new_alerts)
+            except IntegrityError:
+                # Otra escritura insertó el mismo external_id entre la lectura y el commit:
+                # el índice único la rechaza y se vuelve a filtrar el lote
+                session.rollback()
+                if attempt:
+                    raise
+                logging.info("🔁 Conflicto de external_id en el lote, se reintenta sin duplicados")
+
+# Instancia global
+ingestion_pipeline = IngestionPipeline()
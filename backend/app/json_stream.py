@@ -0,0 +1,50 @@
+import logging
+
+try:
+    import ijson
+except ImportError:  # sin ijson se usa el parseo completo con response.json()
+    ijson = None
+    logging.warning("ijson no está instalado: los feeds grandes se parsearán completos en memoria")
+
+def _walk(data, path):
+    """Recorrer `path` (estilo ijson: 'features.item') sobre datos ya parseados"""
+    if not path:
+        yield data
+        return
+    head, rest = path[0], path[1:]
+    if head == "item":
+        for element in data if isinstance(data, list) else []:
+            yield from _walk(element, rest)
+    elif isinstance(data, dict) and head in data:
+        yield from _walk(data[head], rest)
+
+def _raw_stream(response):
+    # Descomprimir gzip/deflate al leer del socket
+    response.raw.decode_content = True
+    return response.raw
+
+def iter_items(response, prefix: str):
+    """Objetos bajo `prefix` de uno en uno, sin materializar el documento completo"""
+    if ijson is None:
+        yield from _walk(response.json(), prefix.split("."))
+        return
+    yield from ijson.items(_raw_stream(response), prefix, use_float=True)
+
+def iter_leaves(response, prefix: str):
+    """Pares (ruta relativa, valor) de los escalares bajo `prefix`"""
+    if ijson is None:
+        def leaves(data, path):
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    yield from leaves(value, path + (key,))
+            else:
+                yield path, data
+
+        for subtree in _walk(response.json(), prefix.split(".")):
+            yield from leaves(subtree, ())
+        return
+
+    start = prefix + "."
+    for path, event, value in ijson.parse(_raw_stream(response), use_float=True):
+        if event in ("number", "string", "boolean", "null") and path.startswith(start):
+            yield tuple(path[len(start):].split(".")), value
@@ -0,0 +1,285 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import DateTime, func, inspect, type_coerce
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlmodel import select
+from .database import engine
+from .models import Lease
+
+# Configuración
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "15"))
+LEASE_HEARTBEAT_SECONDS = float(os.getenv("LEASE_HEARTBEAT_SECONDS", "5"))
+# Con LEADER_ELECTION_ENABLED=false cada proceso se considera líder (despliegue de un solo worker)
+LEADER_ELECTION_ENABLED = os.getenv("LEADER_ELECTION_ENABLED", "true").lower() == "true"
+
+class LeaseLostError(RuntimeError):
+    """La lease cambió de dueño (o venció) antes de que el líder escribiera"""
+
+class LeaseManager:
+    """Leases en la base de datos para que un solo proceso ejecute cada trabajo periódico.
+
+    Cada lease es una fila (name, holder, token, expires_at). Renovarla o tomar
+    una vencida es un UPDATE condicional, atómico en cualquier motor; si la
+    fila no existe, un INSERT que solo gana un proceso. Los vencimientos se
+    calculan y comparan con el reloj de la base, no con el de cada proceso.
+    Las escrituras del líder verifican con `fence` que su token sigue
+    vigente dentro de la misma transacción. Un hilo de latido renueva
+    las leases propias cada LEASE_HEARTBEAT_SECONDS e intenta tomar las
+    vencidas, así que si el líder muere otro proceso lo reemplaza en a lo sumo
+    LEASE_TTL_SECONDS + LEASE_HEARTBEAT_SECONDS. Al apagarse se liberan las
+    leases para que el reemplazo sea inmediato.
+    """
+
+    def __init__(self, db_engine=engine, ttl: float = LEASE_TTL_SECONDS,
+                 heartbeat: float = LEASE_HEARTBEAT_SECONDS, enabled: bool = LEADER_ELECTION_ENABLED):
+        self.engine = db_engine
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.enabled = enabled
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.names = []
+        self.scheduler = None
+        # Hasta cuándo (reloj monotónico local) este proceso puede actuar como líder
+        self._valid_until: Dict[str, float] = {}
+        # Token (fencing) con el que se tomó cada lease propia
+        self._tokens: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._table_ready = False
+
+    def ensure_table(self):
+        if self._table_ready:
+            return
+        try:
+            Lease.__table__.create(self.engine, checkfirst=True)
+        except (OperationalError, ProgrammingError, IntegrityError):
+            # Otro proceso la creó al mismo tiempo (en PostgreSQL la carrera da
+            # ProgrammingError o IntegrityError sobre el catálogo)
+            if not inspect(self.engine).has_table(Lease.__table__.name):
+                raise
+        self._table_ready = True
+
+    def db_now(self, seconds: float = 0.0):
+        """Instante actual de la base (UTC sin zona), desplazado `seconds`"""
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            # Mismo formato de texto que guarda SQLAlchemy: se compara como cadena
+            return type_coerce(func.strftime("%Y-%m-%d %H:%M:%f000", "now", f"{seconds:+.3f} seconds"), DateTime())
+        if dialect == "postgresql":
+            now = func.timezone("UTC", func.clock_timestamp())
+        elif dialect in ("mysql", "mariadb"):
+            now = func.utc_timestamp(6)
+        else:
+            now = func.current_timestamp()
+        return now + timedelta(seconds=seconds) if seconds else now
+
+    def try_acquire(self, name: str) -> Optional[bool]:
+        """Tomar o renovar la lease. None si no se obtuvo; True si se tomó de otro
+        proceso (su lease venció); False si ya era propia o es la primera vez"""
+        self.ensure_table()
+        started = time.monotonic()
+        now, expires_at = self.db_now(), self.db_now(self.ttl)
+        table = Lease.__table__
+        taken = None
+        with self.engine.begin() as connection:
+            renewed = connection.execute(
+                table.update().where(table.c.name == name, table.c.holder == self.holder)
+                .values(renewed_at=now, expires_at=expires_at)
+            ).rowcount
+            if renewed:
+                taken = False
+            elif connection.execute(
+                table.update().where(table.c.name == name, table.c.expires_at < now)
+                .values(holder=self.holder, token=table.c.token + 1, acquired_at=now,
+                        renewed_at=now, expires_at=expires_at)
+            ).rowcount:
+                taken = True
+            if taken is not None:
+                token = connection.execute(
+                    select(table.c.token).where(table.c.name == name, table.c.holder == self.holder)
+                ).scalar()
+        if taken is None:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(table.insert().values(
+                        name=name, holder=self.holder, token=1, acquired_at=now,
+                        renewed_at=now, expires_at=expires_at
+                    ))
+                taken, token = False, 1
+            except IntegrityError:
+                # Existe y tiene otro dueño vigente
+                pass
+
+        if taken is None:
+            self._valid_until.pop(name, None)
+            self._tokens.pop(name, None)
+        else:
+            # Contar desde antes de la consulta: nunca se cree líder más de lo que dura la lease
+            self._valid_until[name] = started + self.ttl
+            self._tokens[name] = token
+        return taken
+
+    def fence(self, name: str, session):
+        """Verificar, dentro de la transacción de una escritura del líder, que la
+        lease sigue siendo propia, vigente y con el mismo token.
+
+        En motores con bloqueo de filas la fila de la lease queda bloqueada
+        hasta el commit, así que nadie puede tomarla entre la verificación y la
+        escritura. Lanza LeaseLostError si el líder ya fue reemplazado.
+        """
+        if not self.enabled:
+            return
+        table = Lease.__table__
+        token = session.execute(
+            select(table.c.token)
+            .where(table.c.name == name, table.c.holder == self.holder, table.c.expires_at > self.db_now())
+            .with_for_update()
+        ).scalar()
+        if token is None or token != self._tokens.get(name):
+            self._valid_until.pop(name, None)
+            raise LeaseLostError(f"La lease {name} ya no pertenece a {self.holder}")
+
+    def release(self, name: str):
+        table = Lease.__table__
+        self._valid_until.pop(name, None)
+        self._tokens.pop(name, None)
+        with self.engine.begin() as connection:
+            connection.execute(table.update().where(table.c.name == name, table.c.holder == self.holder)
+                               .values(expires_at=self.db_now()))
+
+    def is_leader(self, name: str) -> bool:
+        if not self.enabled:
+            return True
+        return time.monotonic() < self._valid_until.get(name, 0.0)
+
+    def leader_only(self, name: str, fn: Callable) -> Callable:
+        """Envolver un trabajo periódico: en cada ciclo solo corre en el dueño de la lease.
+
+        Todos los procesos lo programan; usar como `name` el id del trabajo en
+        el programador permite adelantar el ciclo cuando se toma una lease vencida.
+        """
+        if name not in self.names:
+            self.names.append(name)
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            if not self.is_leader(name):
+                return None
+            return fn(*args, **kwargs)
+        return run
+
+    def beat(self):
+        """Un latido: renovar las leases propias e intentar tomar las vencidas"""
+        for name in self.names:
+            was_leader = self.is_leader(name)
+            try:
+                taken = self.try_acquire(name)
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo renovar la lease {name}: {e}")
+                continue
+            if taken is not None and not was_leader:
+                logging.info(f"👑 {self.holder} lidera {name}")
+                if taken:
+                    self._run_overdue(name)
+            elif taken is None and was_leader:
+                logging.warning(f"🔻 {self.holder} perdió la lease {name}")
+
+    def _run_overdue(self, name: str):
+        # El líder anterior murió: su ciclo pendiente se ejecuta ya en lugar de esperar el intervalo
+        try:
+            if self.scheduler is not None and self.scheduler.get_job(name) is not None:
+                self.scheduler.modify_job(name, next_run_time=datetime.utcnow())
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo adelantar {name}: {e}")
+
+    def start(self, scheduler=None):
+        """Primer latido (síncrono) y luego un hilo propio, independiente de los hilos del programador"""
+        self.scheduler = scheduler
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self.beat()
+        self._thread = threading.Thread(target=self._loop, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.heartbeat):
+            self.beat()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.heartbeat + 1)
+        self._thread = None
+        for name in list(self._valid_until):
+            try:
+                self.release(name)
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo liberar la lease {name}: {e}")
+
+    @contextmanager
+    def exclusive(self, name: str, poll_seconds: float = 0.5):
+        """Sección crítica entre procesos (migraciones, backfills, datos iniciales).
+
+        Espera a que la lease quede libre; mientras dura la sección un hilo la
+        renueva, y si el dueño muere a mitad, la lease vence y otro continúa.
+        """
+        if not self.enabled:
+            yield
+            return
+        waited = False
+        while self.try_acquire(name) is None:
+            if not waited:
+                logging.info(f"⏳ Esperando la lease {name}")
+                waited = True
+            time.sleep(poll_seconds)
+
+        done = threading.Event()
+
+        def keepalive():
+            while not done.wait(self.heartbeat):
+                try:
+                    self.try_acquire(name)
+                except Exception as e:
+                    logging.warning(f"⚠️ No se pudo renovar la lease {name}: {e}")
+
+        thread = threading.Thread(target=keepalive, name=f"lease-{name}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join(timeout=self.heartbeat + 1)
+            self.release(name)
+
+    def status(self) -> Dict[str, Any]:
+        leases = []
+        if self.enabled and self._table_ready:
+            table = Lease.__table__
+            with self.engine.connect() as connection:
+                for row in connection.execute(select(table, self.db_now().label("db_now"))).mappings():
+                    leases.append({
+                        "name": row["name"],
+                        "holder": row["holder"],
+                        "token": row["token"],
+                        "expires_in_s": round((row["expires_at"] - row["db_now"]).total_seconds(), 1),
+                        "mine": row["holder"] == self.holder
+                    })
+        return {
+            "enabled": self.enabled,
+            "holder": self.holder,
+            "leading": [name for name in self.names if self.is_leader(name)],
+            "leases": leases
+        }
+
+# Instancia global
+lease_manager = LeaseManager()
@@ -1,7 +1,8 @@
 import os
 import logging
-from fastapi import FastAPI, HTTPException
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from fastapi import FastAPI, HTTPException, Request, Response
+from sqlmodel import SQLModel, Field, Session, select
+from sqlalchemy import func
 from typing import Optional, List
 from pydantic import BaseModel
 from datetime import datetime
@@ -12,8 +13,11 @@ from apscheduler.schedulers.background import BackgroundScheduler
 load_dotenv()
 
 # Configuración de base de datos
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./alerts.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+from .database import DATABASE_URL, engine, ensure_columns
+
+# Ingesta de fuentes externas
+EXTERNAL_SOURCES_ENABLED = os.getenv("EXTERNAL_SOURCES_ENABLED", "true").lower() == "true"
+scheduler = BackgroundScheduler(timezone="UTC")
 
 app = FastAPI(title="Backend - Alerta Desastres")
 
@@ -28,35 +32,7 @@ app.add_middleware(
 )
 
 # ===== MODELOS =====
-class Alert(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    title: str
-    description: Optional[str] = ""
-    lat: float
-    lon: float
-    severity: int = 1
-    alert_type: str = "general"
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-
-class Zone(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
-    geojson: str
-    zone_type: str = "risk"
-
-class Shelter(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
-    lat: float
-    lon: float
-    capacity: Optional[int] = None
-    shelter_type: str = "refuge"
-
-class PushSubscription(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    endpoint: str
-    p256dh: str
-    auth: str
+from .models import Alert, Zone, Shelter, PushSubscription
 
 # ===== MODELOS PYDANTIC =====
 class AlertCreate(BaseModel):
@@ -67,18 +43,27 @@ class AlertCreate(BaseModel):
     severity: Optional[int] = 1
     alert_type: Optional[str] = "general"
 
+class OccupancyUpdate(BaseModel):
+    occupancy: int
+
 class SubscriptionCreate(BaseModel):
     endpoint: str
     keys: dict
 
 # ===== SERVICIOS =====
 from .twilio_service import twilio_service
+from .snapshot import external_snapshot, EXTERNAL_SNAPSHOT_REFRESH_SECONDS
+from .leadership import lease_manager
+# Registra el hook que mantiene los rollups al insertar alertas
+from .rollups import (BREAKDOWNS, GRANULARITIES, ROLLUP_PAGE_LIMIT, ensure_rollups, rollup_bootstrap, rollup_rows,
+                      stats_breakdown, stats_summary, stats_timeseries)
 
 # ===== FUNCIONES AUXILIARES =====
 def create_tables_safe():
     """Crear tablas manejando posibles errores"""
     try:
         SQLModel.metadata.create_all(engine)
+        ensure_columns()
         logging.info("✅ Tablas creadas exitosamente")
     except Exception as e:
         logging.error(f"❌ Error creando tablas: {e}")
@@ -163,9 +148,34 @@ def notify_all(alert: Alert):
 # ===== EVENTOS DE APLICACIÓN =====
 @app.on_event("startup")
 def on_startup():
-    create_tables_safe()
+    # Con varios workers o réplicas, uno a la vez crea tablas, reconstruye rollups y
+    # carga datos iniciales; los siguientes encuentran el trabajo hecho
+    with lease_manager.exclusive("startup"):
+        create_tables_safe()
+        ensure_rollups()
+    external_snapshot.safe_refresh()
+    # Cada worker refresca su instantánea desde la base de datos (sin tocar fuentes externas)
+    scheduler.add_job(
+        external_snapshot.safe_refresh, "interval",
+        seconds=EXTERNAL_SNAPSHOT_REFRESH_SECONDS,
+        id="external_snapshot", max_instances=1, coalesce=True, replace_existing=True
+    )
+    if EXTERNAL_SOURCES_ENABLED:
+        from .ingestion import ingestion_pipeline
+        ingestion_pipeline.listeners.append(external_snapshot.safe_refresh)
+        # Todos los workers programan la ingesta, pero cada ciclo solo corre en el líder de la fuente
+        ingestion_pipeline.schedule(scheduler)
+    lease_manager.start(scheduler)
+    scheduler.start()
     logging.info("✅ Backend iniciado correctamente")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    # Liberar las leases para que otro worker tome el relevo sin esperar a que venzan
+    lease_manager.stop()
+
 # ===== ENDPOINTS =====
 @app.get("/")
 def read_root():
@@ -187,9 +197,30 @@ def health_check():
             "zones": zone_count,
             "shelters": shelter_count
         },
+        # Qué proceso ejecuta cada trabajo en segundo plano
+        "leadership": lease_manager.status(),
         "version": "2.0.0"
     }
 
+@app.get("/data-version")
+def get_data_version():
+    """Versión barata de los datos: cambia cuando se insertan alertas, zonas o refugios
+    o cuando cambia la ocupación de un refugio"""
+    with Session(engine) as session:
+        counters = {}
+        for name, model in (("alerts", Alert), ("zones", Zone), ("shelters", Shelter)):
+            count, max_id = session.exec(select(func.count(model.id), func.max(model.id))).one()
+            counters[name] = {"count": count, "max_id": max_id or 0}
+        shelters_updated = session.exec(select(func.max(Shelter.updated_at))).one()
+        # Versión mínima de /external-alerts que corresponde a estos datos
+        external_max_id = session.exec(select(func.max(Alert.id)).where(Alert.source != "manual")).one()
+
+    version = "-".join(f"{c['max_id']}.{c['count']}" for c in counters.values())
+    if shelters_updated is not None:
+        counters["shelters"]["updated_at"] = shelters_updated.isoformat()
+        version += f"-{int(shelters_updated.timestamp() * 1000)}"
+    return {"version": version, **counters, "external": {"max_id": external_max_id or 0}}
+
 @app.get("/twilio-status")
 def get_twilio_status():
     """Verificar estado de Twilio"""
@@ -213,6 +244,80 @@ def list_alerts(limit: int = 100):
         logging.error(f"❌ Error obteniendo alertas: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+@app.get("/alerts/changes")
+def list_alert_changes(since_id: int = 0, limit: int = 1000):
+    """Feed de cambios: alertas con id > since_id en orden de inserción"""
+    limit = max(1, min(limit, 10000))
+    try:
+        with Session(engine) as session:
+            alerts = session.exec(
+                select(Alert).where(Alert.id > since_id).order_by(Alert.id).limit(limit + 1)
+            ).all()
+            # max_id permite al consumidor detectar un reinicio de la base de datos
+            max_id = session.exec(select(func.max(Alert.id))).one() or 0
+    except Exception as e:
+        logging.error(f"❌ Error obteniendo cambios de alertas: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+    has_more = len(alerts) > limit
+    alerts = alerts[:limit]
+    return {
+        "alerts": [alert.model_dump(mode="json") for alert in alerts],
+        "last_id": alerts[-1].id if alerts else since_id,
+        "max_id": max_id,
+        "has_more": has_more
+    }
+
+# ===== ESTADÍSTICAS (sobre rollups) =====
+def _check_granularity(granularity: str):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity debe ser uno de {list(GRANULARITIES)}")
+
+@app.get("/stats/summary")
+def get_stats_summary():
+    """Totales del histórico completo a costo constante"""
+    with Session(engine) as session:
+        return stats_summary(session)
+
+@app.get("/stats/timeseries")
+def get_stats_timeseries(granularity: str = "day", since: Optional[datetime] = None,
+                         until: Optional[datetime] = None, zone: Optional[str] = None,
+                         alert_type: Optional[str] = None, min_severity: Optional[int] = None):
+    """Conteo de alertas por hora o por día"""
+    _check_granularity(granularity)
+    with Session(engine) as session:
+        return stats_timeseries(session, granularity, since=since, until=until, zone=zone,
+                                alert_type=alert_type, min_severity=min_severity)
+
+@app.get("/stats/breakdown")
+def get_stats_breakdown(by: str = "alert_type", since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, zone: Optional[str] = None,
+                        alert_type: Optional[str] = None, min_severity: Optional[int] = None):
+    """Conteo agrupado por zona, tipo, severidad, hora del día o mes"""
+    if by not in BREAKDOWNS:
+        raise HTTPException(status_code=400, detail=f"by debe ser uno de {list(BREAKDOWNS)}")
+    with Session(engine) as session:
+        return stats_breakdown(session, by, since=since, until=until, zone=zone,
+                               alert_type=alert_type, min_severity=min_severity)
+
+@app.get("/stats/rollups")
+def get_stats_rollups(granularity: str = "hour", since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, limit: int = ROLLUP_PAGE_LIMIT):
+    """Filas de rollup con el id de alerta hasta el que están al día, paginadas
+    por cubetas completas (la siguiente página empieza en next_since)"""
+    _check_granularity(granularity)
+    limit = max(1, min(limit, ROLLUP_PAGE_LIMIT))
+    with Session(engine) as session:
+        return rollup_rows(session, granularity, since, until, limit)
+
+@app.get("/stats/rollups/bootstrap")
+def get_stats_rollups_bootstrap(recent_hours: int = 48):
+    """Rollups diarios del histórico más los horarios recientes (para arrancar
+    consumidores sin recorrer todas las alertas ni todas las horas)"""
+    recent_hours = max(1, min(recent_hours, 24 * 31))
+    with Session(engine) as session:
+        return rollup_bootstrap(session, recent_hours)
+
 @app.post("/alerts", response_model=Alert, status_code=201)
 def create_alert(alert_data: AlertCreate):
     """Crear una nueva alerta"""
@@ -251,6 +356,41 @@ def create_alert(alert_data: AlertCreate):
         logging.error(f"❌ Error creando alerta: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@app.get("/external-alerts")
+def get_external_alerts(request: Request, min_version: int = 0):
+    """Alertas externas servidas desde la instantánea en memoria.
+
+    `min_version` (el `external.max_id` de /data-version) obliga a reconstruirla
+    si este worker todavía no vio las alertas que ingirió otro.
+    """
+    snapshot = external_snapshot.current(max(min_version, 0))
+    headers = {
+        "ETag": snapshot.etag,
+        "X-Snapshot-Version": str(snapshot.version),
+        "X-Generated-At": snapshot.generated_at,
+        "Cache-Control": f"public, max-age={EXTERNAL_SNAPSHOT_REFRESH_SECONDS}"
+    }
+
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/external-sources/status")
+def get_external_sources_status():
+    """Estado de los circuit breakers y del último ciclo de cada fuente externa"""
+    from .external_data import external_fetcher
+    from .ingestion import ingestion_pipeline
+
+    breakers = external_fetcher.sources_status()
+    return {
+        "sources": {
+            source: {**status, "last_run": ingestion_pipeline.last_runs.get(source)}
+            for source, status in breakers.items()
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @app.get("/zones", response_model=List[Zone])
 def get_zones():
     """Obtener todas las zonas"""
@@ -263,6 +403,23 @@ def get_shelters():
     with Session(engine) as session:
         return session.exec(select(Shelter)).all()
 
+@app.put("/shelters/{shelter_id}/occupancy", response_model=Shelter)
+def update_shelter_occupancy(shelter_id: int, update: OccupancyUpdate):
+    """Actualizar la ocupación actual de un refugio"""
+    if update.occupancy < 0:
+        raise HTTPException(status_code=400, detail="La ocupación no puede ser negativa")
+    with Session(engine) as session:
+        shelter = session.get(Shelter, shelter_id)
+        if shelter is None:
+            raise HTTPException(status_code=404, detail="Refugio no encontrado")
+        shelter.occupancy = update.occupancy
+        shelter.updated_at = datetime.utcnow()
+        session.add(shelter)
+        session.commit()
+        session.refresh(shelter)
+        logging.info(f"🏠 Ocupación de refugio {shelter_id}: {shelter.occupancy}/{shelter.capacity}")
+        return shelter
+
 @app.post("/subscribe", status_code=201)
 def subscribe(subscription: SubscriptionCreate):
     """Guardar suscripción para notificaciones push"""
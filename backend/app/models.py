@@ -5,15 +5,61 @@ from datetime import datetime
 class Alert(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
-    description: str
-    severity: int
+    description: Optional[str] = ""
     lat: float
     lon: float
-    source: str
+    severity: int = 1
+    alert_type: str = "general"
+    source: str = Field(default="manual", index=True)
+    external_id: Optional[str] = Field(default=None, unique=True, index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class Zone(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    geojson: str
+    zone_type: str = "risk"
+
+class Shelter(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    lat: float
+    lon: float
+    capacity: Optional[int] = None
+    shelter_type: str = "refuge"
+    # Personas alojadas actualmente; la capacidad restante es capacity - occupancy
+    occupancy: int = 0
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
 class PushSubscription(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     endpoint: str
     p256dh: str
     auth: str
+
+class AlertRollup(SQLModel, table=True):
+    """Conteo de alertas por cubeta de tiempo (hora o día), zona, tipo y severidad.
+
+    Se actualiza en la misma transacción que inserta las alertas; last_alert_id
+    permite leer los conteos junto con el id hasta el que están al día.
+    """
+    granularity: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+    zone: str = Field(primary_key=True)
+    alert_type: str = Field(primary_key=True)
+    severity: int = Field(primary_key=True)
+    count: int = 0
+    last_alert_id: int = 0
+
+class Lease(SQLModel, table=True):
+    """Liderazgo de un trabajo en segundo plano: solo `holder` lo ejecuta hasta expires_at.
+
+    token aumenta cada vez que la lease cambia de dueño; las escrituras del líder
+    lo verifican (fencing token, ver LeaseManager.fence).
+    """
+    name: str = Field(primary_key=True)
+    holder: str
+    token: int = 1
+    acquired_at: datetime = Field(default_factory=datetime.utcnow)
+    renewed_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
@@ -0,0 +1,125 @@
+import os
+import json
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+# Configuración de la malla de monitoreo (lat_min,lon_min,lat_max,lon_max)
+WEATHER_GRID_BBOX = os.getenv("WEATHER_GRID_BBOX", "13.7,-92.3,17.9,-88.2")
+WEATHER_GRID_STEP = float(os.getenv("WEATHER_GRID_STEP", "0.5"))
+# Decimales usados para fusionar puntos casi idénticos (0.05° ~ celda de Open-Meteo)
+WEATHER_POINT_PRECISION = int(os.getenv("WEATHER_POINT_PRECISION", "2"))
+
+DEFAULT_POINT = (14.625, -90.525)  # Ciudad de Guatemala
+
+@dataclass(frozen=True)
+class MonitoringPoint:
+    key: str
+    lat: float
+    lon: float
+    kind: str  # "zone", "shelter" o "grid"
+    name: str = ""
+
+def point_key(lat: float, lon: float) -> str:
+    """Clave estable de un punto redondeado a la precisión configurada"""
+    return f"{lat:.{WEATHER_POINT_PRECISION}f},{lon:.{WEATHER_POINT_PRECISION}f}"
+
+def polygon_centroid(ring: List[List[float]]) -> Optional[Tuple[float, float]]:
+    """Centroide (lat, lon) de un anillo GeoJSON [[lon, lat], ...]"""
+    if not ring:
+        return None
+
+    area = cx = cy = 0.0
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+        cross = x0 * y1 - x1 * y0
+        area += cross
+        cx += (x0 + x1) * cross
+        cy += (y0 + y1) * cross
+
+    if abs(area) < 1e-12:
+        # Polígono degenerado: usar el promedio de vértices
+        lon = sum(p[0] for p in ring) / len(ring)
+        lat = sum(p[1] for p in ring) / len(ring)
+        return lat, lon
+
+    area *= 0.5
+    return cy / (6 * area), cx / (6 * area)
+
+def geojson_centroid(geojson: str) -> Optional[Tuple[float, float]]:
+    """Centroide de la primera geometría de un GeoJSON (Feature/FeatureCollection/Geometry)"""
+    try:
+        data = json.loads(geojson) if isinstance(geojson, str) else geojson
+    except (TypeError, ValueError):
+        return None
+
+    if data.get("type") == "FeatureCollection":
+        features = data.get("features") or []
+        data = features[0] if features else {}
+    if data.get("type") == "Feature":
+        data = data.get("geometry") or {}
+
+    geom_type = data.get("type")
+    coords = data.get("coordinates") or []
+    if geom_type == "Point" and len(coords) >= 2:
+        return coords[1], coords[0]
+    if geom_type == "Polygon" and coords:
+        return polygon_centroid(coords[0])
+    if geom_type == "MultiPolygon" and coords and coords[0]:
+        return polygon_centroid(coords[0][0])
+    return None
+
+def grid_points(bbox: str = WEATHER_GRID_BBOX, step: float = WEATHER_GRID_STEP) -> List[MonitoringPoint]:
+    """Malla regular de puntos dentro del bbox configurado"""
+    if not bbox or step <= 0:
+        return []
+    try:
+        lat_min, lon_min, lat_max, lon_max = (float(v) for v in bbox.split(","))
+    except ValueError:
+        logging.error(f"WEATHER_GRID_BBOX inválido: {bbox}")
+        return []
+
+    points = []
+    rows = int((lat_max - lat_min) / step) + 1
+    cols = int((lon_max - lon_min) / step) + 1
+    for i in range(rows):
+        for j in range(cols):
+            lat = round(lat_min + i * step, 6)
+            lon = round(lon_min + j * step, 6)
+            points.append(MonitoringPoint(point_key(lat, lon), lat, lon, "grid"))
+    return points
+
+def build_point_registry(zones: Iterable = (), shelters: Iterable = (), include_grid: bool = True) -> List[MonitoringPoint]:
+    """Registro de puntos: centroides de zonas, refugios y malla, sin duplicados"""
+    registry = {}
+
+    def add(point: MonitoringPoint):
+        # El primer punto gana: zonas y refugios tienen prioridad sobre la malla
+        registry.setdefault(point.key, point)
+
+    for zone in zones:
+        centroid = geojson_centroid(zone.geojson)
+        if centroid:
+            lat, lon = centroid
+            add(MonitoringPoint(point_key(lat, lon), lat, lon, "zone", zone.name))
+
+    for shelter in shelters:
+        add(MonitoringPoint(point_key(shelter.lat, shelter.lon), shelter.lat, shelter.lon, "shelter", shelter.name))
+
+    if include_grid:
+        for point in grid_points():
+            add(point)
+
+    if not registry:
+        lat, lon = DEFAULT_POINT
+        add(MonitoringPoint(point_key(lat, lon), lat, lon, "grid", "Ciudad de Guatemala"))
+
+    return list(registry.values())
+
+def load_point_registry(session, include_grid: bool = True) -> List[MonitoringPoint]:
+    """Construir el registro a partir de las zonas y refugios de la base de datos"""
+    from sqlmodel import select
+    from .models import Zone, Shelter
+
+    zones = session.exec(select(Zone)).all()
+    shelters = session.exec(select(Shelter)).all()
+    return build_point_registry(zones, shelters, include_grid=include_grid)
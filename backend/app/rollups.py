@@ -0,0 +1,272 @@
+import os
+import math
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import case, event, extract, func, delete
+from sqlmodel import Session, select
+from .database import engine
+from .models import Alert, AlertRollup
+
+# Configuración: tamaño de celda de las zonas en grados
+ROLLUP_CELL_DEG = float(os.getenv("ROLLUP_CELL_DEG", "0.5"))
+ROLLUP_BACKFILL_BATCH = int(os.getenv("ROLLUP_BACKFILL_BATCH", "5000"))
+# Filas por página de /stats/rollups
+ROLLUP_PAGE_LIMIT = int(os.getenv("ROLLUP_PAGE_LIMIT", "10000"))
+
+GRANULARITIES = ("hour", "day")
+KEY_COLUMNS = ["granularity", "bucket", "zone", "alert_type", "severity"]
+BREAKDOWNS = ("zone", "alert_type", "severity", "hour_of_day", "month")
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def zone_key(lat: Optional[float], lon: Optional[float], cell_deg: float = ROLLUP_CELL_DEG) -> str:
+    """Centro de la celda que contiene el punto, como 'lat,lon'"""
+    center = lambda value: (math.floor((value or 0) / cell_deg) + 0.5) * cell_deg
+    return f"{center(lat):.3f},{center(lon):.3f}"
+
+def rollup_deltas(alerts: Iterable[Tuple[int, datetime, float, float, str, int]]) -> Dict[tuple, List[int]]:
+    """(id, created_at, lat, lon, alert_type, severity) -> {clave: [conteo, último id]}"""
+    deltas: Dict[tuple, List[int]] = {}
+    for alert_id, created_at, lat, lon, alert_type, severity in alerts:
+        created_at = created_at or datetime.utcnow()
+        zone = zone_key(lat, lon)
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(created_at, granularity), zone, alert_type or "general", severity or 1)
+            delta = deltas.setdefault(key, [0, 0])
+            delta[0] += 1
+            delta[1] = max(delta[1], alert_id or 0)
+    return deltas
+
+def _rows(deltas: Dict[tuple, List[int]]) -> List[Dict[str, Any]]:
+    return [dict(zip(KEY_COLUMNS, key), count=count, last_alert_id=last_id)
+            for key, (count, last_id) in deltas.items()]
+
+def upsert_deltas(connection, deltas: Dict[tuple, List[int]]):
+    """Sumar conteos a las filas de rollup (INSERT ... ON CONFLICT DO UPDATE)"""
+    if not deltas:
+        return
+    table = AlertRollup.__table__
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        _upsert_generic(connection, deltas)
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=KEY_COLUMNS, set_={
+        "count": table.c.count + stmt.excluded.count,
+        "last_alert_id": case(
+            (stmt.excluded.last_alert_id > table.c.last_alert_id, stmt.excluded.last_alert_id),
+            else_=table.c.last_alert_id
+        )
+    })
+    connection.execute(stmt, _rows(deltas))
+
+def _upsert_generic(connection, deltas: Dict[tuple, List[int]]):
+    """Otros motores: UPDATE y, si no existe la fila, INSERT"""
+    table = AlertRollup.__table__
+    for row in _rows(deltas):
+        where = [table.c[column] == row[column] for column in KEY_COLUMNS]
+        updated = connection.execute(table.update().where(*where).values(
+            count=table.c.count + row["count"],
+            last_alert_id=case(
+                (table.c.last_alert_id < row["last_alert_id"], row["last_alert_id"]),
+                else_=table.c.last_alert_id
+            )
+        ))
+        if not updated.rowcount:
+            connection.execute(table.insert().values(**row))
+
+@event.listens_for(Session, "after_flush")
+def _rollup_new_alerts(session, flush_context):
+    """Toda alerta insertada (API, ingesta, otros fetchers) actualiza los rollups
+    en la misma transacción; si se hace rollback, los conteos también se revierten"""
+    new_alerts = [obj for obj in session.new if isinstance(obj, Alert)]
+    if not new_alerts:
+        return
+    deltas = rollup_deltas(
+        (a.id, a.created_at, a.lat, a.lon, a.alert_type, a.severity) for a in new_alerts
+    )
+    upsert_deltas(session.connection(), deltas)
+
+def rebuild_rollups(db_engine=engine) -> int:
+    """Recalcular los rollups desde la tabla de alertas (backfill)"""
+    columns = (Alert.id, Alert.created_at, Alert.lat, Alert.lon, Alert.alert_type, Alert.severity)
+    deltas: Dict[tuple, List[int]] = {}
+    total = 0
+    with db_engine.begin() as connection:
+        connection.execute(delete(AlertRollup))
+        last_id = 0
+        # Paginado por id para no cargar todas las alertas a la vez
+        while True:
+            batch = connection.execute(
+                select(*columns).where(Alert.id > last_id).order_by(Alert.id).limit(ROLLUP_BACKFILL_BATCH)
+            ).all()
+            if not batch:
+                break
+            for key, (count, batch_last) in rollup_deltas(batch).items():
+                delta = deltas.setdefault(key, [0, 0])
+                delta[0] += count
+                delta[1] = max(delta[1], batch_last)
+            total += len(batch)
+            last_id = batch[-1][0]
+        upsert_deltas(connection, deltas)
+    return total
+
+def ensure_rollups(db_engine=engine):
+    """Hacer backfill si los rollups no coinciden con las alertas (base existente
+    o alertas insertadas por versiones anteriores)"""
+    with Session(db_engine) as session:
+        alerts, max_id = session.exec(select(func.count(Alert.id), func.max(Alert.id))).one()
+        counted, counted_max = session.exec(
+            select(func.sum(AlertRollup.count), func.max(AlertRollup.last_alert_id))
+            .where(AlertRollup.granularity == "day")
+        ).one()
+    if (alerts or 0) == (counted or 0) and (max_id or 0) == (counted_max or 0):
+        return
+    logging.info(f"🔧 Reconstruyendo rollups de alertas ({alerts} alertas, {counted or 0} contadas)")
+    total = rebuild_rollups(db_engine)
+    logging.info(f"✅ Rollups reconstruidos con {total} alertas")
+
+# Consultas (GROUP BY sobre los rollups, independientes del número de alertas)
+
+def _filtered(query, granularity: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              zone: Optional[str] = None, alert_type: Optional[str] = None, min_severity: Optional[int] = None):
+    query = query.where(AlertRollup.granularity == granularity)
+    if since is not None:
+        query = query.where(AlertRollup.bucket >= bucket_start(since, granularity))
+    if until is not None:
+        query = query.where(AlertRollup.bucket < until)
+    if zone is not None:
+        query = query.where(AlertRollup.zone == zone)
+    if alert_type is not None:
+        query = query.where(AlertRollup.alert_type == alert_type)
+    if min_severity is not None:
+        query = query.where(AlertRollup.severity >= min_severity)
+    return query
+
+def stats_timeseries(session: Session, granularity: str = "day", **filters) -> List[Dict[str, Any]]:
+    """Conteo y severidad total por cubeta de tiempo"""
+    query = _filtered(select(
+        AlertRollup.bucket,
+        func.sum(AlertRollup.count),
+        func.sum(AlertRollup.count * AlertRollup.severity)
+    ), granularity, **filters).group_by(AlertRollup.bucket).order_by(AlertRollup.bucket)
+    return [
+        {"bucket": bucket.isoformat(), "count": count, "severity_sum": severity_sum}
+        for bucket, count, severity_sum in session.exec(query).all()
+    ]
+
+def stats_breakdown(session: Session, by: str, **filters) -> List[Dict[str, Any]]:
+    """Conteo agrupado por zona, tipo, severidad, hora del día o mes"""
+    granularity = "hour" if by == "hour_of_day" else "day"
+    dimension = {
+        "zone": AlertRollup.zone,
+        "alert_type": AlertRollup.alert_type,
+        "severity": AlertRollup.severity,
+        "hour_of_day": extract("hour", AlertRollup.bucket),
+        "month": extract("month", AlertRollup.bucket),
+    }[by]
+    count = func.sum(AlertRollup.count)
+    query = _filtered(select(
+        dimension, count, func.sum(AlertRollup.count * AlertRollup.severity)
+    ), granularity, **filters).group_by(dimension).order_by(count.desc())
+    return [
+        {by: value, "count": total, "avg_severity": round(severity_sum / total, 3) if total else 0}
+        for value, total, severity_sum in session.exec(query).all()
+    ]
+
+def stats_summary(session: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Totales del histórico completo y de las últimas 24 horas / 7 días"""
+    now = now or datetime.utcnow()
+    by_severity = {row["severity"]: row["count"] for row in stats_breakdown(session, "severity")}
+    by_type = {row["alert_type"]: row["count"] for row in stats_breakdown(session, "alert_type")}
+    total = sum(by_severity.values())
+    severity_sum = sum(severity * count for severity, count in by_severity.items())
+
+    def window_count(granularity: str, since: datetime) -> int:
+        query = _filtered(select(func.sum(AlertRollup.count)), granularity, since=since)
+        return session.exec(query).one() or 0
+
+    first, last, last_id = session.exec(
+        select(func.min(AlertRollup.bucket), func.max(AlertRollup.bucket), func.max(AlertRollup.last_alert_id))
+        .where(AlertRollup.granularity == "day")
+    ).one()
+    return {
+        "total_alerts": total,
+        "avg_severity": severity_sum / total if total else 0,
+        "high_severity": sum(count for severity, count in by_severity.items() if severity >= 3),
+        "by_severity": by_severity,
+        "by_type": by_type,
+        "last_24h": window_count("hour", now - timedelta(hours=23)),
+        "last_7d": window_count("day", now - timedelta(days=6)),
+        "first_day": first.isoformat() if first else None,
+        "last_day": last.isoformat() if last else None,
+        "last_alert_id": last_id or 0,
+        "cell_deg": ROLLUP_CELL_DEG
+    }
+
+def _rollup_row(row: AlertRollup) -> Dict[str, Any]:
+    return {"bucket": row.bucket.isoformat(), "zone": row.zone, "alert_type": row.alert_type,
+            "severity": row.severity, "count": row.count}
+
+def rollup_rows(session: Session, granularity: str = "hour", since: Optional[datetime] = None,
+                until: Optional[datetime] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Filas de rollup en orden de tiempo, con el id de alerta hasta el que están al día.
+
+    Sin `limit` se leen en una sola consulta, así que last_alert_id es
+    consistente con los conteos. Con `limit` se devuelven cubetas completas
+    (una cubeta más grande que el límite va entera) y `next_since` es la
+    primera cubeta de la página siguiente.
+    """
+    query = _filtered(select(AlertRollup), granularity, since=since, until=until).order_by(
+        AlertRollup.bucket, AlertRollup.zone, AlertRollup.alert_type, AlertRollup.severity)
+    rows = session.exec(query.limit(limit + 1) if limit else query).all()
+    next_since = None
+    if limit and len(rows) > limit:
+        next_since = rows[limit].bucket
+        if rows[0].bucket == next_since:
+            # La primera cubeta no cabe en el límite: se entrega entera
+            rows = session.exec(query.where(AlertRollup.bucket == next_since)).all()
+            next_since = session.exec(_filtered(select(func.min(AlertRollup.bucket)), granularity, until=until)
+                                      .where(AlertRollup.bucket > rows[0].bucket)).one()
+        else:
+            rows = [row for row in rows[:limit] if row.bucket < next_since]
+    return {
+        "granularity": granularity,
+        "cell_deg": ROLLUP_CELL_DEG,
+        "last_alert_id": max((row.last_alert_id for row in rows), default=0),
+        "rows": [_rollup_row(row) for row in rows],
+        "has_more": next_since is not None,
+        "next_since": next_since.isoformat() if next_since else None
+    }
+
+def rollup_bootstrap(session: Session, recent_hours: int = 48, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Arranque de consumidores: rollups diarios del histórico y horarios solo de
+    las últimas `recent_hours` horas (desde el inicio de ese día).
+
+    La distribución por hora del día del tramo diario va agregada en
+    `hour_of_day`. Todo se lee en la misma sesión, y last_alert_id sale de las
+    filas devueltas (cubren el histórico completo).
+    """
+    now = now or datetime.utcnow()
+    cutoff = bucket_start(now - timedelta(hours=recent_hours), "day")
+    days = session.exec(_filtered(select(AlertRollup), "day", until=cutoff).order_by(AlertRollup.bucket)).all()
+    hours = session.exec(_filtered(select(AlertRollup), "hour", since=cutoff).order_by(AlertRollup.bucket)).all()
+    hour_of_day = [0] * 24
+    for row in stats_breakdown(session, "hour_of_day", until=cutoff):
+        hour_of_day[int(row["hour_of_day"])] = row["count"]
+    return {
+        "cell_deg": ROLLUP_CELL_DEG,
+        "since": cutoff.isoformat(),
+        "last_alert_id": max((row.last_alert_id for row in (*days, *hours)), default=0),
+        "days": [_rollup_row(row) for row in days],
+        "hours": [_rollup_row(row) for row in hours],
+        "hour_of_day": hour_of_day
+    }
@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import func
+from sqlmodel import Session, select
+from .database import engine
+from .models import Alert
+
+EXTERNAL_SNAPSHOT_LIMIT = int(os.getenv("EXTERNAL_SNAPSHOT_LIMIT", "200"))
+EXTERNAL_SNAPSHOT_REFRESH_SECONDS = int(os.getenv("EXTERNAL_SNAPSHOT_REFRESH_SECONDS", "60"))
+
+@dataclass(frozen=True)
+class Snapshot:
+    body: bytes
+    etag: str
+    version: int
+    generated_at: str
+    count: int
+
+class ExternalAlertsSnapshot:
+    """Respuesta de /external-alerts precalculada y reemplazada de forma atómica"""
+
+    def __init__(self, db_engine=engine, limit: int = EXTERNAL_SNAPSHOT_LIMIT):
+        self.engine = db_engine
+        self.limit = limit
+        self._current = None
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self) -> Snapshot:
+        """Reconstruir la instantánea desde la base de datos"""
+        with self._refresh_lock:
+            with Session(self.engine) as session:
+                # La versión es el id externo más alto de la base: igual en todos los workers
+                # y comparable con el que informa /data-version
+                version = session.exec(select(func.max(Alert.id)).where(Alert.source != "manual")).one() or 0
+                alerts = session.exec(
+                    select(Alert)
+                    .where(Alert.source != "manual")
+                    .order_by(Alert.created_at.desc())
+                    .limit(self.limit)
+                ).all()
+
+            alerts_json = [alert.model_dump(mode="json") for alert in alerts]
+            # La versión va en el cuerpo: también en el ETag
+            digest = hashlib.sha1(json.dumps([version, alerts_json], sort_keys=True).encode()).hexdigest()
+
+            previous = self._current
+            if previous is not None and previous.etag == f'"{digest}"':
+                # Sin cambios: conservar la instantánea y su generated_at
+                return previous
+
+            generated_at = datetime.utcnow().isoformat()
+            body = json.dumps({
+                "success": True,
+                "version": version,
+                "generated_at": generated_at,
+                "count": len(alerts_json),
+                "alerts": alerts_json
+            }, ensure_ascii=False).encode("utf-8")
+
+            snapshot = Snapshot(body, f'"{digest}"', version, generated_at, len(alerts_json))
+            self._current = snapshot  # asignación atómica: los lectores ven la vieja o la nueva
+            logging.info(f"📸 Instantánea de alertas externas v{version} ({len(alerts_json)} alertas)")
+            return snapshot
+
+    def safe_refresh(self):
+        """Refresco para el programador: un fallo conserva la instantánea anterior"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"❌ Error refrescando instantánea externa: {e}")
+
+    def current(self, min_version: int = 0) -> Snapshot:
+        """Instantánea vigente; se reconstruye si es anterior a `min_version`
+        (otro worker ya publicó alertas que esta todavía no incluye)"""
+        snapshot = self._current
+        if snapshot is None or snapshot.version < min_version:
+            return self.refresh()
+        return snapshot
+
+# Instancia global
+external_snapshot = ExternalAlertsSnapshot()
@@ -0,0 +1,150 @@
+import os
+import json
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import numpy as np
+
+NASA_POWER_STORE_DIR = os.getenv("NASA_POWER_STORE_DIR", "./data/nasa_power")
+
+DAY_FORMAT = "%Y%m%d"
+DTYPE = np.float32
+
+def parse_day(value: str) -> date:
+    return datetime.strptime(value, DAY_FORMAT).date()
+
+class TimeSeriesStore:
+    """Series diarias por punto y parámetro en archivos float32 mapeados en memoria.
+
+    Cada punto tiene un directorio con un archivo binario por parámetro y un
+    meta.json con el primer día y la cantidad de días. Todos los parámetros de
+    un punto comparten el mismo rango, así que el índice de un día es común.
+    """
+
+    def __init__(self, root: str = NASA_POWER_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _point_dir(self, key: str) -> str:
+        return os.path.join(self.root, key.replace(",", "_"))
+
+    def _meta(self, key: str) -> Optional[dict]:
+        path = os.path.join(self._point_dir(key), "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def last_day(self, key: str) -> Optional[date]:
+        """Último día almacenado para un punto"""
+        meta = self._meta(key)
+        if not meta or not meta["days"]:
+            return None
+        return parse_day(meta["start"]) + timedelta(days=meta["days"] - 1)
+
+    def append(self, key: str, start: date, values: Dict[str, np.ndarray]):
+        """Agregar días contiguos al final de la serie (los huecos quedan como NaN)"""
+        lengths = {len(v) for v in values.values()}
+        if len(lengths) != 1:
+            raise ValueError("Todos los parámetros deben tener la misma cantidad de días")
+        count = lengths.pop()
+        if count == 0:
+            return
+
+        with self._lock:
+            point_dir = self._point_dir(key)
+            os.makedirs(point_dir, exist_ok=True)
+            meta = self._meta(key) or {"start": start.strftime(DAY_FORMAT), "days": 0, "parameters": []}
+            first = parse_day(meta["start"])
+            offset = (start - first).days
+
+            if offset < meta["days"]:
+                # Días ya almacenados: descartar el solape
+                skip = meta["days"] - offset
+                values = {p: v[skip:] for p, v in values.items()}
+                count -= skip
+                offset = meta["days"]
+                if count <= 0:
+                    return
+            gap = offset - meta["days"]
+
+            parameters = sorted(set(meta["parameters"]) | set(values))
+            for parameter in parameters:
+                path = os.path.join(point_dir, f"{parameter}.f32")
+                existing = os.path.getsize(path) // DTYPE().itemsize if os.path.exists(path) else 0
+                # Un parámetro nuevo se rellena con NaN hasta alinearse con los demás
+                padding = meta["days"] + gap - existing
+                series = values.get(parameter)
+                if series is None:
+                    series = np.full(count, np.nan)
+                with open(path, "ab") as f:
+                    if padding > 0:
+                        np.full(padding, np.nan, dtype=DTYPE).tofile(f)
+                    np.asarray(series, dtype=DTYPE).tofile(f)
+
+            meta["days"] = offset + count
+            meta["parameters"] = parameters
+            tmp_path = os.path.join(point_dir, "meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, os.path.join(point_dir, "meta.json"))
+
+    def read(self, key: str, parameter: str, days: Optional[int] = None) -> np.ndarray:
+        """Últimos `days` valores de un parámetro como vista mapeada en memoria"""
+        meta = self._meta(key)
+        path = os.path.join(self._point_dir(key), f"{parameter}.f32")
+        if not meta or not os.path.exists(path) or meta["days"] == 0:
+            return np.empty(0, dtype=DTYPE)
+
+        series = np.memmap(path, dtype=DTYPE, mode="r", shape=(meta["days"],))
+        return series[-days:] if days else series
+
+def window_mean(series: np.ndarray, window: int) -> float:
+    """Media de los últimos `window` días ignorando huecos"""
+    tail = series[-window:]
+    if tail.size == 0 or np.isnan(tail).all():
+        return float("nan")
+    return float(np.nanmean(tail))
+
+def rolling_mean(series: np.ndarray, window: int) -> np.ndarray:
+    """Media móvil vectorizada (suma acumulada) que ignora NaN"""
+    values = np.nan_to_num(series, nan=0.0).astype(np.float64)
+    valid = (~np.isnan(series)).astype(np.float64)
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    ccount = np.concatenate(([0.0], np.cumsum(valid)))
+    sums = csum[window:] - csum[:-window]
+    counts = ccount[window:] - ccount[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def climatology(series: np.ndarray, window: int = 30, years: int = 3) -> float:
+    """Media de la misma ventana del calendario en años anteriores (ignorando huecos).
+
+    La ventana de los últimos `window` días se desplaza un año (365,25 días
+    redondeados) por cada año anterior disponible en la serie.
+    """
+    windows = []
+    for year in range(1, years + 1):
+        end = series.size - round(365.25 * year)
+        if end < window:
+            break
+        windows.append(series[end - window:end])
+    if not windows:
+        return float("nan")
+    values = np.concatenate(windows)
+    if np.isnan(values).all():
+        return float("nan")
+    return float(np.nanmean(values))
+
+def anomaly(series: np.ndarray, window: int = 30, years: int = 3) -> float:
+    """Diferencia entre la media reciente y la climatología de la misma época.
+
+    NaN si la serie aún no cubre la ventana en al menos un año anterior.
+    """
+    if series.size < window:
+        return float("nan")
+    return window_mean(series, window) - climatology(series, window, years)
+
+# Instancia global
+nasa_power_store = TimeSeriesStore()
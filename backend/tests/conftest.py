@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Las pruebas importan el paquete `app` del servicio (ejecutar desde backend/: python -m pytest tests)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,71 @@
+import io
+import json
+import pytest
+import requests
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.external_data import ExternalDataFetcher
+
+class Body(io.BytesIO):
+    """Cuerpo de respuesta en streaming (requests marca decode_content al leerlo)"""
+    decode_content = False
+
+def response(status: int, body: bytes) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    result.raw = Body(body)
+    return result
+
+FEED = json.dumps({"features": [
+    {"properties": {"eventtype": "EQ", "name": "Sismo", "alertlevel": "Orange", "eventid": 1, "episodeid": 1,
+                    "fromdate": "2024-05-01T00:00:00"},
+     "geometry": {"coordinates": [-90.5, 14.6]}}
+]}).encode()
+
+@pytest.fixture
+def fetcher(monkeypatch):
+    fetcher = ExternalDataFetcher()
+    fetcher.breakers["GDACS"] = CircuitBreaker("GDACS", failure_threshold=2, cooldown_seconds=0)
+    replies = []
+    monkeypatch.setattr(fetcher, "_request", lambda url, params, stream=False: replies.pop(0))
+    return fetcher, replies
+
+def test_success_is_recorded_only_after_the_body_is_consumed(fetcher):
+    fetcher, replies = fetcher
+    replies.append(response(200, FEED))
+    alerts = fetcher.iter_gdacs_alerts()
+    assert fetcher.breakers["GDACS"].last_success_at is None
+    assert [alert["source"] for alert in alerts] == ["GDACS"]
+    assert fetcher.breakers["GDACS"].last_success_at is not None
+
+def test_malformed_bodies_open_the_circuit(fetcher):
+    fetcher, replies = fetcher
+    breaker = fetcher.breakers["GDACS"]
+    for _ in range(2):
+        replies.append(response(200, b'{"features": [{"properties": {"eventtype": "EQ"'))
+        with pytest.raises(Exception):
+            list(fetcher.iter_gdacs_alerts())
+    assert breaker.consecutive_failures == 2
+    assert breaker._state == OPEN
+
+def test_abandoned_stream_releases_the_probe():
+    breaker = CircuitBreaker("prueba", failure_threshold=1, cooldown_seconds=0)
+    breaker.record_failure(RuntimeError("caída"), 1.0)
+    assert breaker.state == HALF_OPEN and breaker.allow()
+    assert not breaker.allow()
+    breaker.release_probe()
+
+    items = breaker.stream(lambda: iter([1, 2, 3]))
+    assert next(items) == 1
+    items.close()
+    # Sin veredicto: sigue semiabierto y admite una nueva sonda
+    assert breaker.consecutive_failures == 1 and breaker.allow()
+    breaker.release_probe()
+    assert list(breaker.stream(lambda: iter([1, 2]))) == [1, 2]
+    assert breaker.state == CLOSED
+
+def test_client_errors_do_not_count_as_failures(fetcher):
+    fetcher, replies = fetcher
+    replies.append(response(404, b"{}"))
+    with pytest.raises(requests.HTTPError):
+        fetcher.iter_gdacs_alerts()
+    assert fetcher.breakers["GDACS"].consecutive_failures == 0
@@ -0,0 +1,74 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, select
+from app import ingestion
+from app.database import ensure_columns
+from app.ingestion import IngestionPipeline
+from app.models import Alert, AlertRollup
+
+NOW = datetime(2024, 6, 15, 13, 30)
+
+@pytest.fixture
+def db_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def external(key: str, title: str = "Sismo") -> Alert:
+    return Alert(title=title, lat=14.6, lon=-90.5, source="GDACS", external_id=key, created_at=NOW)
+
+def stored(engine):
+    with Session(engine) as session:
+        return sorted((a.external_id, a.title) for a in session.exec(select(Alert)).all()
+                      if a.external_id is not None)
+
+def test_concurrent_insert_between_read_and_commit_is_skipped(db_engine, monkeypatch):
+    raced = []
+
+    def fence(lease, session):
+        # Otro worker confirma el mismo external_id justo antes que este lote
+        if not raced:
+            raced.append(lease)
+            with Session(db_engine) as other:
+                other.add(external("GDACS:1", "Del otro worker"))
+                other.commit()
+
+    monkeypatch.setattr(ingestion.lease_manager, "fence", fence)
+    pipeline = IngestionPipeline(db_engine=db_engine)
+    assert pipeline.persist([external("GDACS:1"), external("GDACS:2")], lease="ingesta") == 1
+    assert stored(db_engine) == [("GDACS:1", "Del otro worker"), ("GDACS:2", "Sismo")]
+    with Session(db_engine) as session:
+        assert sum(r.count for r in session.exec(select(AlertRollup)).all() if r.granularity == "day") == 2
+
+def test_external_id_is_unique_but_manual_alerts_are_not(db_engine):
+    with Session(db_engine) as session:
+        session.add_all([Alert(title="Manual", lat=14.6, lon=-90.5), Alert(title="Manual", lat=14.6, lon=-90.5)])
+        session.commit()
+        session.add(external("GDACS:1"))
+        session.add(external("GDACS:1"))
+        with pytest.raises(IntegrityError):
+            session.commit()
+
+def test_migration_drops_duplicates_and_makes_the_index_unique(db_engine):
+    with db_engine.begin() as conn:
+        # Esquema anterior: índice sin unicidad y duplicados de una carrera
+        conn.execute(text("DROP INDEX ix_alert_external_id"))
+        conn.execute(text("CREATE INDEX ix_alert_external_id ON alert (external_id)"))
+        for key in ["GDACS:1", "GDACS:1", "GDACS:2", None, None]:
+            conn.execute(text("INSERT INTO alert (title, description, lat, lon, severity, alert_type, source, "
+                              "external_id, created_at) VALUES ('A', '', 14.6, -90.5, 1, 'general', 'GDACS', "
+                              ":key, :created_at)"), {"key": key, "created_at": NOW})
+
+    ensure_columns(db_engine)
+    indexes = {i["name"]: i for i in inspect(db_engine).get_indexes("alert")}
+    assert indexes["ix_alert_external_id"]["unique"]
+    with Session(db_engine) as session:
+        alerts = session.exec(select(Alert).order_by(Alert.id)).all()
+        assert [a.external_id for a in alerts] == ["GDACS:1", "GDACS:2", None, None]
+        assert sum(r.count for r in session.exec(select(AlertRollup)).all() if r.granularity == "day") == 4
+    # Segunda ejecución sin cambios
+    ensure_columns(db_engine)
+    assert len(stored(db_engine)) == 2
@@ -0,0 +1,64 @@
+import time
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session
+from app.leadership import LeaseLostError, LeaseManager
+
+@pytest.fixture
+def db_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}", connect_args={"check_same_thread": False})
+    yield engine
+    engine.dispose()
+
+def test_only_one_process_holds_the_lease(db_engine):
+    managers = [LeaseManager(db_engine, ttl=5, enabled=True) for _ in range(6)]
+    for round_ in range(5):
+        barrier = threading.Barrier(len(managers))
+        results = [None] * len(managers)
+
+        def contend(position):
+            barrier.wait()
+            results[position] = managers[position].try_acquire(f"trabajo-{round_}")
+
+        threads = [threading.Thread(target=contend, args=(position,)) for position in range(len(managers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        winners = [m for m, result in zip(managers, results) if result is not None]
+        assert len(winners) == 1
+        assert [m.is_leader(f"trabajo-{round_}") for m in managers].count(True) == 1
+
+def test_expired_lease_changes_owner_and_fences_the_old_leader(db_engine):
+    old, new = LeaseManager(db_engine, ttl=0.3, enabled=True), LeaseManager(db_engine, ttl=0.3, enabled=True)
+    assert old.try_acquire("ingesta") is False
+    assert new.try_acquire("ingesta") is None
+    with Session(db_engine) as session:
+        old.fence("ingesta", session)
+
+    # El líder deja de renovar: al vencer (según el reloj de la base) otro la toma con un token nuevo
+    time.sleep(0.5)
+    assert new.try_acquire("ingesta") is True
+    assert old.try_acquire("ingesta") is None
+    tokens = {lease["holder"]: lease["token"] for lease in new.status()["leases"]}
+    assert tokens == {new.holder: 2}
+    with Session(db_engine) as session:
+        new.fence("ingesta", session)
+        with pytest.raises(LeaseLostError):
+            old.fence("ingesta", session)
+
+def test_fence_rejects_a_stale_token(db_engine):
+    leader = LeaseManager(db_engine, ttl=5, enabled=True)
+    assert leader.try_acquire("ingesta") is False
+    # Simula que la lease pasó por otro dueño y volvió: el token guardado ya no coincide
+    leader._tokens["ingesta"] = 0
+    with Session(db_engine) as session, pytest.raises(LeaseLostError):
+        leader.fence("ingesta", session)
+
+def test_ensure_table_is_idempotent(db_engine):
+    first, second = LeaseManager(db_engine, enabled=True), LeaseManager(db_engine, enabled=True)
+    first.ensure_table()
+    second.ensure_table()
+    second._table_ready = False
+    second.ensure_table()
@@ -0,0 +1,38 @@
+from datetime import datetime
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel
+from app.models import Alert
+from app.snapshot import ExternalAlertsSnapshot
+
+@pytest.fixture
+def db_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'snapshot.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def add(engine, key: str, created_at: datetime, source: str = "GDACS") -> int:
+    with Session(engine) as session:
+        alert = Alert(title=key, lat=14.6, lon=-90.5, source=source, external_id=key if source != "manual" else None,
+                      created_at=created_at)
+        session.add(alert)
+        session.commit()
+        return alert.id
+
+def test_stale_worker_refreshes_up_to_the_requested_version(db_engine):
+    add(db_engine, "GDACS:1", datetime(2024, 6, 15))
+    leader, follower = ExternalAlertsSnapshot(db_engine, limit=1), ExternalAlertsSnapshot(db_engine, limit=1)
+    first = follower.current()
+
+    # El líder ingiere una alerta con fecha antigua: fuera del límite, pero cuenta para la versión
+    newest = add(db_engine, "GDACS:2", datetime(2020, 1, 1))
+    add(db_engine, "manual", datetime(2024, 6, 16), source="manual")
+    assert leader.refresh().version == newest
+    assert follower.current() is first
+    current = follower.current(min_version=newest)
+    assert current.version == newest and current.etag != first.etag
+    body = json.loads(current.body)
+    assert body["version"] == newest and [a["external_id"] for a in body["alerts"]] == ["GDACS:1"]
+    assert follower.current(min_version=newest) is current
@@ -0,0 +1,26 @@
+import numpy as np
+from app.timeseries_store import anomaly, climatology
+
+def seasonal(days: int, warming: float = 0.0) -> np.ndarray:
+    """Temperatura diaria con ciclo anual y un calentamiento opcional en los últimos 30 días"""
+    t = np.arange(days)
+    series = 15 + 8 * np.sin(2 * np.pi * t / 365.25)
+    series[-30:] += warming
+    return series.astype(np.float32)
+
+def test_seasonal_cycle_is_not_an_anomaly():
+    # Serie que termina en plena subida estacional: contra la media anual daría varios grados
+    series = seasonal(4 * 365 + 120)
+    assert abs(float(np.mean(series[-30:])) - float(np.mean(series[-365:]))) > 2
+    assert abs(anomaly(series, window=30, years=3)) < 0.2
+
+def test_detects_warming_against_climatology():
+    series = seasonal(4 * 365 + 120, warming=3.0)
+    assert anomaly(series, window=30, years=3) > 2.8
+
+def test_climatology_ignores_gaps_and_short_history():
+    series = seasonal(3 * 365)
+    series[-395:-365] = np.nan
+    # El primer año anterior es un hueco: vale el resto de los años disponibles
+    assert np.isfinite(climatology(series, window=30, years=3))
+    assert np.isnan(anomaly(seasonal(300), window=30, years=3))
@@ -0,0 +1,343 @@
+"""Benchmark de carga HTTP de extremo a extremo (backend + MCP).
+
+Mide latencia (p50/p95/p99) y throughput de /alerts, /zones, /shelters,
+/mcp/alerts y /mcp/analytics/dashboard con concurrencia fija (clientes en
+lazo cerrado: cada uno envía la siguiente petición al recibir la respuesta).
+
+Con --db levanta localmente ambos servicios sobre una base generada por
+bench/synthetic_data.py; sin --db usa los que ya corren en --backend-url y
+--mcp-url:
+
+    python bench/synthetic_data.py --db /tmp/bench_1m.db --alerts 1M
+    python bench/bench_http.py --db /tmp/bench_1m.db --concurrency 1 8 32 \\
+        --duration 15 --json bench/results/http_1m.json
+
+Comparar contra una línea base (código de salida 1 si hay regresión):
+
+    python bench/bench_http.py --db /tmp/bench_1m.db --baseline bench/results/http_1m.json
+    python bench/bench_http.py --results nueva.json --baseline bench/results/http_1m.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+
+# nombre -> (servicio, ruta, parámetros)
+ENDPOINTS = {
+    "alerts": ("backend", "/alerts", {"limit": 100}),
+    "zones": ("backend", "/zones", {}),
+    "shelters": ("backend", "/shelters", {}),
+    "mcp_alerts": ("mcp", "/mcp/alerts", {"limit": 100}),
+    "mcp_dashboard": ("mcp", "/mcp/analytics/dashboard", {}),
+}
+HEALTH = {"backend": "/health", "mcp": "/mcp/health"}
+
+# Métricas comparadas con la línea base: (clave, mayor es peor)
+COMPARED = [("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("throughput_rps", False)]
+
+class Services:
+    """Backend y MCP con uvicorn como subprocesos, sobre una copia de la base"""
+
+    def __init__(self, db_path: str, backend_port: int, mcp_port: int, workers: int, startup_timeout: float):
+        self.db_path = os.path.abspath(db_path)
+        self.backend_port = backend_port
+        self.mcp_port = mcp_port
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.workdir = tempfile.mkdtemp(prefix="bench_http_")
+        self.processes = {}
+
+    @property
+    def backend_url(self) -> str:
+        return f"http://127.0.0.1:{self.backend_port}"
+
+    @property
+    def mcp_url(self) -> str:
+        return f"http://127.0.0.1:{self.mcp_port}"
+
+    def _spawn(self, name: str, cwd: str, port: int, env: dict):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "wb")
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(self.workers), "--log-level", "warning"]
+        self.processes[name] = subprocess.Popen(command, cwd=cwd, env={**os.environ, **env},
+                                                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+    def _wait(self, name: str, url: str):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.processes[name].poll() is not None:
+                raise RuntimeError(f"{name} terminó al arrancar:\n{self.log_tail(name)}")
+            try:
+                if httpx.get(url, timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"{name} no respondió en {self.startup_timeout:g}s:\n{self.log_tail(name)}")
+
+    def log_tail(self, name: str, lines: int = 30) -> str:
+        with open(os.path.join(self.workdir, f"{name}.log"), errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def start(self):
+        # Los servicios escriben (leases, rollups, trabajos): nunca sobre la base generada
+        db_copy = os.path.join(self.workdir, "bench.db")
+        shutil.copyfile(self.db_path, db_copy)
+        self._spawn("backend", os.path.join(ROOT_DIR, "backend"), self.backend_port, {
+            "DATABASE_URL": f"sqlite:///{db_copy}",
+            # Sin red: la carga se mide solo sobre los datos sintéticos
+            "EXTERNAL_SOURCES_ENABLED": "false",
+        })
+        self._wait("backend", self.backend_url + HEALTH["backend"])
+        self._spawn("mcp", os.path.join(ROOT_DIR, "mcp"), self.mcp_port, {
+            "BACKEND_URL": self.backend_url,
+            "JOBS_DB_PATH": os.path.join(self.workdir, "mcp_jobs.db"),
+        })
+        self._wait("mcp", self.mcp_url + HEALTH["mcp"])
+        return self
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGTERM)
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+def percentiles(latencies) -> dict:
+    """p50/p95/p99 con interpolación lineal (como numpy.percentile)"""
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(latencies) == 1:
+        return {"p50": latencies[0], "p95": latencies[0], "p99": latencies[0]}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+async def run_level(url: str, params: dict, concurrency: int, duration: float, warmup: float,
+                    max_requests: int = None, timeout: float = 60.0) -> dict:
+    """`concurrency` clientes en lazo cerrado durante `warmup` (descartado) y luego `duration` segundos"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, sizes, errors, cache = [], [], {}, {}
+    measuring = False
+    sent = 0
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def worker(deadline: float):
+            nonlocal sent
+            while time.perf_counter() < deadline:
+                if measuring:
+                    if max_requests and sent >= max_requests:
+                        return
+                    sent += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, params=params)
+                    body = response.content
+                    error = None
+                    if response.status_code >= 400:
+                        error = f"HTTP {response.status_code}"
+                    elif body.startswith(b'{"error"'):
+                        # Algunos handlers del MCP devuelven 200 con {"error": ...}
+                        error = "error en el cuerpo"
+                except httpx.HTTPError as e:
+                    body, error, response = b"", type(e).__name__, None
+                elapsed = time.perf_counter() - started
+                if not measuring:
+                    continue
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+                    continue
+                latencies.append(elapsed * 1000)
+                sizes.append(len(body))
+                status = response.headers.get("X-Cache")
+                if status:
+                    cache[status] = cache.get(status, 0) + 1
+
+        if warmup > 0:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+
+        measuring = True
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + duration) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        client_cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    cuts = percentiles(latencies)
+    result = {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else None,
+        **{f"{key}_ms": round(value, 3) if value is not None else None for key, value in cuts.items()},
+        "max_ms": round(latencies[-1], 3) if latencies else None,
+        "bytes_per_response": int(statistics.fmean(sizes)) if sizes else None,
+        # Cerca de duration_s: el cliente (un solo proceso) es el cuello de botella, no el servidor
+        "client_cpu_s": round(client_cpu, 3),
+    }
+    if cache:
+        result["cache"] = cache
+    return result
+
+def _fmt(value, width: int = 9, decimals: int = 2) -> str:
+    return f"{value:>{width}.{decimals}f}" if value is not None else f"{'-':>{width}}"
+
+def run(urls: dict, endpoints, levels, duration: float, warmup: float, max_requests: int, limit: int) -> list:
+    results = []
+    for name in endpoints:
+        service, path, params = ENDPOINTS[name]
+        params = {**params, "limit": limit} if "limit" in params and limit else params
+        for concurrency in levels:
+            result = asyncio.run(run_level(urls[service] + path, params, concurrency, duration, warmup, max_requests))
+            result = {"endpoint": name, "path": path, "params": params, **result}
+            results.append(result)
+            print(f"{name:<14} c={concurrency:<4} {_fmt(result['throughput_rps'], 9, 1)} req/s  "
+                  f"p50 {_fmt(result['p50_ms'])}  p95 {_fmt(result['p95_ms'])}  "
+                  f"p99 {_fmt(result['p99_ms'])} ms  errores {result['errors']}", flush=True)
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def load_manifest(db_path: str):
+    path = f"{db_path}.json"
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Regresiones de `current` frente a `baseline` por (endpoint, concurrencia)"""
+    base = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    same_data = _dataset_key(current) == _dataset_key(baseline)
+    if not same_data:
+        print("⚠️ Los conjuntos de datos difieren (semilla/tamaños): la comparación es orientativa")
+
+    regressions = []
+    print(f"\n{'endpoint':<14} {'c':>4} {'métrica':<15} {'base':>11} {'actual':>11} {'cambio':>9}")
+    for result in current["results"]:
+        reference = base.get((result["endpoint"], result["concurrency"]))
+        if reference is None:
+            continue
+        for metric, worse_up in COMPARED:
+            old, new = reference.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            regressed = change > threshold if worse_up else change < -threshold
+            mark = "  REGRESIÓN" if regressed else ""
+            print(f"{result['endpoint']:<14} {result['concurrency']:>4} {metric:<15} {old:>11.2f} {new:>11.2f} "
+                  f"{change:>+8.1%}{mark}")
+            if regressed:
+                regressions.append({"endpoint": result["endpoint"], "concurrency": result["concurrency"],
+                                    "metric": metric, "baseline": old, "current": new, "change": round(change, 4)})
+        # Una tasa de error nueva es regresión sin importar el umbral
+        old_rate = reference["errors"] / max(reference["requests"] + reference["errors"], 1)
+        new_rate = result["errors"] / max(result["requests"] + result["errors"], 1)
+        if new_rate > old_rate + 0.001:
+            print(f"{result['endpoint']:<14} {result['concurrency']:>4} {'error_rate':<15} {old_rate:>11.2%} "
+                  f"{new_rate:>11.2%} {'':>9}  REGRESIÓN")
+            regressions.append({"endpoint": result["endpoint"], "concurrency": result["concurrency"],
+                                "metric": "error_rate", "baseline": old_rate, "current": new_rate})
+    return regressions
+
+def _dataset_key(report: dict):
+    dataset = report.get("dataset") or {}
+    return tuple(dataset.get(key) for key in ("seed", "alerts", "zones", "shelters", "days"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga HTTP del backend y el MCP")
+    parser.add_argument("--db", help="Base generada por synthetic_data.py: levanta los servicios localmente")
+    parser.add_argument("--backend-url", default="http://localhost:8000")
+    parser.add_argument("--mcp-url", default="http://localhost:8001")
+    parser.add_argument("--backend-port", type=int, default=18000)
+    parser.add_argument("--mcp-port", type=int, default=18001)
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn por servicio")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos medidos por nivel")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Segundos descartados por nivel")
+    parser.add_argument("--requests", type=int, help="Tope de peticiones medidas por nivel")
+    parser.add_argument("--limit", type=int, help="Parámetro limit de /alerts y /mcp/alerts")
+    parser.add_argument("--json", help="Guardar resultados (línea base) en este archivo")
+    parser.add_argument("--results", help="No ejecutar: comparar este archivo de resultados")
+    parser.add_argument("--baseline", help="Línea base JSON contra la cual comparar")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Cambio tolerado antes de marcar regresión")
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            report = json.load(f)
+    else:
+        services = Services(args.db, args.backend_port, args.mcp_port, args.workers,
+                            args.startup_timeout) if args.db else None
+        try:
+            if services:
+                print(f"Levantando backend y MCP sobre una copia de {args.db} ...", flush=True)
+                started = time.perf_counter()
+                services.start()
+                print(f"Servicios listos en {time.perf_counter() - started:.1f} s\n", flush=True)
+                urls = {"backend": services.backend_url, "mcp": services.mcp_url}
+            else:
+                urls = {"backend": args.backend_url.rstrip("/"), "mcp": args.mcp_url.rstrip("/")}
+            results = run(urls, args.endpoints, args.concurrency, args.duration, args.warmup,
+                          args.requests, args.limit)
+        finally:
+            if services:
+                services.stop()
+
+        report = {
+            "created_at": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "host": {"platform": platform.platform(), "python": platform.python_version(),
+                     "cpu_count": os.cpu_count()},
+            "config": {"duration_s": args.duration, "warmup_s": args.warmup, "concurrency": args.concurrency,
+                       "workers": args.workers if args.db else None, "requests": args.requests,
+                       "urls": None if args.db else urls},
+            "dataset": load_manifest(os.path.abspath(args.db)) if args.db else None,
+            "results": results,
+        }
+        if args.json:
+            os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResultados guardados en {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (umbral {args.threshold:.0%})")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones (umbral {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
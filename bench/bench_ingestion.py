@@ -0,0 +1,198 @@
+"""Benchmark offline de la ingesta de ExternalDataFetcher.
+
+Levanta el servidor de replay (bench/replay.py), redirige las fuentes hacia él
+y mide, para cada tamaño de malla, el tiempo de ciclo por fuente, el costo de
+parseo por respuesta y las alertas producidas por segundo.
+
+    python bench/bench_ingestion.py --points 1 100 10000 --latency-ms 50 \\
+        --fixtures bench/fixtures --json bench/results/ingestion.json
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from replay import StubServer, replay_env  # noqa: E402
+
+BBOX = (13.7, -92.3, 17.9, -88.2)
+
+def grid_for(count: int) -> float:
+    """Paso de malla que produce aproximadamente `count` puntos en el bbox"""
+    lat_min, lon_min, lat_max, lon_max = BBOX
+    area = (lat_max - lat_min) * (lon_max - lon_min)
+    return math.sqrt(area / count) if count > 1 else 0
+
+class _Raw(io.BytesIO):
+    decode_content = True
+
+class _Response:
+    """Respuesta en memoria para medir el parseo sin red"""
+    status_code = 200
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.raw = _Raw(body)
+
+    def json(self):
+        return json.loads(self.body)
+
+    def raise_for_status(self):
+        pass
+
+def measure_parse(fetcher, base_url: str, repeat: int = 20) -> dict:
+    """Costo de parseo y normalización por respuesta, sin latencia de red"""
+    import requests
+    from app import external_data
+    from app.json_stream import iter_items, iter_leaves
+
+    session = requests.Session()
+    lats = ",".join(["14.6"] * external_data.OPEN_METEO_BATCH_SIZE)
+    lons = ",".join(["-90.5"] * external_data.OPEN_METEO_BATCH_SIZE)
+    bodies = {
+        "OPEN_METEO": session.get(f"{base_url}/open-meteo", params={"latitude": lats, "longitude": lons}).content,
+        "GDACS": session.get(f"{base_url}/gdacs").content,
+        "NASA_POWER": session.get(f"{base_url}/nasa-power", params={
+            "parameters": ",".join(external_data.NASA_POWER_PARAMETERS),
+            "start": "20230101", "end": "20231231", "latitude": 14.6, "longitude": -90.5,
+        }).content,
+    }
+
+    def parse_open_meteo(body):
+        data = json.loads(body)
+        data = data if isinstance(data, list) else [data]
+        return sum(len(fetcher._evaluate_open_meteo(item, 14.6, -90.5)) for item in data)
+
+    def parse_gdacs(body):
+        return sum(1 for _ in map(fetcher._gdacs_event_to_alert, iter_items(_Response(body), "features.item")))
+
+    def parse_nasa(body):
+        return sum(1 for _ in iter_leaves(_Response(body), "properties.parameter"))
+
+    parsers = {"OPEN_METEO": parse_open_meteo, "GDACS": parse_gdacs, "NASA_POWER": parse_nasa}
+    results = {}
+    for source, parse in parsers.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            items = parse(bodies[source])
+            timings.append(time.perf_counter() - started)
+        results[source] = {
+            "bytes": len(bodies[source]),
+            "items": items,
+            "median_ms": round(statistics.median(timings) * 1000, 3),
+        }
+    return results
+
+def run_cycle(server, count: int, workdir: str) -> dict:
+    """Un ciclo completo (fetch + normalización + dedup + inserción) por fuente"""
+    from sqlmodel import SQLModel, create_engine
+    from app import external_data
+    from app.ingestion import IngestionPipeline
+    from app.points import grid_points, DEFAULT_POINT, MonitoringPoint, point_key
+    from app.timeseries_store import nasa_power_store
+
+    step = grid_for(count)
+    points = grid_points(",".join(str(v) for v in BBOX), step) if step else []
+    if not points:
+        points = [MonitoringPoint(point_key(*DEFAULT_POINT), *DEFAULT_POINT, "grid")]
+
+    # Base de datos y almacén NASA nuevos en cada corrida
+    db_engine = create_engine(f"sqlite:///{os.path.join(workdir, f'bench_{count}.db')}")
+    SQLModel.metadata.create_all(db_engine)
+    nasa_power_store.root = os.path.join(workdir, f"nasa_{count}")
+
+    fetcher = external_data.ExternalDataFetcher()
+    pipeline = IngestionPipeline(fetcher=fetcher, db_engine=db_engine)
+
+    sources = {}
+    for source in external_data.EXTERNAL_SOURCES:
+        before = server.counts.get(source, 0)
+        started = time.perf_counter()
+        raw = fetcher.fetch_source(source, points)
+        fetched = time.perf_counter()
+        produced = [pipeline.normalize(item) for item in raw] if raw is not None else []
+        inserted = pipeline.persist(iter(produced))
+        finished = time.perf_counter()
+
+        cycle = finished - started
+        sources[source] = {
+            "requests": server.counts.get(source, 0) - before,
+            "alerts": len(produced),
+            "inserted": inserted,
+            "fetch_s": round(fetched - started, 4),
+            "persist_s": round(finished - fetched, 4),
+            "cycle_s": round(cycle, 4),
+            "alerts_per_s": round(len(produced) / cycle, 1) if cycle > 0 else None,
+        }
+
+    total_alerts = sum(s["alerts"] for s in sources.values())
+    total_time = sum(s["cycle_s"] for s in sources.values())
+    return {
+        "points": len(points),
+        "sources": sources,
+        "total_cycle_s": round(total_time, 4),
+        "total_alerts": total_alerts,
+        "alerts_per_s": round(total_alerts / total_time, 1) if total_time > 0 else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de ingesta externa")
+    parser.add_argument("--points", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--fixtures", default=os.path.join(BENCH_DIR, "fixtures"))
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--gdacs-features", type=int, default=2000)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    server = StubServer(args.fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        gdacs_features=args.gdacs_features).start()
+    workdir = tempfile.mkdtemp(prefix="bench_ingestion_")
+
+    # Configurar el entorno antes de importar el backend (lee variables al importar)
+    os.environ.update(replay_env(server.base_url))
+    os.environ.setdefault("OPENWEATHER_API_KEY", "replay")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'unused.db')}"
+    os.environ["NASA_POWER_STORE_DIR"] = os.path.join(workdir, "nasa")
+
+    try:
+        from app.external_data import ExternalDataFetcher
+        report = {
+            "latency_ms": args.latency_ms,
+            "parse": measure_parse(ExternalDataFetcher(), server.base_url),
+            "runs": [run_cycle(server, count, workdir) for count in args.points],
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("Parseo por respuesta:")
+    for source, parse in report["parse"].items():
+        print(f"  {source:<12} {parse['bytes']:>10} B {parse['items']:>8} items {parse['median_ms']:>9.3f} ms")
+    print()
+    print(f"{'puntos':>8} {'fuente':<12} {'peticiones':>10} {'alertas':>8} {'ciclo s':>9} {'alertas/s':>10}")
+    for run in report["runs"]:
+        for source, stats in run["sources"].items():
+            print(f"{run['points']:>8} {source:<12} {stats['requests']:>10} {stats['alerts']:>8} "
+                  f"{stats['cycle_s']:>9.3f} {stats['alerts_per_s'] or 0:>10.1f}")
+        print(f"{run['points']:>8} {'TOTAL':<12} {'':>10} {run['total_alerts']:>8} "
+              f"{run['total_cycle_s']:>9.3f} {run['alerts_per_s'] or 0:>10.1f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
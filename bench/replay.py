@@ -0,0 +1,333 @@
+"""Grabación y replay de las fuentes externas de ExternalDataFetcher.
+
+Grabar respuestas reales (requiere red):
+    python bench/replay.py record --out bench/fixtures
+
+Servirlas localmente con latencia simulada:
+    python bench/replay.py serve --fixtures bench/fixtures --port 8765 --latency-ms 50
+
+Para apuntar el backend al servidor, exportar las variables de `replay_env()`.
+Las fuentes sin grabación se sirven con datos sintéticos deterministas.
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Prefijo de ruta del servidor -> fuente
+ROUTES = {
+    "openweather": "OPENWEATHER",
+    "open-meteo": "OPEN_METEO",
+    "gdacs": "GDACS",
+    "nasa-power": "NASA_POWER",
+}
+
+def replay_env(base_url: str) -> dict:
+    """Variables de entorno que redirigen el fetcher al servidor de replay"""
+    return {
+        "OPENWEATHER_BASE_URL": f"{base_url}/openweather",
+        "OPEN_METEO_URL": f"{base_url}/open-meteo",
+        "GDACS_URL": f"{base_url}/gdacs",
+        "NASA_POWER_URL": f"{base_url}/nasa-power",
+    }
+
+# ===== GRABACIÓN =====
+
+class _RecordedRaw(io.BytesIO):
+    """Sustituto de response.raw tras leer el cuerpo para grabarlo"""
+    decode_content = True
+
+class Recorder:
+    def __init__(self, out_dir: str, source_urls: dict):
+        self.out_dir = out_dir
+        self.source_urls = source_urls
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def _source_for(self, url: str):
+        for source, prefix in self.source_urls.items():
+            if url.startswith(prefix):
+                return source
+        return None
+
+    def hook(self, response, *args, **kwargs):
+        """Hook de respuesta de requests: guarda cuerpo y metadatos"""
+        source = self._source_for(response.url)
+        if source is None:
+            return response
+
+        body = response.content
+        # El cuerpo ya se leyó: dejarlo disponible para el parseo en streaming
+        response.raw = _RecordedRaw(body)
+
+        with self._lock:
+            index = self.counts.get(source, 0)
+            self.counts[source] = index + 1
+
+        source_dir = os.path.join(self.out_dir, source)
+        os.makedirs(source_dir, exist_ok=True)
+        query = {k: v[0] for k, v in parse_qs(urlparse(response.url).query).items()}
+        query.pop("appid", None)  # nunca grabar la API key
+        with open(os.path.join(source_dir, f"{index:04d}.body"), "wb") as f:
+            f.write(body)
+        with open(os.path.join(source_dir, f"{index:04d}.json"), "w") as f:
+            json.dump({
+                "status": response.status_code,
+                "content_type": response.headers.get("Content-Type", "application/json"),
+                "query": query,
+                "recorded_at": datetime.utcnow().isoformat(),
+            }, f, indent=2)
+        return response
+
+def record(out_dir: str):
+    """Ejecutar un ciclo real de todas las fuentes grabando cada respuesta"""
+    sys.path.insert(0, BACKEND_DIR)
+    from app import external_data
+    from app.points import build_point_registry
+
+    fetcher = external_data.ExternalDataFetcher()
+    recorder = Recorder(out_dir, {
+        "OPENWEATHER": external_data.OPENWEATHER_BASE_URL,
+        "OPEN_METEO": external_data.OPEN_METEO_URL,
+        "GDACS": external_data.GDACS_URL,
+        "NASA_POWER": external_data.NASA_POWER_URL,
+    })
+    fetcher.session.hooks["response"].append(recorder.hook)
+
+    points = build_point_registry(include_grid=False)
+    for source in external_data.EXTERNAL_SOURCES:
+        alerts = fetcher.fetch_source(source, points)
+        count = len(list(alerts)) if alerts is not None else "error"
+        print(f"{source}: {recorder.counts.get(source, 0)} respuestas grabadas, alertas={count}")
+
+# ===== DATOS SINTÉTICOS =====
+
+def _rng(*parts) -> random.Random:
+    seed = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return random.Random(int(seed[:12], 16))
+
+def synthetic_open_meteo(lats, lons):
+    results = []
+    for lat, lon in zip(lats, lons):
+        rng = _rng("om", lat, lon)
+        results.append({
+            "latitude": float(lat),
+            "longitude": float(lon),
+            "current": {
+                "temperature_2m": round(rng.uniform(15, 36), 1),
+                "relative_humidity_2m": rng.randint(40, 100),
+                "precipitation": round(rng.choice([0, 0, 0, 2.5, 12.0, 28.0]), 1),
+                "weather_code": rng.choice([0, 1, 3, 61, 63, 95]),
+                "wind_speed_10m": round(rng.uniform(0, 40), 1),
+            },
+            "daily": {
+                "precipitation_sum": [round(rng.uniform(0, 45), 1) for _ in range(3)],
+                "weather_code": [rng.choice([0, 61, 95]) for _ in range(3)],
+            },
+        })
+    return results[0] if len(results) == 1 else results
+
+def synthetic_openweather(lat, lon):
+    rng = _rng("ow", lat, lon)
+    return {
+        "weather": [{"main": rng.choice(["Clear", "Clouds", "Rain", "Thunderstorm"])}],
+        "main": {"temp": round(rng.uniform(15, 38), 1), "humidity": rng.randint(40, 100)},
+        "wind": {"speed": round(rng.uniform(0, 20), 1)},
+    }
+
+def synthetic_gdacs(count: int):
+    rng = _rng("gdacs", count)
+    levels = ["Green", "Green", "Orange", "Red"]
+    types = ["EQ", "FL", "TC", "VO", "WF"]
+    features = []
+    for i in range(count):
+        lat, lon = rng.uniform(13.7, 17.9), rng.uniform(-92.3, -88.2)
+        event_type = rng.choice(types)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "eventtype": event_type,
+                "eventid": 1000000 + i,
+                "episodeid": 1,
+                "alertlevel": rng.choice(levels),
+                "title": f"Evento sintético {event_type} {i}",
+                "description": "Evento generado para replay",
+                "fromdate": (datetime(2024, 1, 1) + timedelta(hours=i)).isoformat(),
+            },
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+def synthetic_nasa_power(params: dict):
+    start = datetime.strptime(params.get("start", "20240101"), "%Y%m%d").date()
+    end = datetime.strptime(params.get("end", start.strftime("%Y%m%d")), "%Y%m%d").date()
+    rng = _rng("nasa", params.get("latitude"), params.get("longitude"))
+    base = rng.uniform(18, 28)
+    parameters = {name: {} for name in params.get("parameters", "T2M").split(",")}
+    day = start
+    while day <= end:
+        key = day.strftime("%Y%m%d")
+        for name, series in parameters.items():
+            series[key] = round(base + rng.uniform(-3, 3), 2) if name == "T2M" else round(rng.uniform(0, 20), 2)
+        day += timedelta(days=1)
+    return {"properties": {"parameter": parameters}}
+
+# ===== SERVIDOR DE REPLAY =====
+
+class Cassettes:
+    """Respuestas grabadas por fuente, con selección por query exacta o round-robin"""
+
+    def __init__(self, fixtures_dir: str = None):
+        self.entries = {}
+        self._cursor = {}
+        self._lock = threading.Lock()
+        if fixtures_dir and os.path.isdir(fixtures_dir):
+            for source in os.listdir(fixtures_dir):
+                source_dir = os.path.join(fixtures_dir, source)
+                for name in sorted(os.listdir(source_dir)):
+                    if not name.endswith(".json"):
+                        continue
+                    with open(os.path.join(source_dir, name)) as f:
+                        meta = json.load(f)
+                    with open(os.path.join(source_dir, name[:-5] + ".body"), "rb") as f:
+                        meta["body"] = f.read()
+                    self.entries.setdefault(source, []).append(meta)
+
+    def pick(self, source: str, query: dict):
+        entries = self.entries.get(source)
+        if not entries:
+            return None
+        for entry in entries:
+            if entry["query"] == query:
+                return entry
+        with self._lock:
+            index = self._cursor.get(source, 0)
+            self._cursor[source] = index + 1
+        return entries[index % len(entries)]
+
+def _adapt_open_meteo(body: bytes, lats, lons) -> bytes:
+    """Repetir puntos grabados para responder a lotes de cualquier tamaño"""
+    recorded = json.loads(body)
+    recorded = recorded if isinstance(recorded, list) else [recorded]
+    results = []
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        item = dict(recorded[i % len(recorded)])
+        item["latitude"], item["longitude"] = float(lat), float(lon)
+        results.append(item)
+    return json.dumps(results[0] if len(results) == 1 else results).encode()
+
+class StubServer:
+    def __init__(self, fixtures_dir: str = None, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, gdacs_features: int = 200):
+        self.cassettes = Cassettes(fixtures_dir)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.gdacs_features = gdacs_features
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _respond(self, source: str, query: dict):
+        entry = self.cassettes.pick(source, query)
+        if source == "OPEN_METEO":
+            lats = query.get("latitude", "0").split(",")
+            lons = query.get("longitude", "0").split(",")
+            if entry:
+                return entry["status"], _adapt_open_meteo(entry["body"], lats, lons)
+            return 200, json.dumps(synthetic_open_meteo(lats, lons)).encode()
+        if entry:
+            return entry["status"], entry["body"]
+        if source == "OPENWEATHER":
+            return 200, json.dumps(synthetic_openweather(query.get("lat"), query.get("lon"))).encode()
+        if source == "GDACS":
+            return 200, json.dumps(synthetic_gdacs(self.gdacs_features)).encode()
+        return 200, json.dumps(synthetic_nasa_power(query)).encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                source = ROUTES.get(parsed.path.strip("/").split("/")[0])
+                if source is None:
+                    self.send_error(404)
+                    return
+                with server._lock:
+                    server.counts[source] = server.counts.get(source, 0) + 1
+
+                delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 1000)
+
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                query.pop("appid", None)
+                status, body = server._respond(source, query)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Grabación/replay de fuentes externas")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Grabar respuestas reales")
+    rec.add_argument("--out", default="bench/fixtures")
+
+    srv = sub.add_parser("serve", help="Servir respuestas grabadas")
+    srv.add_argument("--fixtures", default="bench/fixtures")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--latency-ms", type=float, default=0.0)
+    srv.add_argument("--jitter-ms", type=float, default=0.0)
+    srv.add_argument("--gdacs-features", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.out)
+        return
+
+    server = StubServer(args.fixtures, args.host, args.port, args.latency_ms, args.jitter_ms, args.gdacs_features)
+    print(f"Servidor de replay en {server.base_url}")
+    for key, value in replay_env(server.base_url).items():
+        print(f"export {key}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
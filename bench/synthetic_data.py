@@ -0,0 +1,483 @@
+"""Generador de datos sintéticos con forma de Guatemala (alertas, zonas y refugios).
+
+Las alertas se concentran alrededor de ciudades y focos de amenaza (volcanes,
+costa del Pacífico, valle del Motagua, Petén) con estacionalidad por tipo
+(lluvias de mayo a octubre, incendios en época seca), ciclo diario y
+episodios (tormentas, réplicas) que agrupan muchas alertas en pocas horas y
+pocos kilómetros. Los ids crecen con created_at, como en una base real.
+
+    python bench/synthetic_data.py --db /tmp/bench_1m.db --alerts 1M --days 730 --seed 42
+
+Escribe además un manifiesto `<db>.json` que bench/bench_http.py adjunta a
+sus resultados para comparar solo corridas sobre el mismo conjunto de datos.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+BBOX = (13.7, -92.3, 17.9, -88.2)
+
+# (nombre, lat, lon, peso ~ población, dispersión en grados)
+CITIES = [
+    ("Ciudad de Guatemala", 14.6349, -90.5069, 30.0, 0.06),
+    ("Mixco", 14.6333, -90.6064, 6.0, 0.03),
+    ("Villa Nueva", 14.5269, -90.5875, 6.0, 0.03),
+    ("Quetzaltenango", 14.8347, -91.5181, 4.0, 0.04),
+    ("Escuintla", 14.3050, -90.7850, 2.5, 0.05),
+    ("Chimaltenango", 14.6611, -90.8194, 2.0, 0.04),
+    ("Antigua Guatemala", 14.5586, -90.7295, 1.5, 0.02),
+    ("Huehuetenango", 15.3197, -91.4709, 2.0, 0.05),
+    ("Cobán", 15.4703, -90.3709, 2.0, 0.06),
+    ("Mazatenango", 14.5344, -91.5031, 1.5, 0.04),
+    ("Retalhuleu", 14.5361, -91.6778, 1.0, 0.04),
+    ("San Marcos", 14.9639, -91.7944, 1.0, 0.04),
+    ("Totonicapán", 14.9114, -91.3611, 1.0, 0.03),
+    ("Sololá", 14.7731, -91.1831, 1.0, 0.03),
+    ("Santa Cruz del Quiché", 15.0306, -91.1489, 1.0, 0.04),
+    ("Salamá", 15.1028, -90.3181, 0.6, 0.04),
+    ("Guastatoya", 14.8539, -90.0686, 0.5, 0.03),
+    ("Zacapa", 14.9722, -89.5306, 0.8, 0.04),
+    ("Chiquimula", 14.7997, -89.5458, 1.0, 0.04),
+    ("Jalapa", 14.6333, -89.9889, 0.8, 0.04),
+    ("Jutiapa", 14.2917, -89.8958, 0.8, 0.04),
+    ("Cuilapa", 14.2792, -90.2986, 0.6, 0.04),
+    ("Puerto Barrios", 15.7278, -88.5944, 1.0, 0.05),
+    ("Flores", 16.9275, -89.8917, 1.0, 0.08),
+]
+
+# Tipos de alerta del sistema. Por tipo: proporción de alertas, focos propios
+# (nombre, lat, lon, peso, dispersión), peso de las ciudades, estacionalidad
+# mensual (ene..dic), ciclo diario (24 h), proporción y forma de los episodios
+# y probabilidades de severidad 1..4.
+ALERT_TYPES = {
+    "inundacion": {
+        "share": 0.32,
+        "hotspots": [
+            ("Costa del Pacífico - Escuintla", 14.05, -90.95, 6.0, 0.15),
+            ("Costa del Pacífico - Suchitepéquez", 14.25, -91.45, 5.0, 0.15),
+            ("Costa del Pacífico - Retalhuleu", 14.30, -91.90, 4.0, 0.12),
+            ("Valle del Motagua", 15.05, -89.60, 4.0, 0.15),
+            ("Río Polochic - Izabal", 15.45, -89.30, 3.0, 0.12),
+        ],
+        "city_weight": 0.4,
+        "monthly": [0.2, 0.15, 0.2, 0.4, 1.2, 2.0, 1.6, 1.5, 2.4, 2.2, 0.8, 0.3],
+        "diurnal": "afternoon",
+        "episode_share": 0.45, "episode_hours": (6, 72), "episode_km": 8.0, "episodes_per_year": 40,
+        "severity": [0.25, 0.40, 0.25, 0.10],
+    },
+    "deslizamiento": {
+        "share": 0.14,
+        "hotspots": [
+            ("Altiplano occidental", 14.90, -91.50, 5.0, 0.20),
+            ("Sierra de las Minas", 15.10, -89.90, 2.0, 0.15),
+            ("Alta Verapaz", 15.50, -90.30, 3.0, 0.20),
+            ("Barrancos de la capital", 14.62, -90.52, 4.0, 0.05),
+        ],
+        "city_weight": 0.2,
+        "monthly": [0.1, 0.1, 0.1, 0.2, 0.8, 1.6, 1.2, 1.3, 2.5, 2.8, 1.0, 0.2],
+        "diurnal": "night",
+        "episode_share": 0.40, "episode_hours": (12, 96), "episode_km": 12.0, "episodes_per_year": 20,
+        "severity": [0.15, 0.35, 0.35, 0.15],
+    },
+    "incendio": {
+        "share": 0.20,
+        "hotspots": [
+            ("Petén - Laguna del Tigre", 17.40, -90.60, 6.0, 0.30),
+            ("Petén - Sierra del Lacandón", 16.90, -90.90, 4.0, 0.25),
+            ("Petén - Flores", 16.90, -89.90, 3.0, 0.20),
+            ("Oriente seco", 14.90, -89.60, 2.0, 0.20),
+        ],
+        "city_weight": 0.3,
+        "monthly": [0.8, 1.6, 2.8, 3.2, 2.0, 0.4, 0.2, 0.2, 0.1, 0.2, 0.3, 0.5],
+        "diurnal": "midday",
+        "episode_share": 0.30, "episode_hours": (24, 240), "episode_km": 15.0, "episodes_per_year": 25,
+        "severity": [0.30, 0.40, 0.22, 0.08],
+    },
+    "terremoto": {
+        "share": 0.10,
+        "hotspots": [
+            ("Subducción del Pacífico", 13.90, -91.20, 6.0, 0.45),
+            ("Falla del Motagua", 15.10, -89.40, 3.0, 0.35),
+            ("Falla Chixoy-Polochic", 15.35, -90.50, 2.0, 0.35),
+        ],
+        "city_weight": 0.1,
+        "monthly": [1.0] * 12,
+        "diurnal": "flat",
+        "episode_share": 0.55, "episode_hours": (24, 336), "episode_km": 25.0, "episodes_per_year": 8,
+        "severity": [0.35, 0.35, 0.20, 0.10],
+    },
+    "general": {
+        "share": 0.24,
+        "hotspots": [
+            ("Volcán de Fuego", 14.473, -90.880, 3.0, 0.04),
+            ("Volcán de Pacaya", 14.381, -90.601, 2.0, 0.03),
+            ("Volcán Santiaguito", 14.741, -91.570, 1.5, 0.03),
+        ],
+        "city_weight": 0.8,
+        "monthly": [0.9, 0.9, 1.0, 1.0, 1.1, 1.1, 1.0, 1.0, 1.1, 1.1, 1.0, 1.2],
+        "diurnal": "day",
+        "episode_share": 0.15, "episode_hours": (6, 48), "episode_km": 5.0, "episodes_per_year": 30,
+        "severity": [0.45, 0.35, 0.15, 0.05],
+    },
+}
+
+DIURNAL = {
+    "flat": [1.0] * 24,
+    "day": [0.2, 0.15, 0.1, 0.1, 0.15, 0.3, 0.7, 1.2, 1.6, 1.8, 1.8, 1.7,
+            1.6, 1.6, 1.7, 1.7, 1.6, 1.4, 1.2, 1.0, 0.8, 0.6, 0.4, 0.3],
+    "midday": [0.2, 0.2, 0.2, 0.2, 0.2, 0.3, 0.5, 0.8, 1.2, 1.6, 2.0, 2.4,
+               2.6, 2.6, 2.4, 2.0, 1.6, 1.2, 0.8, 0.5, 0.4, 0.3, 0.3, 0.2],
+    "afternoon": [0.8, 0.6, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.5, 0.6, 0.7, 0.9,
+                  1.2, 1.6, 2.0, 2.2, 2.2, 2.0, 1.8, 1.6, 1.4, 1.2, 1.0, 0.9],
+    "night": [1.6, 1.7, 1.8, 1.8, 1.6, 1.3, 1.0, 0.8, 0.6, 0.5, 0.5, 0.5,
+              0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.5, 1.6],
+}
+
+TITLES = {
+    "inundacion": ["Alerta de Inundación", "Crecida de río", "Lluvias intensas"],
+    "deslizamiento": ["Riesgo de Deslizamiento", "Deslave reportado", "Hundimiento de terreno"],
+    "incendio": ["Incendio Forestal", "Alerta de Temperatura Extrema", "Foco de calor detectado"],
+    "terremoto": ["Sismo reportado", "Réplica sísmica", "Actividad sísmica"],
+    "general": ["Alerta General", "Actividad volcánica", "Vientos Fuertes"],
+}
+
+# Fuente de la alerta y su probabilidad (las externas llevan external_id)
+SOURCES = {"manual": 0.45, "OPEN_METEO": 0.30, "OPENWEATHER": 0.10, "NASA_POWER": 0.10, "GDACS": 0.05}
+
+SHELTER_TYPES = {"refuge": (0.60, 150), "meeting_point": (0.25, 500), "hospital": (0.15, 120)}
+SHELTER_NAMES = {"refuge": "Refugio", "meeting_point": "Punto de Encuentro", "hospital": "Hospital"}
+
+KM_PER_DEG = 111.0
+
+def parse_count(value: str) -> int:
+    """'10k', '1.5M' o '250000' -> entero"""
+    value = value.strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+def _mixture(spots, city_weight: float):
+    """Focos del tipo + ciudades (con `city_weight` del peso total) como mezcla gaussiana"""
+    lat = np.array([s[1] for s in spots] + [c[1] for c in CITIES])
+    lon = np.array([s[2] for s in spots] + [c[2] for c in CITIES])
+    sigma = np.array([s[4] for s in spots] + [c[4] for c in CITIES])
+    own = np.array([s[3] for s in spots], dtype=float)
+    cities = np.array([c[3] for c in CITIES], dtype=float)
+    own = own / own.sum() * (1 - city_weight) if len(own) else own
+    weights = np.concatenate([own, cities / cities.sum() * city_weight])
+    return lat, lon, sigma, weights / weights.sum()
+
+def _sample_mixture(rng, mixture, size: int):
+    lat, lon, sigma, weights = mixture
+    component = rng.choice(len(weights), size=size, p=weights)
+    return (lat[component] + rng.normal(0, 1, size) * sigma[component],
+            lon[component] + rng.normal(0, 1, size) * sigma[component])
+
+def _clip(lat, lon):
+    lat_min, lon_min, lat_max, lon_max = BBOX
+    return np.clip(lat, lat_min, lat_max), np.clip(lon, lon_min, lon_max)
+
+class AlertPlan:
+    """Conteos de alertas por tipo y hora más los episodios, antes de generar filas.
+
+    Con el plan completo se recorren las horas en orden y se generan las filas
+    por bloques de `chunk_size`, así que la memoria no depende del total.
+    """
+
+    def __init__(self, rng, total: int, start: datetime, days: int):
+        self.rng = rng
+        self.start = start
+        self.hours = days * 24
+        self.types = list(ALERT_TYPES)
+        self.mixtures = {name: _mixture(spec["hotspots"], spec["city_weight"]) for name, spec in ALERT_TYPES.items()}
+
+        hour_starts = np.datetime64(start, "h") + np.arange(self.hours)
+        months = hour_starts.astype("datetime64[M]").astype(int) % 12
+        hour_of_day = (hour_starts - hour_starts.astype("datetime64[D]")).astype(int)
+
+        shares = np.array([spec["share"] for spec in ALERT_TYPES.values()])
+        per_type = rng.multinomial(total, shares / shares.sum())
+        self.base = np.zeros((len(self.types), self.hours), dtype=np.int64)
+        episodes = {"type": [], "start": [], "length": [], "lat": [], "lon": [], "sigma": []}
+        ep_hours, ep_index = [], []
+        years = days / 365.0
+
+        for t, (name, spec) in enumerate(ALERT_TYPES.items()):
+            intensity = np.asarray(spec["monthly"])[months] * np.asarray(DIURNAL[spec["diurnal"]])[hour_of_day]
+            intensity = intensity / intensity.sum()
+            in_episodes = int(per_type[t] * spec["episode_share"])
+            self.base[t] = rng.multinomial(per_type[t] - in_episodes, intensity)
+
+            # Episodios: inicio según la estacionalidad del tipo, tamaños muy desiguales
+            count = max(1, int(round(spec["episodes_per_year"] * years)))
+            first = len(episodes["type"])
+            low, high = spec["episode_hours"]
+            starts = rng.choice(self.hours, size=count, p=intensity)
+            lengths = rng.integers(low, high + 1, size=count)
+            lat, lon = _sample_mixture(rng, self.mixtures[name], count)
+            episodes["type"].extend([t] * count)
+            episodes["start"].extend(starts.tolist())
+            episodes["length"].extend(lengths.tolist())
+            episodes["lat"].extend(lat.tolist())
+            episodes["lon"].extend(lon.tolist())
+            episodes["sigma"].extend([spec["episode_km"] / KM_PER_DEG] * count)
+            weights = rng.pareto(1.5, count) + 1
+            sizes = rng.multinomial(in_episodes, weights / weights.sum())
+            for e in range(count):
+                if not sizes[e]:
+                    continue
+                # Decaimiento exponencial dentro del episodio (pico al inicio, como réplicas o crecidas)
+                offsets = np.minimum(rng.exponential(lengths[e] / 3, sizes[e]).astype(np.int64), lengths[e] - 1)
+                ep_hours.append(np.minimum(starts[e] + offsets, self.hours - 1))
+                ep_index.append(np.full(sizes[e], first + e, dtype=np.int32))
+
+        self.episodes = {key: np.asarray(values) for key, values in episodes.items()}
+        ep_hours = np.concatenate(ep_hours) if ep_hours else np.zeros(0, dtype=np.int64)
+        ep_index = np.concatenate(ep_index) if ep_index else np.zeros(0, dtype=np.int32)
+        order = np.argsort(ep_hours, kind="stable")
+        self.ep_hours = ep_hours[order]
+        self.ep_index = ep_index[order]
+        self.per_hour = self.base.sum(axis=0) + np.bincount(self.ep_hours, minlength=self.hours)
+        self.total = int(self.per_hour.sum())
+
+    def chunks(self, chunk_size: int):
+        """Rangos de horas [h0, h1) con aproximadamente chunk_size alertas cada uno"""
+        cumulative = np.cumsum(self.per_hour)
+        h0 = 0
+        while h0 < self.hours:
+            target = (cumulative[h0 - 1] if h0 else 0) + chunk_size
+            h1 = min(max(int(np.searchsorted(cumulative, target, side="right")), h0 + 1), self.hours)
+            yield h0, h1
+            h0 = h1
+
+    def rows(self, h0: int, h1: int):
+        """Columnas de las alertas con hora en [h0, h1), ordenadas por created_at"""
+        rng = self.rng
+        hours, types, lats, lons, boosted = [], [], [], [], []
+        for t, name in enumerate(self.types):
+            counts = self.base[t, h0:h1]
+            n = int(counts.sum())
+            if not n:
+                continue
+            hours.append(np.repeat(np.arange(h0, h1), counts))
+            types.append(np.full(n, t))
+            lat, lon = _sample_mixture(rng, self.mixtures[name], n)
+            lats.append(lat)
+            lons.append(lon)
+            boosted.append(np.zeros(n, dtype=bool))
+
+        s0, s1 = np.searchsorted(self.ep_hours, [h0, h1])
+        if s1 > s0:
+            index = self.ep_index[s0:s1]
+            sigma = self.episodes["sigma"][index]
+            hours.append(self.ep_hours[s0:s1])
+            types.append(self.episodes["type"][index])
+            lats.append(self.episodes["lat"][index] + rng.normal(0, 1, s1 - s0) * sigma)
+            lons.append(self.episodes["lon"][index] + rng.normal(0, 1, s1 - s0) * sigma)
+            boosted.append(np.ones(s1 - s0, dtype=bool))
+
+        if not hours:
+            return None
+        hours = np.concatenate(hours)
+        seconds = hours * 3600 + rng.integers(0, 3600, len(hours))
+        order = np.argsort(seconds, kind="stable")
+        types = np.concatenate(types)[order]
+        lat, lon = _clip(np.concatenate(lats)[order], np.concatenate(lons)[order])
+        boosted = np.concatenate(boosted)[order]
+
+        severity = np.empty(len(types), dtype=np.int64)
+        for t, spec in enumerate(ALERT_TYPES.values()):
+            mask = types == t
+            severity[mask] = rng.choice(4, size=int(mask.sum()), p=spec["severity"]) + 1
+        # Los episodios son eventos mayores: severidad un nivel más alta en la mitad de los casos
+        severity = np.minimum(severity + (boosted & (rng.random(len(types)) < 0.5)), 4)
+
+        created_at = (np.datetime64(self.start, "s") + seconds[order].astype("timedelta64[s]")).astype("datetime64[us]")
+        return {"type": types, "lat": lat, "lon": lon, "severity": severity, "created_at": created_at}
+
+def alert_records(rng, columns: dict, first_id: int):
+    """Filas para INSERT; las alertas externas llevan un external_id único"""
+    sources = list(SOURCES)
+    source = rng.choice(len(sources), size=len(columns["type"]), p=list(SOURCES.values()))
+    title_pick = rng.integers(0, 3, len(source))
+    types = list(ALERT_TYPES)
+    records = []
+    for i, (t, lat, lon, severity, created_at, s, title) in enumerate(zip(
+            columns["type"].tolist(), columns["lat"].tolist(), columns["lon"].tolist(),
+            columns["severity"].tolist(), columns["created_at"].tolist(), source.tolist(), title_pick.tolist())):
+        name = sources[s]
+        records.append({
+            "title": TITLES[types[t]][title],
+            "description": f"Alerta sintética #{first_id + i}",
+            "lat": round(lat, 5),
+            "lon": round(lon, 5),
+            "severity": severity,
+            "alert_type": types[t],
+            "source": name,
+            "external_id": None if name == "manual" else f"{name}:syn{first_id + i}",
+            "created_at": created_at,
+        })
+    return records
+
+def zone_records(rng, count: int):
+    """Polígonos irregulares: zonas de riesgo en focos de amenaza y áreas seguras en ciudades"""
+    records = []
+    risk = rng.random(count) < 0.7
+    types = list(ALERT_TYPES)
+    for i in range(count):
+        if risk[i]:
+            alert_type = types[rng.integers(0, len(types))]
+            lat, lon = _sample_mixture(rng, _mixture(ALERT_TYPES[alert_type]["hotspots"], 0.3), 1)
+            name, zone_type, radius = f"Zona de riesgo ({alert_type}) #{i + 1}", "risk", rng.uniform(0.01, 0.06)
+        else:
+            city = CITIES[rng.integers(0, len(CITIES))]
+            lat, lon = _sample_mixture(rng, _mixture([city], 0.0), 1)
+            name, zone_type, radius = f"Área Segura - {city[0]} #{i + 1}", "safe", rng.uniform(0.003, 0.015)
+        lat, lon = _clip(lat, lon)
+        vertices = int(rng.integers(6, 13))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radii = radius * rng.uniform(0.6, 1.0, vertices)
+        ring = [[round(float(lon[0] + r * np.cos(a)), 5), round(float(lat[0] + r * np.sin(a)), 5)]
+                for a, r in zip(angles, radii)]
+        ring.append(ring[0])
+        geojson = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+        ]}
+        records.append({"name": name, "geojson": json.dumps(geojson, separators=(",", ":")), "zone_type": zone_type})
+    return records
+
+def shelter_records(rng, count: int, now: datetime):
+    """Refugios cerca de las ciudades en proporción a su población"""
+    kinds = list(SHELTER_TYPES)
+    kind = rng.choice(len(kinds), size=count, p=[SHELTER_TYPES[k][0] for k in kinds])
+    lat, lon = _clip(*_sample_mixture(rng, _mixture([], 1.0), count))
+    records = []
+    for i in range(count):
+        name = kinds[kind[i]]
+        capacity = max(10, int(rng.lognormal(np.log(SHELTER_TYPES[name][1]), 0.5)))
+        records.append({
+            "name": f"{SHELTER_NAMES[name]} {i + 1}",
+            "lat": round(float(lat[i]), 5),
+            "lon": round(float(lon[i]), 5),
+            "capacity": capacity,
+            "shelter_type": name,
+            "occupancy": int(capacity * rng.beta(1, 4)),
+            "updated_at": now,
+        })
+    return records
+
+def generate(database_url: str, alerts: int, zones: int, shelters: int, days: int = 730,
+             seed: int = 42, chunk_size: int = 50_000, end: datetime = None, rollups: bool = True) -> dict:
+    """Crear las tablas del backend y llenarlas; devuelve el manifiesto"""
+    from sqlalchemy import event
+    from sqlmodel import SQLModel, create_engine
+    from app.models import Alert, Zone, Shelter
+
+    engine = create_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _fast_inserts(dbapi_connection, _):
+            # Solo durante la carga: si se interrumpe, se vuelve a generar
+            dbapi_connection.execute("PRAGMA synchronous=OFF")
+    SQLModel.metadata.create_all(engine)
+
+    rng = np.random.default_rng(seed)
+    end = (end or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        if zones:
+            connection.execute(Zone.__table__.insert(), zone_records(rng, zones))
+        if shelters:
+            connection.execute(Shelter.__table__.insert(), shelter_records(rng, shelters, end))
+
+    plan = AlertPlan(rng, alerts, start, days)
+    inserted = 0
+    for h0, h1 in plan.chunks(chunk_size):
+        columns = plan.rows(h0, h1)
+        if columns is None:
+            continue
+        with engine.begin() as connection:
+            connection.execute(Alert.__table__.insert(), alert_records(rng, columns, inserted + 1))
+        inserted += len(columns["type"])
+        print(f"\r  {inserted:>12,} / {plan.total:,} alertas", end="", flush=True)
+    print()
+    loaded = time.perf_counter()
+
+    if rollups:
+        # El backend los reconstruye al arrancar si no coinciden; hacerlo aquí evita un arranque lento
+        from app.rollups import rebuild_rollups
+        rebuild_rollups(engine)
+    engine.dispose()
+
+    return {
+        "database_url": database_url,
+        "seed": seed,
+        "alerts": inserted,
+        "zones": zones,
+        "shelters": shelters,
+        "days": days,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "episodes": int(len(plan.episodes["type"])),
+        "by_type": {name: int(plan.base[t].sum() + (plan.episodes["type"][plan.ep_index] == t).sum())
+                    for t, name in enumerate(plan.types)},
+        "load_s": round(loaded - started, 2),
+        "rollups_s": round(time.perf_counter() - loaded, 2) if rollups else None,
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+def manifest_path(db_path: str) -> str:
+    return f"{db_path}.json"
+
+def main():
+    parser = argparse.ArgumentParser(description="Datos sintéticos de alertas, zonas y refugios")
+    parser.add_argument("--db", required=True, help="Archivo SQLite de salida")
+    parser.add_argument("--alerts", type=parse_count, default=parse_count("100k"), help="p. ej. 10k, 1M, 10M")
+    parser.add_argument("--zones", type=parse_count, help="Por defecto alertas/1000 (mínimo 10)")
+    parser.add_argument("--shelters", type=parse_count, help="Por defecto alertas/200 (mínimo 20)")
+    parser.add_argument("--days", type=int, default=730, help="Historia hasta ahora, en días")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--no-rollups", action="store_true", help="Dejar los rollups al arranque del backend")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if os.path.exists(db_path):
+        if not args.overwrite:
+            parser.error(f"{db_path} ya existe (usar --overwrite)")
+        for suffix in ("", "-wal", "-shm", ".json"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    database_url = f"sqlite:///{db_path}"
+    # app.database crea su engine al importarse: que apunte al mismo archivo
+    os.environ["DATABASE_URL"] = database_url
+    zones = args.zones if args.zones is not None else max(10, args.alerts // 1000)
+    shelters = args.shelters if args.shelters is not None else max(20, args.alerts // 200)
+
+    print(f"Generando {args.alerts:,} alertas, {zones:,} zonas y {shelters:,} refugios en {db_path}")
+    manifest = generate(database_url, args.alerts, zones, shelters, days=args.days, seed=args.seed,
+                        chunk_size=args.chunk_size, rollups=not args.no_rollups)
+    manifest["db_bytes"] = os.path.getsize(db_path)
+    with open(manifest_path(db_path), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Carga: {manifest['load_s']} s ({manifest['alerts'] / max(manifest['load_s'], 1e-9):,.0f} alertas/s)"
+          + (f", rollups: {manifest['rollups_s']} s" if manifest["rollups_s"] is not None else ""))
+    for name, count in manifest["by_type"].items():
+        print(f"  {name:<14} {count:>12,}")
+    print(f"Manifiesto en {manifest_path(db_path)}")
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,39 @@ import json
 import logging
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import httpx
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 import asyncio
+import numpy as np
 
-app = FastAPI(title="MCP Avanzado - Agente Analítico")
+from .backend_client import lifespan
+from .alert_frame import AlertFrame
+from .analytics_engine import analytics_engine
+from .clustering import location_clusters
+from .compute_pool import compute_pool
+from .forecasting import FORECAST_LEVEL, forecast_engine
+from .result_cache import result_cache
+from .snapshot_cache import snapshot_cache
+from .spatial import index_counts
+
+@asynccontextmanager
+async def app_lifespan(app):
+    async with lifespan(app):
+        try:
+            yield
+        finally:
+            compute_pool.shutdown()
+
+app = FastAPI(title="MCP Avanzado - Agente Analítico", lifespan=app_lifespan)
 
 # Configuración
-BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")  # Opcional para análisis avanzado
+# 0.02° (~2.2 km) era el umbral anterior; ventana 0 = sin restricción temporal
+CORRELATION_RADIUS_KM = float(os.getenv("CORRELATION_RADIUS_KM", "2.2"))
+CORRELATION_WINDOW_HOURS = float(os.getenv("CORRELATION_WINDOW_HOURS", "0"))
+PREDICT_MAX_HORIZON_DAYS = int(os.getenv("PREDICT_MAX_HORIZON_DAYS", "30"))
 
 class AnalysisRequest(BaseModel):
     query: str
@@ -36,73 +59,64 @@ async def health():
             "recommendation_engine",
             "data_aggregation",
             "alert_correlation"
-        ]
+        ],
+        "result_cache": result_cache.stats(),
+        "compute_pool": compute_pool.stats()
     }
 
 @app.get("/mcp/analytics/dashboard")
 async def get_analytics_dashboard():
-    """Dashboard analítico consolidado"""
-    async with httpx.AsyncClient() as client:
-        # Obtener datos de múltiples fuentes
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=100")
-        external_response = await client.get(f"{BACKEND_URL}/external-alerts")
-        
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-        external_data = external_response.json() if external_response.status_code == 200 else {"alerts": []}
-    
-    # Análisis básico
-    total_alerts = len(alerts_data)
-    external_alerts = len(external_data.get("alerts", []))
-    
-    # Análisis por severidad
-    severity_count = {}
-    for alert in alerts_data:
-        sev = alert.get('severity', 1)
-        severity_count[sev] = severity_count.get(sev, 0) + 1
-    
-    # Análisis temporal (últimas 24 horas)
-    recent_alerts = [
-        alert for alert in alerts_data 
-        if datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')) > datetime.utcnow() - timedelta(hours=24)
-    ]
-    
+    """Dashboard analítico consolidado (desde caché mientras no cambien los datos)"""
+    snapshot = await snapshot_cache.get()
+    return await result_cache.get_or_compute("advanced.analytics_dashboard", {}, snapshot.version,
+                                             lambda: build_analytics_dashboard(snapshot), store=not snapshot.partial)
+
+async def build_analytics_dashboard(snapshot) -> Dict:
+    # Agregados incrementales sobre todo el histórico (lecturas O(1))
+    await analytics_engine.sync()
+    summary = analytics_engine.summary()
+
     return {
         "summary": {
-            "total_alerts": total_alerts,
-            "external_alerts": external_alerts,
-            "recent_24h": len(recent_alerts),
-            "avg_severity": sum(alert.get('severity', 1) for alert in alerts_data) / total_alerts if total_alerts > 0 else 0
+            "total_alerts": summary["total_alerts"],
+            "external_alerts": len(snapshot.external.get("alerts", [])),
+            "recent_24h": summary["recent_24h"],
+            "last_7d": summary["last_7d"],
+            "last_12m": summary["last_12m"],
+            "avg_severity": summary["avg_severity"]
         },
-        "severity_breakdown": severity_count,
-        "risk_level": calculate_risk_level(severity_count, len(recent_alerts)),
-        "trends": analyze_trends(alerts_data),
+        "severity_breakdown": analytics_engine.severity_count,
+        # Nivel de riesgo sobre la ventana de 24 h
+        "risk_level": calculate_risk_level(analytics_engine.severity_24h(), summary["recent_24h"]),
+        "trends": analytics_engine.trends(days=7),
         "timestamp": datetime.utcnow().isoformat()
     }
 
 @app.post("/mcp/analysis/risk-assessment")
 async def risk_assessment(request: AnalysisRequest):
-    """Evaluación de riesgo basada en datos actuales"""
-    async with httpx.AsyncClient() as client:
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=50")
-        external_response = await client.get(f"{BACKEND_URL}/external-alerts")
-        
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-        external_data = external_response.json() if external_response.status_code == 200 else {"alerts": []}
-    
+    """Evaluación de riesgo basada en datos actuales (no depende de los parámetros de la petición)"""
+    snapshot = await snapshot_cache.get()
+    return await result_cache.get_or_compute("advanced.risk_assessment", {}, snapshot.version,
+                                             lambda: build_risk_assessment(snapshot), store=not snapshot.partial)
+
+async def build_risk_assessment(snapshot) -> RiskAssessment:
+    await analytics_engine.sync()
+    high_severity_count = snapshot.frame.head(50).count_high_severity()
+    external_data = snapshot.external
+
     # Análisis de factores de riesgo
     risk_factors = []
     recommendations = []
     
     # Factor 1: Alertas de alta severidad recientes
-    high_severity_alerts = [a for a in alerts_data if a.get('severity', 1) >= 3]
-    if high_severity_alerts:
-        risk_factors.append(f"{len(high_severity_alerts)} alertas de alta severidad activas")
+    if high_severity_count:
+        risk_factors.append(f"{high_severity_count} alertas de alta severidad activas")
         recommendations.append("Monitorear continuamente las alertas de alta severidad")
     
     # Factor 2: Concentración geográfica
-    location_clusters = analyze_location_clusters(alerts_data)
-    if location_clusters:
-        risk_factors.append(f"Concentración de alertas en {len(location_clusters)} zonas")
+    zone_clusters = await location_clusters(snapshot.frame)
+    if zone_clusters:
+        risk_factors.append(f"Concentración de alertas en {len(zone_clusters)} zonas")
         recommendations.append("Evaluar recursos en zonas de alta concentración")
     
     # Factor 3: Alertas externas
@@ -111,13 +125,13 @@ async def risk_assessment(request: AnalysisRequest):
         recommendations.append("Integrar alertas externas al sistema de monitoreo")
     
     # Factor 4: Tendencia temporal
-    trend = analyze_trends(alerts_data)
+    trend = analytics_engine.trends(days=7)
     if trend.get('increasing'):
         risk_factors.append("Tendencia creciente en número de alertas")
         recommendations.append("Aumentar capacidad de respuesta")
     
     # Calcular nivel de riesgo
-    risk_score = len(risk_factors) * 0.5 + len(high_severity_alerts) * 0.3
+    risk_score = len(risk_factors) * 0.5 + high_severity_count * 0.3
     if risk_score >= 2:
         risk_level = "ALTO"
     elif risk_score >= 1:
@@ -133,19 +147,22 @@ async def risk_assessment(request: AnalysisRequest):
     )
 
 @app.get("/mcp/analysis/correlation")
-async def analyze_correlations():
+async def analyze_correlations(radius_km: float = CORRELATION_RADIUS_KM,
+                               window_hours: float = CORRELATION_WINDOW_HOURS):
     """Detectar correlaciones entre alertas y factores externos"""
-    async with httpx.AsyncClient() as client:
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=100")
-        external_response = await client.get(f"{BACKEND_URL}/external-alerts")
-        
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-        external_data = external_response.json() if external_response.status_code == 200 else {"alerts": []}
-    
+    snapshot = await snapshot_cache.get()
+    return await result_cache.get_or_compute(
+        "advanced.analyze_correlations", {"radius_km": radius_km, "window_hours": window_hours}, snapshot.version,
+        lambda: build_correlations(snapshot, radius_km, window_hours), store=not snapshot.partial)
+
+async def build_correlations(snapshot, radius_km: float, window_hours: float) -> Dict:
+    await analytics_engine.sync()
+    external_data = snapshot.external
+
     correlations = []
     
     # Correlación temporal
-    time_patterns = analyze_temporal_patterns(alerts_data)
+    time_patterns = analytics_engine.temporal_pattern()
     if time_patterns:
         correlations.append({
             "type": "temporal",
@@ -154,7 +171,7 @@ async def analyze_correlations():
         })
     
     # Correlación geográfica
-    geo_clusters = analyze_location_clusters(alerts_data)
+    geo_clusters = await location_clusters(snapshot.frame)
     if geo_clusters:
         correlations.append({
             "type": "geographic", 
@@ -164,7 +181,8 @@ async def analyze_correlations():
     
     # Correlación con alertas externas
     if external_data.get('alerts'):
-        external_corr = correlate_with_external(alerts_data, external_data['alerts'])
+        external_corr = await correlate_with_external(snapshot.frame, external_data['alerts'],
+                                                radius_km=radius_km, window_hours=window_hours)
         if external_corr:
             correlations.extend(external_corr)
     
@@ -177,23 +195,52 @@ async def analyze_correlations():
 @app.post("/mcp/analysis/predict")
 async def predict_risk(request: AnalysisRequest):
     """Predecir riesgos futuros basado en datos históricos"""
-    async with httpx.AsyncClient() as client:
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=200")
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-    
-    # Análisis predictivo simple
-    trends = analyze_trends(alerts_data)
-    seasonal_patterns = analyze_seasonal_patterns(alerts_data)
+    # Parámetros opcionales en el contexto: horizon_days, zone, alert_type, level
+    # (ya convertidos, para que "2" y 2 compartan entrada en la caché; query no influye)
+    try:
+        horizon_days = int(request.context.get("horizon_days", 2))
+        level = float(request.context.get("level", FORECAST_LEVEL))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="horizon_days debe ser entero y level un número")
+    if not 1 <= horizon_days <= PREDICT_MAX_HORIZON_DAYS:
+        raise HTTPException(status_code=400, detail=f"horizon_days debe estar entre 1 y {PREDICT_MAX_HORIZON_DAYS}")
+    if not 0 < level < 1:
+        raise HTTPException(status_code=400, detail="level debe estar entre 0 y 1 (p. ej. 0.9)")
+    zone = request.context.get("zone")
+    alert_type = request.context.get("alert_type")
+    snapshot = await snapshot_cache.get()
+    params = {"horizon_days": horizon_days, "level": level, "zone": zone, "alert_type": alert_type}
+    return await result_cache.get_or_compute("advanced.predict_risk", params, snapshot.version,
+                                             lambda: build_prediction(horizon_days, level, zone, alert_type),
+                                             store=not snapshot.partial)
+
+async def build_prediction(horizon_days: int, level: float, zone: Optional[str], alert_type: Optional[str]) -> Dict:
+    await analytics_engine.sync()
+    forecast = forecast_engine.forecast(zone, alert_type, horizon_days, level)
+    seasonal_patterns = analytics_engine.seasonal_pattern()
     
     predictions = []
-    
-    if trends.get('increasing'):
-        predictions.append({
-            "timeframe": "24-48 horas",
-            "prediction": "Aumento esperado en número de alertas",
-            "confidence": 0.75,
-            "basis": "Tendencia histórica creciente"
-        })
+    timeframe = f"Próximos {horizon_days} días" if horizon_days != 1 else "Próximas 24 horas"
+    
+    if forecast:
+        interval = forecast["interval"]
+        basis = (f"Esperadas {forecast['expected']} alertas "
+                 f"(intervalo {int(level * 100)}%: {interval['low']}-{interval['high']}) "
+                 f"frente a {forecast['baseline']} de la última semana")
+        if forecast["p_increase"] >= 0.5:
+            predictions.append({
+                "timeframe": timeframe,
+                "prediction": "Aumento esperado en número de alertas",
+                "confidence": forecast["p_increase"],
+                "basis": basis
+            })
+        elif forecast["p_decrease"] >= 0.5:
+            predictions.append({
+                "timeframe": timeframe,
+                "prediction": "Disminución esperada en número de alertas",
+                "confidence": forecast["p_decrease"],
+                "basis": basis
+            })
     
     if seasonal_patterns:
         predictions.append({
@@ -205,7 +252,10 @@ async def predict_risk(request: AnalysisRequest):
     
     return {
         "predictions": predictions,
-        "based_on_samples": len(alerts_data),
+        "forecast": forecast,
+        "hotspots": [] if zone else forecast_engine.top_zones(horizon_days, level, alert_type),
+        "model": forecast_engine.stats(),
+        "based_on_samples": analytics_engine.total,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -227,120 +277,39 @@ def calculate_risk_level(severity_count: dict, recent_count: int) -> str:
     else:
         return "BAJO"
 
-def analyze_trends(alerts_data: List[Dict]) -> Dict[str, Any]:
-    if not alerts_data:
-        return {"trend": "stable", "increasing": False}
-    
-    # Agrupar por día
-    daily_count = {}
-    for alert in alerts_data:
-        date = datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')).date()
-        daily_count[date] = daily_count.get(date, 0) + 1
-    
-    # Analizar tendencia de los últimos 7 días
-    recent_dates = sorted(daily_count.keys())[-7:]
-    if len(recent_dates) < 2:
-        return {"trend": "insufficient_data", "increasing": False}
-    
-    recent_counts = [daily_count[date] for date in recent_dates]
-    trend = "increasing" if recent_counts[-1] > recent_counts[0] else "decreasing"
-    
-    return {
-        "trend": trend,
-        "increasing": trend == "increasing",
-        "last_7_days": recent_counts
-    }
-
-def analyze_temporal_patterns(alerts_data: List[Dict]) -> str:
-    if not alerts_data:
-        return ""
-    
-    # Agrupar por hora del día
-    hourly_count = {h: 0 for h in range(24)}
-    for alert in alerts_data:
-        hour = datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')).hour
-        hourly_count[hour] += 1
-    
-    # Encontrar horas pico
-    max_hour = max(hourly_count, key=hourly_count.get)
-    if hourly_count[max_hour] > len(alerts_data) * 0.2:  # 20% de las alertas en una hora
-        return f"Pico de alertas alrededor de las {max_hour}:00"
-    
-    return ""
+async def correlate_with_external(internal_alerts: AlertFrame, external_alerts: List[Dict],
+                                  radius_km: float = CORRELATION_RADIUS_KM,
+                                  window_hours: float = CORRELATION_WINDOW_HOURS) -> List[Dict]:
+    """Join espacial (haversine) entre alertas externas y el histórico interno.
 
-def analyze_location_clusters(alerts_data: List[Dict]) -> List[Dict]:
-    if not alerts_data:
+    El subconjunto manual y su índice se guardan en el frame de la instantánea
+    (se reconstruyen solo con una nueva versión de datos); por consulta solo
+    se recorren las alertas externas, en un hilo fuera del event loop.
+    """
+    internal = internal_alerts.manual_frame()
+    if not len(internal) or not external_alerts:
         return []
-    
-    # Agrupar alertas por proximidad (simplificado)
-    clusters = []
-    for alert in alerts_data:
-        lat, lon = alert.get('lat', 0), alert.get('lon', 0)
-        
-        # Buscar cluster cercano
-        found_cluster = None
-        for cluster in clusters:
-            cluster_lat, cluster_lon = cluster['center']
-            distance = ((lat - cluster_lat)**2 + (lon - cluster_lon)**2)**0.5
-            if distance < 0.01:  # ~1km
-                found_cluster = cluster
-                break
-        
-        if found_cluster:
-            found_cluster['alerts'].append(alert)
-            # Actualizar centro
-            alerts_in_cluster = found_cluster['alerts']
-            avg_lat = sum(a.get('lat', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            avg_lon = sum(a.get('lon', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            found_cluster['center'] = (avg_lat, avg_lon)
-        else:
-            clusters.append({
-                'center': (lat, lon),
-                'alerts': [alert],
-                'count': 1
-            })
-    
-    return [c for c in clusters if len(c['alerts']) > 1]  # Solo clusters con múltiples alertas
 
-def analyze_seasonal_patterns(alerts_data: List[Dict]) -> str:
-    if len(alerts_data) < 30:  # Necesitamos suficientes datos
-        return ""
-    
-    # Agrupar por mes
-    monthly_count = {}
-    for alert in alerts_data:
-        month = datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')).month
-        monthly_count[month] = monthly_count.get(month, 0) + 1
-    
-    # Buscar patrones estacionales
-    if len(monthly_count) >= 3:
-        avg = sum(monthly_count.values()) / len(monthly_count)
-        high_months = [m for m, count in monthly_count.items() if count > avg * 1.5]
-        if high_months:
-            return f"Mayor actividad en meses: {high_months}"
-    
-    return ""
+    external = AlertFrame.from_alerts(external_alerts)
+
+    def external_counts():
+        # La primera consulta de una versión construye el índice (también fuera del loop)
+        return index_counts(internal.geo_index(CORRELATION_RADIUS_KM), internal.epoch,
+                            external.lat, external.lon, external.epoch, radius_km, window_hours)
+
+    internal_count, nearest_km = await compute_pool.offload(external_counts)
 
-def correlate_with_external(internal_alerts: List[Dict], external_alerts: List[Dict]) -> List[Dict]:
     correlations = []
-    
-    for ext_alert in external_alerts:
-        ext_lat, ext_lon = ext_alert.get('lat', 0), ext_alert.get('lon', 0)
-        
-        # Buscar alertas internas cercanas
-        nearby_internal = [
-            alert for alert in internal_alerts
-            if ((alert.get('lat', 0) - ext_lat)**2 + (alert.get('lon', 0) - ext_lon)**2)**0.5 < 0.02
-        ]
-        
-        if nearby_internal:
-            correlations.append({
-                "type": "external_internal",
-                "description": f"Alerta externa correlacionada con {len(nearby_internal)} alertas internas",
-                "external_source": ext_alert.get('source', 'unknown'),
-                "internal_count": len(nearby_internal),
-                "confidence": 0.8
-            })
+    for k in np.flatnonzero(internal_count).tolist():
+        ext_alert = external_alerts[k]
+        correlations.append({
+            "type": "external_internal",
+            "description": f"Alerta externa correlacionada con {internal_count[k]} alertas internas",
+            "external_source": ext_alert.get('source', 'unknown'),
+            "internal_count": int(internal_count[k]),
+            "nearest_km": round(float(nearest_km[k]), 2),
+            "confidence": 0.8
+        })
     
     return correlations
 
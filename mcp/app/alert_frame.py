@@ -0,0 +1,148 @@
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from .analytics_engine import parse_timestamp
+from .spatial import GeoIndex, KDTree, haversine_km
+
+def parse_epochs(values: Sequence[Optional[str]]) -> np.ndarray:
+    """created_at ISO -> segundos epoch UTC (NaN si no se puede leer)"""
+    cleaned = [value if isinstance(value, str) and value else "NaT" for value in values]
+    try:
+        # Vía rápida: el backend serializa fechas UTC sin zona
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            stamps = np.array(cleaned, dtype="datetime64[us]")
+    except (ValueError, UserWarning, DeprecationWarning):
+        # Fechas con zona horaria u otros formatos: una por una
+        epochs = np.full(len(cleaned), np.nan)
+        for index, value in enumerate(cleaned):
+            moment = parse_timestamp(value)
+            if moment is not None:
+                epochs[index] = (np.datetime64(moment, "us") - np.datetime64(0, "us")) / np.timedelta64(1, "s")
+        return epochs
+
+    epochs = stamps.astype(np.int64) / 1e6
+    epochs[np.isnat(stamps)] = np.nan
+    return epochs
+
+class AlertFrame:
+    """Alertas en columnas NumPy, construidas una sola vez por instantánea.
+
+    `alerts` conserva los dicts originales (el orden del backend, de la más
+    reciente a la más antigua) para devolver filas sin reconstruirlas.
+    `version` identifica los datos (versión de la instantánea) cuando las
+    columnas no cambian mientras ella siga vigente; sirve de clave de caché.
+    """
+
+    def __init__(self, alerts: List[Dict[str, Any]], epoch: np.ndarray, lat: np.ndarray,
+                 lon: np.ndarray, severity: np.ndarray, type_code: np.ndarray, types: List[str],
+                 manual: np.ndarray, version: Optional[str] = None):
+        self.alerts = alerts
+        self.epoch = epoch
+        self.lat = lat
+        self.lon = lon
+        self.severity = severity
+        self.type_code = type_code
+        self.types = types
+        # True para alertas reportadas en la plataforma (source == "manual")
+        self.manual = manual
+        self.version = version
+        self._geo_index: Dict[float, GeoIndex] = {}
+        self._kd_tree: Optional[KDTree] = None
+        self._heads: Dict[int, "AlertFrame"] = {}
+        self._manual: Optional["AlertFrame"] = None
+
+    @classmethod
+    def from_alerts(cls, alerts: List[Dict[str, Any]], version: Optional[str] = None) -> "AlertFrame":
+        lat = np.array([alert.get('lat') or 0 for alert in alerts], dtype=np.float64)
+        lon = np.array([alert.get('lon') or 0 for alert in alerts], dtype=np.float64)
+        severity = np.array([alert.get('severity') or 1 for alert in alerts], dtype=np.int16)
+        types, type_code = np.unique(
+            np.array([alert.get('alert_type') or 'general' for alert in alerts], dtype=object).astype(str),
+            return_inverse=True
+        ) if alerts else (np.array([], dtype=str), np.array([], dtype=np.int64))
+        epoch = parse_epochs([alert.get('created_at') for alert in alerts])
+        manual = np.array([alert.get('source', 'manual') == 'manual' for alert in alerts], dtype=bool)
+        return cls(alerts, epoch, lat, lon, severity, type_code.astype(np.int16), types.tolist(), manual, version)
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def head(self, n: int) -> "AlertFrame":
+        """Las `n` alertas más recientes (vistas, sin copiar columnas).
+
+        Se guarda por `n` para que sus índices espaciales también se reutilicen.
+        """
+        if n not in self._heads:
+            self._heads[n] = AlertFrame(self.alerts[:n], self.epoch[:n], self.lat[:n], self.lon[:n],
+                                        self.severity[:n], self.type_code[:n], self.types, self.manual[:n],
+                                        f"{self.version}:head{n}" if self.version else None)
+        return self._heads[n]
+
+    def manual_frame(self) -> "AlertFrame":
+        """Solo las alertas reportadas en la plataforma.
+
+        Se guarda como `head`: el subconjunto y sus índices espaciales se
+        construyen una vez por instantánea y no en cada consulta.
+        """
+        if self._manual is None:
+            self._manual = self.take(self.manual)
+            self._manual.version = f"{self.version}:manual" if self.version else None
+        return self._manual
+
+    def take(self, mask) -> "AlertFrame":
+        """Subconjunto por máscara booleana o índices"""
+        indices = np.flatnonzero(mask) if getattr(mask, "dtype", None) == bool else np.asarray(mask, dtype=np.int64)
+        return AlertFrame(self.rows(indices), self.epoch[indices], self.lat[indices], self.lon[indices],
+                          self.severity[indices], self.type_code[indices], self.types, self.manual[indices])
+
+    def rows(self, mask) -> List[Dict[str, Any]]:
+        """Dicts originales seleccionados por máscara o índices"""
+        indices = np.flatnonzero(mask) if getattr(mask, "dtype", None) == bool else mask
+        return [self.alerts[i] for i in np.asarray(indices).tolist()]
+
+    # Consultas vectorizadas
+
+    def recent_mask(self, hours: float = 24, now: Optional[float] = None) -> np.ndarray:
+        now = time.time() if now is None else now
+        with np.errstate(invalid="ignore"):
+            return now - self.epoch < hours * 3600
+
+    def count_recent(self, hours: float = 24, now: Optional[float] = None) -> int:
+        return int(self.recent_mask(hours, now).sum())
+
+    def high_severity_mask(self, threshold: int = 3) -> np.ndarray:
+        return self.severity >= threshold
+
+    def count_high_severity(self, threshold: int = 3) -> int:
+        return int(self.high_severity_mask(threshold).sum())
+
+    def severity_counts(self) -> Dict[int, int]:
+        values, counts = np.unique(self.severity, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def type_counts(self) -> Dict[str, int]:
+        counts = np.bincount(self.type_code, minlength=len(self.types))
+        return {self.types[k]: int(c) for k, c in enumerate(counts) if c}
+
+    def daily_counts(self) -> Dict[int, int]:
+        """Conteo por día (días desde epoch)"""
+        valid = self.epoch[~np.isnan(self.epoch)]
+        days, counts = np.unique((valid // 86400).astype(np.int64), return_counts=True)
+        return dict(zip(days.tolist(), counts.tolist()))
+
+    def distances_km(self, lat: float, lon: float) -> np.ndarray:
+        return haversine_km(lat, lon, self.lat, self.lon)
+
+    def geo_index(self, cell_km: float = 5.0) -> GeoIndex:
+        """Índice espacial de las alertas, construido una vez por frame y tamaño de celda"""
+        if cell_km not in self._geo_index:
+            self._geo_index[cell_km] = GeoIndex(self.lat, self.lon, cell_km)
+        return self._geo_index[cell_km]
+
+    def kd_tree(self) -> KDTree:
+        """KD-tree de las alertas para vecinos más cercanos, construido una vez por frame"""
+        if self._kd_tree is None:
+            self._kd_tree = KDTree(self.lat, self.lon)
+        return self._kd_tree
@@ -0,0 +1,287 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from .backend_client import get_client
+
+# Configuración
+ANALYTICS_SYNC_SECONDS = float(os.getenv("ANALYTICS_SYNC_SECONDS", "5"))
+ANALYTICS_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", "5000"))
+# Horas recientes que el arranque pide con rollups horarios (el resto, diarios)
+ANALYTICS_BOOTSTRAP_HOURS = int(os.getenv("ANALYTICS_BOOTSTRAP_HOURS", "48"))
+
+# Canales de cada ventana: total, suma de severidad y conteo por severidad 1..5
+MAX_SEVERITY = 5
+_COUNT, _SEVERITY_SUM = 0, 1
+WIDTH = 2 + MAX_SEVERITY
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    """created_at del backend como datetime UTC sin zona"""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def hour_bucket(moment: datetime) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() // 3600)
+
+def day_bucket(moment: datetime) -> int:
+    return moment.toordinal()
+
+def month_bucket(moment: datetime) -> int:
+    return moment.year * 12 + moment.month - 1
+
+class RollingWindow:
+    """Ventana deslizante de `size` cubetas con totales acumulados.
+
+    Agregar un evento es O(1); avanzar la ventana limpia como máximo `size`
+    cubetas, y cada cubeta se limpia una sola vez por vuelta.
+    """
+
+    def __init__(self, size: int, bucket_of: Callable[[datetime], int]):
+        self.size = size
+        self.bucket_of = bucket_of
+        self.slots = [[0] * WIDTH for _ in range(size)]
+        self.totals = [0] * WIDTH
+        self.head: Optional[int] = None
+
+    def advance(self, bucket: int):
+        if self.head is None:
+            self.head = bucket
+            return
+        if bucket <= self.head:
+            return
+        for b in range(max(self.head + 1, bucket - self.size + 1), bucket + 1):
+            slot = self.slots[b % self.size]
+            for k in range(WIDTH):
+                self.totals[k] -= slot[k]
+                slot[k] = 0
+        self.head = bucket
+
+    def add(self, moment: datetime, values: List[int]):
+        bucket = self.bucket_of(moment)
+        self.advance(bucket)
+        # Eventos anteriores a la ventana solo cuentan en los agregados históricos
+        if bucket <= self.head - self.size:
+            return
+        slot = self.slots[bucket % self.size]
+        for k, value in enumerate(values):
+            slot[k] += value
+            self.totals[k] += value
+
+    def series(self, channel: int = _COUNT) -> List[int]:
+        """Valores de un canal de la cubeta más antigua a la más reciente"""
+        if self.head is None:
+            return [0] * self.size
+        return [self.slots[b % self.size][channel] for b in range(self.head - self.size + 1, self.head + 1)]
+
+    def severity_breakdown(self) -> Dict[int, int]:
+        return {sev: self.totals[1 + sev] for sev in range(1, MAX_SEVERITY + 1) if self.totals[1 + sev]}
+
+class AnalyticsEngine:
+    """Agregados de alertas mantenidos incrementalmente desde /alerts/changes.
+
+    Cada alerta nueva se aplica una sola vez (O(1)); las lecturas del
+    dashboard no recorren alertas, aunque el histórico sea completo.
+    """
+
+    def __init__(self):
+        # Modelos que consumen el mismo feed: observe(alert, moment) y reset()
+        self.subscribers = []
+        self.reset()
+        self._synced_at = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+
+    def reset(self):
+        self.last_id = 0
+        self.total = 0
+        self.severity_sum = 0
+        self.severity_count: Dict[int, int] = {}
+        self.type_count: Dict[str, int] = {}
+        self.hour_of_day = [0] * 24
+        self.month_of_year = [0] * 12
+        self.last_24h = RollingWindow(24, hour_bucket)
+        self.last_7d = RollingWindow(7, day_bucket)
+        self.last_12m = RollingWindow(12, month_bucket)
+        for subscriber in self.subscribers:
+            subscriber.reset()
+
+    @property
+    def windows(self):
+        return (self.last_24h, self.last_7d, self.last_12m)
+
+    def apply(self, alert: Dict[str, Any], count: int = 1, hourly: bool = True):
+        """Incorporar una alerta nueva (o `count` alertas iguales) a todos los agregados.
+
+        hourly=False: la hora de created_at no es significativa (rollup diario).
+        """
+        severity = alert.get('severity') or 1
+        self.total += count
+        self.severity_sum += severity * count
+        self.severity_count[severity] = self.severity_count.get(severity, 0) + count
+        alert_type = alert.get('alert_type') or 'general'
+        self.type_count[alert_type] = self.type_count.get(alert_type, 0) + count
+
+        moment = parse_timestamp(alert.get('created_at', ''))
+        if moment is None:
+            return
+        # Una fecha futura (reloj de la fuente adelantado) no debe adelantar las ventanas
+        moment = min(moment, datetime.utcnow())
+        if hourly:
+            self.hour_of_day[moment.hour] += count
+        self.month_of_year[moment.month - 1] += count
+
+        values = [0] * WIDTH
+        values[_COUNT] = count
+        values[_SEVERITY_SUM] = severity * count
+        values[1 + min(max(severity, 1), MAX_SEVERITY)] = count
+        for window in self.windows:
+            window.add(moment, values)
+        for subscriber in self.subscribers:
+            subscriber.observe(alert, moment, count)
+
+    def advance(self, now: Optional[datetime] = None):
+        """Desplazar las ventanas hasta `now` aunque no lleguen alertas"""
+        now = now or datetime.utcnow()
+        for window in self.windows:
+            window.advance(window.bucket_of(now))
+
+    async def sync(self):
+        """Traer alertas nuevas del backend (a lo sumo una vez por ANALYTICS_SYNC_SECONDS)"""
+        if time.monotonic() - self._synced_at < ANALYTICS_SYNC_SECONDS:
+            return
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._pull())
+        await asyncio.shield(self._inflight)
+
+    async def _pull(self):
+        try:
+            client = get_client()
+            if self.last_id == 0:
+                await self._bootstrap(client)
+            while True:
+                response = await client.get("/alerts/changes", params={
+                    "since_id": self.last_id, "limit": ANALYTICS_PAGE_SIZE
+                })
+                if response.status_code != 200:
+                    logging.warning(f"Feed de cambios no disponible: HTTP {response.status_code}")
+                    return
+                page = response.json()
+                if page.get("max_id", 0) < self.last_id:
+                    # La base del backend se reinició: reconstruir desde cero
+                    logging.info("🔄 Reinicio detectado en el backend, recalculando analíticas")
+                    self.reset()
+                    continue
+                for alert in page.get("alerts", []):
+                    self.apply(alert)
+                self.last_id = page.get("last_id", self.last_id)
+                if not page.get("has_more"):
+                    break
+            self._synced_at = time.monotonic()
+        except Exception as e:
+            logging.warning(f"No se pudieron sincronizar analíticas: {e}")
+        finally:
+            self._inflight = None
+
+    async def _bootstrap(self, client):
+        """Arranque en frío desde los rollups del backend (/stats/rollups/bootstrap).
+
+        Rollups diarios para el histórico y horarios solo para los últimos
+        días (la ventana de 24 horas); la distribución por hora del día del
+        tramo diario llega ya agregada. El costo depende del número de
+        cubetas, no del de alertas; el feed de cambios continúa desde el id
+        hasta el que los rollups están al día. Si el backend no expone
+        rollups se recorre el feed completo.
+        """
+        response = await client.get("/stats/rollups/bootstrap", params={"recent_hours": ANALYTICS_BOOTSTRAP_HOURS})
+        if response.status_code != 200:
+            return
+        page = response.json()
+        for rows, hourly in ((page.get("days", []), False), (page.get("hours", []), True)):
+            for row in rows:
+                # La zona es el centro de la celda del backend: basta como ubicación
+                lat, lon = (float(value) for value in row["zone"].split(","))
+                alert = {"created_at": row["bucket"], "lat": lat, "lon": lon,
+                         "alert_type": row["alert_type"], "severity": row["severity"]}
+                self.apply(alert, row["count"], hourly=hourly)
+        for hour, count in enumerate(page.get("hour_of_day", [])):
+            self.hour_of_day[hour] += count
+        self.last_id = page.get("last_alert_id", 0)
+        rows = len(page.get("days", [])) + len(page.get("hours", []))
+        logging.info(f"📊 Analíticas iniciadas desde {rows} filas de rollup")
+
+    # Lecturas O(1) (o O(tamaño de ventana), constante)
+
+    def recent_24h(self) -> int:
+        self.advance()
+        return self.last_24h.totals[_COUNT]
+
+    def avg_severity(self) -> float:
+        return self.severity_sum / self.total if self.total else 0
+
+    def high_severity(self) -> int:
+        return sum(count for sev, count in self.severity_count.items() if sev >= 3)
+
+    def high_severity_24h(self) -> int:
+        self.advance()
+        return sum(count for sev, count in self.last_24h.severity_breakdown().items() if sev >= 3)
+
+    def severity_24h(self) -> Dict[int, int]:
+        self.advance()
+        return self.last_24h.severity_breakdown()
+
+    def trends(self, days: int = 7) -> Dict[str, Any]:
+        """Tendencia de conteos diarios de los últimos `days` días (máximo 7)"""
+        if not self.total:
+            return {"trend": "stable", "increasing": False}
+        self.advance()
+        counts = self.last_7d.series()[-days:]
+        if sum(1 for count in counts if count) < 2:
+            return {"trend": "insufficient_data", "increasing": False}
+        trend = "increasing" if counts[-1] > counts[0] else "decreasing"
+        return {"trend": trend, "increasing": trend == "increasing", "recent_counts": counts}
+
+    def temporal_pattern(self) -> str:
+        """Hora pico si concentra más del 20% del histórico"""
+        if not self.total:
+            return ""
+        max_hour = max(range(24), key=self.hour_of_day.__getitem__)
+        if self.hour_of_day[max_hour] > self.total * 0.2:
+            return f"Pico de alertas alrededor de las {max_hour}:00"
+        return ""
+
+    def seasonal_pattern(self) -> str:
+        """Meses con actividad 1.5 veces por encima del promedio"""
+        if self.total < 30:
+            return ""
+        monthly = {m + 1: count for m, count in enumerate(self.month_of_year) if count}
+        if len(monthly) >= 3:
+            avg = sum(monthly.values()) / len(monthly)
+            high_months = [m for m, count in monthly.items() if count > avg * 1.5]
+            if high_months:
+                return f"Mayor actividad en meses: {high_months}"
+        return ""
+
+    def summary(self) -> Dict[str, Any]:
+        self.advance()
+        return {
+            "total_alerts": self.total,
+            "recent_24h": self.last_24h.totals[_COUNT],
+            "last_7d": self.last_7d.totals[_COUNT],
+            "last_12m": self.last_12m.totals[_COUNT],
+            "high_severity": self.high_severity(),
+            "avg_severity": self.avg_severity(),
+            "by_type": dict(self.type_count),
+            "daily_7d": self.last_7d.series(),
+            "hourly_24h": self.last_24h.series(),
+            "monthly_12m": self.last_12m.series(),
+            "last_id": self.last_id
+        }
+
+# Instancia global
+analytics_engine = AnalyticsEngine()
@@ -0,0 +1,76 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+import httpx
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+# Configuración
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+BACKEND_TIMEOUT_SECONDS = float(os.getenv("BACKEND_TIMEOUT_SECONDS", "10"))
+BACKEND_CONNECT_TIMEOUT_SECONDS = float(os.getenv("BACKEND_CONNECT_TIMEOUT_SECONDS", "3"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # sin h2 el cliente usa HTTP/1.1 con keep-alive
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=BACKEND_URL,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_KEEPALIVE
+        ),
+        timeout=httpx.Timeout(BACKEND_TIMEOUT_SECONDS, connect=BACKEND_CONNECT_TIMEOUT_SECONDS)
+    )
+
+def get_client() -> httpx.AsyncClient:
+    """Cliente compartido con pool de conexiones hacia el backend"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+@asynccontextmanager
+async def lifespan(app):
+    """Abrir el cliente al arrancar y cerrarlo al apagar"""
+    get_client()
+    logging.info(f"🔌 Cliente del backend listo ({'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'}) -> {BACKEND_URL}")
+    try:
+        yield
+    finally:
+        await close_client()
+
+async def proxy_stream(path: str, fallback):
+    """Reenviar los bytes del backend sin decodificar ni recodificar el JSON"""
+    client = get_client()
+    try:
+        response = await client.send(client.build_request("GET", path), stream=True)
+    except Exception as e:
+        logging.error(f"Error en proxy {path}: {e}")
+        return JSONResponse(fallback)
+
+    if response.status_code != 200:
+        await response.aclose()
+        logging.error(f"Error en proxy {path}: HTTP {response.status_code}")
+        return JSONResponse(fallback)
+
+    return StreamingResponse(
+        response.aiter_bytes(),
+        media_type=response.headers.get("content-type", "application/json"),
+        background=BackgroundTask(response.aclose)
+    )
@@ -0,0 +1,261 @@
+import os
+from typing import Dict, List, Tuple, Union
+import numpy as np
+from .alert_frame import AlertFrame
+from .compute_pool import compute_pool
+from .spatial import EARTH_RADIUS_KM
+
+# Configuración
+# 0.01° (~1.1 km) era el umbral de las versiones anteriores
+CLUSTER_RADIUS_KM = float(os.getenv("CLUSTER_RADIUS_KM", "1.1"))
+CLUSTER_MIN_SAMPLES = int(os.getenv("CLUSTER_MIN_SAMPLES", "2"))
+
+# Puntos por celda a partir de los cuales la celda se trata como bloque:
+# sus puntos no se comparan entre sí (todos son vecinos) y entre dos celdas
+# así basta un par cercano para unirlas
+CLUSTER_CELL_CAP = int(os.getenv("CLUSTER_CELL_CAP", "32"))
+
+# Celdas de lado radius/√2 (dos puntos de la misma celda siempre son vecinos):
+# se revisa la propia y la mitad de las 24 que están a dos celdas o menos,
+# así cada par de celdas se compara una sola vez
+_HALF_NEIGHBORHOOD = ((0, 0), (0, 1), (0, 2)) + tuple((dx, dy) for dx in (1, 2) for dy in range(-2, 3))
+# Distancias calculadas por bloque al buscar un par cercano entre dos celdas llenas
+_BLOCK = 1 << 20
+
+def project_km(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Proyección equirectangular a km alrededor de la latitud media"""
+    cos_lat = np.cos(np.radians(lat.mean())) if len(lat) else 1.0
+    scale = np.pi * EARTH_RADIUS_KM / 180.0
+    return np.column_stack((lon * cos_lat * scale, lat * scale))
+
+def neighbor_graph(xy: np.ndarray, radius: float,
+                   cap: int = CLUSTER_CELL_CAP) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aristas (i, j) de vecinos a distancia <= radius y máscara de puntos en celdas llenas.
+
+    Todo par cercano con algún extremo en una celda de `cap` puntos o menos
+    aparece una vez. Dentro de una celda llena (más de `cap` puntos) los
+    puntos se unen en estrella a su menor índice, y entre dos celdas llenas
+    vecinas hay una sola arista si algún par está a menos de radius: la
+    conectividad es la misma y el trabajo ya no es cuadrático en los puntos
+    de una celda.
+    """
+    n = len(xy)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 2:
+        return empty, empty, np.zeros(n, dtype=bool)
+
+    side = radius / np.sqrt(2)
+    cells = np.floor((xy - xy.min(axis=0)) / side).astype(np.int64) + 2
+    width = int(cells[:, 1].max()) + 3
+    keys = cells[:, 0] * width + cells[:, 1]
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    # Celdas ocupadas (ordenadas): las búsquedas se hacen por celda y no por punto
+    unique, cell_start, cell_size = np.unique(sorted_keys, return_index=True, return_counts=True)
+    cell = np.searchsorted(unique, keys)
+    full = cell_size[cell] > cap
+
+    left, right = [], []
+    for dx, dy in _HALF_NEIGHBORHOOD:
+        target = unique + dx * width + dy
+        found = np.minimum(np.searchsorted(unique, target), len(unique) - 1)
+        hit = unique[found] == target
+        start = cell_start[found][cell]
+        counts = np.where(hit, cell_size[found], 0)[cell]
+        # Celda llena contra celda llena: se resuelve abajo, por celdas
+        counts[full & (counts > cap)] = 0
+        if not counts.any():
+            continue
+
+        i = np.repeat(np.arange(n), counts)
+        # Posición dentro del rango [start, stop) de cada punto
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(start, counts) + offsets]
+
+        if (dx, dy) == (0, 0):
+            # En la propia celda todos son vecinos; cada par aparece dos veces: i < j
+            keep = i < j
+            left.append(i[keep])
+            right.append(j[keep])
+            continue
+        close = np.einsum("ij,ij->i", xy[i] - xy[j], xy[i] - xy[j]) <= radius * radius
+        left.append(i[close])
+        right.append(j[close])
+
+    if full.any():
+        # Estrella dentro de cada celda llena, centrada en su menor índice
+        members = order[full[order]]
+        same = sorted_keys[full[order]]
+        starts = np.flatnonzero(np.r_[True, same[1:] != same[:-1]])
+        group = np.cumsum(np.r_[False, same[1:] != same[:-1]])
+        link = np.ones(len(members), dtype=bool)
+        link[starts] = False
+        left.append(members[starts][group[link]])
+        right.append(members[link])
+
+        # Una arista por par de celdas llenas vecinas con algún par cercano
+        keys_full = same[starts]
+        bounds = np.r_[starts, len(members)]
+        for dx, dy in _HALF_NEIGHBORHOOD[1:]:
+            wanted = keys_full + dx * width + dy
+            target = np.minimum(np.searchsorted(keys_full, wanted), len(keys_full) - 1)
+            source = np.flatnonzero(keys_full[target] == wanted)
+            if not len(source):
+                continue
+            target = target[source]
+            # Candidato: el punto de cada celda que más avanza hacia la otra
+            direction = np.array([dx, dy], dtype=np.float64)
+            a = _extreme(xy, members, group, direction)[source]
+            b = _extreme(xy, members, group, -direction)[target]
+            close = np.einsum("ij,ij->i", xy[a] - xy[b], xy[a] - xy[b]) <= radius * radius
+            left.append(a[close])
+            right.append(b[close])
+            for k in np.flatnonzero(~close).tolist():
+                edge = _close_pair(xy, members[bounds[source[k]]:bounds[source[k] + 1]],
+                                   members[bounds[target[k]]:bounds[target[k] + 1]], radius)
+                if edge is not None:
+                    left.append(np.array([edge[0]]))
+                    right.append(np.array([edge[1]]))
+
+    i = np.concatenate(left) if left else empty
+    j = np.concatenate(right) if right else empty
+    return i, j, full
+
+def _extreme(xy: np.ndarray, members: np.ndarray, group: np.ndarray, direction: np.ndarray) -> np.ndarray:
+    """Por grupo (miembros contiguos), el punto con mayor proyección sobre `direction`"""
+    ranked = np.lexsort((-(xy[members] @ direction), group))
+    first = np.r_[True, group[ranked][1:] != group[ranked][:-1]]
+    return members[ranked[first]]
+
+def _close_pair(xy: np.ndarray, a: np.ndarray, b: np.ndarray, radius: float):
+    """Algún par (a, b) a distancia <= radius, o None"""
+    # Solo cuentan los puntos a menos de radius de la caja de la otra celda,
+    # primero los más cercanos a su centro: en zonas densas basta con pocos
+    def near(points, box_of):
+        low, high = xy[box_of].min(axis=0) - radius, xy[box_of].max(axis=0) + radius
+        points = points[np.all((xy[points] >= low) & (xy[points] <= high), axis=1)]
+        gap = xy[points] - (low + high) / 2
+        return points[np.argsort(np.einsum("ij,ij->i", gap, gap), kind="stable")]
+
+    a, b = near(a, b), near(b, a)
+    if not len(a) or not len(b):
+        return None
+    prefix = 16
+    while prefix < max(len(a), len(b)) and prefix * prefix < _BLOCK:
+        edge = _first_close(xy, a[:prefix], b[:prefix], radius)
+        if edge is not None:
+            return edge
+        prefix *= 4
+    step = max(1, _BLOCK // len(b))
+    for begin in range(0, len(a), step):
+        edge = _first_close(xy, a[begin:begin + step], b, radius)
+        if edge is not None:
+            return edge
+    return None
+
+def _first_close(xy: np.ndarray, a: np.ndarray, b: np.ndarray, radius: float):
+    gap = xy[a][:, None, :] - xy[b][None, :, :]
+    hits = np.argwhere(np.einsum("ijk,ijk->ij", gap, gap) <= radius * radius)
+    return (int(a[hits[0, 0]]), int(b[hits[0, 1]])) if len(hits) else None
+
+def connected_labels(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Componentes conexas: cada nodo queda etiquetado con el menor índice de su componente"""
+    labels = np.arange(n)
+    if not len(i):
+        return labels
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        updated = labels.copy()
+        np.minimum.at(updated, i, low)
+        np.minimum.at(updated, j, low)
+        # Salto de punteros para acortar cadenas largas
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def dbscan_labels(lat: np.ndarray, lon: np.ndarray, radius_km: float = CLUSTER_RADIUS_KM,
+                  min_samples: int = CLUSTER_MIN_SAMPLES) -> np.ndarray:
+    """Etiquetas estilo DBSCAN (-1 = ruido), independientes del orden de entrada"""
+    n = len(lat)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    xy = project_km(lat, lon)
+    i, j, full = neighbor_graph(xy, radius_km, max(CLUSTER_CELL_CAP, min_samples))
+
+    # Núcleos: puntos con al menos min_samples vecinos (incluido él mismo); en
+    # una celda llena todos lo son, y fuera de ellas el grado es exacto
+    degree = np.bincount(np.concatenate((i, j)), minlength=n) + 1
+    core = (degree >= min_samples) | full
+
+    both = core[i] & core[j]
+    components = connected_labels(n, i[both], j[both])
+    labels[core] = components[core]
+
+    # Bordes: se unen al cluster del núcleo vecino de menor índice
+    border_i = np.concatenate((i[core[j] & ~core[i]], j[core[i] & ~core[j]]))
+    border_core = np.concatenate((j[core[j] & ~core[i]], i[core[i] & ~core[j]]))
+    if len(border_i):
+        order = np.lexsort((border_core, border_i))
+        border_i, border_core = border_i[order], border_core[order]
+        first = np.r_[True, border_i[1:] != border_i[:-1]]
+        labels[border_i[first]] = components[border_core[first]]
+
+    return labels
+
+def analyze_location_clusters(alerts_data: Union[AlertFrame, List[Dict]], radius_km: float = CLUSTER_RADIUS_KM,
+                              min_samples: int = CLUSTER_MIN_SAMPLES) -> List[Dict]:
+    """Clusters geográficos de alertas.
+
+    Devuelve dicts con 'center' (lat, lon medios), 'alerts' (en el orden de
+    entrada) y 'count', ordenados de mayor a menor tamaño.
+    """
+    if not len(alerts_data):
+        return []
+
+    if isinstance(alerts_data, AlertFrame):
+        lat, lon, alerts_data = alerts_data.lat, alerts_data.lon, alerts_data.alerts
+    else:
+        lat = np.array([alert.get('lat') or 0 for alert in alerts_data], dtype=np.float64)
+        lon = np.array([alert.get('lon') or 0 for alert in alerts_data], dtype=np.float64)
+    return clusters_from_labels(alerts_data, lat, lon, dbscan_labels(lat, lon, radius_km, min_samples))
+
+async def location_clusters(frame: AlertFrame, radius_km: float = CLUSTER_RADIUS_KM,
+                            min_samples: int = CLUSTER_MIN_SAMPLES) -> List[Dict]:
+    """Igual que analyze_location_clusters, con el DBSCAN en el pool de procesos"""
+    if not len(frame):
+        return []
+    # Las coordenadas de una misma versión de datos se comparten una sola vez con el pool
+    labels = await compute_pool.run(dbscan_labels, [frame.lat, frame.lon], radius_km, min_samples,
+                                    key=(frame.version, "lat_lon") if frame.version else None)
+    return clusters_from_labels(frame.alerts, frame.lat, frame.lon, labels)
+
+def clusters_from_labels(alerts_data: List[Dict], lat: np.ndarray, lon: np.ndarray,
+                         labels: np.ndarray) -> List[Dict]:
+    """Clusters a partir de etiquetas de dbscan_labels (-1 = ruido)"""
+    members = np.flatnonzero(labels >= 0)
+    if not len(members):
+        return []
+
+    ids, inverse, counts = np.unique(labels[members], return_inverse=True, return_counts=True)
+    sum_lat = np.bincount(inverse, weights=lat[members])
+    sum_lon = np.bincount(inverse, weights=lon[members])
+
+    grouped = [[] for _ in ids]
+    for index, group in zip(members.tolist(), inverse.tolist()):
+        grouped[group].append(alerts_data[index])
+
+    clusters = [
+        {
+            'center': (float(sum_lat[k] / counts[k]), float(sum_lon[k] / counts[k])),
+            'alerts': grouped[k],
+            'count': int(counts[k])
+        }
+        for k in range(len(ids))
+    ]
+    # Orden determinista: tamaño descendente y, a igual tamaño, por su primer núcleo en la entrada
+    clusters.sort(key=lambda c: -c['count'])
+    return clusters
@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Configuración
+# 0 = sin procesos: el análisis corre en un hilo (no bloquea el event loop, pero comparte el GIL)
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(os.cpu_count() or 1)))
+COMPUTE_MAX_CONCURRENT = int(os.getenv("COMPUTE_MAX_CONCURRENT", str(max(COMPUTE_WORKERS, 1))))
+COMPUTE_TIMEOUT_SECONDS = float(os.getenv("COMPUTE_TIMEOUT_SECONDS", "30"))
+# Por debajo de este número de filas el costo de enviar el trabajo supera al del cálculo
+COMPUTE_INLINE_MAX_ITEMS = int(os.getenv("COMPUTE_INLINE_MAX_ITEMS", "5000"))
+# Juegos de arreglos en memoria compartida que se conservan por clave (versión de datos)
+COMPUTE_SHARED_ENTRIES = int(os.getenv("COMPUTE_SHARED_ENTRIES", "8"))
+
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+def _share(arrays: Sequence[np.ndarray]) -> Tuple[List[shared_memory.SharedMemory], List[ArraySpec]]:
+    """Copiar cada arreglo a un bloque de memoria compartida (sin pickle)"""
+    blocks, specs = [], []
+    try:
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            specs.append((block.name, array.shape, array.dtype.str))
+    except Exception:
+        _release(blocks)
+        raise
+    return blocks, specs
+
+def _release(blocks: List[shared_memory.SharedMemory]):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+def _readonly(block: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: str) -> np.ndarray:
+    array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+def _invoke(fn: Callable, specs: List[ArraySpec], args: tuple) -> Any:
+    """En el proceso hijo: abrir los bloques como arreglos de solo lectura y llamar a fn.
+
+    fn debe devolver objetos propios, no vistas de los arreglos recibidos.
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [_readonly(block, shape, dtype) for block, (_, shape, dtype) in zip(blocks, specs)]
+        result = fn(*arrays, *args)
+        # Sin referencias a los búferes, close() no falla
+        del arrays
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+class _SharedArrays:
+    """Bloques compartidos de una clave; se liberan al salir del caché y quedar sin tareas"""
+
+    def __init__(self, blocks: List[shared_memory.SharedMemory], specs: List[ArraySpec]):
+        self.blocks = blocks
+        self.specs = specs
+        self.users = 0
+        self.evicted = False
+
+    def matches(self, arrays: Sequence[np.ndarray]) -> bool:
+        return [(tuple(shape), dtype) for _, shape, dtype in self.specs] == \
+            [(tuple(np.shape(array)), np.asarray(array).dtype.str) for array in arrays]
+
+    def done(self):
+        self.users -= 1
+        if self.evicted and not self.users:
+            _release(self.blocks)
+
+class ComputePool:
+    """Pool de procesos para análisis que consumen CPU.
+
+    Los handlers son `async def`: un DBSCAN o un join espacial grande
+    ejecutado en el event loop detiene todas las demás peticiones del worker.
+    `run` envía la función a un proceso hijo pasando los arreglos por memoria
+    compartida, limita las tareas simultáneas (las demás esperan su turno sin
+    bloquear el loop) y corta las que exceden el tiempo: si la tarea ya estaba
+    en ejecución, el pool se reinicia para no dejar un proceso ocupado.
+
+    Con `key` (p. ej. la versión de datos de la instantánea) los bloques
+    compartidos se reutilizan entre llamadas en lugar de copiar los arreglos
+    cada vez; quien pasa la clave garantiza que los arreglos no cambian
+    mientras ella siga vigente. `offload` corre en un hilo, con el mismo
+    límite de concurrencia, el trabajo que depende de estado del proceso
+    (p. ej. los precios de arranque en caliente de las subastas).
+    """
+
+    def __init__(self, workers: int = COMPUTE_WORKERS, max_concurrent: int = COMPUTE_MAX_CONCURRENT,
+                 timeout: float = COMPUTE_TIMEOUT_SECONDS, inline_max_items: int = COMPUTE_INLINE_MAX_ITEMS,
+                 shared_entries: int = COMPUTE_SHARED_ENTRIES):
+        self.workers = max(workers, 0)
+        self.max_concurrent = max(max_concurrent, 1)
+        self.timeout = timeout
+        self.inline_max_items = inline_max_items
+        self.shared_entries = max(shared_entries, 0)
+        self._shared: "OrderedDict[Hashable, _SharedArrays]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.counts: Dict[str, int] = {"submitted": 0, "inline": 0, "threaded": 0, "completed": 0,
+                                       "timeouts": 0, "failures": 0, "restarts": 0, "shared_reused": 0}
+        self.busy_seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: los hijos no heredan hilos ni sockets del servidor
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logging.info(f"🧮 Pool de cálculo con {self.workers} procesos")
+        return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        # Solo si sigue siendo el pool actual (otra tarea pudo reiniciarlo ya)
+        if executor is None or executor is not self._executor:
+            return
+        self._executor = None
+        self.counts["restarts"] += 1
+        # Los procesos con una tarea vencida no se pueden interrumpir de otra forma
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def run(self, fn: Callable, arrays: Sequence[np.ndarray], *args, timeout: Optional[float] = None,
+                  key: Optional[Hashable] = None) -> Any:
+        """fn(*arrays, *args) fuera del event loop; fn debe ser una función de módulo (importable)"""
+        items = max((len(array) for array in arrays), default=0)
+        if items <= self.inline_max_items:
+            self.counts["inline"] += 1
+            return fn(*arrays, *args)
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._semaphore:
+            self.active += 1
+            started = time.perf_counter()
+            try:
+                if not self.workers:
+                    self.counts["threaded"] += 1
+                    result = await asyncio.wait_for(asyncio.to_thread(fn, *arrays, *args), timeout)
+                else:
+                    try:
+                        result = await self._submit(fn, arrays, args, timeout, key)
+                    except BrokenProcessPool:
+                        # Otra tarea reinició el pool mientras esta corría: un reintento
+                        result = await self._submit(fn, arrays, args, timeout, key)
+                self.counts["completed"] += 1
+                return result
+            except asyncio.TimeoutError:
+                self.counts["timeouts"] += 1
+                raise TimeoutError(f"El análisis {getattr(fn, '__name__', fn)} excedió {timeout:g}s") from None
+            except Exception:
+                self.counts["failures"] += 1
+                raise
+            finally:
+                self.active -= 1
+                self.busy_seconds += time.perf_counter() - started
+
+    async def offload(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """fn(*args, **kwargs) en un hilo, dentro del límite de concurrencia.
+
+        Un hilo no se puede interrumpir: al vencer el plazo se responde con
+        TimeoutError y el cálculo termina en segundo plano.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        async with self._semaphore:
+            self.active += 1
+            self.counts["threaded"] += 1
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout)
+                self.counts["completed"] += 1
+                return result
+            except asyncio.TimeoutError:
+                self.counts["timeouts"] += 1
+                raise TimeoutError(f"El cálculo {getattr(fn, '__name__', fn)} excedió {timeout:g}s") from None
+            except Exception:
+                self.counts["failures"] += 1
+                raise
+            finally:
+                self.active -= 1
+                self.busy_seconds += time.perf_counter() - started
+
+    def _lease(self, arrays: Sequence[np.ndarray], key: Optional[Hashable]) -> _SharedArrays:
+        """Bloques compartidos para una tarea: nuevos, o los de la clave si ya existen"""
+        if key is None or not self.shared_entries:
+            shared = _SharedArrays(*_share(arrays))
+            shared.evicted = True
+        else:
+            shared = self._shared.get(key)
+            if shared is not None and shared.matches(arrays):
+                self._shared.move_to_end(key)
+                self.counts["shared_reused"] += 1
+            else:
+                if shared is not None:
+                    self._evict(key)
+                shared = self._shared[key] = _SharedArrays(*_share(arrays))
+                while len(self._shared) > self.shared_entries:
+                    self._evict(next(iter(self._shared)))
+        shared.users += 1
+        return shared
+
+    def _evict(self, key: Hashable):
+        shared = self._shared.pop(key)
+        shared.evicted = True
+        if not shared.users:
+            _release(shared.blocks)
+
+    async def _submit(self, fn: Callable, arrays: Sequence[np.ndarray], args: tuple, timeout: float,
+                      key: Optional[Hashable] = None) -> Any:
+        shared = self._lease(arrays, key)
+        specs = shared.specs
+        try:
+            self.counts["submitted"] += 1
+            executor = self._pool()
+            try:
+                future = executor.submit(_invoke, fn, specs, args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                executor = self._pool()
+                future = executor.submit(_invoke, fn, specs, args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                if not future.cancel():
+                    self._restart(executor)
+                raise
+            except BrokenProcessPool:
+                self._restart(executor)
+                raise
+        finally:
+            # El hijo ya no usa los bloques (o fue terminado): sin clave, unlink libera la memoria
+            shared.done()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for key in list(self._shared):
+            self._evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "timeout_seconds": self.timeout,
+            "inline_max_items": self.inline_max_items,
+            "shared_entries": len(self._shared),
+            **self.counts,
+            "busy_seconds": round(self.busy_seconds, 3)
+        }
+
+# Instancia global
+compute_pool = ComputePool()
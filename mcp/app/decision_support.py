@@ -1,8 +1,25 @@
-from fastapi import APIRouter
+import os
+import json
+import logging
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
-import httpx
+import numpy as np
+from .analytics_engine import MAX_SEVERITY
+from .clustering import location_clusters
+from .compute_pool import compute_pool
+from .optimization import allocation_solver
+from .snapshot_cache import snapshot_cache
+from .spatial import haversine_km
+
+# Configuración de la asignación de equipos (km equivalentes de traslado)
+ALLOCATION_VALUE_KM = float(os.getenv("ALLOCATION_VALUE_KM", "100"))
+ALLOCATION_MAX_KM = float(os.getenv("ALLOCATION_MAX_KM", "100"))
+# Equipos disponibles para GET /resource-optimization: JSON [{"id", "lat", "lon", "capacity", "team_type"}, ...]
+ALLOCATION_TEAMS_FILE = os.getenv("ALLOCATION_TEAMS_FILE", "")
+
+RESOURCE_TYPES = ("medical_teams", "rescue_teams", "communication_units", "logistics_support")
 
 router = APIRouter(prefix="/mcp/decisions", tags=["decision-support"])
 
@@ -11,6 +28,17 @@ class DecisionRequest(BaseModel):
     available_resources: Dict[str, Any]
     constraints: List[str] = []
 
+class Team(BaseModel):
+    id: str
+    lat: float
+    lon: float
+    capacity: int = 1
+    team_type: str = "rescue_teams"
+
+class ResourceOptimizationRequest(BaseModel):
+    teams: List[Team]
+    max_km: Optional[float] = None
+
 class DecisionResponse(BaseModel):
     recommended_actions: List[str]
     priority_order: List[str]
@@ -22,15 +50,11 @@ async def emergency_response_plan(request: DecisionRequest):
     """Generar plan de respuesta de emergencia basado en escenario"""
     
     # Obtener datos actuales del sistema
-    async with httpx.AsyncClient() as client:
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=50")
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-    
+    snapshot = await snapshot_cache.get()
+    frame = snapshot.frame.head(50)
+
     # Filtrar alertas activas de alta severidad
-    high_priority_alerts = [
-        alert for alert in alerts_data 
-        if alert.get('severity', 1) >= 3
-    ]
+    high_priority_alerts = frame.rows(frame.high_severity_mask())
     
     # Generar recomendaciones basadas en el escenario
     if request.scenario.lower() == "inundacion":
@@ -125,33 +149,113 @@ def generate_generic_response(alerts: List[Dict], resources: Dict) -> DecisionRe
         rationale="Respuesta genérica de emergencia adaptativa a múltiples escenarios"
     )
 
+def configured_teams() -> List[Team]:
+    """Equipos declarados en ALLOCATION_TEAMS_FILE (vacío si no hay archivo)"""
+    if not ALLOCATION_TEAMS_FILE:
+        return []
+    try:
+        with open(ALLOCATION_TEAMS_FILE, encoding="utf-8") as f:
+            return [Team(**team) for team in json.load(f)]
+    except (OSError, ValueError, TypeError) as e:
+        logging.error(f"❌ No se pudieron leer los equipos de {ALLOCATION_TEAMS_FILE}: {e}")
+        return []
+
 @router.get("/resource-optimization")
-async def optimize_resources():
-    """Optimizar asignación de recursos basado en alertas actuales"""
-    async with httpx.AsyncClient() as client:
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=100")
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-    
-    # Analizar distribución geográfica de alertas
-    clusters = analyze_location_clusters(alerts_data)
-    
+async def optimize_resources(max_km: float = ALLOCATION_MAX_KM):
+    """Asignar los equipos configurados a todos los clusters (mismo plan que el POST).
+
+    Sin equipos configurados el plan informa la demanda de cada cluster sin
+    cobertura; el POST permite enviar los equipos en la petición.
+    """
+    teams = configured_teams()
+    unknown = {team.team_type for team in teams} - set(RESOURCE_TYPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"team_type desconocido en {ALLOCATION_TEAMS_FILE}: {sorted(unknown)}")
+    snapshot = await snapshot_cache.get()
+    clusters = await location_clusters(snapshot.frame)
+    return await compute_pool.offload(allocate_teams, clusters, teams, max(max_km, 0.0))
+
+@router.post("/resource-optimization")
+async def optimize_resource_allocation(request: ResourceOptimizationRequest):
+    """Asignar equipos a todos los clusters minimizando traslados y priorizando severidad"""
+    unknown = {team.team_type for team in request.teams} - set(RESOURCE_TYPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"team_type desconocido: {sorted(unknown)}; válidos: {list(RESOURCE_TYPES)}")
+    snapshot = await snapshot_cache.get()
+    clusters = await location_clusters(snapshot.frame)
+    # Las subastas corren en un hilo (los precios de arranque en caliente viven en este proceso)
+    return await compute_pool.offload(allocate_teams, clusters, request.teams, request.max_km or ALLOCATION_MAX_KM)
+
+def allocate_teams(clusters: List[Dict], teams: List[Team], max_km: float = ALLOCATION_MAX_KM) -> Dict[str, Any]:
+    """Asignación de costo mínimo por tipo de recurso.
+
+    Cada unidad de capacidad de un equipo vale ALLOCATION_VALUE_KM escalado por
+    la severidad máxima del cluster, menos la distancia recorrida; la subasta
+    maximiza el total respetando la demanda de cada cluster.
+    """
+    centers = np.array([cluster['center'] for cluster in clusters], dtype=np.float64).reshape(-1, 2)
+    demands = [calculate_required_resources(cluster['alerts']) for cluster in clusters]
+    max_severity = np.array([max((a.get('severity') or 1 for a in cluster['alerts']), default=1)
+                             for cluster in clusters], dtype=np.float64)
+    value_km = ALLOCATION_VALUE_KM * max_severity / MAX_SEVERITY
+    keys = [(round(lat, 2), round(lon, 2)) for lat, lon in centers.tolist()]
+
+    assigned: List[Dict[str, List[Dict[str, Any]]]] = [{} for _ in clusters]
+    idle_units: Dict[str, int] = {}
+    solver_info = {}
+    total_km = 0.0
+    for team_type in sorted({team.team_type for team in teams}):
+        group = [team for team in teams if team.team_type == team_type and team.capacity > 0]
+        team_lat = np.array([team.lat for team in group], dtype=np.float64)
+        team_lon = np.array([team.lon for team in group], dtype=np.float64)
+        distance = haversine_km(team_lat[:, None], team_lon[:, None], centers[:, 0][None, :], centers[:, 1][None, :])
+        benefit = np.where(distance <= max_km, value_km[None, :] - distance, -np.inf)
+        demand = [d[team_type] for d in demands]
+        capacity = [team.capacity for team in group]
+        result, solver_info[team_type] = allocation_solver.solve(benefit, demand, keys, group=team_type, supply=capacity)
+
+        for team_index, cluster_index, count in result.flows:
+            team = group[team_index]
+            km = float(distance[team_index, cluster_index])
+            total_km += km * count
+            assigned[cluster_index].setdefault(team_type, []).append({
+                "team_id": team.id, "units": count, "distance_km": round(km, 2)
+            })
+        for team, placed in zip(group, result.assigned(len(group)).tolist()):
+            if placed < team.capacity:
+                idle_units[team.id] = team.capacity - placed
+
     optimization_plan = {}
-    
-    for i, cluster in enumerate(clusters[:5]):  # Máximo 5 clusters
-        cluster_alerts = cluster['alerts']
-        high_severity_count = len([a for a in cluster_alerts if a.get('severity', 1) >= 3])
-        
+    demand_units = assigned_units = 0
+    for i, cluster in enumerate(clusters):
+        high_severity_count = len([a for a in cluster['alerts'] if a.get('severity', 1) >= 3])
+        # Sin ningún equipo, la demanda de todos los tipos queda descubierta
+        types = list(solver_info) or list(RESOURCE_TYPES)
+        requested = {t: demands[i][t] for t in types}
+        covered = {t: sum(a["units"] for a in assigned[i].get(t, [])) for t in types}
+        demand_units += sum(requested.values())
+        assigned_units += sum(covered.values())
         optimization_plan[f"zone_{i+1}"] = {
             "center": cluster['center'],
-            "alert_count": len(cluster_alerts),
+            "alert_count": len(cluster['alerts']),
             "high_severity_alerts": high_severity_count,
-            "recommended_resources": calculate_required_resources(cluster_alerts),
+            "recommended_resources": demands[i],
+            "assigned_teams": assigned[i],
+            "coverage": round(sum(covered.values()) / sum(requested.values()), 2) if sum(requested.values()) else 1.0,
             "priority": "HIGH" if high_severity_count > 0 else "MEDIUM"
         }
-    
+
     return {
         "optimization_plan": optimization_plan,
         "total_zones": len(clusters),
+        "unassigned_teams": idle_units,
+        "summary": {
+            "teams": len(teams),
+            "demand_units": demand_units,
+            "assigned_units": assigned_units,
+            "total_travel_km": round(total_km, 2)
+        },
+        "solver": solver_info,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -165,33 +269,3 @@ def calculate_required_resources(alerts: List[Dict]) -> Dict[str, int]:
         "communication_units": 1 if total_alerts > 0 else 0,
         "logistics_support": min(total_alerts // 10 + 1, 2)
     }
-
-# Función auxiliar (definida en el archivo anterior)
-def analyze_location_clusters(alerts_data: List[Dict]) -> List[Dict]:
-    # Reutilizar la función del archivo anterior
-    clusters = []
-    for alert in alerts_data:
-        lat, lon = alert.get('lat', 0), alert.get('lon', 0)
-        
-        found_cluster = None
-        for cluster in clusters:
-            cluster_lat, cluster_lon = cluster['center']
-            distance = ((lat - cluster_lat)**2 + (lon - cluster_lon)**2)**0.5
-            if distance < 0.01:
-                found_cluster = cluster
-                break
-        
-        if found_cluster:
-            found_cluster['alerts'].append(alert)
-            alerts_in_cluster = found_cluster['alerts']
-            avg_lat = sum(a.get('lat', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            avg_lon = sum(a.get('lon', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            found_cluster['center'] = (avg_lat, avg_lon)
-        else:
-            clusters.append({
-                'center': (lat, lon),
-                'alerts': [alert],
-                'count': 1
-            })
-    
-    return [c for c in clusters if len(c['alerts']) > 1]
\ No newline at end of file
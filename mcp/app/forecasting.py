@@ -0,0 +1,312 @@
+import os
+import math
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from .analytics_engine import analytics_engine
+
+# Configuración
+FORECAST_CELL_DEG = float(os.getenv("FORECAST_CELL_DEG", "0.5"))
+FORECAST_LEVEL = float(os.getenv("FORECAST_LEVEL", "0.9"))
+
+# Suavizado Holt-Winters: nivel, tendencia (amortiguada), estacionalidad semanal y varianza
+ALPHA, BETA, GAMMA, PHI = 0.2, 0.05, 0.1, 0.9
+VARIANCE_ALPHA = 0.1
+SEASON = 7
+# Días vacíos que se procesan como máximo al reanudar una serie inactiva
+MAX_GAP = 90
+# Días cerrados que se pueden recalcular cuando llega una alerta atrasada
+FORECAST_LATE_DAYS = int(os.getenv("FORECAST_LATE_DAYS", "7"))
+# Por encima de esta media se usa la aproximación normal
+NORMAL_ABOVE = 500.0
+
+ALL = "*"
+
+class SeriesModel:
+    """Conteos diarios de una serie, suavizados con Holt-Winters.
+
+    Tendencia amortiguada y estacionalidad semanal multiplicativa; la
+    varianza del error se sigue con una media móvil exponencial para
+    detectar sobredispersión. Cada día se cierra una sola vez (O(1)).
+
+    Los últimos FORECAST_LATE_DAYS días cerrados guardan su conteo junto con
+    el estado previo a ellos (`base`): una alerta atrasada se suma a su día y
+    esos días se vuelven a cerrar. Las más antiguas se suman al día más viejo
+    que todavía se puede recalcular.
+    """
+
+    __slots__ = ("day", "count", "level", "trend", "season", "var", "history", "observed_days", "total",
+                 "base", "recent")
+
+    def __init__(self, day: int):
+        self.day = day
+        self.count = 0
+        self.level: Optional[float] = None
+        self.trend = 0.0
+        self.season = [1.0] * SEASON
+        self.var = 0.0
+        # Últimos 7 días cerrados, por día de la semana
+        self.history = [0] * SEASON
+        self.observed_days = 0
+        self.total = 0
+        self.base = self._state()
+        # [día, conteo] de los días cerrados que aún se pueden recalcular
+        self.recent: deque = deque()
+
+    def _state(self) -> Tuple:
+        return (self.level, self.trend, list(self.season), self.var, list(self.history), self.observed_days)
+
+    def _restore(self, state: Tuple):
+        self.level, self.trend, season, self.var, history, self.observed_days = state
+        self.season, self.history = list(season), list(history)
+
+    def add(self, day: int, count: int = 1) -> bool:
+        """Sumar `count` alertas al día `day`; False si el día ya estaba cerrado (se recalcula)"""
+        self.total += count
+        if day >= self.day:
+            self.advance(day)
+            self.count += count
+            return True
+        entry = next((entry for entry in self.recent if entry[0] >= day), None)
+        if entry is None:
+            # Sin días cerrados recalculables (serie recién reanudada): al día abierto
+            self.count += count
+            return False
+        entry[1] += count
+        self._restore(self.base)
+        for closed, y in self.recent:
+            self._close(y, closed)
+        return False
+
+    def advance(self, day: int):
+        """Cerrar el día abierto y los días vacíos hasta `day`"""
+        if day <= self.day:
+            return
+        self._close(self.count, self.day)
+        self.recent.append([self.day, self.count])
+        for empty in range(max(self.day + 1, day - MAX_GAP), day):
+            self._close(0, empty)
+            self.recent.append([empty, 0])
+        self.day = day
+        self.count = 0
+        self._settle()
+
+    def _settle(self):
+        """Pasar a `base` los días que ya no se pueden recalcular"""
+        limit = self.day - FORECAST_LATE_DAYS
+        if not self.recent or self.recent[0][0] >= limit:
+            return
+        current = self._state()
+        self._restore(self.base)
+        while self.recent and self.recent[0][0] < limit:
+            closed, y = self.recent.popleft()
+            self._close(y, closed)
+        self.base = self._state()
+        self._restore(current)
+
+    def _close(self, y: int, day: int):
+        dow = day % SEASON
+        self.history[dow] = y
+        self.observed_days += 1
+        if self.level is None:
+            self.level = float(y)
+            return
+        s = self.season[dow]
+        error = y - max((self.level + PHI * self.trend) * s, 0.0)
+        self.var = (1 - VARIANCE_ALPHA) * self.var + VARIANCE_ALPHA * error * error
+
+        previous = self.level
+        self.level = max(ALPHA * (y / s) + (1 - ALPHA) * (previous + PHI * self.trend), 0.0)
+        self.trend = BETA * (self.level - previous) + (1 - BETA) * PHI * self.trend
+        if self.level > 0:
+            self.season[dow] = min(max(GAMMA * (y / self.level) + (1 - GAMMA) * s, 0.1), SEASON)
+            mean = sum(self.season) / SEASON
+            self.season = [value / mean for value in self.season]
+
+    def daily_forecast(self, horizon_days: int) -> List[Tuple[float, float]]:
+        """(media, varianza) de los días siguientes al día abierto"""
+        level = self.level or 0.0
+        damped = 0.0
+        out = []
+        # El nivel corresponde al último día cerrado (self.day - 1)
+        for step in range(1, horizon_days + 2):
+            damped += PHI ** step
+            if step == 1:
+                continue
+            mean = max((level + damped * self.trend) * self.season[(self.day - 1 + step) % SEASON], 0.0)
+            # La incertidumbre del nivel crece con el horizonte; nunca menos que Poisson
+            var = max(self.var, mean) * (1 + (step - 1) * ALPHA * ALPHA)
+            out.append((mean, var))
+        return out
+
+# Distribución de conteos: Poisson, binomial negativa si hay sobredispersión
+
+def _pmf_start(mean: float, var: float) -> Tuple[float, Optional[float], float]:
+    """P(0), parámetro r de la binomial negativa (None = Poisson) y 1 - p"""
+    if var <= mean * 1.0001:
+        return math.exp(-mean), None, mean
+    r = mean * mean / (var - mean)
+    return math.exp(r * math.log(r / (r + mean))), r, mean / (r + mean)
+
+def _cdf_until(mean: float, var: float, stop) -> Tuple[int, float]:
+    """Recorrer la función de probabilidad hasta que stop(k, cdf) se cumpla"""
+    pmf, r, q = _pmf_start(mean, var)
+    cdf, k = pmf, 0
+    while not stop(k, cdf) and k < 100 * (mean + 10):
+        pmf *= (q / (k + 1)) if r is None else (k + r) / (k + 1) * q
+        k += 1
+        cdf += pmf
+    return k, cdf
+
+def count_interval(mean: float, var: float, level: float = FORECAST_LEVEL) -> Tuple[int, int]:
+    """Intervalo de predicción central para un conteo"""
+    tail = (1 - level) / 2
+    if mean <= 0:
+        return 0, 0
+    if mean > NORMAL_ABOVE:
+        z = _normal_quantile(1 - tail)
+        sd = math.sqrt(max(var, mean))
+        return max(int(math.floor(mean - z * sd)), 0), int(math.ceil(mean + z * sd))
+    low, _ = _cdf_until(mean, var, lambda k, cdf: cdf >= tail)
+    high, _ = _cdf_until(mean, var, lambda k, cdf: cdf >= 1 - tail)
+    return low, high
+
+def exceed_probability(mean: float, var: float, threshold: float) -> float:
+    """P(N > threshold)"""
+    if threshold < 0:
+        return 1.0
+    if mean <= 0:
+        return 0.0
+    if mean > NORMAL_ABOVE:
+        z = (math.floor(threshold) + 0.5 - mean) / math.sqrt(max(var, mean))
+        return 0.5 * math.erfc(z / math.sqrt(2))
+    limit = math.floor(threshold)
+    _, cdf = _cdf_until(mean, var, lambda k, cdf: k >= limit)
+    return min(max(1 - cdf, 0.0), 1.0)
+
+def _normal_quantile(p: float) -> float:
+    """Cuantil normal estándar por bisección sobre erf"""
+    low, high = -10.0, 10.0
+    for _ in range(60):
+        mid = (low + high) / 2
+        if 0.5 * math.erfc(-mid / math.sqrt(2)) < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+class ForecastEngine:
+    """Modelos de tasa de alertas por zona y tipo, alimentados por el feed de cambios.
+
+    Las zonas son celdas de FORECAST_CELL_DEG grados. Se mantienen series
+    por (zona, tipo), por zona, por tipo y global; cada alerta actualiza
+    cuatro series en O(1) y las consultas solo proyectan el estado.
+    """
+
+    def __init__(self, cell_deg: float = FORECAST_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.reset()
+
+    def reset(self):
+        self.series: Dict[Tuple[str, str], SeriesModel] = {}
+        self.revision = 0
+        self.late_alerts = 0
+        self.today: Optional[int] = None
+        self._cache: Dict[Tuple, Optional[Dict[str, Any]]] = {}
+        self._cache_key: Tuple = ()
+
+    def zone_of(self, lat: Optional[float], lon: Optional[float]) -> Optional[str]:
+        """Centro de la celda que contiene el punto, como 'lat,lon'"""
+        if lat is None or lon is None:
+            return None
+        center = lambda value: (math.floor(value / self.cell_deg) + 0.5) * self.cell_deg
+        return f"{center(lat):.3f},{center(lon):.3f}"
+
+    def observe(self, alert: Dict[str, Any], moment: datetime, count: int = 1):
+        day = moment.toordinal()
+        alert_type = alert.get('alert_type') or 'general'
+        zone = self.zone_of(alert.get('lat'), alert.get('lon'))
+        keys = [(ALL, ALL), (ALL, alert_type)]
+        if zone is not None:
+            keys += [(zone, ALL), (zone, alert_type)]
+        accepted = True
+        for key in keys:
+            model = self.series.get(key)
+            if model is None:
+                model = self.series[key] = SeriesModel(day)
+            accepted = model.add(day, count) and accepted
+        if not accepted:
+            self.late_alerts += count
+        self.revision += 1
+
+    def advance(self, today: Optional[int] = None):
+        """Cerrar en todas las series los días transcurridos sin alertas"""
+        today = today or datetime.utcnow().toordinal()
+        if self.today is not None and today <= self.today:
+            return
+        for model in self.series.values():
+            model.advance(today)
+        self.today = today
+
+    def forecast(self, zone: Optional[str] = None, alert_type: Optional[str] = None,
+                 horizon_days: int = 2, level: float = FORECAST_LEVEL) -> Optional[Dict[str, Any]]:
+        """Pronóstico del número de alertas en los próximos `horizon_days` días"""
+        self.advance()
+        key = (zone or ALL, alert_type or ALL, horizon_days, level)
+        if self._cache_key != (self.revision, self.today):
+            self._cache = {}
+            self._cache_key = (self.revision, self.today)
+        if key not in self._cache:
+            self._cache[key] = self._forecast(*key)
+        return self._cache[key]
+
+    def _forecast(self, zone: str, alert_type: str, horizon_days: int, level: float) -> Optional[Dict[str, Any]]:
+        model = self.series.get((zone, alert_type))
+        if model is None or model.level is None:
+            return None
+        daily = model.daily_forecast(horizon_days)
+        mean = sum(m for m, _ in daily)
+        var = sum(v for _, v in daily)
+        low, high = count_interval(mean, var, level)
+        # Línea base: promedio de los últimos 7 días cerrados en el mismo horizonte
+        days = min(model.observed_days, SEASON)
+        baseline = sum(model.history) / days * horizon_days
+        return {
+            "zone": None if zone == ALL else zone,
+            "alert_type": None if alert_type == ALL else alert_type,
+            "horizon_days": horizon_days,
+            "expected": round(mean, 2),
+            "interval": {"level": level, "low": low, "high": high},
+            "daily_expected": [round(m, 2) for m, _ in daily],
+            "baseline": round(baseline, 2),
+            "p_increase": round(exceed_probability(mean, var, baseline), 3),
+            "p_decrease": round(1 - exceed_probability(mean, var, math.ceil(baseline) - 1), 3),
+            "overdispersed": var > mean * 1.0001,
+            "observed_days": model.observed_days
+        }
+
+    def top_zones(self, horizon_days: int = 2, level: float = FORECAST_LEVEL,
+                  alert_type: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+        """Zonas con mayor número esperado de alertas"""
+        self.advance()
+        wanted = alert_type or ALL
+        forecasts = [self.forecast(zone, wanted, horizon_days, level)
+                     for zone, series_type in list(self.series) if zone != ALL and series_type == wanted]
+        forecasts = [f for f in forecasts if f and f["expected"] > 0]
+        return sorted(forecasts, key=lambda f: f["expected"], reverse=True)[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "method": "holt_winters_damped_weekly",
+            "distribution": "poisson/negative_binomial",
+            "cell_deg": self.cell_deg,
+            "series": len(self.series),
+            "zones": sum(1 for zone, alert_type in self.series if zone != ALL and alert_type == ALL),
+            # Alertas de días ya cerrados (se recalcularon sus días)
+            "late_alerts": self.late_alerts,
+            "revision": self.revision
+        }
+
+# Instancia global, alimentada por el mismo feed que las analíticas
+forecast_engine = ForecastEngine()
+analytics_engine.subscribers.append(forecast_engine)
@@ -0,0 +1,291 @@
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from .alert_frame import parse_epochs
+from .backend_client import get_client
+from .clustering import CLUSTER_MIN_SAMPLES, CLUSTER_RADIUS_KM, dbscan_labels
+from .compute_pool import compute_pool
+from .spatial import join_counts
+
+# Configuración
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10000"))
+# Los análisis de histórico completo tienen más margen que los de una petición
+HISTORY_COMPUTE_TIMEOUT_SECONDS = float(os.getenv("HISTORY_COMPUTE_TIMEOUT_SECONDS", "900"))
+# Sobre años de histórico, sin ventana temporal todo evento termina "correlacionado"
+HISTORY_CORRELATION_RADIUS_KM = float(os.getenv("HISTORY_CORRELATION_RADIUS_KM", "2.2"))
+HISTORY_CORRELATION_WINDOW_HOURS = float(os.getenv("HISTORY_CORRELATION_WINDOW_HOURS", "72"))
+
+# Fracción del progreso que corresponde a leer el histórico
+LOAD_SHARE = 0.8
+
+Progress = Callable[[float, str], None]
+
+class AlertHistory:
+    """Histórico completo en columnas NumPy (sin conservar un dict por alerta)"""
+
+    def __init__(self, ids: np.ndarray, epoch: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                 severity: np.ndarray, types: List[str], type_code: np.ndarray,
+                 sources: List[str], source_code: np.ndarray):
+        self.ids = ids
+        self.epoch = epoch
+        self.lat = lat
+        self.lon = lon
+        self.severity = severity
+        self.types = types
+        self.type_code = type_code
+        self.sources = sources
+        self.source_code = source_code
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, mask) -> "AlertHistory":
+        return AlertHistory(self.ids[mask], self.epoch[mask], self.lat[mask], self.lon[mask],
+                            self.severity[mask], self.types, self.type_code[mask],
+                            self.sources, self.source_code[mask])
+
+    def type_mask(self, alert_type: Optional[str]) -> np.ndarray:
+        if alert_type is None:
+            return np.ones(len(self), dtype=bool)
+        if alert_type not in self.types:
+            return np.zeros(len(self), dtype=bool)
+        return self.type_code == self.types.index(alert_type)
+
+    def source_mask(self, source: str) -> np.ndarray:
+        if source not in self.sources:
+            return np.zeros(len(self), dtype=bool)
+        return self.source_code == self.sources.index(source)
+
+def _codes(values: List[str]):
+    if not values:
+        return [], np.empty(0, dtype=np.int32)
+    labels, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    return labels.tolist(), codes.astype(np.int32)
+
+def _iso(epoch: float) -> Optional[str]:
+    return None if np.isnan(epoch) else datetime.utcfromtimestamp(epoch).isoformat()
+
+async def load_history(progress: Progress, share: float = LOAD_SHARE) -> AlertHistory:
+    """Recorrer /alerts/changes desde el principio; el progreso avanza con last_id / max_id"""
+    client = get_client()
+    ids, created, lat, lon, severity, types, sources = [], [], [], [], [], [], []
+    last_id = 0
+    while True:
+        response = await client.get("/alerts/changes", params={"since_id": last_id, "limit": HISTORY_PAGE_SIZE})
+        if response.status_code != 200:
+            raise RuntimeError(f"Feed de cambios no disponible: HTTP {response.status_code}")
+        page = response.json()
+        for alert in page.get("alerts", []):
+            ids.append(alert.get('id') or 0)
+            created.append(alert.get('created_at'))
+            lat.append(alert.get('lat') or 0)
+            lon.append(alert.get('lon') or 0)
+            severity.append(alert.get('severity') or 1)
+            types.append(alert.get('alert_type') or 'general')
+            sources.append(alert.get('source') or 'manual')
+        last_id = page.get("last_id", last_id)
+        max_id = page.get("max_id") or 0
+        progress(share * min(last_id / max_id, 1.0) if max_id else share, f"{len(ids)} alertas leídas")
+        if not page.get("has_more"):
+            break
+
+    type_labels, type_code = _codes(types)
+    source_labels, source_code = _codes(sources)
+    return AlertHistory(np.array(ids, dtype=np.int64), parse_epochs(created),
+                        np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64),
+                        np.array(severity, dtype=np.int16), type_labels, type_code,
+                        source_labels, source_code)
+
+# Cada tipo de trabajo: normalizar parámetros (para deduplicar) y ejecutar
+
+def _optional_str(params: Dict[str, Any], key: str) -> Optional[str]:
+    value = params.get(key)
+    return None if value in (None, "") else str(value)
+
+def _number(params: Dict[str, Any], key: str, default: float, minimum: float = 0) -> float:
+    try:
+        value = float(params.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} debe ser numérico")
+    if value < minimum:
+        raise ValueError(f"{key} debe ser >= {minimum}")
+    return value
+
+def seasonal_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"alert_type": _optional_str(params, "alert_type")}
+
+async def seasonal_patterns(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Estacionalidad mensual sobre todos los años del histórico"""
+    history = await load_history(progress)
+    history = history.take(history.type_mask(params["alert_type"]))
+    dated = ~np.isnan(history.epoch)
+    months = history.epoch[dated].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    if not len(months):
+        return {"total_alerts": len(history), "undated": int((~dated).sum()), "years": {}}
+
+    first_year = int(months.min() // 12)
+    year, month = months // 12 - first_year, months % 12
+    years = int(year.max()) + 1
+    table = np.bincount(year * 12 + month, minlength=years * 12).reshape(years, 12)
+
+    # Promedio por mes sobre los años observados (el primero y el último pueden estar incompletos)
+    monthly_mean = table.mean(axis=0)
+    overall = monthly_mean.mean()
+    index = monthly_mean / overall if overall else np.zeros(12)
+    peaks = np.flatnonzero(index >= 1.5)
+    # Consistencia: en qué fracción de años cada mes pico supera el promedio de su año
+    yearly_mean = table.mean(axis=1, keepdims=True)
+    above = (table > yearly_mean).mean(axis=0)
+
+    by_type = {}
+    for code, name in enumerate(history.types):
+        selected = history.type_code[dated] == code
+        if selected.any():
+            counts = np.bincount(month[selected], minlength=12)
+            by_type[name] = {"total": int(counts.sum()), "peak_month": int(counts.argmax()) + 1}
+
+    progress(1.0, "Estacionalidad calculada")
+    return {
+        "total_alerts": len(history),
+        "undated": int((~dated).sum()),
+        "years": {str(1970 + first_year + y): table[y].tolist() for y in range(years)},
+        "monthly_mean": [round(float(value), 2) for value in monthly_mean],
+        "seasonality_index": [round(float(value), 3) for value in index],
+        "peak_months": [int(m) + 1 for m in peaks],
+        "peak_consistency": {str(int(m) + 1): round(float(above[m]), 2) for m in peaks},
+        "by_type": by_type
+    }
+
+def correlation_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "source": _optional_str(params, "source"),
+        "radius_km": _number(params, "radius_km", HISTORY_CORRELATION_RADIUS_KM, minimum=0.001),
+        "window_hours": _number(params, "window_hours", HISTORY_CORRELATION_WINDOW_HOURS),
+        "top": int(_number(params, "top", 20))
+    }
+
+async def external_correlation(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Eventos externos (GDACS, etc.) de todo el histórico contra las alertas reportadas cerca"""
+    history = await load_history(progress)
+    manual = history.source_mask("manual")
+    external_mask = ~manual if params["source"] is None else history.source_mask(params["source"])
+    internal, external = history.take(manual), history.take(external_mask)
+
+    progress(LOAD_SHARE, f"Correlacionando {len(external)} eventos externos con {len(internal)} alertas")
+    counts, nearest_km = await compute_pool.run(
+        join_counts, [internal.lat, internal.lon, internal.epoch, external.lat, external.lon, external.epoch],
+        params["radius_km"], params["window_hours"], timeout=HISTORY_COMPUTE_TIMEOUT_SECONDS
+    )
+    correlated = counts > 0
+
+    def breakdown(codes: np.ndarray, labels: List[str]) -> Dict[str, Dict[str, int]]:
+        events = np.bincount(codes, minlength=len(labels))
+        hits = np.bincount(codes, weights=correlated, minlength=len(labels))
+        matches = np.bincount(codes, weights=counts, minlength=len(labels))
+        return {labels[k]: {"events": int(events[k]), "correlated": int(hits[k]), "internal_matches": int(matches[k])}
+                for k in np.flatnonzero(events)}
+
+    top = np.argsort(-counts, kind="stable")[:params["top"]]
+    top = top[counts[top] > 0]
+    progress(1.0, "Correlación calculada")
+    return {
+        "external_events": len(external),
+        "internal_alerts": len(internal),
+        "correlated_events": int(correlated.sum()),
+        "correlation_rate": round(float(correlated.mean()), 4) if len(external) else 0.0,
+        "by_source": breakdown(external.source_code, history.sources),
+        "by_type": breakdown(external.type_code, history.types),
+        "top_events": [
+            {
+                "id": int(external.ids[k]),
+                "source": history.sources[external.source_code[k]],
+                "alert_type": history.types[external.type_code[k]],
+                "severity": int(external.severity[k]),
+                "created_at": _iso(external.epoch[k]),
+                "lat": float(external.lat[k]),
+                "lon": float(external.lon[k]),
+                "internal_count": int(counts[k]),
+                "nearest_km": round(float(nearest_km[k]), 2)
+            }
+            for k in top.tolist()
+        ]
+    }
+
+def reclustering_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    since = _optional_str(params, "since")
+    if since is not None:
+        try:
+            since = datetime.fromisoformat(since).isoformat()
+        except ValueError:
+            raise ValueError("since debe ser una fecha ISO 8601")
+    return {
+        "radius_km": _number(params, "radius_km", CLUSTER_RADIUS_KM, minimum=0.001),
+        "min_samples": int(_number(params, "min_samples", CLUSTER_MIN_SAMPLES, minimum=1)),
+        "alert_type": _optional_str(params, "alert_type"),
+        "since": since,
+        "top": int(_number(params, "top", 100))
+    }
+
+async def recluster_history(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """DBSCAN sobre todo el histórico (p. ej. después de una importación masiva)"""
+    history = await load_history(progress)
+    mask = history.type_mask(params["alert_type"])
+    if params["since"] is not None:
+        since = parse_epochs([params["since"]])[0]
+        with np.errstate(invalid="ignore"):
+            mask &= history.epoch >= since
+    history = history.take(mask)
+
+    progress(LOAD_SHARE, f"Agrupando {len(history)} alertas")
+    labels = await compute_pool.run(dbscan_labels, [history.lat, history.lon],
+                                    params["radius_km"], params["min_samples"],
+                                    timeout=HISTORY_COMPUTE_TIMEOUT_SECONDS)
+    members = np.flatnonzero(labels >= 0)
+    _, group, size = np.unique(labels[members], return_inverse=True, return_counts=True)
+    clusters = len(size)
+    mean_lat = np.bincount(group, weights=history.lat[members], minlength=clusters) / np.maximum(size, 1)
+    mean_lon = np.bincount(group, weights=history.lon[members], minlength=clusters) / np.maximum(size, 1)
+    mean_severity = np.bincount(group, weights=history.severity[members], minlength=clusters) / np.maximum(size, 1)
+    max_severity = np.zeros(clusters, dtype=np.int64)
+    np.maximum.at(max_severity, group, history.severity[members])
+    epoch = np.nan_to_num(history.epoch[members], nan=np.inf)
+    first_seen = np.full(clusters, np.inf)
+    np.minimum.at(first_seen, group, epoch)
+    epoch = np.nan_to_num(history.epoch[members], nan=-np.inf)
+    last_seen = np.full(clusters, -np.inf)
+    np.maximum.at(last_seen, group, epoch)
+
+    width = max(len(history.types), 1)
+    type_counts = np.bincount(group * width + history.type_code[members],
+                              minlength=clusters * width).reshape(clusters, width)
+
+    order = np.argsort(-size, kind="stable")[:params["top"]]
+    result = []
+    for k in order.tolist():
+        types = type_counts[k]
+        result.append({
+            "center": (round(float(mean_lat[k]), 6), round(float(mean_lon[k]), 6)),
+            "count": int(size[k]),
+            "max_severity": int(max_severity[k]),
+            "avg_severity": round(float(mean_severity[k]), 2),
+            "types": {history.types[t]: int(types[t]) for t in np.flatnonzero(types)},
+            "first_seen": _iso(first_seen[k]) if np.isfinite(first_seen[k]) else None,
+            "last_seen": _iso(last_seen[k]) if np.isfinite(last_seen[k]) else None
+        })
+
+    progress(1.0, "Clusters calculados")
+    return {
+        "alerts": len(history),
+        "clusters": clusters,
+        "clustered_alerts": int(len(members)),
+        "noise": int(len(history) - len(members)),
+        "top_clusters": result
+    }
+
+# Tipos de trabajo: (normalizar parámetros, ejecutar)
+HISTORY_JOBS = {
+    "seasonal_patterns": (seasonal_params, seasonal_patterns),
+    "external_correlation": (correlation_params, external_correlation),
+    "reclustering": (reclustering_params, recluster_history)
+}
@@ -0,0 +1,483 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+from .history_analysis import HISTORY_JOBS
+from .result_cache import encode_json, normalize_params
+from .snapshot_cache import snapshot_cache
+
+# Configuración
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "mcp_jobs.db")
+JOBS_MAX_RUNNING = int(os.getenv("JOBS_MAX_RUNNING", "2"))
+# Trabajos terminados que se conservan (y se reutilizan al deduplicar)
+JOBS_RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", "168"))
+# Intervalo mínimo entre escrituras de progreso en la base
+JOBS_PROGRESS_INTERVAL_SECONDS = float(os.getenv("JOBS_PROGRESS_INTERVAL_SECONDS", "1"))
+# Cada cuánto un worker renueva sus trabajos, atiende cancelaciones y toma trabajos en cola
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "2"))
+# Sin latido en este tiempo, el trabajo de un worker caído vuelve a la cola
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "30"))
+
+ACTIVE = ("queued", "running")
+
+router = APIRouter(prefix="/mcp/jobs", tags=["jobs"])
+
+class JobRequest(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+
+class JobStore:
+    """Trabajos y resultados (JSON ya serializado) en SQLite, compartidos por los workers.
+
+    Un trabajo lo ejecuta el worker que lo reclama con un UPDATE condicionado
+    a su estado; el índice único parcial sobre `dedup_key` impide dos trabajos
+    vivos (o exitosos) idénticos aunque los envíen workers distintos. La
+    conexión se comparte entre el event loop (vía `asyncio.to_thread`) y los
+    handlers del threadpool, así que cada consulta la toma con `_lock`.
+    """
+
+    COLUMNS = ("id", "kind", "params", "dedup_key", "data_version", "status", "progress", "message",
+               "error", "result", "created_at", "started_at", "finished_at", "owner", "heartbeat_at",
+               "cancel_requested")
+    # Columnas agregadas después de la primera versión de la tabla
+    MIGRATIONS = {"owner": "TEXT", "heartbeat_at": "TEXT", "cancel_requested": "INTEGER NOT NULL DEFAULT 0"}
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                dedup_key TEXT NOT NULL,
+                data_version TEXT,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                error TEXT,
+                result BLOB,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                owner TEXT,
+                heartbeat_at TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            )""")
+        existing = {row["name"] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+        for column, definition in self.MIGRATIONS.items():
+            if column not in existing:
+                try:
+                    self.connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError:
+                    pass  # otro worker la agregó entre la consulta y el ALTER
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_dedup ON jobs (dedup_key, status)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_created ON jobs (created_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, owner)")
+        try:
+            self._unique_dedup()
+        except sqlite3.IntegrityError:
+            # Duplicados de antes del índice único: se conserva el más reciente
+            self.connection.execute("""
+                UPDATE jobs SET status = 'cancelled', finished_at = ?
+                WHERE status IN ('queued', 'running', 'succeeded') AND EXISTS (
+                    SELECT 1 FROM jobs AS newer WHERE newer.dedup_key = jobs.dedup_key
+                    AND newer.status IN ('queued', 'running', 'succeeded') AND newer.created_at > jobs.created_at)
+            """, (datetime.utcnow().isoformat(),))
+            self._unique_dedup()
+
+    def _unique_dedup(self):
+        self.connection.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_dedup_live ON jobs (dedup_key) "
+            "WHERE status IN ('queued', 'running', 'succeeded')")
+
+    def _execute(self, sql: str, params=()) -> int:
+        """Escritura con la conexión tomada; devuelve las filas afectadas"""
+        with self._lock:
+            return self.connection.execute(sql, params).rowcount
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def insert(self, job: Dict[str, Any]):
+        """Insertar un trabajo; sqlite3.IntegrityError si ya hay uno vivo idéntico"""
+        columns = [column for column in self.COLUMNS if column in job]
+        self._execute(
+            f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            [job[column] for column in columns]
+        )
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+    def update_owned(self, job_id: str, owner: str, **fields) -> bool:
+        """Actualizar solo si el trabajo sigue en manos de `owner` (no lo retomó otro worker)"""
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        return self._execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ? AND status = 'running'",
+            [*fields.values(), job_id, owner]
+        ) == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Tomar un trabajo en cola de forma atómica: solo un worker lo consigue"""
+        now = datetime.utcnow().isoformat()
+        return self._execute(
+            "UPDATE jobs SET status = 'running', owner = ?, started_at = ?, heartbeat_at = ? "
+            "WHERE id = ? AND status = 'queued'", (owner, now, now, job_id)
+        ) == 1
+
+    def heartbeat(self, owner: str):
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                      (datetime.utcnow().isoformat(), owner))
+
+    def requeue_stale(self, before: str) -> int:
+        """Devolver a la cola los trabajos de workers que dejaron de dar latido"""
+        return self._execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, progress = 0, "
+            "message = 'Reanudado: el worker dejó de responder' "
+            "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)", (before,)
+        )
+
+    def release(self, owner: str) -> int:
+        """Devolver a la cola los trabajos de un worker que se apaga"""
+        return self._execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, progress = 0, message = 'Reanudado tras reinicio' "
+            "WHERE owner = ? AND status = 'running'", (owner,)
+        )
+
+    def cancel_queued(self, job_id: str) -> bool:
+        return self._execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (datetime.utcnow().isoformat(), job_id)
+        ) == 1
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Marcar un trabajo en curso para que el worker que lo ejecuta lo detenga"""
+        return self._execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+        ) == 1
+
+    def cancel_requested(self, owner: str) -> List[str]:
+        return [row["id"] for row in self._query(
+            "SELECT id FROM jobs WHERE owner = ? AND status = 'running' AND cancel_requested = 1", (owner,))]
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        columns = self.COLUMNS if with_result else tuple(c for c in self.COLUMNS if c != "result")
+        rows = self._query(f"SELECT {', '.join(columns)} FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def find_reusable(self, dedup_key: str) -> Optional[Dict[str, Any]]:
+        """Trabajo idéntico en curso o terminado con éxito (los fallidos se pueden reintentar)"""
+        rows = self._query(
+            "SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running', 'succeeded') "
+            "ORDER BY created_at DESC LIMIT 1", (dedup_key,)
+        )
+        return self.get(rows[0]["id"]) if rows else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        columns = ", ".join(c for c in self.COLUMNS if c != "result")
+        if status:
+            rows = self._query(
+                f"SELECT {columns} FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit))
+        else:
+            rows = self._query(f"SELECT {columns} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    def queued(self, limit: int) -> List[str]:
+        return [row["id"] for row in self._query(
+            "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT ?", (limit,))]
+
+    def purge(self, before: str) -> int:
+        return self._execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (before,)
+        )
+
+    def counts(self) -> Dict[str, int]:
+        return {row["status"]: row["total"] for row in self._query(
+            "SELECT status, COUNT(*) AS total FROM jobs GROUP BY status")}
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+class JobManager:
+    """Análisis de histórico completo como trabajos en segundo plano.
+
+    Cada envío se identifica por (tipo, parámetros normalizados, versión de
+    datos del backend): un envío idéntico devuelve el trabajo existente, en
+    curso o terminado, en lugar de calcular de nuevo. Como mucho
+    JOBS_MAX_RUNNING trabajos corren a la vez por worker (la parte de CPU va
+    al pool de procesos); el progreso se guarda en SQLite junto con el
+    resultado, así que sobrevive a reinicios.
+
+    Con varios workers de uvicorn sobre la misma base, cada trabajo lo
+    ejecuta solo el worker que lo reclama. Un ciclo periódico renueva el
+    latido de los trabajos propios, detiene los que tienen la cancelación
+    marcada, devuelve a la cola los de workers caídos y toma trabajos en cola.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, max_running: int = JOBS_MAX_RUNNING):
+        self.path = path
+        self.max_running = max(max_running, 1)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.store: Optional[JobStore] = None
+        self._semaphore = asyncio.Semaphore(self.max_running)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._live: Dict[str, Tuple[float, str]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        # Escrituras de progreso en curso (se lanzan sin esperar desde el callback del trabajo)
+        self._writes = set()
+        self._open_lock = threading.Lock()
+        self.deduplicated = 0
+
+    def _open(self):
+        with self._open_lock:
+            if self.store is not None:
+                return
+            store = JobStore(self.path)
+            cutoff = (datetime.utcnow() - timedelta(hours=JOBS_RETENTION_HOURS)).isoformat()
+            purged = store.purge(cutoff)
+            self.store = store
+        logging.info(f"🗂️ Trabajos: {purged} purgados ({self.path}, worker {self.owner})")
+
+    async def _db(self, method: str, *args, **kwargs):
+        """Llamada a la base en un hilo: una espera por el lock de SQLite de otro
+        worker (hasta `timeout`) no detiene el event loop"""
+        if self.store is None:
+            await asyncio.to_thread(self._open)
+        return await asyncio.to_thread(getattr(self.store, method), *args, **kwargs)
+
+    def start(self):
+        """Lanzar el ciclo de reclamo (desde el event loop); la base se abre en un hilo"""
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll())
+
+    async def shutdown(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *self._writes, return_exceptions=True)
+        if self.store is not None:
+            # Los trabajos propios vuelven a la cola para otro worker o el próximo arranque
+            released = await self._db("release", self.owner)
+            if released:
+                logging.info(f"🗂️ {released} trabajos devueltos a la cola")
+            await self._db("close")
+            self.store = None
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.error(f"❌ Error en el ciclo de trabajos: {e}")
+            await asyncio.sleep(JOBS_POLL_SECONDS)
+
+    async def tick(self):
+        """Latido, cancelaciones pedidas, trabajos huérfanos y reclamo de la cola"""
+        await self._db("heartbeat", self.owner)
+        for job_id in await self._db("cancel_requested", self.owner):
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+        stale = (datetime.utcnow() - timedelta(seconds=JOBS_STALE_SECONDS)).isoformat()
+        requeued = await self._db("requeue_stale", stale)
+        if requeued:
+            logging.warning(f"🗂️ {requeued} trabajos de workers sin latido vuelven a la cola")
+        free = self.max_running - len(self._tasks)
+        if free > 0:
+            for job_id in await self._db("queued", free + len(self._tasks)):
+                if job_id not in self._tasks:
+                    self._schedule(job_id)
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        if kind not in HISTORY_JOBS:
+            raise ValueError(f"kind desconocido: {kind}; válidos: {list(HISTORY_JOBS)}")
+        normalize, _ = HISTORY_JOBS[kind]
+        params = normalize(params)
+        self.start()
+        version = (await snapshot_cache.get()).version
+        dedup_key = hashlib.sha1(f"{kind}|{normalize_params(params)}|{version}".encode()).hexdigest()
+
+        # El índice único decide entre envíos concurrentes; si el trabajo que
+        # chocó ya no está vivo (cancelado o fallido) se vuelve a intentar
+        for _ in range(3):
+            existing = await self._db("find_reusable", dedup_key)
+            if existing is not None:
+                self.deduplicated += 1
+                return self.view(existing), True
+            job_id = uuid.uuid4().hex
+            try:
+                await self._db("insert", {
+                    "id": job_id, "kind": kind, "params": normalize_params(params), "dedup_key": dedup_key,
+                    "data_version": version, "status": "queued", "progress": 0.0,
+                    "created_at": datetime.utcnow().isoformat()
+                })
+            except sqlite3.IntegrityError:
+                continue
+            self._schedule(job_id)
+            return self.view(await self._db("get", job_id)), False
+        raise RuntimeError("No se pudo registrar el trabajo")
+
+    def _schedule(self, job_id: str):
+        task = asyncio.ensure_future(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        async with self._semaphore:
+            job = await self._db("get", job_id)
+            if job is None or not await self._db("claim", job_id, self.owner):
+                return
+            _, handler = HISTORY_JOBS[job["kind"]]
+            self._live[job_id] = (0.0, "Iniciando")
+            written = 0.0
+
+            def progress(fraction: float, message: str):
+                nonlocal written
+                self._live[job_id] = (fraction, message)
+                now = time.monotonic()
+                if now - written >= JOBS_PROGRESS_INTERVAL_SECONDS:
+                    written = now
+                    # Sin esperar: el callback es síncrono. Si llega después del estado final
+                    # no escribe nada (update_owned exige status = 'running')
+                    write = asyncio.ensure_future(self._db(
+                        "update_owned", job_id, self.owner, progress=round(fraction, 4), message=message,
+                        heartbeat_at=datetime.utcnow().isoformat()))
+                    self._writes.add(write)
+                    write.add_done_callback(self._writes.discard)
+
+            started = time.perf_counter()
+            try:
+                result = await handler(json.loads(job["params"]), progress)
+                await self._db("update_owned", job_id, self.owner, status="succeeded", progress=1.0,
+                               message="Completado", result=encode_json(result),
+                               finished_at=datetime.utcnow().isoformat())
+                logging.info(f"✅ Trabajo {job['kind']} {job_id} en {time.perf_counter() - started:.1f}s")
+            except asyncio.CancelledError:
+                # Cancelada esta tarea, las escrituras se protegen para no quedar a medias
+                current = await asyncio.shield(self._db("get", job_id))
+                if current is not None and current["cancel_requested"]:
+                    await asyncio.shield(self._db("update_owned", job_id, self.owner, status="cancelled",
+                                                  message="Cancelado", finished_at=datetime.utcnow().isoformat()))
+                raise
+            except Exception as e:
+                logging.error(f"❌ Trabajo {job['kind']} {job_id} falló: {e}")
+                await self._db("update_owned", job_id, self.owner, status="failed", error=str(e),
+                               finished_at=datetime.utcnow().isoformat())
+            finally:
+                self._live.pop(job_id, None)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancelar: en cola se marca directamente; en curso se pide al worker que lo ejecuta"""
+        job = await self._db("get", job_id)
+        if job is None or job["status"] not in ACTIVE:
+            return job and self.view(job)
+        if not await self._db("cancel_queued", job_id) and await self._db("request_cancel", job_id):
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        return self.view(await self._db("get", job_id))
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        self._open()
+        return self.store.get(job_id, with_result)
+
+    def view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Estado público del trabajo (el progreso en memoria es más reciente que el guardado)"""
+        progress, message = self._live.get(job["id"], (job["progress"], job["message"]))
+        return {
+            "id": job["id"],
+            "kind": job["kind"],
+            "params": json.loads(job["params"]),
+            "status": job["status"],
+            "progress": round(progress, 4),
+            "message": message,
+            "error": job["error"],
+            "data_version": job["data_version"],
+            "cancel_requested": bool(job["cancel_requested"]),
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "result_url": f"{router.prefix}/{job['id']}/result" if job["status"] == "succeeded" else None
+        }
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        self._open()
+        return [self.view(job) for job in self.store.list(status, limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "running": len(self._live),
+            "scheduled": len(self._tasks),
+            "max_running": self.max_running,
+            "deduplicated": self.deduplicated,
+            "by_status": self.store.counts() if self.store is not None else {}
+        }
+
+# Instancia global
+job_manager = JobManager()
+
+@router.post("", status_code=202)
+async def submit_job(request: JobRequest):
+    """Encolar un análisis de histórico completo; envíos idénticos comparten el trabajo"""
+    try:
+        job, deduplicated = await job_manager.submit(request.kind, request.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**job, "deduplicated": deduplicated}
+
+@router.get("")
+def list_jobs(status: Optional[str] = None, limit: int = 50):
+    return {"jobs": job_manager.list(status, max(1, min(limit, 500))), **job_manager.stats()}
+
+@router.get("/kinds")
+def job_kinds():
+    return {kind: (handler.__doc__ or "").strip() for kind, (_, handler) in HISTORY_JOBS.items()}
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job_manager.view(job)
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    job = job_manager.get(job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=job_manager.view(job))
+    # El resultado se guardó ya serializado
+    return Response(content=job["result"], media_type="application/json")
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancelar un trabajo; si corre en otro worker, ese worker lo detiene en su próximo ciclo"""
+    job_manager.start()
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
@@ -6,18 +6,48 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 import httpx
+import numpy as np
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+from .backend_client import BACKEND_URL, get_client, lifespan, proxy_stream
+from .alert_frame import AlertFrame
+from .analytics_engine import analytics_engine
+from .clustering import analyze_location_clusters, location_clusters
+from .compute_pool import compute_pool
+from .nearby import NEARBY_ALERT_RADIUS_KM, NEARBY_SHELTER_RADIUS_KM, ShelterIndex, nearby_alert_counts, nearby_alerts
+from .routing import ROUTING_MAX_SNAP_KM, road_router
+from .shelter_assignment import SHELTER_MAX_KM, shelter_assignment
+from .result_cache import result_cache
+from .snapshot_cache import snapshot_cache
+from .jobs import job_manager
+from . import decision_support, jobs
+
+# Usuarios por bloque en las recomendaciones por lotes (cada bloque se envía al terminarlo)
+RECOMMENDATION_BATCH_CHUNK = int(os.getenv("RECOMMENDATION_BATCH_CHUNK", "2000"))
+
+@asynccontextmanager
+async def app_lifespan(app):
+    async with lifespan(app):
+        # El índice de rutas se carga (o construye) en segundo plano
+        road_router.start()
+        # Reclamar trabajos en cola o interrumpidos (un solo worker ejecuta cada uno)
+        job_manager.start()
+        try:
+            yield
+        finally:
+            await job_manager.shutdown()
+            compute_pool.shutdown()
 
 app = FastAPI(
     title="MCP Avanzado - Sistema de Alertas",
     description="Model Context Protocol con capacidades inteligentes",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=app_lifespan
 )
 
-# Configuración
-BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
-
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +57,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(decision_support.router)
+app.include_router(jobs.router)
+
 # Modelos Pydantic
 class AnalysisRequest(BaseModel):
     query: str
@@ -42,6 +75,22 @@ class RecommendationRequest(BaseModel):
     user_role: str
     location: Optional[Dict[str, float]] = None
 
+class BatchRecommendationItem(RecommendationRequest):
+    id: Optional[str] = None
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[BatchRecommendationItem] = []
+
+class EvacueeRequest(BaseModel):
+    id: Optional[str] = None
+    lat: float
+    lon: float
+    people: int = 1
+
+class BatchAssignmentRequest(BaseModel):
+    points: List[EvacueeRequest] = []
+    max_km: Optional[float] = None
+
 # Endpoints básicos (compatibilidad)
 @app.get("/mcp/health")
 def health():
@@ -52,174 +101,225 @@ def health():
             "analytics",
             "risk_assessment",
             "recommendations",
-            "decision_support"
-        ]
+            "decision_support",
+            "routing",
+            "jobs"
+        ],
+        "snapshot": snapshot_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "compute_pool": compute_pool.stats(),
+        "jobs": job_manager.stats()
     }
 
+@app.get("/mcp/cache/stats")
+def cache_stats():
+    """Aciertos, fallos y ocupación de la caché de resultados"""
+    return result_cache.stats()
+
 @app.get("/mcp/alerts")
-def mcp_alerts(limit: int = 100):
+async def mcp_alerts(limit: int = 100):
     try:
-        with httpx.Client() as client:
-            r = client.get(f"{BACKEND_URL}/alerts?limit={limit}", timeout=10)
-            r.raise_for_status()
-            alerts = r.json()
-            
-            # Análisis básico
-            counts = {}
-            high_severity = 0
-            for a in alerts:
-                s = str(a.get("severity", 1))
-                counts[s] = counts.get(s, 0) + 1
-                if a.get('severity', 1) >= 3:
-                    high_severity += 1
-            
-            return {
-                "alerts": alerts, 
-                "analytics": {
-                    "total_alerts": len(alerts),
-                    "high_severity_alerts": high_severity,
-                    "severity_breakdown": counts,
-                    "risk_level": "HIGH" if high_severity > 3 else "MEDIUM" if high_severity > 0 else "LOW"
-                }
+        r = await get_client().get(f"{BACKEND_URL}/alerts", params={"limit": limit})
+        r.raise_for_status()
+        alerts = r.json()
+        
+        # Análisis básico
+        counts = {}
+        high_severity = 0
+        for a in alerts:
+            s = str(a.get("severity", 1))
+            counts[s] = counts.get(s, 0) + 1
+            if a.get('severity', 1) >= 3:
+                high_severity += 1
+        
+        return {
+            "alerts": alerts, 
+            "analytics": {
+                "total_alerts": len(alerts),
+                "high_severity_alerts": high_severity,
+                "severity_breakdown": counts,
+                "risk_level": "HIGH" if high_severity > 3 else "MEDIUM" if high_severity > 0 else "LOW"
             }
+        }
     except Exception as e:
         logging.error(f"Error en mcp/alerts: {e}")
         return {"alerts": [], "analytics": {"error": str(e)}}
 
 @app.get("/mcp/zones")
-def mcp_zones():
-    try:
-        with httpx.Client() as client:
-            r = client.get(f"{BACKEND_URL}/zones", timeout=10)
-            r.raise_for_status()
-            return r.json()
-    except Exception as e:
-        logging.error(f"Error en mcp/zones: {e}")
-        return []
+async def mcp_zones():
+    return await proxy_stream("/zones", [])
 
 @app.get("/mcp/shelters")
-def mcp_shelters():
-    try:
-        with httpx.Client() as client:
-            r = client.get(f"{BACKEND_URL}/shelters", timeout=10)
-            r.raise_for_status()
-            return r.json()
-    except Exception as e:
-        logging.error(f"Error en mcp/shelters: {e}")
-        return []
+async def mcp_shelters():
+    return await proxy_stream("/shelters", [])
+
+@app.get("/mcp/shelters/nearest")
+async def mcp_nearest_shelters(lat: float, lon: float, k: int = 3, radius_km: Optional[float] = None,
+                               shelter_type: Optional[str] = None, min_capacity: int = 0):
+    """Refugios más cercanos (km reales), filtrables por tipo y capacidad restante"""
+    snapshot = await snapshot_cache.get()
+    index = snapshot.shelter_index
+    if radius_km is not None and k <= 0:
+        shelters = index.within(lat, lon, radius_km, shelter_type, min_capacity)
+    else:
+        shelters = index.nearest(lat, lon, max(k, 1), radius_km, shelter_type, min_capacity)
+    return {"shelters": shelters, "count": len(shelters), "data_version": snapshot.version}
+
+@app.post("/mcp/shelters/assign")
+async def assign_shelter(request: EvacueeRequest, max_km: float = SHELTER_MAX_KM):
+    """Reservar cupo en el refugio más cercano con espacio para todo el grupo"""
+    snapshot = await snapshot_cache.get()
+    # Espera a que termine una re-optimización en curso (no reservar sobre un lote a medio aplicar)
+    async with shelter_assignment.lock:
+        return shelter_assignment.assign(snapshot.shelter_index, request.lat, request.lon,
+                                         request.people, request.id, max_km)
+
+@app.post("/mcp/shelters/assign/batch")
+async def assign_shelters_batch(request: BatchAssignmentRequest):
+    """Registrar puntos de población y re-optimizar todas las asignaciones"""
+    snapshot = await snapshot_cache.get()
+    # Registro y subasta bajo el mismo lock: un id repetido no reemplaza una solicitud en plena subasta
+    points = [(p.lat, p.lon, p.people, p.id) for p in request.points]
+    return await shelter_assignment.reoptimize(snapshot.shelter_index, request.max_km or SHELTER_MAX_KM, points)
+
+@app.delete("/mcp/shelters/assign/{request_id}")
+async def release_shelter(request_id: str):
+    """Liberar el cupo reservado por una solicitud"""
+    async with shelter_assignment.lock:
+        request = shelter_assignment.release(request_id)
+    if request is None:
+        raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+    return request
+
+@app.get("/mcp/shelters/assignments")
+async def shelter_assignments():
+    """Reservas vigentes y ocupación de cada refugio"""
+    snapshot = await snapshot_cache.get()
+    return {**shelter_assignment.summary(), "shelters": shelter_assignment.shelters(snapshot.shelter_index)}
+
+@app.get("/mcp/alerts/nearby")
+async def mcp_nearby_alerts(lat: float, lon: float, radius_km: float = NEARBY_ALERT_RADIUS_KM, k: int = 0):
+    """Alertas dentro de radius_km (o las k más cercanas si k > 0)"""
+    snapshot = await snapshot_cache.get()
+    frame = snapshot.frame
+    if k > 0:
+        indices, distances = frame.kd_tree().query(lat, lon, k, radius_km)
+    else:
+        indices, distances = frame.kd_tree().query_radius(lat, lon, radius_km)
+    alerts = [
+        {**alert, "distance_km": round(distance, 3)}
+        for alert, distance in zip(frame.rows(indices), distances.tolist())
+    ]
+    return {"alerts": alerts, "count": len(alerts), "data_version": snapshot.version}
+
+async def _road_metric(snapshot):
+    metric = await road_router.metric(snapshot.zones)
+    if metric is None:
+        raise HTTPException(status_code=503, detail={"message": "Red vial no disponible", **road_router.status()})
+    return metric
+
+def _snap(lat: float, lon: float, label: str):
+    node, distance = road_router.index.snap(lat, lon, ROUTING_MAX_SNAP_KM)
+    if node is None:
+        raise HTTPException(status_code=422, detail=f"{label} a más de {ROUTING_MAX_SNAP_KM} km de la red vial")
+    return node, distance
+
+@app.get("/mcp/routes/status")
+def routes_status():
+    return road_router.status()
+
+@app.get("/mcp/routes/shortest")
+async def shortest_route(from_lat: float, from_lon: float, to_lat: float, to_lon: float):
+    """Ruta más rápida por la red vial, penalizando tramos en zonas de riesgo"""
+    snapshot = await snapshot_cache.get()
+    metric = await _road_metric(snapshot)
+    source, source_km = _snap(from_lat, from_lon, "Origen")
+    target, target_km = _snap(to_lat, to_lon, "Destino")
+    route = metric.route(source, target)
+    if route is None:
+        raise HTTPException(status_code=404, detail="Sin ruta transitable entre los puntos")
+    return {**route, "snap_km": {"from": round(source_km, 3), "to": round(target_km, 3)},
+            "data_version": snapshot.version}
+
+@app.get("/mcp/routes/shelters")
+async def shelter_routes(lat: float, lon: float, k: int = 3, min_capacity: int = 1, geometry: bool = True):
+    """Refugios más cercanos por tiempo de viaje (uno-a-muchos) con su ruta"""
+    snapshot = await snapshot_cache.get()
+    metric = await _road_metric(snapshot)
+    source, source_km = _snap(lat, lon, "Origen")
+    index = snapshot.shelter_index
+    positions, snap_km, nodes, targets = road_router.shelter_targets(metric, snapshot.version, index.shelters)
+    seconds = metric.one_to_many(source, targets)
+    available = shelter_assignment.available(index)[positions]
+    candidates = np.flatnonzero(np.isfinite(seconds) & (available >= min_capacity))
+    best = candidates[np.argsort(seconds[candidates], kind="stable")[:max(k, 1)]]
+
+    shelters = []
+    for i in best.tolist():
+        shelter = index.shelters[positions[i]]
+        remaining = available[i]
+        row = {**shelter, "duration_min": round(float(seconds[i]) / 60, 2), "snap_km": round(float(snap_km[i]), 3),
+               "remaining_capacity": None if np.isinf(remaining) else int(remaining)}
+        if geometry:
+            row["route"] = metric.route(source, int(nodes[i]))
+        shelters.append(row)
+    return {"shelters": shelters, "count": len(shelters), "snap_km": round(source_km, 3),
+            "data_version": snapshot.version}
 
 # 🆕 ENDPOINTS AVANZADOS
 
 @app.get("/mcp/analytics/dashboard")
 async def analytics_dashboard():
-    """Dashboard analítico completo"""
+    """Dashboard analítico completo (desde caché mientras no cambien los datos)"""
     try:
-        async with httpx.AsyncClient() as client:
-            # Obtener datos múltiples
-            alerts_task = client.get(f"{BACKEND_URL}/alerts?limit=100")
-            external_task = client.get(f"{BACKEND_URL}/external-alerts")
-            
-            alerts_response, external_response = await asyncio.gather(
-                alerts_task, external_task, return_exceptions=True
-            )
-        
-        alerts_data = []
-        if not isinstance(alerts_response, Exception) and alerts_response.status_code == 200:
-            alerts_data = alerts_response.json()
-        
-        external_data = {"alerts": []}
-        if not isinstance(external_response, Exception) and external_response.status_code == 200:
-            external_data = external_response.json()
-
-        # Análisis
-        total_alerts = len(alerts_data)
-        external_alerts = len(external_data.get("alerts", []))
-        
-        # Análisis por severidad
-        severity_count = {}
-        high_severity_count = 0
-        for alert in alerts_data:
-            sev = alert.get('severity', 1)
-            severity_count[sev] = severity_count.get(sev, 0) + 1
-            if sev >= 3:
-                high_severity_count += 1
-
-        # Alertas recientes (últimas 24 horas)
-        recent_alerts = [
-            alert for alert in alerts_data 
-            if is_recent(alert.get('created_at', ''), hours=24)
-        ]
-
-        # Tendencias
-        trends = analyze_trends(alerts_data)
-
-        return {
-            "summary": {
-                "total_alerts": total_alerts,
-                "external_alerts": external_alerts,
-                "recent_24h": len(recent_alerts),
-                "high_severity": high_severity_count,
-                "avg_severity": sum(alert.get('severity', 1) for alert in alerts_data) / total_alerts if total_alerts > 0 else 0
-            },
-            "severity_breakdown": severity_count,
-            "risk_assessment": {
-                "level": calculate_risk_level(high_severity_count, len(recent_alerts)),
-                "factors": get_risk_factors(alerts_data, external_data),
-                "confidence": 0.8
-            },
-            "trends": trends,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        snapshot = await snapshot_cache.get()
+        return await result_cache.get_or_compute("analytics_dashboard", {}, snapshot.version,
+                                                 lambda: build_analytics_dashboard(snapshot),
+                                                 store=not snapshot.partial)
 
     except Exception as e:
         logging.error(f"Error en analytics dashboard: {e}")
         return {"error": str(e)}
 
+async def build_analytics_dashboard(snapshot) -> Dict:
+    # Agregados incrementales (histórico completo) + instantánea para factores espaciales
+    await analytics_engine.sync()
+    external_data = snapshot.external
+    summary = analytics_engine.summary()
+
+    return {
+        "summary": {
+            "total_alerts": summary["total_alerts"],
+            "external_alerts": len(external_data.get("alerts", [])),
+            "recent_24h": summary["recent_24h"],
+            "last_7d": summary["last_7d"],
+            "high_severity": summary["high_severity"],
+            "avg_severity": summary["avg_severity"]
+        },
+        "severity_breakdown": analytics_engine.severity_count,
+        "type_breakdown": summary["by_type"],
+        "risk_assessment": {
+            # El riesgo se evalúa sobre la ventana de 24 h, no sobre todo el histórico
+            "level": calculate_risk_level(analytics_engine.high_severity_24h(), summary["recent_24h"]),
+            "factors": get_risk_factors(snapshot.frame.head(100), external_data),
+            "confidence": 0.8
+        },
+        "trends": analytics_engine.trends(days=3),
+        "activity": {
+            "hourly_24h": summary["hourly_24h"],
+            "daily_7d": summary["daily_7d"],
+            "monthly_12m": summary["monthly_12m"]
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @app.post("/mcp/analysis/risk-assessment")
 async def risk_assessment(request: AnalysisRequest):
-    """Evaluación de riesgo inteligente"""
+    """Evaluación de riesgo inteligente (no depende de los parámetros de la petición)"""
     try:
-        async with httpx.AsyncClient() as client:
-            alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=50")
-            alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-
-        # Análisis de factores de riesgo
-        risk_factors = []
-        recommendations = []
-
-        # Factor 1: Alertas de alta severidad
-        high_severity = [a for a in alerts_data if a.get('severity', 1) >= 3]
-        if high_severity:
-            risk_factors.append(f"{len(high_severity)} alertas de alta severidad activas")
-            recommendations.append("Monitorear continuamente alertas críticas")
-
-        # Factor 2: Concentración geográfica
-        clusters = analyze_location_clusters(alerts_data)
-        if clusters:
-            risk_factors.append(f"Concentración en {len(clusters)} zonas de riesgo")
-            recommendations.append("Optimizar recursos en zonas críticas")
-
-        # Factor 3: Tendencia temporal
-        trends = analyze_trends(alerts_data)
-        if trends.get('increasing'):
-            risk_factors.append("Tendencia creciente en número de alertas")
-            recommendations.append("Preparar capacidad de respuesta adicional")
-
-        # Calcular nivel de riesgo
-        risk_score = len(risk_factors) * 0.5 + len(high_severity) * 0.3
-        if risk_score >= 2:
-            risk_level = "HIGH"
-        elif risk_score >= 1:
-            risk_level = "MEDIUM"
-        else:
-            risk_level = "LOW"
-
-        return RiskAssessment(
-            risk_level=risk_level,
-            confidence=min(risk_score / 3.0, 1.0),
-            factors=risk_factors,
-            recommendations=recommendations
-        )
+        snapshot = await snapshot_cache.get()
+        return await result_cache.get_or_compute("risk_assessment", {}, snapshot.version,
+                                                 lambda: build_risk_assessment(snapshot), store=not snapshot.partial)
 
     except Exception as e:
         logging.error(f"Error en risk assessment: {e}")
@@ -230,16 +330,55 @@ async def risk_assessment(request: AnalysisRequest):
             recommendations=["Revisar conectividad con backend"]
         )
 
+async def build_risk_assessment(snapshot) -> RiskAssessment:
+    await analytics_engine.sync()
+    frame = snapshot.frame.head(50)
+
+    # Análisis de factores de riesgo
+    risk_factors = []
+    recommendations = []
+
+    # Factor 1: Alertas de alta severidad
+    high_severity = frame.count_high_severity()
+    if high_severity:
+        risk_factors.append(f"{high_severity} alertas de alta severidad activas")
+        recommendations.append("Monitorear continuamente alertas críticas")
+
+    # Factor 2: Concentración geográfica (sobre toda la instantánea)
+    clusters = await location_clusters(snapshot.frame)
+    if clusters:
+        risk_factors.append(f"Concentración en {len(clusters)} zonas de riesgo")
+        recommendations.append("Optimizar recursos en zonas críticas")
+
+    # Factor 3: Tendencia temporal
+    trends = analytics_engine.trends(days=3)
+    if trends.get('increasing'):
+        risk_factors.append("Tendencia creciente en número de alertas")
+        recommendations.append("Preparar capacidad de respuesta adicional")
+
+    # Calcular nivel de riesgo
+    risk_score = len(risk_factors) * 0.5 + high_severity * 0.3
+    if risk_score >= 2:
+        risk_level = "HIGH"
+    elif risk_score >= 1:
+        risk_level = "MEDIUM"
+    else:
+        risk_level = "LOW"
+
+    return RiskAssessment(
+        risk_level=risk_level,
+        confidence=min(risk_score / 3.0, 1.0),
+        factors=risk_factors,
+        recommendations=recommendations
+    )
+
 @app.post("/mcp/recommendations/personalized")
 async def personalized_recommendations(request: RecommendationRequest):
     """Recomendaciones personalizadas por rol de usuario"""
     try:
-        async with httpx.AsyncClient() as client:
-            alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=50")
-            shelters_response = await client.get(f"{BACKEND_URL}/shelters")
-            
-            alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-            shelters_data = shelters_response.json() if shelters_response.status_code == 200 else []
+        snapshot = await snapshot_cache.get()
+        alerts_data = snapshot.frame.head(50)
+        shelters_data = snapshot.shelter_index
 
         # Generar recomendaciones basadas en rol
         if request.user_role == "first_responder":
@@ -263,87 +402,128 @@ async def personalized_recommendations(request: RecommendationRequest):
             "priority": "LOW"
         }
 
+@app.post("/mcp/recommendations/batch")
+async def batch_recommendations(request: BatchRecommendationRequest):
+    """Recomendaciones para muchos usuarios contra una sola instantánea, en NDJSON.
+
+    Cada línea es {"index", "id", "user_role", ...recomendación}; las líneas
+    se envían por bloques a medida que se calculan.
+    """
+    try:
+        snapshot = await snapshot_cache.get()
+    except Exception as e:
+        logging.error(f"Error en recommendations/batch: {e}")
+        raise HTTPException(status_code=503, detail="No se pudieron obtener datos del backend")
+    alerts = snapshot.frame.head(50)
+    shelters = snapshot.shelter_index
+    available = shelter_assignment.available(shelters)
+    items = request.requests
+    # Respuestas ya serializadas: muchos usuarios reciben exactamente la misma
+    serialized: Dict[Any, str] = {}
+
+    async def lines():
+        for first in range(0, len(items), RECOMMENDATION_BATCH_CHUNK):
+            chunk = items[first:first + RECOMMENDATION_BATCH_CHUNK]
+            try:
+                body = recommendation_lines(chunk, first, alerts, shelters, available, serialized)
+            except Exception as e:
+                logging.error(f"Error en recommendations/batch: {e}")
+                yield json.dumps({"index": first, "error": str(e)}) + "\n"
+                return
+            yield body
+            # Ceder el event loop entre bloques
+            await asyncio.sleep(0)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"X-Data-Version": snapshot.version})
+
+def recommendation_lines(items: List[BatchRecommendationItem], offset: int, alerts: AlertFrame,
+                         shelters: ShelterIndex, available: np.ndarray, serialized: Dict[Any, str]) -> str:
+    """Un bloque de recomendaciones: cercanía de alertas y refugios vectorizada para todo el bloque"""
+    roles = [item.user_role for item in items]
+    located = np.array([bool(item.location) and role in ("first_responder", "citizen")
+                        for item, role in zip(items, roles)], dtype=bool)
+    lat = np.array([(item.location or {}).get('lat', 0) for item in items], dtype=np.float64)
+    lon = np.array([(item.location or {}).get('lon', 0) for item in items], dtype=np.float64)
+
+    counts = np.zeros(len(items), dtype=np.int64)
+    high = np.zeros(len(items), dtype=np.int64)
+    rows = np.flatnonzero(located)
+    counts[rows], high[rows] = nearby_alert_counts(alerts, lat[rows], lon[rows])
+    shelter_of = np.full(len(items), -1, dtype=np.int64)
+    shelter_km = np.full(len(items), np.inf)
+    rows = np.flatnonzero(located & (np.array(roles, dtype=object) == "citizen"))
+    shelter_of[rows], shelter_km[rows] = shelters.nearest_many(lat[rows], lon[rows], NEARBY_SHELTER_RADIUS_KM,
+                                                               min_remaining=1, available=available)
+
+    counts, high, shelter_of, shelter_km = counts.tolist(), high.tolist(), shelter_of.tolist(), shelter_km.tolist()
+    out = []
+    for i, (item, role) in enumerate(zip(items, roles)):
+        if role == "first_responder":
+            key = (role, high[i])
+        elif role == "citizen":
+            shelter = shelter_of[i]
+            # La descripción muestra la distancia con un decimal
+            key = (role, counts[i], high[i] > 0, shelter, f"{shelter_km[i]:.1f}" if shelter >= 0 else None)
+        else:
+            key = (role,)
+        if key not in serialized:
+            if role == "first_responder":
+                result = responder_recommendations(key[1])
+            elif role == "citizen":
+                nearest = {**shelters.shelters[shelter], "distance_km": shelter_km[i]} if shelter >= 0 else None
+                result = citizen_recommendations(key[1], high[i], nearest)
+            elif role == "coordinator":
+                result = generate_coordinator_recommendations(alerts)
+            else:
+                result = generate_general_recommendations(alerts)
+            serialized[key] = json.dumps({"user_role": role, **result})[1:]
+        out.append(f'{{"index": {offset + i}, "id": {json.dumps(item.id)}, {serialized[key]}\n')
+    return "".join(out)
+
 @app.get("/mcp/analysis/correlation")
 async def analyze_correlations():
-    """Análisis de correlaciones entre alertas"""
+    """Análisis de correlaciones entre alertas (desde caché mientras no cambien los datos)"""
     try:
-        async with httpx.AsyncClient() as client:
-            alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=100")
-            alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-
-        correlations = []
-
-        # Correlación temporal
-        time_patterns = analyze_temporal_patterns(alerts_data)
-        if time_patterns:
-            correlations.append({
-                "type": "temporal",
-                "description": time_patterns,
-                "confidence": 0.7
-            })
-
-        # Correlación geográfica
-        clusters = analyze_location_clusters(alerts_data)
-        if clusters:
-            correlations.append({
-                "type": "geographic",
-                "description": f"{len(clusters)} clusters geográficos identificados",
-                "confidence": 0.8
-            })
-
-        return {
-            "total_correlations": len(correlations),
-            "correlations": correlations,
-            "analysis_timestamp": datetime.utcnow().isoformat()
-        }
+        snapshot = await snapshot_cache.get()
+        return await result_cache.get_or_compute("analyze_correlations", {}, snapshot.version,
+                                                 lambda: build_correlations(snapshot), store=not snapshot.partial)
 
     except Exception as e:
         logging.error(f"Error en correlation analysis: {e}")
         return {"correlations": [], "error": str(e)}
 
-# 🔧 FUNCIONES AUXILIARES
+async def build_correlations(snapshot) -> Dict:
+    await analytics_engine.sync()
+
+    correlations = []
+
+    # Correlación temporal
+    time_patterns = analytics_engine.temporal_pattern()
+    if time_patterns:
+        correlations.append({
+            "type": "temporal",
+            "description": time_patterns,
+            "confidence": 0.7
+        })
+
+    # Correlación geográfica (sobre toda la instantánea)
+    clusters = await location_clusters(snapshot.frame)
+    if clusters:
+        correlations.append({
+            "type": "geographic",
+            "description": f"{len(clusters)} clusters geográficos identificados",
+            "confidence": 0.8
+        })
 
-def is_recent(timestamp: str, hours: int = 24) -> bool:
-    """Verificar si una alerta es reciente"""
-    try:
-        if not timestamp:
-            return False
-        # Ajustar formato de timestamp
-        if timestamp.endswith('Z'):
-            timestamp = timestamp.replace('Z', '+00:00')
-        alert_time = datetime.fromisoformat(timestamp)
-        return datetime.utcnow() - alert_time < timedelta(hours=hours)
-    except:
-        return False
-
-def analyze_trends(alerts_data: List[Dict]) -> Dict[str, Any]:
-    """Analizar tendencias en las alertas"""
-    if not alerts_data:
-        return {"trend": "stable", "increasing": False}
-    
-    # Agrupar por fecha
-    daily_count = {}
-    for alert in alerts_data:
-        try:
-            date = datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')).date()
-            daily_count[date] = daily_count.get(date, 0) + 1
-        except:
-            continue
-    
-    # Analizar tendencia de últimos días
-    recent_dates = sorted(daily_count.keys())[-3:]  # Últimos 3 días
-    if len(recent_dates) < 2:
-        return {"trend": "insufficient_data", "increasing": False}
-    
-    recent_counts = [daily_count[date] for date in recent_dates]
-    trend = "increasing" if recent_counts[-1] > recent_counts[0] else "decreasing"
-    
     return {
-        "trend": trend,
-        "increasing": trend == "increasing",
-        "recent_counts": recent_counts
+        "total_correlations": len(correlations),
+        "correlations": correlations,
+        "analysis_timestamp": datetime.utcnow().isoformat()
     }
 
+# 🔧 FUNCIONES AUXILIARES
+
 def calculate_risk_level(high_severity_count: int, recent_count: int) -> str:
     """Calcular nivel de riesgo"""
     risk_score = (high_severity_count * 0.6) + (recent_count * 0.4)
@@ -357,11 +537,11 @@ def calculate_risk_level(high_severity_count: int, recent_count: int) -> str:
     else:
         return "LOW"
 
-def get_risk_factors(alerts_data: List[Dict], external_data: Dict) -> List[str]:
+def get_risk_factors(alerts_data: AlertFrame, external_data: Dict) -> List[str]:
     """Obtener factores de riesgo"""
     factors = []
     
-    high_severity = len([a for a in alerts_data if a.get('severity', 1) >= 3])
+    high_severity = alerts_data.count_high_severity()
     if high_severity > 0:
         factors.append(f"{high_severity} alertas de alta severidad")
     
@@ -374,77 +554,21 @@ def get_risk_factors(alerts_data: List[Dict], external_data: Dict) -> List[str]:
     
     return factors
 
-def analyze_location_clusters(alerts_data: List[Dict]) -> List[Dict]:
-    """Analizar clusters geográficos de alertas"""
-    clusters = []
-    
-    for alert in alerts_data:
-        lat, lon = alert.get('lat', 0), alert.get('lon', 0)
-        
-        # Buscar cluster cercano
-        found_cluster = None
-        for cluster in clusters:
-            cluster_lat, cluster_lon = cluster['center']
-            distance = ((lat - cluster_lat)**2 + (lon - cluster_lon)**2)**0.5
-            if distance < 0.01:  # ~1km
-                found_cluster = cluster
-                break
-        
-        if found_cluster:
-            found_cluster['alerts'].append(alert)
-            # Actualizar centro del cluster
-            alerts_in_cluster = found_cluster['alerts']
-            avg_lat = sum(a.get('lat', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            avg_lon = sum(a.get('lon', 0) for a in alerts_in_cluster) / len(alerts_in_cluster)
-            found_cluster['center'] = (avg_lat, avg_lon)
-            found_cluster['count'] = len(alerts_in_cluster)
-        else:
-            clusters.append({
-                'center': (lat, lon),
-                'alerts': [alert],
-                'count': 1
-            })
-    
-    return [c for c in clusters if c['count'] > 1]
-
-def analyze_temporal_patterns(alerts_data: List[Dict]) -> str:
-    """Analizar patrones temporales"""
-    if not alerts_data:
-        return ""
-    
-    # Agrupar por hora del día
-    hourly_count = {h: 0 for h in range(24)}
-    for alert in alerts_data:
-        try:
-            hour = datetime.fromisoformat(alert['created_at'].replace('Z', '+00:00')).hour
-            hourly_count[hour] += 1
-        except:
-            continue
-    
-    # Encontrar horas pico
-    max_hour = max(hourly_count, key=hourly_count.get)
-    max_count = hourly_count[max_hour]
-    total_alerts = len(alerts_data)
-    
-    if max_count > total_alerts * 0.2:  # 20% en una hora
-        return f"Pico de actividad alrededor de las {max_hour}:00"
-    
-    return ""
-
 # 🎯 FUNCIONES DE RECOMENDACIONES
 
-def generate_responder_recommendations(alerts: List[Dict], location: Optional[Dict]) -> Dict:
+def generate_responder_recommendations(alerts: AlertFrame, location: Optional[Dict]) -> Dict:
     """Recomendaciones para equipos de respuesta"""
-    nearby_alerts = get_nearby_alerts(alerts, location) if location else []
-    high_priority = [a for a in nearby_alerts if a.get('severity', 1) >= 3]
-    
+    nearby_alerts = get_nearby_alerts(alerts, location) if location else alerts.head(0)
+    return responder_recommendations(nearby_alerts.count_high_severity())
+
+def responder_recommendations(high_priority: int) -> Dict:
     recommendations = []
     
     if high_priority:
         recommendations.append({
             "type": "immediate_action",
             "title": "Atender alertas críticas",
-            "description": f"{len(high_priority)} alertas de alta prioridad en tu área",
+            "description": f"{high_priority} alertas de alta prioridad en tu área",
             "actions": ["Desplegar equipo", "Reportar situación", "Solicitar apoyo"]
         })
     
@@ -461,9 +585,9 @@ def generate_responder_recommendations(alerts: List[Dict], location: Optional[Di
         "validity_period": "1h"
     }
 
-def generate_coordinator_recommendations(alerts: List[Dict]) -> Dict:
+def generate_coordinator_recommendations(alerts: AlertFrame) -> Dict:
     """Recomendaciones para coordinadores"""
-    high_severity = len([a for a in alerts if a.get('severity', 1) >= 3])
+    high_severity = alerts.count_high_severity()
     clusters = analyze_location_clusters(alerts)
     
     recommendations = []
@@ -490,17 +614,21 @@ def generate_coordinator_recommendations(alerts: List[Dict]) -> Dict:
         "validity_period": "2h"
     }
 
-def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], location: Optional[Dict]) -> Dict:
+def generate_citizen_recommendations(alerts: AlertFrame, shelters: ShelterIndex, location: Optional[Dict]) -> Dict:
     """Recomendaciones para ciudadanos"""
-    nearby_alerts = get_nearby_alerts(alerts, location) if location else []
-    nearby_shelters = get_nearby_shelters(shelters, location) if location else []
-    
+    nearby_alerts = get_nearby_alerts(alerts, location) if location else alerts.head(0)
+    # Refugio más cercano con cupo disponible (descontando reservas)
+    nearest_shelters = shelters.nearest(location.get('lat', 0), location.get('lon', 0), k=1,
+                                        max_km=NEARBY_SHELTER_RADIUS_KM, min_remaining=1,
+                                        available=shelter_assignment.available(shelters)) if location else []
+    return citizen_recommendations(len(nearby_alerts), nearby_alerts.count_high_severity(),
+                                   nearest_shelters[0] if nearest_shelters else None)
+
+def citizen_recommendations(nearby_count: int, high_nearby: int, shelter: Optional[Dict]) -> Dict:
     recommendations = []
     
-    if nearby_alerts:
-        high_severity_nearby = any(a.get('severity', 1) >= 3 for a in nearby_alerts)
-        
-        if high_severity_nearby:
+    if nearby_count:
+        if high_nearby:
             recommendations.append({
                 "type": "safety",
                 "title": "¡Precaución!",
@@ -511,10 +639,18 @@ def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], l
         recommendations.append({
             "type": "awareness",
             "title": "Alertas cercanas",
-            "description": f"{len(nearby_alerts)} alertas reportadas cerca de ti",
+            "description": f"{nearby_count} alertas reportadas cerca de ti",
             "actions": ["Monitorea actualizaciones", "Conoce rutas seguras", "Identifica refugios"]
         })
     
+    if shelter and recommendations:
+        recommendations.append({
+            "type": "preparation",
+            "title": "Refugio disponible",
+            "description": f"{shelter.get('name', 'Refugio')} a {shelter['distance_km']:.1f} km con cupo disponible",
+            "actions": ["Conocer la ruta al refugio", "Guardar contactos", "Preparar ruta de evacuación"]
+        })
+    
     if not recommendations:
         recommendations.append({
             "type": "general",
@@ -529,7 +665,7 @@ def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], l
         "validity_period": "6h"
     }
 
-def generate_general_recommendations(alerts: List[Dict]) -> Dict:
+def generate_general_recommendations(alerts: AlertFrame) -> Dict:
     """Recomendaciones generales"""
     return {
         "recommendations": [{
@@ -542,31 +678,12 @@ def generate_general_recommendations(alerts: List[Dict]) -> Dict:
         "validity_period": "12h"
     }
 
-def get_nearby_alerts(alerts: List[Dict], location: Dict, max_distance: float = 0.01) -> List[Dict]:
-    """Obtener alertas cercanas a una ubicación"""
+def get_nearby_alerts(alerts: AlertFrame, location: Dict, radius_km: float = NEARBY_ALERT_RADIUS_KM) -> AlertFrame:
+    """Obtener alertas cercanas a una ubicación (distancia real en km)"""
     if not location:
-        return []
+        return alerts.head(0)
     
-    lat, lon = location.get('lat', 0), location.get('lon', 0)
-    return [
-        alert for alert in alerts
-        if calculate_distance(lat, lon, alert.get('lat', 0), alert.get('lon', 0)) <= max_distance
-    ]
-
-def get_nearby_shelters(shelters: List[Dict], location: Dict, max_distance: float = 0.02) -> List[Dict]:
-    """Obtener refugios cercanos a una ubicación"""
-    if not location:
-        return []
-    
-    lat, lon = location.get('lat', 0), location.get('lon', 0)
-    return [
-        shelter for shelter in shelters
-        if calculate_distance(lat, lon, shelter.get('lat', 0), shelter.get('lon', 0)) <= max_distance
-    ]
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calcular distancia aproximada entre dos puntos"""
-    return ((lat1 - lat2)**2 + (lon1 - lon2)**2)**0.5
+    return nearby_alerts(alerts, location.get('lat', 0), location.get('lon', 0), radius_km)
 
 # Necesario para asyncio.gather
 import asyncio
@@ -0,0 +1,98 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .alert_frame import AlertFrame
+from .spatial import GeoIndex, KDTree
+
+# Configuración (en km; antes 0.01° y 0.02° euclidianos)
+NEARBY_ALERT_RADIUS_KM = float(os.getenv("NEARBY_ALERT_RADIUS_KM", "1.1"))
+NEARBY_SHELTER_RADIUS_KM = float(os.getenv("NEARBY_SHELTER_RADIUS_KM", "2.2"))
+
+class ShelterIndex:
+    """Refugios indexados en un KD-tree, construido una vez por versión de datos
+    (y en una malla `GeoIndex` para consultas de muchos puntos a la vez)"""
+
+    def __init__(self, shelters: List[Dict[str, Any]]):
+        self.shelters = shelters
+        self.lat = np.array([s.get('lat') or 0 for s in shelters], dtype=np.float64)
+        self.lon = np.array([s.get('lon') or 0 for s in shelters], dtype=np.float64)
+        self.shelter_type = np.array([s.get('shelter_type') or 'refuge' for s in shelters], dtype=object)
+        # Sin capacidad registrada se considera ilimitada
+        capacity = np.array([np.inf if s.get('capacity') is None else s['capacity'] for s in shelters], dtype=np.float64)
+        occupancy = np.array([s.get('occupancy') or 0 for s in shelters], dtype=np.float64)
+        self.remaining = np.maximum(capacity - occupancy, 0)
+        self.tree = KDTree(self.lat, self.lon)
+        self._geo_index: Optional[GeoIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.shelters)
+
+    def _mask(self, shelter_type: Optional[str], min_remaining: float, remaining: np.ndarray) -> Optional[np.ndarray]:
+        if shelter_type is None and min_remaining <= 0:
+            return None
+        mask = remaining >= min_remaining if min_remaining > 0 else np.ones(len(self), dtype=bool)
+        if shelter_type is not None:
+            mask &= self.shelter_type == shelter_type
+        return mask
+
+    def _rows(self, indices: np.ndarray, distances: np.ndarray, available: np.ndarray) -> List[Dict[str, Any]]:
+        rows = []
+        for index, distance in zip(indices.tolist(), distances.tolist()):
+            remaining = available[index]
+            rows.append({
+                **self.shelters[index],
+                "distance_km": round(distance, 3),
+                "remaining_capacity": None if np.isinf(remaining) else int(remaining)
+            })
+        return rows
+
+    def nearest(self, lat: float, lon: float, k: int = 3, max_km: Optional[float] = None,
+                shelter_type: Optional[str] = None, min_remaining: float = 0,
+                available: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Los k refugios más cercanos que cumplen los filtros.
+
+        `available` reemplaza la capacidad restante registrada (p. ej. descontando reservas).
+        """
+        available = self.remaining if available is None else available
+        indices, distances = self.tree.query(lat, lon, k, max_km, self._mask(shelter_type, min_remaining, available))
+        return self._rows(indices, distances, available)
+
+    def within(self, lat: float, lon: float, radius_km: float = NEARBY_SHELTER_RADIUS_KM,
+               shelter_type: Optional[str] = None, min_remaining: float = 0,
+               available: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Refugios a menos de radius_km, del más cercano al más lejano"""
+        available = self.remaining if available is None else available
+        indices, distances = self.tree.query_radius(lat, lon, radius_km, self._mask(shelter_type, min_remaining, available))
+        return self._rows(indices, distances, available)
+
+    def nearest_many(self, lat: np.ndarray, lon: np.ndarray, max_km: float, min_remaining: float = 0,
+                     available: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Refugio más cercano (índice, km) para muchos puntos a la vez; -1 e inf si no hay"""
+        available = self.remaining if available is None else available
+        nearest = np.full(len(lat), -1, dtype=np.int64)
+        distance = np.full(len(lat), np.inf)
+        if self._geo_index is None:
+            self._geo_index = GeoIndex(self.lat, self.lon)
+        q, p, km = self._geo_index.query_radius(lat, lon, max_km)
+        if min_remaining > 0:
+            keep = available[p] >= min_remaining
+            q, p, km = q[keep], p[keep], km[keep]
+        order = np.lexsort((km, q))
+        points, first = np.unique(q[order], return_index=True)
+        nearest[points] = p[order][first]
+        distance[points] = km[order][first]
+        return nearest, distance
+
+def nearby_alert_counts(frame: AlertFrame, lat: np.ndarray, lon: np.ndarray,
+                        radius_km: float = NEARBY_ALERT_RADIUS_KM, threshold: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Para muchos puntos a la vez: alertas a menos de radius_km y cuántas son de alta severidad"""
+    q, p, _ = frame.geo_index().query_radius(lat, lon, radius_km)
+    counts = np.bincount(q, minlength=len(lat))
+    high = np.bincount(q, weights=frame.severity[p] >= threshold, minlength=len(lat)).astype(np.int64)
+    return counts, high
+
+def nearby_alerts(frame: AlertFrame, lat: float, lon: float,
+                  radius_km: float = NEARBY_ALERT_RADIUS_KM) -> AlertFrame:
+    """Alertas a menos de radius_km, de la más cercana a la más lejana"""
+    indices, _ = frame.kd_tree().query_radius(lat, lon, radius_km)
+    return frame.take(indices)
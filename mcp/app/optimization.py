@@ -0,0 +1,301 @@
+import os
+import heapq
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Configuración (valores en km equivalentes de traslado)
+ALLOCATION_EPSILON_KM = float(os.getenv("ALLOCATION_EPSILON_KM", "0.01"))
+ALLOCATION_SCALING = float(os.getenv("ALLOCATION_SCALING", "5"))
+ALLOCATION_MAX_BIDS = int(os.getenv("ALLOCATION_MAX_BIDS", "2000000"))
+# Presupuesto de un arranque en caliente, en ofertas por unidad en juego; al agotarlo se resuelve en frío
+ALLOCATION_WARM_BID_FACTOR = float(os.getenv("ALLOCATION_WARM_BID_FACTOR", "20"))
+
+# Con menos postores pendientes que esto, una ronda vectorizada cuesta más que ofertar de a uno
+AUCTION_BATCH_MIN = 32
+
+class AuctionBudgetExceeded(RuntimeError):
+    """La subasta superó el número de ofertas permitido"""
+
+class AuctionResult:
+    """Flujos de origen a destino y precios finales de cada destino"""
+
+    def __init__(self, flows: List[Tuple[int, int, int]], prices: np.ndarray, bids: int, phases: int,
+                 epsilon: float, slack: int):
+        # (origen, destino, cantidad); lo que no aparece queda sin asignar
+        self.flows = flows
+        self.prices = prices
+        self.bids = bids
+        self.phases = phases
+        self.epsilon = epsilon
+        # Cantidad total en juego (orígenes + cupos): la cota de optimalidad es slack * epsilon
+        self.slack = slack
+
+    def assigned(self, n: int) -> np.ndarray:
+        """Cantidad asignada por origen"""
+        totals = np.zeros(n, dtype=np.int64)
+        for i, _, quantity in self.flows:
+            totals[i] += quantity
+        return totals
+
+def auction_assign(benefit: np.ndarray, demand: Sequence[int], prices: Optional[np.ndarray] = None,
+                   epsilon: float = ALLOCATION_EPSILON_KM, start_epsilon: Optional[float] = None,
+                   supply: Optional[Sequence[int]] = None, max_bids: Optional[int] = None) -> AuctionResult:
+    """Problema de transporte de máximo beneficio por subasta (Bertsekas).
+
+    benefit[i, j] es el beneficio por unidad de enviar el origen i al destino j
+    (-inf si no es posible); el origen i tiene supply[i] unidades (1 por
+    omisión), el destino j recibe como máximo demand[j] y cada unidad puede
+    quedar libre con beneficio 0. El resultado es óptimo a menos de
+    (unidades + cupos) * epsilon.
+
+    Para que la subasta directa sea válida con cualquier precio inicial el
+    problema se vuelve simétrico: un destino "libre" con cupo para todas las
+    unidades y un postor ficticio por destino (beneficio 0), que ocupa los
+    cupos que ninguna unidad aprovecha. Así `prices` admite arranques en
+    caliente con los precios de una solución anterior.
+
+    Una sola fase con el epsilon final es pseudo-polinomial (las guerras de
+    ofertas avanzan de a epsilon), así que se escala: la primera fase usa
+    `start_epsilon` (por omisión la mitad del mayor beneficio) y cada fase
+    divide epsilon por ALLOCATION_SCALING reutilizando los precios y las
+    ofertas que siguen cumpliendo eps-CS. Si se superan `max_bids` ofertas se
+    lanza AuctionBudgetExceeded.
+    """
+    n, m = benefit.shape
+    demand = np.maximum(np.asarray(demand, dtype=np.int64), 0)
+    supply = np.ones(n, dtype=np.int64) if supply is None else np.maximum(np.asarray(supply, dtype=np.int64), 0)
+    prices = np.zeros(m) if prices is None else np.asarray(prices, dtype=np.float64)[:m].copy()
+    slack = int(supply.sum() + demand.sum())
+    if not supply.any():
+        return AuctionResult([], prices, 0, 0, epsilon, slack)
+    # Columna extra: quedarse libre (beneficio 0); destinos sin demanda no reciben unidades
+    extended = np.zeros((n, m + 1))
+    extended[:, :m] = np.where(demand > 0, benefit, -np.inf)
+    capacity = np.append(demand, supply.sum())
+    owners = np.flatnonzero(demand > 0)
+    quantity = np.concatenate([supply, demand[owners]])
+    prices = np.append(prices, 0.0)
+    if start_epsilon is None:
+        finite = np.abs(extended[np.isfinite(extended)])
+        start_epsilon = float(finite.max()) / 2 if finite.size else epsilon
+    eps = max(start_epsilon, epsilon)
+
+    auction = _TransportAuction(extended, quantity, capacity, owners, prices)
+    phases = 0
+    while True:
+        phases += 1
+        auction.run(eps, max_bids)
+        if eps <= epsilon:
+            break
+        eps = max(eps / ALLOCATION_SCALING, epsilon)
+        # Conservar lo que sigue cumpliendo eps-CS con el nuevo epsilon
+        auction.release_violations(eps)
+    flows = [(i, j, q) for i, j, q in auction.flows() if j < m]
+    return AuctionResult(flows, prices[:m], auction.bids, phases, eps, slack)
+
+class _TransportAuction:
+    """Estado de la subasta: ofertas aceptadas por destino y cantidades pendientes.
+
+    Los postores n.. son ficticios: uno por destino (`owners`), que solo puede
+    ocupar su destino o el libre, ambos con beneficio 0. Cada postor oferta por
+    todas sus unidades pendientes a la vez; cada destino guarda en un montículo
+    las mejores ofertas aceptadas (partiendo la menor si no cabe entera) y su
+    precio es la menor de ellas cuando está lleno.
+    """
+
+    def __init__(self, benefit: np.ndarray, quantity: np.ndarray, capacity: np.ndarray,
+                 owners: np.ndarray, prices: np.ndarray):
+        self.benefit = benefit
+        self.n, columns = benefit.shape
+        self.idle = columns - 1
+        # Contadores como listas: el acceso escalar a arreglos de numpy domina el costo por oferta
+        self.capacity = capacity.tolist()
+        self.owners = owners
+        self.prices = prices
+        self.pending = quantity.tolist()
+        self.held = [0] * columns
+        # Entradas [oferta, secuencia, postor, cantidad]; la secuencia desempata
+        self.holders: List[List[list]] = [[] for _ in range(columns)]
+        self.sequence = 0
+        self.bids = 0
+
+    def _bids(self, bidders: np.ndarray, eps: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Destino y oferta de cada postor pendiente (ronda de Jacobi, vectorizada)"""
+        targets = np.empty(len(bidders), dtype=np.int64)
+        offers = np.empty(len(bidders))
+        real = bidders < self.n
+        if real.any():
+            rows = bidders[real]
+            net = self.benefit[rows] - self.prices
+            arange = np.arange(len(rows))
+            best_j = net.argmax(axis=1)
+            best = net[arange, best_j]
+            net[arange, best_j] = -np.inf
+            second = net.max(axis=1)
+            second = np.where(np.isfinite(second), second, best)
+            targets[real] = best_j
+            offers[real] = self.benefit[rows, best_j] - second + eps
+        if (~real).any():
+            # Ficticios: comparan su destino con el libre
+            own = self.owners[bidders[~real] - self.n]
+            own_first = self.prices[own] <= self.prices[self.idle]
+            targets[~real] = np.where(own_first, own, self.idle)
+            offers[~real] = np.where(own_first, self.prices[self.idle], self.prices[own]) + eps
+        return targets, offers
+
+    def run(self, eps: float, max_bids: Optional[int] = None):
+        """Ofertas hasta que no quedan unidades pendientes.
+
+        Mientras hay muchos postores pendientes se hacen rondas de Jacobi
+        vectorizadas; la cola final (un postor desplaza a otro, que desplaza a
+        otro...) se atiende de a uno, sin el costo fijo de una ronda completa.
+        """
+        limit = ALLOCATION_MAX_BIDS if max_bids is None else min(max_bids, ALLOCATION_MAX_BIDS)
+        queue = [i for i, quantity in enumerate(self.pending) if quantity > 0]
+        while queue:
+            if len(queue) >= AUCTION_BATCH_MIN:
+                bidders = np.array(queue, dtype=np.int64)
+                targets, offers = self._bids(bidders, eps)
+                self.bids += len(queue)
+                touched = set()
+                for i, j, offer in zip(queue, targets.tolist(), offers.tolist()):
+                    self._place(i, j, offer)
+                    touched.add(j)
+                queue = []
+                for j in touched:
+                    self._settle(j, queue)
+            else:
+                i = queue.pop()
+                j, offer = self._bid(i, eps)
+                self._place(i, j, offer)
+                self.bids += 1
+                self._settle(j, queue)
+            if self.bids > limit:
+                raise AuctionBudgetExceeded("La subasta no convergió" if limit == ALLOCATION_MAX_BIDS
+                                            else "La subasta excedió su presupuesto de ofertas")
+
+    def _bid(self, i: int, eps: float) -> Tuple[int, float]:
+        """Destino y oferta de un solo postor (misma regla que _bids)"""
+        if i < self.n:
+            row = self.benefit[i]
+            net = row - self.prices
+            j = int(net.argmax())
+            best = net[j]
+            net[j] = -np.inf
+            second = net.max()
+            return j, float(row[j] - (second if np.isfinite(second) else best) + eps)
+        own = int(self.owners[i - self.n])
+        own_price, idle_price = float(self.prices[own]), float(self.prices[self.idle])
+        if own_price <= idle_price:
+            return own, idle_price + eps
+        return self.idle, own_price + eps
+
+    def _place(self, i: int, j: int, offer: float):
+        heapq.heappush(self.holders[j], [offer, self.sequence, i, self.pending[i]])
+        self.sequence += 1
+        self.held[j] += self.pending[i]
+        self.pending[i] = 0
+
+    def _settle(self, j: int, queue: List[int]):
+        """Devolver a sus postores las ofertas más bajas que exceden la capacidad"""
+        heap = self.holders[j]
+        overflow = self.held[j] - self.capacity[j]
+        while overflow > 0:
+            entry = heap[0]
+            take = min(entry[3], overflow)
+            entry[3] -= take
+            self.held[j] -= take
+            overflow -= take
+            if entry[3] == 0:
+                heapq.heappop(heap)
+            if not self.pending[entry[2]]:
+                queue.append(entry[2])
+            self.pending[entry[2]] += take
+        if self.held[j] >= self.capacity[j] and heap:
+            self.prices[j] = max(self.prices[j], heap[0][0])
+
+    def release_violations(self, eps: float):
+        """Liberar las ofertas que ya no cumplen eps-CS con los precios actuales"""
+        net = self.benefit - self.prices
+        best = net.max(axis=1)
+        for j, heap in enumerate(self.holders):
+            kept = []
+            for entry in heap:
+                i = entry[2]
+                if i < self.n:
+                    ok = net[i, j] >= best[i] - eps
+                else:
+                    own = self.owners[i - self.n]
+                    ok = -self.prices[j] >= -min(self.prices[own], self.prices[self.idle]) - eps
+                if ok:
+                    kept.append(entry)
+                else:
+                    self.held[j] -= entry[3]
+                    self.pending[i] += entry[3]
+            if len(kept) != len(heap):
+                heapq.heapify(kept)
+                self.holders[j] = kept
+
+    def flows(self) -> List[Tuple[int, int, int]]:
+        flows: Dict[Tuple[int, int], int] = {}
+        for j, heap in enumerate(self.holders):
+            for _, _, i, amount in heap:
+                if i < self.n and amount:
+                    flows[(i, j)] = flows.get((i, j), 0) + amount
+        return [(i, j, amount) for (i, j), amount in flows.items()]
+
+class AllocationSolver:
+    """Resuelve asignaciones sucesivas reutilizando precios por clave de destino.
+
+    Cuando cambian las alertas la mayoría de los destinos persisten, así que
+    sus precios anteriores son un buen punto de partida. En la subasta los
+    precios solo suben: un precio viejo por encima de lo que cualquier origen
+    puede pagar obliga a subir todos los demás de a epsilon. Por eso los
+    precios reutilizados se acotan al mayor beneficio de su destino, el
+    arranque en caliente vuelve a empezar con epsilon grueso y tiene un
+    presupuesto de ofertas (ALLOCATION_WARM_BID_FACTOR por unidad en juego);
+    si lo agota se resuelve en frío. Con `warm=False` se parte siempre de
+    precios cero.
+    """
+
+    def __init__(self):
+        self._prices: Dict[Hashable, Dict[Hashable, float]] = {}
+
+    def solve(self, benefit: np.ndarray, demand: Sequence[int], keys: Sequence[Hashable],
+              group: Hashable = None, epsilon: float = ALLOCATION_EPSILON_KM,
+              supply: Optional[Sequence[int]] = None, warm: bool = True) -> Tuple[AuctionResult, Dict[str, Any]]:
+        started = time.perf_counter()
+        previous = self._prices.get(group, {}) if warm else {}
+        reused = sum(1 for key in keys if key in previous)
+        warm = reused > 0
+        fallback = False
+        result = None
+        if warm:
+            finite = np.where(np.isfinite(benefit), benefit, 0.0)
+            ceiling = np.maximum(finite.max(axis=0), 0.0) if len(benefit) else np.zeros(len(keys))
+            prices = np.clip([previous.get(key, 0.0) for key in keys], 0.0, ceiling)
+            units = int(np.sum(supply) if supply is not None else len(benefit)) + int(np.maximum(demand, 0).sum())
+            try:
+                result = auction_assign(benefit, demand, prices, epsilon, supply=supply,
+                                        max_bids=int(ALLOCATION_WARM_BID_FACTOR * units))
+            except AuctionBudgetExceeded:
+                fallback = True
+        if result is None:
+            result = auction_assign(benefit, demand, None, epsilon, supply=supply)
+        self._prices[group] = dict(zip(keys, result.prices.tolist()))
+        return result, {
+            "warm_start": warm,
+            "warm_fallback": fallback,
+            "reused_prices": reused,
+            "bids": result.bids,
+            "phases": result.phases,
+            "optimality_gap_km": round(result.slack * result.epsilon, 3),
+            "solve_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def reset(self):
+        self._prices.clear()
+
+# Instancia global (mantiene los precios para arranques en caliente)
+allocation_solver = AllocationSolver()
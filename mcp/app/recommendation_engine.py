@@ -1,8 +1,12 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import List, Dict, Any
-from datetime import datetime, timedelta
-import httpx
+from datetime import datetime
+from .alert_frame import AlertFrame
+from .clustering import analyze_location_clusters
+from .nearby import NEARBY_ALERT_RADIUS_KM, ShelterIndex, nearby_alerts
+from .shelter_assignment import shelter_assignment
+from .snapshot_cache import snapshot_cache
 
 router = APIRouter(prefix="/mcp/recommendations", tags=["recommendations"])
 
@@ -20,16 +24,12 @@ class RecommendationResponse(BaseModel):
 async def get_personalized_recommendations(request: RecommendationRequest):
     """Recomendaciones personalizadas basadas en rol y ubicación"""
     
-    async with httpx.AsyncClient() as client:
-        # Obtener datos relevantes
-        alerts_response = await client.get(f"{BACKEND_URL}/alerts?limit=50")
-        external_response = await client.get(f"{BACKEND_URL}/external-alerts")
-        shelters_response = await client.get(f"{BACKEND_URL}/shelters")
-        
-        alerts_data = alerts_response.json() if alerts_response.status_code == 200 else []
-        external_data = external_response.json() if external_response.status_code == 200 else {"alerts": []}
-        shelters_data = shelters_response.json() if shelters_response.status_code == 200 else []
-    
+    # Obtener datos relevantes
+    snapshot = await snapshot_cache.get()
+    alerts_data = snapshot.frame.head(50)
+    external_data = snapshot.external
+    shelters_data = snapshot.shelters
+
     # Generar recomendaciones basadas en el rol
     if request.user_role == "first_responder":
         return generate_responder_recommendations(alerts_data, request.location)
@@ -38,14 +38,15 @@ async def get_personalized_recommendations(request: RecommendationRequest):
     elif request.user_role == "civil_protection":
         return generate_civil_protection_recommendations(alerts_data, shelters_data)
     elif request.user_role == "citizen":
-        return generate_citizen_recommendations(alerts_data, shelters_data, request.location)
+        return generate_citizen_recommendations(alerts_data, snapshot.shelter_index, request.location)
     else:
         return generate_general_recommendations(alerts_data)
 
-def generate_responder_recommendations(alerts: List[Dict], location: Dict) -> RecommendationResponse:
+def generate_responder_recommendations(alerts: AlertFrame, location: Dict) -> RecommendationResponse:
     """Recomendaciones para equipos de primera respuesta"""
-    nearby_alerts = get_nearby_alerts(alerts, location, max_distance=0.02)
-    high_priority = [a for a in nearby_alerts if a.get('severity', 1) >= 3]
+    # Cobertura de equipos: el doble del radio de cercanía ciudadano
+    nearby_alerts = get_nearby_alerts(alerts, location, radius_km=2 * NEARBY_ALERT_RADIUS_KM)
+    high_priority = nearby_alerts.count_high_severity()
     
     recommendations = []
     
@@ -53,11 +54,11 @@ def generate_responder_recommendations(alerts: List[Dict], location: Dict) -> Re
         recommendations.append({
             "type": "immediate_action",
             "title": "Atender alertas de alta prioridad",
-            "description": f"{len(high_priority)} alertas críticas en tu área inmediata",
+            "description": f"{high_priority} alertas críticas en tu área inmediata",
             "actions": ["Desplegar equipo", "Reportar situación", "Solicitar apoyo si es necesario"]
         })
     
-    if nearby_alerts:
+    if len(nearby_alerts):
         recommendations.append({
             "type": "assessment",
             "title": "Evaluar situación general",
@@ -81,12 +82,12 @@ def generate_responder_recommendations(alerts: List[Dict], location: Dict) -> Re
         validity_period="1h"
     )
 
-def generate_coordinator_recommendations(internal_alerts: List[Dict], external_alerts: List[Dict]) -> RecommendationResponse:
+def generate_coordinator_recommendations(internal_alerts: AlertFrame, external_alerts: List[Dict]) -> RecommendationResponse:
     """Recomendaciones para coordinadores"""
     recommendations = []
     
     total_alerts = len(internal_alerts)
-    high_severity = len([a for a in internal_alerts if a.get('severity', 1) >= 3])
+    high_severity = internal_alerts.count_high_severity()
     
     if high_severity > 0:
         recommendations.append({
@@ -120,13 +121,13 @@ def generate_coordinator_recommendations(internal_alerts: List[Dict], external_a
         validity_period="2h"
     )
 
-def generate_civil_protection_recommendations(alerts: List[Dict], shelters: List[Dict]) -> RecommendationResponse:
+def generate_civil_protection_recommendations(alerts: AlertFrame, shelters: List[Dict]) -> RecommendationResponse:
     """Recomendaciones para protección civil"""
     recommendations = []
     
     # Análisis de capacidad de refugios
     total_shelter_capacity = sum(s.get('capacity', 0) for s in shelters)
-    active_alerts = len([a for a in alerts if a.get('severity', 1) >= 2])
+    active_alerts = alerts.count_high_severity(threshold=2)
     
     if active_alerts > total_shelter_capacity * 0.5:
         recommendations.append({
@@ -152,15 +153,17 @@ def generate_civil_protection_recommendations(alerts: List[Dict], shelters: List
         validity_period="4h"
     )
 
-def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], location: Dict) -> RecommendationResponse:
+def generate_citizen_recommendations(alerts: AlertFrame, shelters: ShelterIndex, location: Dict) -> RecommendationResponse:
     """Recomendaciones para ciudadanos"""
-    nearby_alerts = get_nearby_alerts(alerts, location, max_distance=0.01)
-    nearby_shelters = get_nearby_shelters(shelters, location, max_distance=0.02)
+    nearby_alerts = get_nearby_alerts(alerts, location)
+    # Solo refugios con cupo, descontando las reservas de evacuados
+    nearby_shelters = shelters.within(location.get('lat', 0), location.get('lon', 0), min_remaining=1,
+                                      available=shelter_assignment.available(shelters)) if location else []
     
     recommendations = []
     
-    if nearby_alerts:
-        high_severity_nearby = any(a.get('severity', 1) >= 3 for a in nearby_alerts)
+    if len(nearby_alerts):
+        high_severity_nearby = nearby_alerts.count_high_severity() > 0
         
         if high_severity_nearby:
             recommendations.append({
@@ -181,7 +184,8 @@ def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], l
         recommendations.append({
             "type": "preparation",
             "title": "Refugios disponibles",
-            "description": f"{len(nearby_shelters)} refugios identificados en tu área",
+            "description": f"{len(nearby_shelters)} refugios identificados en tu área "
+                           f"(el más cercano a {nearby_shelters[0]['distance_km']:.1f} km)",
             "actions": ["Conocer ubicaciones", "Guardar contactos", "Preparar ruta de evacuación"]
         })
     
@@ -199,7 +203,7 @@ def generate_citizen_recommendations(alerts: List[Dict], shelters: List[Dict], l
         validity_period="6h"
     )
 
-def generate_general_recommendations(alerts: List[Dict]) -> RecommendationResponse:
+def generate_general_recommendations(alerts: AlertFrame) -> RecommendationResponse:
     """Recomendaciones generales"""
     return RecommendationResponse(
         recommendations=[{
@@ -213,57 +217,20 @@ def generate_general_recommendations(alerts: List[Dict]) -> RecommendationRespon
     )
 
 # Funciones auxiliares
-def get_nearby_alerts(alerts: List[Dict], location: Dict, max_distance: float = 0.01) -> List[Dict]:
-    if not location:
-        return []
-    
-    lat, lon = location.get('lat', 0), location.get('lon', 0)
-    return [
-        alert for alert in alerts
-        if ((alert.get('lat', 0) - lat)**2 + (alert.get('lon', 0) - lon)**2)**0.5 <= max_distance
-    ]
-
-def get_nearby_shelters(shelters: List[Dict], location: Dict, max_distance: float = 0.02) -> List[Dict]:
+def get_nearby_alerts(alerts: AlertFrame, location: Dict, radius_km: float = NEARBY_ALERT_RADIUS_KM) -> AlertFrame:
     if not location:
-        return []
+        return alerts.head(0)
     
-    lat, lon = location.get('lat', 0), location.get('lon', 0)
-    return [
-        shelter for shelter in shelters
-        if ((shelter.get('lat', 0) - lat)**2 + (shelter.get('lon', 0) - lon)**2)**0.5 <= max_distance
-    ]
+    return nearby_alerts(alerts, location.get('lat', 0), location.get('lon', 0), radius_km)
 
-def analyze_trends(alerts_data: List[Dict]) -> Dict[str, Any]:
+def analyze_trends(alerts_data: AlertFrame) -> Dict[str, Any]:
     # Implementación simplificada
     if len(alerts_data) < 2:
         return {"trend": "stable"}
     
-    recent = [a for a in alerts_data 
-              if datetime.fromisoformat(a['created_at'].replace('Z', '+00:00')) > datetime.utcnow() - timedelta(hours=24)]
+    recent = alerts_data.count_recent(hours=24)
     
     return {
-        "trend": "increasing" if len(recent) > len(alerts_data) * 0.3 else "stable",
-        "increasing": len(recent) > len(alerts_data) * 0.3
+        "trend": "increasing" if recent > len(alerts_data) * 0.3 else "stable",
+        "increasing": recent > len(alerts_data) * 0.3
     }
-
-def analyze_location_clusters(alerts_data: List[Dict]) -> List[Dict]:
-    # Implementación simplificada
-    clusters = []
-    for alert in alerts_data:
-        lat, lon = alert.get('lat', 0), alert.get('lon', 0)
-        
-        found = False
-        for cluster in clusters:
-            c_lat, c_lon = cluster['center']
-            if ((lat - c_lat)**2 + (lon - c_lon)**2)**0.5 < 0.01:
-                cluster['alerts'].append(alert)
-                found = True
-                break
-        
-        if not found:
-            clusters.append({
-                'center': (lat, lon),
-                'alerts': [alert]
-            })
-    
-    return [c for c in clusters if len(c['alerts']) > 1]
\ No newline at end of file
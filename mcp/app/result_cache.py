@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+# Configuración
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Las ventanas móviles (últimas 24 h, días cerrados) avanzan aunque los datos no cambien
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "60"))
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """Parámetros en forma canónica (orden de claves fijo, sin espacios)"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+def encode_json(result: Any) -> bytes:
+    # Igual que JSONResponse, para que un acierto devuelva los mismos bytes
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+class ResultCache:
+    """Respuestas serializadas por (endpoint, parámetros normalizados, versión de datos).
+
+    Mientras la versión del backend no cambie, los resultados se sirven desde
+    memoria sin recalcular ni volver a serializar; al cambiar la versión se
+    descartan todas las entradas. Las peticiones idénticas concurrentes
+    esperan el mismo cálculo. Se expulsa por LRU al superar el número de
+    entradas o el tamaño total; los errores no se guardan.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 ttl: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[bytes, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self.version: Optional[str] = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.bypassed = 0
+        self.by_endpoint: Dict[str, Dict[str, int]] = {}
+
+    async def get_or_compute(self, endpoint: str, params: Dict[str, Any], version: str,
+                             compute: Callable[[], Awaitable[Any]], store: bool = True) -> Response:
+        if not store:
+            # Datos incompletos: se calcula sin tocar la versión ni las entradas vigentes
+            self.bypassed += 1
+            return self._response(encode_json(await compute()), "bypass")
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+        key = (endpoint, normalize_params(params), version)
+        counters = self.by_endpoint.setdefault(endpoint, {"hits": 0, "misses": 0})
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                counters["hits"] += 1
+                return self._response(entry[0], "hit")
+            self.expirations += 1
+            self._drop(key)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            self.hits += 1
+            counters["hits"] += 1
+            status = "coalesced"
+        else:
+            self.misses += 1
+            counters["misses"] += 1
+            future = self._inflight[key] = asyncio.ensure_future(self._compute(key, compute))
+            status = "miss"
+        # shield: si un cliente cancela, el cálculo sigue para los demás
+        return self._response(await asyncio.shield(future), status)
+
+    async def _compute(self, key: Tuple[str, str, str], compute: Callable[[], Awaitable[Any]]) -> bytes:
+        try:
+            body = encode_json(await compute())
+            # Si la versión cambió durante el cálculo el resultado ya no se guarda
+            if key[2] == self.version:
+                self._store(key, body)
+            return body
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _response(body: bytes, status: str) -> Response:
+        return Response(content=body, media_type="application/json", headers={"X-Cache": status})
+
+    def _store(self, key: Tuple[str, str, str], body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (body, time.monotonic())
+        self.bytes += len(body)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def _drop(self, key: Tuple[str, str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "bypassed": self.bypassed,
+            "by_endpoint": {
+                endpoint: {**counts, "hit_rate": round(counts["hits"] / max(counts["hits"] + counts["misses"], 1), 4)}
+                for endpoint, counts in self.by_endpoint.items()
+            }
+        }
+
+# Instancia global
+result_cache = ResultCache()
@@ -0,0 +1,727 @@
+import os
+import re
+import bz2
+import sys
+import gzip
+import json
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from .spatial import KDTree, geojson_polygons, haversine_km, points_in_polygons
+
+# Configuración
+ROUTING_OSM_FILE = os.getenv("ROUTING_OSM_FILE", "")
+# Índice precalculado; por omisión junto al extracto (<archivo>.cch.npz)
+ROUTING_INDEX_FILE = os.getenv("ROUTING_INDEX_FILE", "")
+# Multiplicador del tiempo en tramos dentro de zonas de riesgo ("inf" = evitarlos)
+ROUTING_RISK_PENALTY = float(os.getenv("ROUTING_RISK_PENALTY", "10"))
+ROUTING_MAX_SNAP_KM = float(os.getenv("ROUTING_MAX_SNAP_KM", "1"))
+# Tamaño de las partes que la disección anidada ya no subdivide
+ROUTING_DISSECTION_LEAF = int(os.getenv("ROUTING_DISSECTION_LEAF", "64"))
+# Fracción de nodos en cada extremo que hace de fuente y de sumidero al buscar separadores
+ROUTING_DISSECTION_BALANCE = float(os.getenv("ROUTING_DISSECTION_BALANCE", "0.3"))
+
+INDEX_FORMAT = 2
+
+# Velocidad por tipo de vía (km/h) cuando el tramo no declara maxspeed
+ROAD_SPEEDS_KMH = {
+    "motorway": 90, "motorway_link": 50, "trunk": 80, "trunk_link": 40,
+    "primary": 60, "primary_link": 40, "secondary": 50, "secondary_link": 30,
+    "tertiary": 40, "tertiary_link": 25, "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15, "track": 15, "road": 25
+}
+ONEWAY_VALUES = {"yes": 1, "true": 1, "1": 1, "-1": -1, "reverse": -1}
+
+def _open(path: str):
+    if path.endswith(".pbf"):
+        raise ValueError("Formato PBF no soportado: convertir a OSM XML (p. ej. osmium cat extracto.osm.pbf -o extracto.osm)")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def _speed(tags: Dict[str, str]) -> Optional[float]:
+    speed = ROAD_SPEEDS_KMH.get(tags.get("highway"))
+    if speed is None or tags.get("access") in ("no", "private"):
+        return None
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", tags.get("maxspeed") or "")
+    if match:
+        declared = float(match.group(1)) * (1.609 if match.group(2) else 1)
+        if declared > 0:
+            speed = declared
+    return float(speed)
+
+def load_osm(path: str) -> Dict[str, np.ndarray]:
+    """Tramos transitables de un extracto OSM XML (.osm, .osm.gz, .osm.bz2).
+
+    Devuelve nodos (lat, lon) y aristas (u, v, km, km/h, sentido) donde el
+    sentido es 0 doble vía, 1 solo u->v y -1 solo v->u.
+    """
+    coordinates: Dict[int, Tuple[float, float]] = {}
+    ways: List[Tuple[List[int], float, int]] = []
+    with _open(path) as source:
+        for _, element in ET.iterparse(source, events=("end",)):
+            if element.tag == "node":
+                coordinates[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                speed = _speed(tags)
+                if speed is not None:
+                    direction = ONEWAY_VALUES.get(tags.get("oneway"), 0)
+                    if not direction and tags.get("oneway") != "no" and (
+                            tags.get("junction") == "roundabout" or tags.get("highway") == "motorway"):
+                        direction = 1
+                    ways.append(([int(nd.get("ref")) for nd in element.iter("nd")], speed, direction))
+            else:
+                continue
+            element.clear()
+
+    ids: Dict[int, int] = {}
+    u, v, speeds, directions = [], [], [], []
+    for refs, speed, direction in ways:
+        # Un nodo sin coordenadas (fuera del extracto) corta la vía: no se unen sus vecinos
+        for a, b in zip(refs, refs[1:]):
+            if a == b or a not in coordinates or b not in coordinates:
+                continue
+            u.append(ids.setdefault(a, len(ids)))
+            v.append(ids.setdefault(b, len(ids)))
+            speeds.append(speed)
+            directions.append(direction)
+    lat = np.array([coordinates[ref][0] for ref in ids], dtype=np.float64)
+    lon = np.array([coordinates[ref][1] for ref in ids], dtype=np.float64)
+    u, v = np.array(u, dtype=np.int64), np.array(v, dtype=np.int64)
+    return {
+        "lat": lat, "lon": lon, "u": u, "v": v,
+        "km": haversine_km(lat[u], lon[u], lat[v], lon[v]) if len(u) else np.empty(0),
+        "speed": np.array(speeds, dtype=np.float64),
+        "direction": np.array(directions, dtype=np.int8)
+    }
+
+def largest_component(n: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Máscara de los nodos de la mayor componente conexa (ignorando sentidos)"""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[u], labels[v])
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels[u], low)
+        np.minimum.at(hooked, labels[v], low)
+        # Saltos de puntero hasta que cada nodo apunta a su raíz
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+    return labels == np.bincount(labels).argmax()
+
+def _min_degree(n: int, u: np.ndarray, v: np.ndarray) -> List[int]:
+    """Orden por grado mínimo (con relleno) de un grafo pequeño"""
+    adjacency = [set() for _ in range(n)]
+    for a, b in zip(u.tolist(), v.tolist()):
+        adjacency[a].add(b)
+        adjacency[b].add(a)
+    heap = [(len(neighbors), node) for node, neighbors in enumerate(adjacency)]
+    heapq.heapify(heap)
+    eliminated = [False] * n
+    order: List[int] = []
+    while heap:
+        degree, node = heapq.heappop(heap)
+        if eliminated[node] or degree != len(adjacency[node]):
+            continue
+        eliminated[node] = True
+        order.append(node)
+        neighbors = adjacency[node]
+        for other in neighbors:
+            row = adjacency[other]
+            row.discard(node)
+            row |= neighbors
+            row.discard(other)
+            heapq.heappush(heap, (len(row), other))
+        adjacency[node] = set()
+    return order
+
+def _vertex_cut(band: int, tails: np.ndarray, heads: np.ndarray, from_source: np.ndarray,
+                to_sink: np.ndarray, limit: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Corte mínimo de nodos (capacidad 1) entre dos lados de una franja, por caminos de aumento.
+
+    Cada nodo x de la franja se desdobla en entrada 2x y salida 2x+1; la
+    fuente entra a `from_source` y `to_sink` sale al sumidero. Devuelve el
+    separador (entrada alcanzable en el residual y salida no) y la máscara de
+    nodos del lado de la fuente, o None si el corte supera `limit`.
+    """
+    source, sink = 2 * band, 2 * band + 1
+    size = 2 * band + 2
+    unbounded = band + 1
+    inner = np.arange(band)
+    # Arcos directos y su inverso intercalados: el inverso de a es a ^ 1
+    tail = np.concatenate((2 * inner, 2 * tails + 1, np.full(len(from_source), source), 2 * to_sink + 1))
+    head = np.concatenate((2 * inner + 1, 2 * heads, 2 * from_source, np.full(len(to_sink), sink)))
+    cap = np.concatenate((np.ones(band, dtype=np.int64), np.full(len(tail) - band, unbounded)))
+    arc_tail = np.column_stack((tail, head)).ravel()
+    target = np.column_stack((head, tail)).ravel().tolist()
+    capacity = np.column_stack((cap, np.zeros_like(cap))).ravel().tolist()
+    by_tail = np.argsort(arc_tail, kind="stable")
+    starts = np.searchsorted(arc_tail[by_tail], np.arange(size + 1)).tolist()
+    arcs = by_tail.tolist()
+
+    flow = 0
+    while True:
+        # Barrido en profundidad: cada nodo se visita a lo sumo una vez y cada
+        # llegada al sumidero aumenta el flujo; se repite mientras encuentre caminos
+        visited = [False] * size
+        visited[source] = True
+        pointer = starts[:-1]
+        found = 0
+        path, node = [], source
+        while True:
+            last = starts[node + 1]
+            while pointer[node] < last:
+                arc = arcs[pointer[node]]
+                pointer[node] += 1
+                if capacity[arc] and not visited[target[arc]]:
+                    break
+            else:
+                if node == source:
+                    break
+                # Callejón sin salida: se retrocede
+                node = target[path.pop() ^ 1]
+                continue
+            node = target[arc]
+            visited[node] = True
+            path.append(arc)
+            if node != sink:
+                continue
+            # Todo camino cruza un nodo desdoblado: el cuello es 1
+            for arc in path:
+                capacity[arc] -= 1
+                capacity[arc ^ 1] += 1
+            found += 1
+            if flow + found > limit:
+                return None
+            visited[sink] = False
+            path, node = [], source
+        if not found:
+            break
+        flow += found
+
+    reached = [False] * size
+    reached[source] = True
+    frontier = [source]
+    while frontier:
+        node = frontier.pop()
+        for arc in arcs[starts[node]:starts[node + 1]]:
+            other = target[arc]
+            if capacity[arc] and not reached[other]:
+                reached[other] = True
+                frontier.append(other)
+    reached = np.array(reached[:-2], dtype=bool).reshape(-1, 2)
+    return np.flatnonzero(reached[:, 0] & ~reached[:, 1]), reached[:, 1]
+
+def _dissection_order(lat: np.ndarray, lon: np.ndarray, u: np.ndarray, v: np.ndarray) -> List[int]:
+    """Orden de disección anidada con separadores por flujo en franjas inerciales.
+
+    Cada subgrafo se ordena a lo largo de varias direcciones; el primer y el
+    último tramo de nodos hacen de fuente y sumidero y el corte mínimo de
+    nodos de la franja intermedia es el separador (el menor entre las
+    direcciones). El separador se contrae después de ambas partes (rango
+    mayor); las partes pequeñas se ordenan por grado mínimo.
+    """
+    x = np.radians(lon) * np.cos(np.radians(np.mean(lat))) if len(lat) else lon
+    y = np.radians(lat)
+    directions = ((1.0, 0.0), (0.0, 1.0), (1.0, 1.0), (1.0, -1.0))
+    order: List[int] = []
+    # Pila de (nodos, aristas en índices locales) o separadores ya resueltos (None, nodos)
+    stack: List[Tuple[Optional[np.ndarray], np.ndarray, np.ndarray]] = [(np.arange(len(lat)), u, v)]
+    while stack:
+        nodes, a, b = stack.pop()
+        if nodes is None:
+            order.extend(a.tolist())
+            continue
+        count = len(nodes)
+        if count <= ROUTING_DISSECTION_LEAF or not len(a):
+            order.extend(nodes[_min_degree(count, a, b)].tolist())
+            continue
+        edge_a, edge_b = np.concatenate((a, b)), np.concatenate((b, a))
+        cut_size = int(count * ROUTING_DISSECTION_BALANCE)
+        best = None
+        for dx, dy in directions:
+            ranked = np.argsort(x[nodes] * dx + y[nodes] * dy, kind="stable")
+            # Por posición (no por valor): siempre se reparte aunque haya empates
+            section = np.ones(count, dtype=np.int8)
+            section[ranked[:cut_size]] = 0
+            section[ranked[count - cut_size:]] = 2
+            # Una arista directa entre fuente y sumidero pasa su extremo a la franja
+            section[edge_a[(section[edge_a] == 0) & (section[edge_b] == 2)]] = 1
+            band = np.flatnonzero(section == 1)
+            position = np.cumsum(section == 1) - 1
+            tail, head = section[edge_a], section[edge_b]
+            inside = (tail == 1) & (head == 1)
+            from_source = np.unique(position[edge_b[(tail == 0) & (head == 1)]])
+            to_sink = np.unique(position[edge_a[(tail == 1) & (head == 2)]])
+            limit = len(best[0]) - 1 if best is not None else count
+            found = _vertex_cut(len(band), position[edge_a[inside]], position[edge_b[inside]],
+                                from_source, to_sink, limit)
+            if found is not None:
+                # Lado de la fuente: su extremo más lo alcanzable de la franja sin el separador
+                cut, reached = found
+                near = section == 0
+                near[band[reached]] = True
+                best = (band[cut], near)
+        separator, near = best
+        removed = np.zeros(count, dtype=bool)
+        removed[separator] = True
+        keep = ~removed[a] & ~removed[b]
+        # El separador sale al final: se apila primero
+        stack.append((None, nodes[separator], None))
+        for half in (near, ~near):
+            member = half & ~removed
+            if member.any():
+                position = np.cumsum(member) - 1
+                edges = keep & member[a]
+                stack.append((nodes[member], position[a[edges]], position[b[edges]]))
+    return order
+
+def _elimination_order(lat: np.ndarray, lon: np.ndarray, u: np.ndarray,
+                       v: np.ndarray) -> Tuple[List[int], List[List[int]]]:
+    """Orden de contracción por disección anidada y vecinos superiores de cada nodo.
+
+    Al eliminar un nodo sus vecinos restantes quedan conectados entre sí
+    (atajos sin búsqueda de testigos): la jerarquía no depende de los pesos.
+    El relleno se obtiene por eliminación simbólica sobre el árbol de
+    eliminación: los vecinos superiores de un nodo pasan a su padre.
+    """
+    n = len(lat)
+    order = _dissection_order(lat, lon, u, v)
+    rank = [0] * n
+    for position, node in enumerate(order):
+        rank[node] = position
+    upward: List[set] = [set() for _ in range(n)]
+    for a, b in zip(u.tolist(), v.tolist()):
+        if a != b:
+            low, high = (a, b) if rank[a] < rank[b] else (b, a)
+            upward[low].add(high)
+    for node in order:
+        neighbors = upward[node]
+        if neighbors:
+            parent = min(neighbors, key=rank.__getitem__)
+            upward[parent] |= neighbors
+            upward[parent].discard(parent)
+    return order, [list(neighbors) for neighbors in upward]
+
+class RoadIndex:
+    """Jerarquía de contracción personalizable (CCH) de la red vial.
+
+    La parte costosa (orden de contracción, atajos y triángulos) solo depende
+    de la topología y se calcula una vez, offline o al arrancar, y se guarda
+    en disco. Los pesos (tiempos con penalización por zonas de riesgo) se
+    aplican después con `customize`, que recorre los triángulos por niveles
+    vectorizado. Las consultas suben por el árbol de eliminación desde el
+    origen y el destino sin cola de prioridad.
+
+    Los nodos se numeran por rango: todo arco va del nodo menor al mayor.
+    """
+
+    ARRAYS = ("lat", "lon", "edge_arc", "edge_up", "edge_time_fwd", "edge_time_bwd", "edge_mid_lat",
+              "edge_mid_lon", "edge_u", "edge_v", "arc_start", "arc_low", "arc_high", "parent",
+              "tri_a", "tri_b", "tri_target", "level_bounds")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.n = len(self.lat)
+        # Listas de Python para las consultas (más rápidas que indexar numpy por elemento)
+        self._arc_start = self.arc_start.tolist()
+        self._arc_high = self.arc_high.tolist()
+        self._arc_low = self.arc_low.tolist()
+        self._parent = self.parent.tolist()
+        self.tree = KDTree(self.lat, self.lon)
+
+    @classmethod
+    def build(cls, graph: Dict[str, np.ndarray], source: str = "") -> "RoadIndex":
+        started = time.perf_counter()
+        keep = largest_component(len(graph["lat"]), graph["u"], graph["v"])
+        edges = keep[graph["u"]] & keep[graph["v"]]
+        renumber = np.cumsum(keep) - 1
+        u, v = renumber[graph["u"][edges]], renumber[graph["v"][edges]]
+        lat, lon = graph["lat"][keep], graph["lon"][keep]
+        n = len(lat)
+
+        order, upward = _elimination_order(lat, lon, u, v)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+
+        # Arcos (menor, mayor) agrupados por el nodo menor, en orden de rango
+        rank_list = rank.tolist()
+        highs = [sorted(rank_list[other] for other in upward[node]) for node in order]
+        degree = np.array([len(row) for row in highs], dtype=np.int64)
+        arc_start = np.concatenate(([0], np.cumsum(degree)))
+        arc_low = np.repeat(np.arange(n), degree)
+        arc_high = np.fromiter((high for row in highs for high in row), dtype=np.int64, count=int(arc_start[-1]))
+        # Clave menor * n + mayor, creciente: ubica cualquier arco por búsqueda binaria
+        arc_key = arc_low * n + arc_high
+
+        # Padre en el árbol de eliminación: el vecino superior de menor rango
+        parent = np.full(n, -1, dtype=np.int64)
+        parent[degree > 0] = arc_high[arc_start[:-1][degree > 0]]
+        level = [0] * n
+        starts, high_list = arc_start.tolist(), arc_high.tolist()
+        for low in range(n):
+            for high in high_list[starts[low]:starts[low + 1]]:
+                level[high] = max(level[high], level[low] + 1)
+        level = np.array(level, dtype=np.int64)
+
+        # Triángulos inferiores x < a < b (arcos x-a, x-b y a-b), por grupos de igual grado
+        tri_a, tri_b = [], []
+        for k in np.unique(degree[degree > 1]).tolist():
+            first = arc_start[:-1][degree == k]
+            i, j = np.triu_indices(k, 1)
+            tri_a.append((first[:, None] + i[None, :]).ravel())
+            tri_b.append((first[:, None] + j[None, :]).ravel())
+        tri_a = np.concatenate(tri_a) if tri_a else np.empty(0, dtype=np.int64)
+        tri_b = np.concatenate(tri_b) if tri_b else np.empty(0, dtype=np.int64)
+        tri_target = np.searchsorted(arc_key, arc_high[tri_a] * n + arc_high[tri_b])
+        tri_level = level[arc_low[tri_a]]
+        by_level = np.argsort(tri_level, kind="stable")
+        level_bounds = np.flatnonzero(np.diff(tri_level[by_level], prepend=-1, append=-1)) if len(by_level) else np.array([0])
+
+        # Aristas originales en rangos: a qué arco pertenecen y en qué sentido
+        ru, rv = rank[u], rank[v]
+        edge_arc = np.searchsorted(arc_key, np.minimum(ru, rv) * n + np.maximum(ru, rv))
+        direction = graph["direction"][edges]
+        seconds = graph["km"][edges] / graph["speed"][edges] * 3600
+        by_rank = np.asarray(order, dtype=np.int64)
+
+        arrays = {
+            "lat": lat[by_rank], "lon": lon[by_rank],
+            "edge_arc": edge_arc,
+            "edge_up": ru < rv,
+            "edge_time_fwd": np.where(direction >= 0, seconds, np.inf),
+            "edge_time_bwd": np.where(direction <= 0, seconds, np.inf),
+            "edge_mid_lat": (lat[u] + lat[v]) / 2, "edge_mid_lon": (lon[u] + lon[v]) / 2,
+            "edge_u": ru, "edge_v": rv,
+            "arc_start": arc_start,
+            "arc_low": arc_low, "arc_high": arc_high,
+            "parent": parent,
+            "tri_a": tri_a[by_level].astype(np.int32),
+            "tri_b": tri_b[by_level].astype(np.int32),
+            "tri_target": tri_target[by_level].astype(np.int32),
+            "level_bounds": level_bounds.astype(np.int64)
+        }
+        meta = {
+            "format": INDEX_FORMAT, "source": source, "nodes": n, "edges": int(len(edge_arc)),
+            "dropped_nodes": int((~keep).sum()), "arcs": len(arc_low), "triangles": len(tri_a),
+            "tree_height": int(level.max()) + 1 if n else 0, "build_seconds": round(time.perf_counter() - started, 2)
+        }
+        return cls(arrays, meta)
+
+    def save(self, path: str):
+        with open(path, "wb") as target:
+            np.savez(target, meta=np.array(json.dumps(self.meta)), **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "RoadIndex":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in cls.ARRAYS}, json.loads(str(data["meta"])))
+
+    def customize(self, polygons: List[List[np.ndarray]], penalty: float = ROUTING_RISK_PENALTY) -> "RoadMetric":
+        """Pesos de todos los arcos para un conjunto de zonas de riesgo"""
+        started = time.perf_counter()
+        node_risk = points_in_polygons(self.lat, self.lon, polygons)
+        risky = (node_risk[self.edge_u] | node_risk[self.edge_v] |
+                 points_in_polygons(self.edge_mid_lat, self.edge_mid_lon, polygons))
+        # Con penalización infinita los tramos en riesgo quedan cerrados (evita 0 * inf)
+        penalize = (lambda seconds: np.full_like(seconds, np.inf)) if np.isinf(penalty) else (lambda seconds: seconds * penalty)
+        fwd = np.where(risky, penalize(self.edge_time_fwd), self.edge_time_fwd)
+        bwd = np.where(risky, penalize(self.edge_time_bwd), self.edge_time_bwd)
+
+        arcs = len(self.arc_low)
+        up, down = np.full(arcs, np.inf), np.full(arcs, np.inf)
+        np.minimum.at(up, self.edge_arc, np.where(self.edge_up, fwd, bwd))
+        np.minimum.at(down, self.edge_arc, np.where(self.edge_up, bwd, fwd))
+        up_via, down_via = np.full(arcs, -1, dtype=np.int64), np.full(arcs, -1, dtype=np.int64)
+
+        # Por niveles del árbol: los arcos que lee un nivel ya no cambian en él
+        for first, last in zip(self.level_bounds[:-1].tolist(), self.level_bounds[1:].tolist()):
+            a, b, target = self.tri_a[first:last], self.tri_b[first:last], self.tri_target[first:last]
+            triangles = np.arange(first, last)
+            for weights, via, candidate in ((up, up_via, down[a] + up[b]), (down, down_via, down[b] + up[a])):
+                before = weights[target]
+                np.minimum.at(weights, target, candidate)
+                improved = (candidate < before) & (candidate == weights[target])
+                via[target[improved]] = triangles[improved]
+
+        return RoadMetric(self, up, down, up_via, down_via, polygons, {
+            "risk_zones": len(polygons),
+            "penalty": penalty,
+            "penalized_edges": int(risky.sum()),
+            "customize_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+
+    def snap(self, lat: float, lon: float, max_km: float = ROUTING_MAX_SNAP_KM) -> Tuple[Optional[int], Optional[float]]:
+        """Nodo de la red más cercano a un punto"""
+        indices, distances = self.tree.query(lat, lon, 1, max_km)
+        if not len(indices):
+            return None, None
+        return int(indices[0]), float(distances[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.meta)
+
+class RoadMetric:
+    """Pesos personalizados de la jerarquía (segundos) y consultas sobre ellos"""
+
+    def __init__(self, index: RoadIndex, up: np.ndarray, down: np.ndarray, up_via: np.ndarray,
+                 down_via: np.ndarray, polygons: List[List[np.ndarray]], info: Dict[str, Any]):
+        self.index = index
+        self.up_via, self.down_via = up_via, down_via
+        self.polygons = polygons
+        self.info = info
+        self.up, self.down = up, down
+
+    def _upward(self, source: int, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Distancias desde (o hacia) `source` a sus ancestros en el árbol de eliminación.
+
+        Devuelve los ancestros y arreglos densos de distancia y arco predecesor;
+        solo se tocan los ancestros, relajando sus arcos vectorizado por nodo.
+        """
+        index = self.index
+        start, parent = index._arc_start, index._parent
+        chain = []
+        node = source
+        while node >= 0:
+            chain.append(node)
+            node = parent[node]
+        distance = np.full(index.n, np.inf)
+        predecessor = np.full(index.n, -1, dtype=np.int64)
+        distance[source] = 0.0
+        for node in chain:
+            base = distance[node]
+            first, last = start[node], start[node + 1]
+            if base == np.inf or first == last:
+                continue
+            targets = index.arc_high[first:last]
+            candidate = base + weights[first:last]
+            better = candidate < distance[targets]
+            distance[targets[better]] = candidate[better]
+            predecessor[targets[better]] = np.flatnonzero(better) + first
+        return np.array(chain, dtype=np.int64), distance, predecessor
+
+    def _unpack(self, first: int, arcs: List[Tuple[int, bool]]) -> List[int]:
+        """Expandir atajos (arco, hacia arriba) a la secuencia de nodos originales"""
+        index = self.index
+        path = [first]
+        stack = list(reversed(arcs))
+        while stack:
+            arc, upward = stack.pop()
+            via = (self.up_via if upward else self.down_via)[arc]
+            if via < 0:
+                path.append(index._arc_high[arc] if upward else index._arc_low[arc])
+                continue
+            a, b = int(index.tri_a[via]), int(index.tri_b[via])
+            # arriba: menor -> x (bajando por a) -> mayor (subiendo por b); abajo al revés
+            stack.extend([(a, True), (b, False)] if not upward else [(b, True), (a, False)])
+        return path
+
+    def route(self, source: int, target: int) -> Optional[Dict[str, Any]]:
+        """Ruta más rápida entre dos nodos de la red"""
+        chain, forward, forward_pred = self._upward(source, self.up)
+        _, backward, backward_pred = self._upward(target, self.down)
+        # Los ancestros comunes están en ambas cadenas; basta recorrer la del origen
+        totals = forward[chain] + backward[chain]
+        meet = int(chain[np.argmin(totals)])
+        best = float(totals.min())
+        if best == np.inf:
+            return None
+
+        index = self.index
+        arcs: List[Tuple[int, bool]] = []
+        node = meet
+        while node != source:
+            arc = int(forward_pred[node])
+            arcs.append((arc, True))
+            node = index._arc_low[arc]
+        arcs.reverse()
+        node = meet
+        while node != target:
+            arc = int(backward_pred[node])
+            arcs.append((arc, False))
+            node = index._arc_low[arc]
+        return self._describe(self._unpack(source, arcs), best)
+
+    def _describe(self, nodes: List[int], seconds: float) -> Dict[str, Any]:
+        index = self.index
+        nodes = np.asarray(nodes, dtype=np.int64)
+        lat, lon = index.lat[nodes], index.lon[nodes]
+        segments = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        risky = points_in_polygons((lat[:-1] + lat[1:]) / 2, (lon[:-1] + lon[1:]) / 2, self.polygons)
+        return {
+            "duration_min": round(seconds / 60, 2),
+            "distance_km": round(float(segments.sum()), 3),
+            "risk_km": round(float(segments[risky].sum()), 3),
+            "crosses_risk_zone": bool(risky.any()),
+            "path": np.column_stack((lat, lon)).round(6).tolist()
+        }
+
+    def targets(self, nodes: Sequence[int]) -> "TargetSet":
+        """Búsquedas hacia cada destino, precalculadas para consultas uno-a-muchos"""
+        bucket_nodes, bucket_seconds, offsets = [], [], []
+        total = 0
+        for node in nodes:
+            chain, distance, _ = self._upward(node, self.down)
+            chain = chain[np.isfinite(distance[chain])]
+            offsets.append(total)
+            bucket_nodes.append(chain)
+            bucket_seconds.append(distance[chain])
+            total += len(chain)
+        if not offsets:
+            return TargetSet(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64))
+        return TargetSet(np.concatenate(bucket_nodes), np.concatenate(bucket_seconds),
+                         np.array(offsets, dtype=np.int64))
+
+    def one_to_many(self, source: int, targets: "TargetSet") -> np.ndarray:
+        """Segundos desde `source` a cada destino (inf si no hay ruta)"""
+        if not len(targets.offsets):
+            return np.empty(0)
+        _, forward, _ = self._upward(source, self.up)
+        return np.minimum.reduceat(forward[targets.nodes] + targets.seconds, targets.offsets)
+
+class TargetSet:
+    """Cubetas (nodo, segundos hasta el destino) concatenadas por destino"""
+
+    def __init__(self, nodes: np.ndarray, seconds: np.ndarray, offsets: np.ndarray):
+        self.nodes = nodes
+        self.seconds = seconds
+        self.offsets = offsets
+
+def _signature(osm_path: str) -> Dict[str, Any]:
+    stat = os.stat(osm_path)
+    speeds = hashlib.sha1(json.dumps(ROAD_SPEEDS_KMH, sort_keys=True).encode()).hexdigest()[:12]
+    return {"path": os.path.abspath(osm_path), "size": stat.st_size, "mtime": int(stat.st_mtime), "speeds": speeds}
+
+def load_index(osm_path: str, index_path: str = "") -> RoadIndex:
+    """Cargar el índice precalculado si corresponde al extracto; si no, construirlo y guardarlo"""
+    index_path = index_path or osm_path + ".cch.npz"
+    signature = _signature(osm_path) if os.path.exists(osm_path) else None
+    if os.path.exists(index_path):
+        index = RoadIndex.load(index_path)
+        if index.meta.get("format") == INDEX_FORMAT and (signature is None or index.meta.get("signature") == signature):
+            return index
+        logging.info(f"🔧 Índice de rutas desactualizado: {index_path}")
+    if signature is None:
+        raise FileNotFoundError(osm_path)
+    index = RoadIndex.build(load_osm(osm_path), source=os.path.basename(osm_path))
+    index.meta["signature"] = signature
+    try:
+        index.save(index_path)
+    except OSError as e:
+        logging.warning(f"No se pudo guardar el índice de rutas en {index_path}: {e}")
+    return index
+
+class RoadRouter:
+    """Servicio de rutas: índice cargado en segundo plano y pesos según las zonas de riesgo.
+
+    La personalización se repite solo cuando cambian las zonas de riesgo
+    activas; las búsquedas hacia los refugios se guardan por versión de datos.
+    """
+
+    def __init__(self, osm_path: str = ROUTING_OSM_FILE, index_path: str = ROUTING_INDEX_FILE):
+        self.osm_path = osm_path
+        self.index_path = index_path
+        self.index: Optional[RoadIndex] = None
+        self.error: Optional[str] = None
+        self._loading: Optional[asyncio.Future] = None
+        self._metric: Optional[RoadMetric] = None
+        self._metric_key: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._targets: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray, np.ndarray, TargetSet]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.osm_path or self.index_path)
+
+    def start(self):
+        """Cargar o construir el índice en un hilo sin bloquear el arranque"""
+        if not self.enabled or self._loading is not None:
+            return
+        self._loading = asyncio.ensure_future(asyncio.to_thread(load_index, self.osm_path, self.index_path))
+        self._loading.add_done_callback(self._loaded)
+
+    def _loaded(self, future: asyncio.Future):
+        try:
+            self.index = future.result()
+            logging.info(f"🗺️ Índice de rutas listo: {self.index.meta['nodes']} nodos, {self.index.meta['arcs']} arcos")
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"❌ Error cargando la red vial: {e}")
+
+    async def metric(self, zones: List[Dict[str, Any]]) -> Optional[RoadMetric]:
+        """Pesos vigentes para las zonas de riesgo activas (None si no hay índice)"""
+        self.start()
+        if self.index is None and self._loading is not None and not self._loading.done():
+            await asyncio.shield(self._loading)
+        if self.index is None:
+            return None
+        risk = sorted(zone.get('geojson') or '' for zone in zones if zone.get('zone_type', 'risk') == 'risk')
+        key = hashlib.sha1(json.dumps([risk, ROUTING_RISK_PENALTY]).encode()).hexdigest()
+        async with self._lock:
+            if key != self._metric_key:
+                polygons = [polygon for geojson in risk for polygon in self._polygons(geojson)]
+                self._metric = await asyncio.to_thread(self.index.customize, polygons)
+                self._metric_key = key
+                self._targets.clear()
+        return self._metric
+
+    @staticmethod
+    def _polygons(geojson: str) -> List[List[np.ndarray]]:
+        try:
+            return geojson_polygons(geojson)
+        except (ValueError, TypeError, IndexError) as e:
+            logging.warning(f"Zona con GeoJSON inválido ignorada: {e}")
+            return []
+
+    def shelter_targets(self, metric: RoadMetric, version: str,
+                        shelters: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, TargetSet]:
+        """(índices de refugio, km al nodo, nodo, búsquedas) de los refugios conectables a la red"""
+        key = (version, self._metric_key)
+        if key not in self._targets:
+            self._targets.clear()
+            kept, snap_km, nodes = [], [], []
+            for position, shelter in enumerate(shelters):
+                node, distance = self.index.snap(shelter.get('lat') or 0, shelter.get('lon') or 0)
+                if node is not None:
+                    kept.append(position)
+                    snap_km.append(distance)
+                    nodes.append(node)
+            self._targets[key] = (np.array(kept, dtype=np.int64), np.array(snap_km),
+                                  np.array(nodes, dtype=np.int64), metric.targets(nodes))
+        return self._targets[key]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.index is not None,
+            "loading": self._loading is not None and not self._loading.done(),
+            "error": self.error,
+            "index": self.index.stats() if self.index else None,
+            "metric": self._metric.info if self._metric else None
+        }
+
+# Instancia global
+road_router = RoadRouter()
+
+if __name__ == "__main__":
+    # Precalcular el índice offline: python -m app.routing extracto.osm [indice.npz]
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        sys.exit("uso: python -m app.routing extracto.osm [indice.npz]")
+    built = load_index(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "")
+    print(json.dumps(built.stats(), indent=2))
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .compute_pool import compute_pool
+from .nearby import ShelterIndex
+from .optimization import AllocationSolver
+from .spatial import haversine_km
+
+# Configuración
+SHELTER_MAX_KM = float(os.getenv("SHELTER_MAX_KM", "50"))
+
+class ShelterAssignment:
+    """Reservas de cupo en refugios para evacuados (citizens o puntos de población).
+
+    Cada solicitud se asigna al llegar, en O(log refugios), al refugio más
+    cercano con cupo para todo el grupo (o repartida entre los más cercanos si
+    ninguno alcanza). La re-optimización por lotes resuelve el problema de
+    transporte completo (mínimo recorrido total respetando capacidades) con la
+    subasta de `optimization`, partiendo de precios cero en cada lote; la
+    subasta corre en un hilo y `lock` impide reservar o liberar mientras
+    tanto. Las reservas se descuentan de la capacidad restante que informa
+    el backend.
+    """
+
+    def __init__(self):
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.reserved: Dict[Any, int] = {}
+        self.solver = AllocationSolver()
+        self.last_batch: Dict[str, Any] = {}
+        # Tomado durante la re-optimización; las reservas y liberaciones lo esperan
+        self.lock = asyncio.Lock()
+
+    def available(self, index: ShelterIndex) -> np.ndarray:
+        """Capacidad restante de cada refugio del índice, descontando reservas"""
+        reserved = np.array([self.reserved.get(s.get('id'), 0) for s in index.shelters], dtype=np.float64)
+        return np.maximum(index.remaining - reserved, 0)
+
+    def _reserve(self, request: Dict[str, Any], allocation: List[Dict[str, Any]]):
+        request["allocation"] = allocation
+        request["assigned"] = sum(a["people"] for a in allocation)
+        for item in allocation:
+            self.reserved[item["shelter_id"]] = self.reserved.get(item["shelter_id"], 0) + item["people"]
+
+    def release(self, request_id: str) -> Optional[Dict[str, Any]]:
+        request = self.requests.pop(request_id, None)
+        if request is None:
+            return None
+        for item in request.get("allocation", []):
+            left = self.reserved.get(item["shelter_id"], 0) - item["people"]
+            if left > 0:
+                self.reserved[item["shelter_id"]] = left
+            else:
+                self.reserved.pop(item["shelter_id"], None)
+        return request
+
+    def _register(self, lat: float, lon: float, people: int, request_id: Optional[str]) -> Dict[str, Any]:
+        request_id = request_id or uuid.uuid4().hex
+        self.release(request_id)
+        request = {"id": request_id, "lat": lat, "lon": lon, "people": max(people, 0), "allocation": [], "assigned": 0}
+        self.requests[request_id] = request
+        return request
+
+    def assign(self, index: ShelterIndex, lat: float, lon: float, people: int = 1,
+               request_id: Optional[str] = None, max_km: float = SHELTER_MAX_KM) -> Dict[str, Any]:
+        """Asignación incremental: el refugio más cercano con cupo para todo el grupo"""
+        request = self._register(lat, lon, people, request_id)
+        if not len(index) or not request["people"]:
+            return request
+        available = self.available(index)
+        rows = index.nearest(lat, lon, k=1, max_km=max_km, min_remaining=request["people"], available=available)
+        if not rows:
+            # Ningún refugio alcanza: repartir entre los más cercanos con cupo
+            rows = index.nearest(lat, lon, k=len(index), max_km=max_km, min_remaining=1, available=available)
+        allocation, pending = [], request["people"]
+        for row in rows:
+            room = pending if row["remaining_capacity"] is None else min(pending, row["remaining_capacity"])
+            if room <= 0:
+                continue
+            allocation.append(self._item(row, room, row["distance_km"]))
+            pending -= room
+            if not pending:
+                break
+        self._reserve(request, allocation)
+        return request
+
+    def add(self, lat: float, lon: float, people: int = 1, request_id: Optional[str] = None) -> Dict[str, Any]:
+        """Registrar una solicitud sin asignarla (la asigna la próxima re-optimización).
+
+        Reemplaza una solicitud con el mismo id: llamar con `lock` tomado para
+        no retirar una solicitud que una subasta en curso todavía va a reservar.
+        """
+        return self._register(lat, lon, people, request_id)
+
+    async def reoptimize(self, index: ShelterIndex, max_km: float = SHELTER_MAX_KM,
+                         points: Iterable[Tuple[float, float, int, Optional[str]]] = ()) -> Dict[str, Any]:
+        """Re-optimización por lotes de todas las solicitudes registradas.
+
+        `points` (lat, lon, personas, id) se registran dentro del mismo lock,
+        antes de la subasta; sus asignaciones vuelven en `assignments`.
+        """
+        async with self.lock:
+            ids = [self.add(lat, lon, people, request_id)["id"] for lat, lon, people, request_id in points]
+            started = time.perf_counter()
+            requests = [r for r in self.requests.values() if r["people"] > 0]
+            before_km = sum(a["people"] * a["distance_km"] for r in requests for a in r["allocation"])
+            info: Dict[str, Any] = {}
+            allocations: Dict[int, List[Dict[str, Any]]] = {}
+
+            if requests and len(index):
+                lat = np.array([r["lat"] for r in requests], dtype=np.float64)
+                lon = np.array([r["lon"] for r in requests], dtype=np.float64)
+                people = np.array([r["people"] for r in requests], dtype=np.int64)
+                distance = haversine_km(lat[:, None], lon[:, None], index.lat[None, :], index.lon[None, :])
+                # Beneficio por persona: max_km - distancia (asignar siempre conviene dentro del radio)
+                benefit = np.where(distance <= max_km, max_km - distance, -np.inf)
+                capacity = np.where(np.isinf(index.remaining), people.sum(), index.remaining).astype(np.int64)
+                keys = [s.get('id') for s in index.shelters]
+                # Si la subasta falla o vence, las asignaciones anteriores quedan intactas
+                result, info = await compute_pool.offload(self.solver.solve, benefit, capacity, keys,
+                                                          group="shelters", supply=people, warm=False)
+                for i, j, count in result.flows:
+                    allocations.setdefault(i, []).append(self._item(index.shelters[j], count, float(distance[i, j])))
+
+            for request in self.requests.values():
+                request["allocation"], request["assigned"] = [], 0
+            self.reserved = {}
+            for i, allocation in allocations.items():
+                allocation.sort(key=lambda a: a["distance_km"])
+                self._reserve(requests[i], allocation)
+
+            after_km = sum(a["people"] * a["distance_km"] for r in requests for a in r["allocation"])
+            self.last_batch = {
+                **self.summary(),
+                "total_person_km": round(after_km, 2),
+                "previous_person_km": round(before_km, 2),
+                "solver": info,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+            return {**self.last_batch, "assignments": [self.requests[i] for i in ids]}
+
+    @staticmethod
+    def _item(shelter: Dict[str, Any], people: int, distance_km: float) -> Dict[str, Any]:
+        return {"shelter_id": shelter.get('id'), "name": shelter.get('name'), "lat": shelter.get('lat'),
+                "lon": shelter.get('lon'), "people": int(people), "distance_km": round(distance_km, 3)}
+
+    def summary(self) -> Dict[str, Any]:
+        people = sum(r["people"] for r in self.requests.values())
+        assigned = sum(r["assigned"] for r in self.requests.values())
+        return {"requests": len(self.requests), "people": people, "assigned": assigned, "unassigned": people - assigned}
+
+    def shelters(self, index: ShelterIndex) -> List[Dict[str, Any]]:
+        """Ocupación de cada refugio incluyendo reservas"""
+        available = self.available(index)
+        return [
+            {"id": shelter.get('id'), "name": shelter.get('name'), "capacity": shelter.get('capacity'),
+             "occupancy": shelter.get('occupancy') or 0, "reserved": self.reserved.get(shelter.get('id'), 0),
+             "available": None if np.isinf(free) else int(free)}
+            for shelter, free in zip(index.shelters, available.tolist())
+        ]
+
+# Instancia global
+shelter_assignment = ShelterAssignment()
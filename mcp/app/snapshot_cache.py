@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from .alert_frame import AlertFrame
+from .backend_client import get_client
+from .nearby import ShelterIndex
+
+# Configuración
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "5"))
+# Las alertas se piden una vez; cada endpoint recorta su ventana y los
+# análisis espaciales usan la instantánea completa
+SNAPSHOT_ALERT_LIMIT = int(os.getenv("SNAPSHOT_ALERT_LIMIT", "2000"))
+
+@dataclass(frozen=True)
+class BackendSnapshot:
+    version: str
+    alerts: List[Dict[str, Any]]
+    shelters: List[Dict[str, Any]]
+    external: Dict[str, Any]
+    zones: List[Dict[str, Any]]
+    # Columnas de las alertas, parseadas una sola vez por instantánea
+    frame: AlertFrame
+    # Índice espacial de refugios (se reconstruye con cada versión de datos)
+    shelter_index: ShelterIndex
+    fetched_at: float = field(default_factory=time.time)
+    # Descarga incompleta (sin instantánea previa): sus resultados no se guardan en caché
+    partial: bool = False
+
+class SnapshotCache:
+    """Instantánea compartida de los datos del backend.
+
+    Dentro del TTL se sirve desde memoria. Al vencer, una sola corrutina
+    consulta /data-version: si no cambió se renueva el TTL sin descargar nada,
+    y si cambió se vuelven a pedir alertas, refugios, zonas y alertas externas.
+    Las peticiones concurrentes esperan ese mismo refresco. Si alguna descarga
+    falla se conserva la instantánea anterior y el refresco se reintenta.
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL_SECONDS, alert_limit: int = SNAPSHOT_ALERT_LIMIT):
+        self.ttl = ttl
+        self.alert_limit = alert_limit
+        self._snapshot: Optional[BackendSnapshot] = None
+        self._checked_at = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self.fetches = 0
+        self.version_checks = 0
+        self.failed_refreshes = 0
+
+    async def get(self) -> BackendSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.ttl:
+            return snapshot
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # shield: si un cliente cancela, el refresco sigue para los demás
+        return await asyncio.shield(self._inflight)
+
+    def invalidate(self):
+        """Forzar la verificación de versión en la próxima lectura"""
+        self._checked_at = 0.0
+
+    async def _fetch_version(self, client) -> Dict[str, Any]:
+        self.version_checks += 1
+        try:
+            response = await client.get("/data-version")
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logging.warning(f"No se pudo consultar /data-version: {e}")
+        return {}
+
+    async def _refresh(self) -> BackendSnapshot:
+        try:
+            client = get_client()
+            current = self._snapshot
+            info = await self._fetch_version(client)
+            version = info.get("version")
+            # Cada worker del backend sirve /external-alerts desde su propia instantánea:
+            # se exige una que incluya las alertas externas de esta versión
+            external_version = (info.get("external") or {}).get("max_id", 0)
+            if current is not None and version is not None and version == current.version:
+                self._checked_at = time.monotonic()
+                return current
+
+            self.fetches += 1
+            alerts_response, shelters_response, external_response, zones_response = await asyncio.gather(
+                client.get("/alerts", params={"limit": self.alert_limit}),
+                client.get("/shelters"),
+                client.get("/external-alerts", params={"min_version": external_version}),
+                client.get("/zones"),
+                return_exceptions=True
+            )
+
+            failed = []
+
+            def payload(name, response, default):
+                if not isinstance(response, Exception) and response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        response = e
+                failed.append(name)
+                logging.warning(f"Fallo al descargar {name} del backend: {response if isinstance(response, Exception) else response.status_code}")
+                return default
+
+            alerts = payload("/alerts", alerts_response, [])
+            shelters = payload("/shelters", shelters_response, [])
+            external = payload("/external-alerts", external_response, {"alerts": []})
+            zones = payload("/zones", zones_response, [])
+            if "/external-alerts" not in failed and external.get("version", 0) < external_version:
+                failed.append("/external-alerts")
+                logging.warning(f"/external-alerts v{external.get('version', 0)} anterior a la versión de datos "
+                                f"(externas hasta {external_version})")
+            if failed:
+                # Nunca se guarda una descarga incompleta bajo la versión vigente:
+                # se sigue sirviendo la instantánea anterior y se reintenta en la próxima lectura
+                self.failed_refreshes += 1
+                if current is not None:
+                    logging.warning(f"Usando instantánea anterior del backend (fallaron {', '.join(failed)})")
+                    return current
+                version = None
+
+            # Las columnas se identifican por versión solo si la dio el backend y la descarga está completa
+            frame_version = version
+            # Sin versión del backend se usa el instante de descarga (solo vale el TTL);
+            # una descarga incompleta lleva su propia versión y no se guarda
+            version = version or f"{'parcial-' if failed else ''}t{time.time():.0f}"
+            snapshot = BackendSnapshot(
+                version=version,
+                alerts=alerts,
+                shelters=shelters,
+                external=external,
+                zones=zones,
+                frame=AlertFrame.from_alerts(alerts, frame_version),
+                shelter_index=ShelterIndex(shelters),
+                partial=bool(failed)
+            )
+            if not failed:
+                self._snapshot = snapshot
+                self._checked_at = time.monotonic()
+            return snapshot
+
+        except Exception as e:
+            if self._snapshot is not None:
+                logging.warning(f"Usando instantánea anterior del backend: {e}")
+                return self._snapshot
+            raise
+        finally:
+            self._inflight = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "age_seconds": round(time.time() - snapshot.fetched_at, 1) if snapshot else None,
+            "ttl_seconds": self.ttl,
+            "fetches": self.fetches,
+            "version_checks": self.version_checks,
+            "failed_refreshes": self.failed_refreshes
+        }
+
+# Instancia global
+snapshot_cache = SnapshotCache()
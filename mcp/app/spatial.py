@@ -0,0 +1,298 @@
+import json
+import heapq
+import itertools
+from typing import Any, List, Optional, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Con más anillos de celdas que esto, la búsqueda exhaustiva vectorizada es más barata
+MAX_RINGS = 3
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distancia en km de (lat, lon) a cada punto"""
+    phi1, phi2 = np.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lons - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def to_unit_xyz(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Coordenadas cartesianas sobre la esfera unitaria (sin distorsión en ninguna latitud)"""
+    phi, lmb = np.radians(lat), np.radians(lon)
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lmb), cos_phi * np.sin(lmb), np.sin(phi)))
+
+def chord_for_km(distance_km: float) -> float:
+    """Cuerda en la esfera unitaria equivalente a una distancia de gran círculo"""
+    return 2 * np.sin(min(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+class GeoIndex:
+    """Índice de malla uniforme sobre la esfera unitaria.
+
+    Los puntos se agrupan en cubos de lado `cell_km`; una consulta de radio r
+    solo revisa los cubos vecinos que pueden contener puntos a menos de r y
+    confirma la distancia exacta (cuerda equivalente a haversine).
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_km: float = 5.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.xyz = to_unit_xyz(self.lat, self.lon)
+        self.cell = chord_for_km(cell_km)
+
+        cells = np.floor(self.xyz / self.cell).astype(np.int64)
+        self.keys = self._key(cells)
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted_keys = self.keys[self.order]
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @staticmethod
+    def _key(cells: np.ndarray) -> np.ndarray:
+        # Las celdas caben en 21 bits por eje con cubos de hasta ~10 m
+        shifted = cells + (1 << 20)
+        return (shifted[:, 0] << 42) | (shifted[:, 1] << 21) | shifted[:, 2]
+
+    def query_radius(self, lat, lon, radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Pares (consulta, punto, distancia km) con distancia <= radius_km"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+        query = to_unit_xyz(np.atleast_1d(np.asarray(lat, dtype=np.float64)),
+                            np.atleast_1d(np.asarray(lon, dtype=np.float64)))
+        if not len(self) or not len(query):
+            return empty
+
+        chord = chord_for_km(radius_km)
+        rings = int(np.ceil(chord / self.cell))
+        if rings > MAX_RINGS:
+            return self._query_brute(query, chord)
+        base = np.floor(query / self.cell).astype(np.int64)
+
+        found_q, found_p = [], []
+        for offset in itertools.product(range(-rings, rings + 1), repeat=3):
+            keys = self._key(base + np.array(offset, dtype=np.int64))
+            start = np.searchsorted(self.sorted_keys, keys, side="left")
+            stop = np.searchsorted(self.sorted_keys, keys, side="right")
+            counts = stop - start
+            total = int(counts.sum())
+            if not total:
+                continue
+            q = np.repeat(np.arange(len(query)), counts)
+            positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            found_q.append(q)
+            found_p.append(self.order[np.repeat(start, counts) + positions])
+
+        if not found_q:
+            return empty
+        q, p = np.concatenate(found_q), np.concatenate(found_p)
+        chords = np.linalg.norm(query[q] - self.xyz[p], axis=1)
+        close = chords <= chord
+        return q[close], p[close], chord_to_km(chords[close])
+
+    def _query_brute(self, query: np.ndarray, chord: float):
+        q, p, found = [], [], []
+        # Por bloques de consultas para acotar la memoria de la matriz de distancias
+        step = max(1, 1_000_000 // max(len(self), 1))
+        for first in range(0, len(query), step):
+            block = query[first:first + step]
+            chords = np.linalg.norm(block[:, None, :] - self.xyz[None, :, :], axis=2)
+            bq, bp = np.nonzero(chords <= chord)
+            q.append(bq + first)
+            p.append(bp)
+            found.append(chords[bq, bp])
+        return np.concatenate(q), np.concatenate(p), chord_to_km(np.concatenate(found))
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Índices y distancias (km) de los puntos a menos de radius_km, ordenados por distancia"""
+        _, points, distances = self.query_radius(lat, lon, radius_km)
+        order = np.argsort(distances, kind="stable")
+        return points[order], distances[order]
+
+def spatial_join(index: GeoIndex, lat: np.ndarray, lon: np.ndarray, radius_km: float,
+                 epoch: Optional[np.ndarray] = None, index_epoch: Optional[np.ndarray] = None,
+                 window_hours: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Join espacial (y opcionalmente temporal) entre consultas y un índice.
+
+    Con `window_hours`, solo se conservan los pares cuya diferencia de tiempo
+    es menor o igual a la ventana; pares sin fecha válida se descartan.
+    """
+    q, p, distances = index.query_radius(lat, lon, radius_km)
+    if window_hours and epoch is not None and index_epoch is not None:
+        with np.errstate(invalid="ignore"):
+            in_window = np.abs(epoch[q] - index_epoch[p]) <= window_hours * 3600
+        q, p, distances = q[in_window], p[in_window], distances[in_window]
+    return q, p, distances
+
+def join_counts(index_lat: np.ndarray, index_lon: np.ndarray, index_epoch: np.ndarray,
+                lat: np.ndarray, lon: np.ndarray, epoch: np.ndarray, radius_km: float,
+                window_hours: Optional[float] = None, cell_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Por cada consulta: puntos del índice a menos de radius_km (y dentro de la
+    ventana) y distancia al más cercano (inf si no hay). Solo arreglos, para
+    poder ejecutarse en el pool de procesos."""
+    index = GeoIndex(index_lat, index_lon, cell_km=cell_km or radius_km)
+    return index_counts(index, index_epoch, lat, lon, epoch, radius_km, window_hours)
+
+def index_counts(index: GeoIndex, index_epoch: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                 epoch: np.ndarray, radius_km: float,
+                 window_hours: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Como `join_counts`, sobre un índice ya construido (p. ej. el de la instantánea)"""
+    q, _, distances = spatial_join(index, lat, lon, radius_km, epoch=epoch,
+                                   index_epoch=index_epoch, window_hours=window_hours)
+    counts = np.bincount(q, minlength=len(lat))
+    nearest_km = np.full(len(lat), np.inf)
+    np.minimum.at(nearest_km, q, distances)
+    return counts, nearest_km
+
+def geojson_polygons(geojson: Any) -> List[List[np.ndarray]]:
+    """Polígonos (lista de anillos [lon, lat]) de un GeoJSON en texto o dict"""
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    if not isinstance(geojson, dict):
+        return []
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [polygon for feature in geojson.get("features") or [] for polygon in geojson_polygons(feature)]
+    if kind == "Feature":
+        return geojson_polygons(geojson.get("geometry"))
+    if kind == "GeometryCollection":
+        return [polygon for geometry in geojson.get("geometries") or [] for polygon in geojson_polygons(geometry)]
+    if kind == "Polygon":
+        coordinates = [geojson.get("coordinates") or []]
+    elif kind == "MultiPolygon":
+        coordinates = geojson.get("coordinates") or []
+    else:
+        return []
+    return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon if len(ring) >= 3]
+            for polygon in coordinates if polygon]
+
+def points_in_polygons(lat: np.ndarray, lon: np.ndarray, polygons: List[List[np.ndarray]]) -> np.ndarray:
+    """Máscara de los puntos dentro de algún polígono (regla par-impar, los huecos quedan fuera)"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    inside_any = np.zeros(len(lat), dtype=bool)
+    for rings in polygons:
+        outer = rings[0]
+        # Descartar primero por caja envolvente
+        candidates = np.flatnonzero((lon >= outer[:, 0].min()) & (lon <= outer[:, 0].max()) &
+                                    (lat >= outer[:, 1].min()) & (lat <= outer[:, 1].max()))
+        if not candidates.size:
+            continue
+        x, y = lon[candidates], lat[candidates]
+        inside = np.zeros(len(candidates), dtype=bool)
+        for ring in rings:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            for ax, ay, bx, by in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+                if ay == by:
+                    continue
+                crosses = ((ay > y) != (by > y)) & (x < (bx - ax) * (y - ay) / (by - ay) + ax)
+                inside ^= crosses
+        inside_any[candidates[inside]] = True
+    return inside_any
+
+class KDTree:
+    """KD-tree sobre coordenadas de la esfera unitaria.
+
+    La cuerda es monótona con la distancia de gran círculo, así que los
+    vecinos más cercanos en 3D son los más cercanos en haversine. Las hojas
+    se evalúan vectorizadas y `mask` permite filtrar puntos sin reconstruir.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, leaf_size: int = 16):
+        self.xyz = to_unit_xyz(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        self.leaf_size = leaf_size
+        self.perm = np.arange(len(self.xyz))
+        # Nodos: (inicio, fin, hijo izquierdo, hijo derecho, caja mínima, caja máxima)
+        self.nodes = []
+        if len(self.xyz):
+            self._build(0, len(self.xyz))
+
+    def __len__(self) -> int:
+        return len(self.xyz)
+
+    def _build(self, start: int, end: int) -> int:
+        points = self.xyz[self.perm[start:end]]
+        node = len(self.nodes)
+        self.nodes.append([start, end, -1, -1, points.min(axis=0), points.max(axis=0)])
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(self.nodes[node][5] - self.nodes[node][4]))
+            middle = (end - start) // 2
+            order = np.argpartition(points[:, axis], middle)
+            self.perm[start:end] = self.perm[start:end][order]
+            self.nodes[node][2] = self._build(start, start + middle)
+            self.nodes[node][3] = self._build(start + middle, end)
+        return node
+
+    @staticmethod
+    def _box_distance(point: np.ndarray, low: np.ndarray, high: np.ndarray) -> float:
+        gap = np.maximum(np.maximum(low - point, point - high), 0)
+        return float(np.sqrt(gap @ gap))
+
+    def _leaf(self, node, point: np.ndarray, mask: Optional[np.ndarray]):
+        indices = self.perm[node[0]:node[1]]
+        if mask is not None:
+            indices = indices[mask[indices]]
+        chords = np.linalg.norm(self.xyz[indices] - point, axis=1)
+        return indices, chords
+
+    def query(self, lat: float, lon: float, k: int = 1, max_km: Optional[float] = None,
+              mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Los k puntos más cercanos (índices, distancias km), opcionalmente dentro de max_km"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        if not self.nodes or k <= 0:
+            return empty
+        point = to_unit_xyz(np.array([lat], dtype=np.float64), np.array([lon], dtype=np.float64))[0]
+        bound = chord_for_km(max_km) if max_km is not None else np.inf
+
+        best_idx = np.empty(0, dtype=np.int64)
+        best_chord = np.empty(0)
+        heap = [(self._box_distance(point, self.nodes[0][4], self.nodes[0][5]), 0)]
+        while heap:
+            distance, node_id = heapq.heappop(heap)
+            worst = best_chord[-1] if len(best_chord) == k else bound
+            if distance > worst:
+                break
+            node = self.nodes[node_id]
+            if node[2] < 0:
+                indices, chords = self._leaf(node, point, mask)
+                keep = chords <= bound
+                best_idx = np.concatenate((best_idx, indices[keep]))
+                best_chord = np.concatenate((best_chord, chords[keep]))
+                order = np.argsort(best_chord, kind="stable")[:k]
+                best_idx, best_chord = best_idx[order], best_chord[order]
+                continue
+            for child in (node[2], node[3]):
+                child_node = self.nodes[child]
+                heapq.heappush(heap, (self._box_distance(point, child_node[4], child_node[5]), child))
+        return best_idx, chord_to_km(best_chord)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float,
+                     mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Todos los puntos a menos de radius_km (índices, distancias km) ordenados por distancia"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        if not self.nodes:
+            return empty
+        point = to_unit_xyz(np.array([lat], dtype=np.float64), np.array([lon], dtype=np.float64))[0]
+        bound = chord_for_km(radius_km)
+
+        found_idx, found_chord = [], []
+        stack = [0]
+        while stack:
+            node = self.nodes[stack.pop()]
+            if self._box_distance(point, node[4], node[5]) > bound:
+                continue
+            if node[2] < 0:
+                indices, chords = self._leaf(node, point, mask)
+                keep = chords <= bound
+                found_idx.append(indices[keep])
+                found_chord.append(chords[keep])
+            else:
+                stack.extend((node[2], node[3]))
+        if not found_idx:
+            return empty
+        indices, chords = np.concatenate(found_idx), np.concatenate(found_chord)
+        order = np.argsort(chords, kind="stable")
+        return indices[order], chord_to_km(chords[order])
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timedelta
+import httpx
+from app import analytics_engine as module
+from app.analytics_engine import AnalyticsEngine
+
+def test_future_dated_alerts_do_not_advance_the_windows():
+    engine = AnalyticsEngine()
+    now = datetime.utcnow()
+    for hours in (1, 3, 5):
+        engine.apply({"created_at": (now - timedelta(hours=hours)).isoformat(), "severity": 2})
+    engine.apply({"created_at": (now + timedelta(days=3)).isoformat(), "severity": 4})
+    assert engine.last_24h.totals[0] == 4
+    assert engine.last_7d.totals[0] == 4
+
+def test_bootstrap_uses_daily_rollups_and_recent_hours(monkeypatch):
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    old_day = (now - timedelta(days=5)).replace(hour=0)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        if request.url.path == "/stats/rollups/bootstrap":
+            row = {"zone": "14.750,-90.250", "alert_type": "sismo", "severity": 3}
+            return httpx.Response(200, json={
+                "last_alert_id": 12, "since": (now - timedelta(days=2)).isoformat(),
+                "days": [{**row, "bucket": old_day.isoformat(), "count": 9}],
+                "hours": [{**row, "bucket": (now - timedelta(hours=2)).isoformat(), "count": 3}],
+                "hour_of_day": [0] * 7 + [9] + [0] * 16
+            })
+        return httpx.Response(200, json={"alerts": [], "last_id": 12, "max_id": 12, "has_more": False})
+
+    client = httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(module, "get_client", lambda: client)
+    engine = AnalyticsEngine()
+    asyncio.run(engine._pull())
+
+    assert requests == ["/stats/rollups/bootstrap", "/alerts/changes"]
+    assert engine.total == 12 and engine.last_id == 12
+    # La hora del tramo diario viene agregada, no de la medianoche de la cubeta
+    assert sum(engine.hour_of_day) == 12 and engine.hour_of_day[7] >= 9
+    assert engine.last_24h.totals[0] == 3
+    assert engine.last_7d.totals[0] == 12
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from app import clustering
+from app.clustering import dbscan_labels, project_km
+
+def brute_force_labels(lat, lon, radius_km, min_samples):
+    """DBSCAN por definición: matriz completa de distancias"""
+    xy = project_km(lat, lon)
+    close = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2) <= radius_km
+    n = len(lat)
+    core = close.sum(axis=1) >= min_samples
+    labels = np.full(n, -1)
+    for start in np.flatnonzero(core):
+        if labels[start] != -1:
+            continue
+        stack, members = [start], {start}
+        while stack:
+            point = stack.pop()
+            for other in np.flatnonzero(close[point] & core):
+                if other not in members:
+                    members.add(other)
+                    stack.append(other)
+        labels[sorted(members)] = min(members)
+    for point in np.flatnonzero(~core):
+        cores = np.flatnonzero(close[point] & core)
+        if len(cores):
+            labels[point] = labels[cores.min()]
+    return labels
+
+def clumps(seed: int, n: int = 900):
+    """Nubes densas (tormentas) sobre ruido disperso"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([14.0, -91.0], [14.3, -90.7], (4, 2))
+    dense = centers[rng.integers(0, 4, n // 2)] + rng.normal(0, 0.004, (n // 2, 2))
+    sparse = rng.uniform([14.0, -91.0], [14.3, -90.7], (n - n // 2, 2))
+    points = rng.permutation(np.vstack((dense, sparse)))
+    return points[:, 0], points[:, 1]
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("cap", [2, 8, 1000])
+@pytest.mark.parametrize("min_samples", [2, 4])
+def test_dbscan_matches_brute_force(monkeypatch, seed, cap, min_samples):
+    monkeypatch.setattr(clustering, "CLUSTER_CELL_CAP", cap)
+    lat, lon = clumps(seed)
+    expected = brute_force_labels(lat, lon, 1.1, min_samples)
+    assert np.array_equal(dbscan_labels(lat, lon, 1.1, min_samples), expected)
+
+def test_dense_cells_are_not_quadratic():
+    rng = np.random.default_rng(0)
+    # 200k alertas en unos pocos cientos de metros: antes, ~2e10 pares
+    lat = 14.6 + rng.normal(0, 0.001, 200_000)
+    lon = -90.5 + rng.normal(0, 0.001, 200_000)
+    i, j, full = clustering.neighbor_graph(project_km(lat, lon), 1.1)
+    assert full.mean() > 0.99
+    assert len(i) < 10 * len(lat)
+    assert len(np.unique(dbscan_labels(lat, lon, 1.1, 2))) == 1
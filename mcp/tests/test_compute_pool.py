@@ -0,0 +1,52 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from app.compute_pool import ComputePool
+
+def test_shared_blocks_are_reused_per_key_and_released():
+    pool = ComputePool(workers=1, inline_max_items=0, shared_entries=1)
+    values = np.arange(1000, dtype=np.float64)
+
+    async def scenario():
+        first = await pool.run(np.sum, [values], key=("v1", "valores"))
+        second = await pool.run(np.sum, [values], key=("v1", "valores"))
+        third = await pool.run(np.sum, [values * 2], key=("v2", "valores"))
+        return first, second, third
+
+    try:
+        assert asyncio.run(scenario()) == (values.sum(), values.sum(), 2 * values.sum())
+        stats = pool.stats()
+        assert stats["shared_reused"] == 1
+        # La clave v1 salió del caché (una entrada) y sus bloques se liberaron
+        assert stats["shared_entries"] == 1 and list(pool._shared) == [("v2", "valores")]
+    finally:
+        pool.shutdown()
+    assert not pool._shared
+
+def test_offload_keeps_the_event_loop_free():
+    pool = ComputePool(workers=0, max_concurrent=2)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        result = await pool.offload(lambda seconds: time.sleep(seconds) or "listo", 0.2)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == "listo" and ticks > 5
+    assert pool.stats()["threaded"] == 1
+
+def test_offload_timeout():
+    pool = ComputePool(workers=0)
+    with pytest.raises(TimeoutError):
+        asyncio.run(pool.offload(time.sleep, 0.5, timeout=0.05))
+    assert pool.stats()["timeouts"] == 1
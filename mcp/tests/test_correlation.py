@@ -0,0 +1,33 @@
+import asyncio
+import numpy as np
+from app.advanced_mcp import CORRELATION_RADIUS_KM, correlate_with_external
+from app.alert_frame import AlertFrame
+from app.spatial import haversine_km
+
+def alerts(rng, n, source):
+    return [{"lat": float(lat), "lon": float(lon), "source": source, "severity": 2,
+             "created_at": "2024-05-01T12:00:00"}
+            for lat, lon in zip(rng.uniform(14.5, 14.7, n), rng.uniform(-90.6, -90.4, n))]
+
+def test_correlation_matches_brute_force_and_reuses_the_index():
+    rng = np.random.default_rng(3)
+    internal = alerts(rng, 400, "manual") + alerts(rng, 100, "GDACS")
+    external = alerts(rng, 30, "GDACS")
+    frame = AlertFrame.from_alerts(internal, version="v1")
+
+    first = asyncio.run(correlate_with_external(frame, external))
+    index = frame.manual_frame().geo_index(CORRELATION_RADIUS_KM)
+    second = asyncio.run(correlate_with_external(frame, external))
+    assert first == second
+    # El subconjunto manual y su índice quedan en el frame de la versión
+    assert frame.manual_frame().geo_index(CORRELATION_RADIUS_KM) is index
+    assert frame.manual_frame().version == "v1:manual"
+
+    manual = np.array([[a["lat"], a["lon"]] for a in internal if a["source"] == "manual"])
+    expected = []
+    for alert in external:
+        distances = haversine_km(alert["lat"], alert["lon"], manual[:, 0], manual[:, 1])
+        close = distances <= CORRELATION_RADIUS_KM
+        if close.any():
+            expected.append((int(close.sum()), round(float(distances.min()), 2)))
+    assert [(c["internal_count"], c["nearest_km"]) for c in first] == expected
@@ -0,0 +1,46 @@
+import json
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import decision_support
+from app.alert_frame import AlertFrame
+
+@pytest.fixture
+def client(monkeypatch):
+    rng = np.random.default_rng(5)
+    # Siete focos: el GET anterior solo planificaba los cinco primeros
+    centers = [(14.0 + 0.3 * k, -90.5) for k in range(7)]
+    alerts = [{"id": i, "lat": lat + float(rng.normal(0, 0.001)), "lon": lon + float(rng.normal(0, 0.001)),
+               "severity": int(rng.integers(1, 6)), "created_at": "2024-05-01T12:00:00"}
+              for i, (lat, lon) in enumerate(centers * 6)]
+    frame = AlertFrame.from_alerts(alerts)
+
+    async def snapshot():
+        return SimpleNamespace(frame=frame)
+
+    monkeypatch.setattr(decision_support.snapshot_cache, "get", snapshot)
+    app = FastAPI()
+    app.include_router(decision_support.router)
+    return TestClient(app)
+
+def test_get_and_post_give_the_same_plan(client, tmp_path, monkeypatch):
+    teams = [{"id": f"r{k}", "lat": 14.0 + 0.4 * k, "lon": -90.4, "capacity": 2, "team_type": "rescue_teams"}
+             for k in range(4)]
+    path = tmp_path / "teams.json"
+    path.write_text(json.dumps(teams))
+    monkeypatch.setattr(decision_support, "ALLOCATION_TEAMS_FILE", str(path))
+
+    plan = client.get("/mcp/decisions/resource-optimization").json()
+    posted = client.post("/mcp/decisions/resource-optimization", json={"teams": teams}).json()
+    assert plan["total_zones"] == len(plan["optimization_plan"]) == 7
+    for key in ("optimization_plan", "unassigned_teams", "summary"):
+        assert plan[key] == posted[key]
+    assert plan["summary"]["assigned_units"] == 8
+
+def test_get_without_teams_reports_uncovered_demand(client):
+    plan = client.get("/mcp/decisions/resource-optimization").json()
+    assert len(plan["optimization_plan"]) == 7
+    assert all(zone["coverage"] == 0 and not zone["assigned_teams"] for zone in plan["optimization_plan"].values())
+    assert plan["summary"]["assigned_units"] == 0 < plan["summary"]["demand_units"]
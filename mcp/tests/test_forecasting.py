@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from app.forecasting import FORECAST_LATE_DAYS, SeriesModel
+
+def state(model: SeriesModel):
+    return (model.level, model.trend, model.season, model.var, model.history, model.observed_days, model.total)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_late_alerts_fold_into_their_day(seed):
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(4, 40).tolist()
+    in_order, late = SeriesModel(100), SeriesModel(100)
+    held = {}
+    for offset, count in enumerate(counts):
+        in_order.add(100 + offset, count)
+        # Un tercio de cada día llega unos días después, ya cerrado
+        delayed = count // 3
+        late.add(100 + offset, count - delayed)
+        held.setdefault(offset + int(rng.integers(1, FORECAST_LATE_DAYS)), []).append((100 + offset, delayed))
+        for day, delayed in held.pop(offset, []):
+            assert late.add(day, delayed) is (day >= late.day)
+    for offset in sorted(held):
+        for day, delayed in held[offset]:
+            late.add(day, delayed)
+    in_order.advance(200)
+    late.advance(200)
+    assert state(late) == pytest.approx(state(in_order))
+
+def test_alerts_older_than_the_replay_window_still_count():
+    model = SeriesModel(10)
+    for day in range(10, 30):
+        model.add(day, 2)
+    assert model.add(5, 3) is False
+    assert model.total == 43
+    # Se suma al día cerrado más antiguo que todavía se puede recalcular
+    assert list(model.recent[0]) == [29 - FORECAST_LATE_DAYS, 5]
+    assert sum(y for _, y in model.recent) == 2 * FORECAST_LATE_DAYS + 3
+
+@pytest.mark.parametrize("context", [{"horizon_days": "x"}, {"horizon_days": 0}, {"horizon_days": -3},
+                                     {"level": "alto"}, {"level": 1.5}, {"horizon_days": [2]}])
+def test_predict_rejects_invalid_parameters(context):
+    from fastapi.testclient import TestClient
+    from app.advanced_mcp import app
+    response = TestClient(app).post("/mcp/analysis/predict", json={"query": "riesgo", "context": context})
+    assert response.status_code == 400
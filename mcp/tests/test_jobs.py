@@ -0,0 +1,128 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+import pytest
+from app import jobs
+from app.jobs import JobManager
+
+@pytest.fixture
+def history(monkeypatch):
+    """Tipo de trabajo de prueba que cuenta ejecuciones y espera una señal para terminar"""
+    state = {"runs": 0, "release": None}
+
+    async def slow_job(params, progress):
+        state["runs"] += 1
+        progress(0.5, "Trabajando")
+        await state["release"].wait()
+        return {"value": params["value"]}
+
+    async def snapshot():
+        return SimpleNamespace(version="v1")
+
+    monkeypatch.setitem(jobs.HISTORY_JOBS, "prueba", (lambda params: {"value": int(params.get("value", 1))}, slow_job))
+    monkeypatch.setattr(jobs.snapshot_cache, "get", snapshot)
+    return state
+
+async def settle():
+    # Las llamadas a la base pasan por hilos: esperar a que vuelvan al loop
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+
+def test_workers_deduplicate_and_run_each_job_once(tmp_path, history):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        history["release"] = asyncio.Event()
+        first, second = JobManager(path), JobManager(path)
+        (a, a_dedup), (b, b_dedup) = await asyncio.gather(first.submit("prueba", {"value": 3}),
+                                                          second.submit("prueba", {"value": 3}))
+        assert a["id"] == b["id"] and sorted([a_dedup, b_dedup]) == [False, True]
+        # Ambos workers intentan tomar la cola: solo uno reclama el trabajo
+        await first.tick()
+        await second.tick()
+        await settle()
+        history["release"].set()
+        await settle()
+        assert history["runs"] == 1
+        assert first.get(a["id"])["status"] == "succeeded"
+        await first.shutdown()
+        await second.shutdown()
+
+    asyncio.run(scenario())
+
+def test_cancel_reaches_the_worker_running_the_job(tmp_path, history):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        history["release"] = asyncio.Event()
+        runner, other = JobManager(path), JobManager(path)
+        job, _ = await runner.submit("prueba", {"value": 1})
+        await settle()
+        assert runner.get(job["id"])["status"] == "running"
+
+        # Se cancela desde otro worker: queda marcado hasta el próximo ciclo del que lo ejecuta
+        other.start()
+        pending = await other.cancel(job["id"])
+        assert pending["status"] == "running" and pending["cancel_requested"]
+        await runner.tick()
+        await settle()
+        assert runner.get(job["id"])["status"] == "cancelled"
+        assert history["runs"] == 1
+        await runner.shutdown()
+        await other.shutdown()
+
+    asyncio.run(scenario())
+
+def test_jobs_of_a_dead_worker_are_requeued(tmp_path, history, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        history["release"] = asyncio.Event()
+        dead, alive = JobManager(path), JobManager(path)
+        job, _ = await dead.submit("prueba", {"value": 2})
+        await settle()
+        # El worker muere sin liberar: su trabajo queda 'running' sin latido
+        for task in list(dead._tasks.values()):
+            task.cancel()
+        await settle()
+        dead.store.update(job["id"], heartbeat_at="2000-01-01T00:00:00")
+        alive.start()
+        await alive.tick()
+        await settle()
+        assert alive.get(job["id"])["status"] == "running"
+        history["release"].set()
+        await settle()
+        assert alive.get(job["id"])["status"] == "succeeded"
+        assert history["runs"] == 2
+        await alive.shutdown()
+
+    asyncio.run(scenario())
+
+def test_a_locked_database_does_not_block_the_event_loop(tmp_path, history):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        manager = JobManager(path)
+        await manager.tick()
+        # Otro worker retiene el lock de escritura de SQLite
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        pending = asyncio.create_task(manager.tick())
+        await asyncio.sleep(0.3)
+        assert not pending.done() and ticks > 10
+        other.execute("COMMIT")
+        await pending
+        task.cancel()
+        other.close()
+        await manager.shutdown()
+
+    asyncio.run(scenario())
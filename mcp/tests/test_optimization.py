@@ -0,0 +1,125 @@
+import itertools
+import numpy as np
+import pytest
+from app import optimization
+from app.optimization import AllocationSolver, auction_assign
+
+def compositions(total: int, parts: int):
+    """Formas de repartir hasta `total` unidades entre `parts` destinos"""
+    for counts in itertools.product(range(total + 1), repeat=parts):
+        if sum(counts) <= total:
+            yield counts
+
+def brute_force(benefit: np.ndarray, demand, supply) -> float:
+    n, m = benefit.shape
+    options = [[c for c in compositions(supply[i], m)
+                if all(q == 0 or np.isfinite(benefit[i, j]) for j, q in enumerate(c))] for i in range(n)]
+    best = 0.0
+    for plan in itertools.product(*options):
+        load = np.sum(plan, axis=0)
+        if np.any(load > demand):
+            continue
+        value = sum(q * benefit[i, j] for i, c in enumerate(plan) for j, q in enumerate(c) if q)
+        best = max(best, value)
+    return best
+
+def check_feasible(result, benefit, demand, supply):
+    n, m = benefit.shape
+    load = np.zeros(m, dtype=np.int64)
+    sent = np.zeros(n, dtype=np.int64)
+    for i, j, q in result.flows:
+        assert q > 0 and np.isfinite(benefit[i, j])
+        load[j] += q
+        sent[i] += q
+    assert np.all(load <= demand)
+    assert np.all(sent <= supply)
+
+def value(result, benefit) -> float:
+    return sum(q * benefit[i, j] for i, j, q in result.flows)
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_brute_force_on_small_instances(seed):
+    rng = np.random.default_rng(seed)
+    n, m = int(rng.integers(1, 4)), int(rng.integers(1, 4))
+    benefit = rng.integers(-5, 30, size=(n, m)).astype(np.float64)
+    benefit[rng.random((n, m)) < 0.2] = -np.inf
+    supply = rng.integers(1, 3, n)
+    demand = rng.integers(0, 3, m)
+    # Beneficios enteros y (unidades + cupos) * epsilon < 1: la subasta debe dar el óptimo exacto
+    epsilon = 0.9 / (supply.sum() + demand.sum())
+    result = auction_assign(benefit, demand, epsilon=epsilon, supply=supply)
+    check_feasible(result, benefit, demand, supply)
+    assert value(result, benefit) == pytest.approx(brute_force(benefit, demand, supply))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_float_benefits_within_gap(seed):
+    rng = np.random.default_rng(100 + seed)
+    n, m = 3, 3
+    benefit = rng.uniform(-10, 60, size=(n, m))
+    supply = rng.integers(1, 3, n)
+    demand = rng.integers(1, 3, m)
+    result = auction_assign(benefit, demand, supply=supply)
+    check_feasible(result, benefit, demand, supply)
+    assert value(result, benefit) >= brute_force(benefit, demand, supply) - result.slack * result.epsilon
+
+def test_warm_prices_give_same_optimum():
+    rng = np.random.default_rng(7)
+    benefit = rng.uniform(0, 100, size=(3, 3))
+    supply, demand = np.array([2, 1, 2]), np.array([1, 2, 1])
+    epsilon = 0.9 / (supply.sum() + demand.sum())
+    # Precios arbitrarios (incluso muy altos) siguen siendo un arranque válido
+    prices = np.array([500.0, 0.0, 37.0])
+    result = auction_assign(benefit, demand, prices, epsilon=epsilon, supply=supply)
+    check_feasible(result, benefit, demand, supply)
+    assert value(result, benefit) >= brute_force(benefit, demand, supply) - 1
+
+def test_tight_capacity_converges():
+    # Muchos orígenes compitiendo por destinos casi llenos: sin escalamiento de epsilon no termina
+    rng = np.random.default_rng(3)
+    n, m = 2000, 40
+    distance = rng.uniform(0, 60, size=(n, m))
+    benefit = np.where(distance <= 50, 50 - distance, -np.inf)
+    supply = rng.integers(1, 6, n)
+    demand = np.full(m, int(supply.sum() * 0.92 / m))
+    result = auction_assign(benefit, demand, supply=supply)
+    check_feasible(result, benefit, demand, supply)
+    assert sum(q for _, _, q in result.flows) == demand.sum()
+
+def test_epsilon_scaling_bounds_price_wars():
+    # Orígenes idénticos por menos cupos: con una sola fase en epsilon final los
+    # precios suben de a 0.01 hasta 100 (unas 10^4 ofertas)
+    benefit = np.full((3, 2), 100.0)
+    result = auction_assign(benefit, [1, 1])
+    assert sum(q for _, _, q in result.flows) == 2
+    assert result.phases > 1
+    assert result.bids < 500
+
+def _teams_instance(rng, m):
+    distance = rng.uniform(0, 120, size=(40, m))
+    benefit = np.where(distance <= 100, 100 - distance, -np.inf)
+    return benefit, rng.integers(1, 4, m), rng.integers(1, 3, 40)
+
+def test_warm_start_matches_cold_after_changes():
+    rng = np.random.default_rng(11)
+    solver = AllocationSolver()
+    keys = list(range(60))
+    for step in range(6):
+        benefit, demand, supply = _teams_instance(rng, len(keys))
+        warm, info = solver.solve(benefit, demand, keys, group="g", supply=supply)
+        cold = auction_assign(benefit, demand, supply=supply)
+        check_feasible(warm, benefit, demand, supply)
+        gap = warm.slack * warm.epsilon
+        assert abs(value(warm, benefit) - value(cold, benefit)) <= gap
+        assert info["warm_start"] == (step > 0)
+        # La mitad de los destinos cambia en cada paso
+        keys = keys[30:] + list(range(1000 * (step + 1), 1000 * (step + 1) + 30))
+
+def test_warm_start_falls_back_to_cold(monkeypatch):
+    rng = np.random.default_rng(12)
+    solver = AllocationSolver()
+    benefit, demand, supply = _teams_instance(rng, 60)
+    solver.solve(benefit, demand, list(range(60)), group="g", supply=supply)
+    monkeypatch.setattr(optimization, "ALLOCATION_WARM_BID_FACTOR", 0.01)
+    result, info = solver.solve(benefit, demand, list(range(60)), group="g", supply=supply)
+    assert info["warm_fallback"]
+    check_feasible(result, benefit, demand, supply)
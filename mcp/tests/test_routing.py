@@ -0,0 +1,100 @@
+import heapq
+import numpy as np
+import pytest
+from app.routing import RoadIndex, _dissection_order, load_osm
+from app.spatial import haversine_km, points_in_polygons
+
+def road_graph(side: int, seed: int):
+    """Cuadrícula perturbada con tramos eliminados, sentidos únicos y velocidades mixtas"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.meshgrid(np.arange(side), np.arange(side), indexing="ij")
+    lat = -33.45 + rows.ravel() * 0.002 + rng.normal(0, 2e-4, side * side)
+    lon = -70.65 + cols.ravel() * 0.002 + rng.normal(0, 2e-4, side * side)
+    ids = np.arange(side * side).reshape(side, side)
+    u = np.concatenate((ids[:-1].ravel(), ids[:, :-1].ravel(), ids[:-1, :-1].ravel()))
+    v = np.concatenate((ids[1:].ravel(), ids[:, 1:].ravel(), ids[1:, 1:].ravel()))
+    kept = rng.random(len(u)) < np.where(np.arange(len(u)) < len(u) - (side - 1) ** 2, 0.9, 0.15)
+    u, v = u[kept], v[kept]
+    return {
+        "lat": lat, "lon": lon, "u": u, "v": v,
+        "km": haversine_km(lat[u], lon[u], lat[v], lon[v]),
+        "speed": rng.choice([25.0, 40.0, 60.0, 90.0], len(u)),
+        "direction": rng.choice(np.array([0, 0, 0, 1, -1], dtype=np.int8), len(u))
+    }
+
+def dijkstra(index: RoadIndex, source: int, seconds_fwd: np.ndarray, seconds_bwd: np.ndarray) -> np.ndarray:
+    adjacency = [[] for _ in range(index.n)]
+    for a, b, fwd, bwd in zip(index.edge_u.tolist(), index.edge_v.tolist(), seconds_fwd.tolist(), seconds_bwd.tolist()):
+        adjacency[a].append((b, fwd))
+        adjacency[b].append((a, bwd))
+    distance = np.full(index.n, np.inf)
+    distance[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        best, node = heapq.heappop(heap)
+        if best > distance[node]:
+            continue
+        for other, seconds in adjacency[node]:
+            if best + seconds < distance[other]:
+                distance[other] = best + seconds
+                heapq.heappush(heap, (best + seconds, other))
+    return distance
+
+def square(lat: float, lon: float, size: float):
+    return [[np.array([[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]])]]
+
+@pytest.mark.parametrize("seed", range(4))
+def test_dissection_order_is_a_permutation(seed):
+    graph = road_graph(20, seed)
+    order = _dissection_order(graph["lat"], graph["lon"], graph["u"], graph["v"])
+    assert sorted(order) == list(range(len(graph["lat"])))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_routes_match_dijkstra(seed):
+    index = RoadIndex.build(road_graph(24, seed))
+    metric = index.customize([])
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(index.n, 8, replace=False)
+    target_set = metric.targets(targets.tolist())
+    for source in rng.choice(index.n, 6, replace=False).tolist():
+        expected = dijkstra(index, source, index.edge_time_fwd, index.edge_time_bwd)
+        assert np.allclose(metric.one_to_many(source, target_set), expected[targets])
+        for target in targets.tolist():
+            route = metric.route(source, target)
+            if not np.isfinite(expected[target]):
+                assert route is None
+                continue
+            assert route["duration_min"] == pytest.approx(expected[target] / 60, abs=0.006)
+            assert route["path"][0] == [round(index.lat[source], 6), round(index.lon[source], 6)]
+            assert route["path"][-1] == [round(index.lat[target], 6), round(index.lon[target], 6)]
+
+def test_risk_penalty_matches_dijkstra():
+    index = RoadIndex.build(road_graph(24, 7))
+    polygons = square(-33.43, -70.63, 0.012)
+    metric = index.customize(polygons, penalty=10)
+    risky = (points_in_polygons(index.lat, index.lon, polygons)[index.edge_u] |
+             points_in_polygons(index.lat, index.lon, polygons)[index.edge_v] |
+             points_in_polygons(index.edge_mid_lat, index.edge_mid_lon, polygons))
+    assert risky.any()
+    fwd = np.where(risky, index.edge_time_fwd * 10, index.edge_time_fwd)
+    bwd = np.where(risky, index.edge_time_bwd * 10, index.edge_time_bwd)
+    targets = list(range(0, index.n, 37))
+    target_set = metric.targets(targets)
+    for source in range(5, index.n, 53):
+        expected = dijkstra(index, source, fwd, bwd)
+        assert np.allclose(metric.one_to_many(source, target_set), expected[targets])
+
+def test_load_osm_splits_ways_at_missing_nodes(tmp_path):
+    extract = tmp_path / "extracto.osm"
+    extract.write_text("""<osm>
+  <node id="1" lat="-33.40" lon="-70.60"/>
+  <node id="2" lat="-33.41" lon="-70.60"/>
+  <node id="4" lat="-33.43" lon="-70.60"/>
+  <node id="5" lat="-33.44" lon="-70.60"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="5"/><tag k="highway" v="residential"/></way>
+</osm>""")
+    graph = load_osm(str(extract))
+    pairs = {tuple(sorted((round(graph["lat"][a], 2), round(graph["lat"][b], 2))))
+             for a, b in zip(graph["u"].tolist(), graph["v"].tolist())}
+    # El nodo 3 falta en el extracto: no debe aparecer el tramo 2-4
+    assert pairs == {(-33.41, -33.4), (-33.44, -33.43)}
@@ -0,0 +1,30 @@
+import asyncio
+from app import shelter_assignment as module
+from app.nearby import ShelterIndex
+from app.shelter_assignment import ShelterAssignment
+
+def test_repeated_id_waits_for_the_running_batch(monkeypatch):
+    offload = module.compute_pool.offload
+
+    async def slow_offload(*args, **kwargs):
+        # Subasta lenta: el segundo lote llega mientras corre la primera
+        await asyncio.sleep(0.05)
+        return await offload(*args, **kwargs)
+
+    monkeypatch.setattr(module.compute_pool, "offload", slow_offload)
+    index = ShelterIndex([{"id": 1, "name": "Escuela", "lat": 14.6, "lon": -90.5, "capacity": 20, "occupancy": 0}])
+    assignment = ShelterAssignment()
+
+    async def scenario():
+        first = asyncio.create_task(assignment.reoptimize(index, points=[(14.61, -90.5, 10, "x")]))
+        await asyncio.sleep(0.01)
+        second = await assignment.reoptimize(index, points=[(14.61, -90.5, 5, "x")])
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["assignments"][0]["assigned"] == 10
+    assert second["assignments"][0]["assigned"] == 5
+    # La solicitud reemplazada no deja cupo reservado
+    assert assignment.reserved == {1: 5}
+    assignment.release("x")
+    assert assignment.reserved == {}
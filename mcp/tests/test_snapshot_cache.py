@@ -0,0 +1,87 @@
+import asyncio
+import httpx
+from app import snapshot_cache as module
+from app.result_cache import ResultCache
+from app.snapshot_cache import SnapshotCache
+
+def backend(state):
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/data-version":
+            return httpx.Response(200, json={"version": state["version"],
+                                             "external": {"max_id": state.get("external_max_id", 0)}})
+        if path in state["failing"]:
+            return httpx.Response(503)
+        if path == "/alerts":
+            return httpx.Response(200, json=[{"id": 1, "lat": -33.4, "lon": -70.6, "severity": 2,
+                                              "alert_type": "general", "created_at": "2026-01-01T00:00:00"}])
+        if path == "/external-alerts":
+            state.setdefault("external_requests", []).append(dict(request.url.params))
+            return httpx.Response(200, json={"version": state.get("external_version", 0), "alerts": []})
+        return httpx.Response(200, json=[{"id": 1, "lat": -33.4, "lon": -70.6}])
+    return httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(handler))
+
+def test_failed_refresh_keeps_previous_snapshot(monkeypatch):
+    state = {"version": "v1", "failing": set()}
+    client = backend(state)
+    monkeypatch.setattr(module, "get_client", lambda: client)
+    cache = SnapshotCache(ttl=0)
+
+    async def scenario():
+        first = await cache.get()
+        assert first.version == "v1" and len(first.alerts) == 1
+
+        # Cambia la versión pero /alerts falla: se conserva la instantánea anterior
+        state["version"], state["failing"] = "v2", {"/alerts"}
+        assert await cache.get() is first
+        assert cache.stats()["failed_refreshes"] == 1
+
+        # Al recuperarse el backend se reintenta y se toma la nueva versión
+        state["failing"] = set()
+        second = await cache.get()
+        assert second.version == "v2" and len(second.alerts) == 1
+
+    asyncio.run(scenario())
+
+def test_partial_first_refresh_is_not_cached(monkeypatch):
+    state = {"version": "v1", "failing": {"/shelters"}}
+    client = backend(state)
+    monkeypatch.setattr(module, "get_client", lambda: client)
+    cache = SnapshotCache(ttl=60)
+
+    async def compute():
+        return {"total": 1}
+
+    async def scenario():
+        results = ResultCache()
+        assert (await results.get_or_compute("conteo", {}, "v1", compute)).headers["X-Cache"] == "miss"
+        partial = await cache.get()
+        assert partial.version.startswith("parcial-") and partial.shelters == [] and partial.partial
+        # Lo calculado sobre datos incompletos no vacía ni ocupa la caché de resultados
+        response = await results.get_or_compute("conteo", {}, partial.version, compute, store=not partial.partial)
+        assert response.headers["X-Cache"] == "bypass"
+        assert results.version == "v1" and len(results._entries) == 1
+        state["failing"] = set()
+        complete = await cache.get()
+        assert complete.version == "v1" and len(complete.shelters) == 1 and not complete.partial
+        assert (await results.get_or_compute("conteo", {}, complete.version, compute)).headers["X-Cache"] == "hit"
+
+    asyncio.run(scenario())
+
+def test_stale_external_alerts_are_not_stored_under_a_new_version(monkeypatch):
+    state = {"version": "v1", "failing": set()}
+    client = backend(state)
+    monkeypatch.setattr(module, "get_client", lambda: client)
+    cache = SnapshotCache(ttl=0)
+
+    async def scenario():
+        first = await cache.get()
+        # Otro worker ingirió la alerta externa 7, pero el que responde aún sirve la 5
+        state.update(version="v2", external_max_id=7, external_version=5)
+        assert await cache.get() is first
+        assert state["external_requests"][-1] == {"min_version": "7"}
+        state["external_version"] = 7
+        second = await cache.get()
+        assert second.version == "v2" and second.external["version"] == 7
+
+    asyncio.run(scenario())